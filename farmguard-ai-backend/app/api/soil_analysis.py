@@ -5,17 +5,62 @@ Provides soil analysis, recommendations, and fertilizer calculations
 for Indian farming conditions.
 """
 
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import csv
+import math
+import secrets
+from dataclasses import asdict
+from datetime import date
+from functools import lru_cache
 import logging
 import json
 from enum import Enum
 
+import numpy as np
+
+from app.core.config import settings
+from app.services.analytics_sink import get_analytics_sink
+from app.services.fertilizer_catalog import OXIDE_FACTOR
+from app.services.fertilizer_optimizer import ProductMatrix, optimize_fertilizer_mix
+from app.services.fertilizer_calculator import MAX_RISK_SCENARIOS, SoilTestResult
+from app.services.fertilizer_plan import FertilizerPlanner, PlanInputs
+from app.services.procurement_planner import (
+    DEFAULT_HOLDING_RATE, DEFAULT_LEAD_WEEKS, DEFAULT_ORDER_COST, PlotSpec, ProcurementPlanner
+)
+from app.services.gazetteer import Place, get_gazetteer
+from app.services.nutrient_economics import NutrientEconomicsSolver
+from app.services.price_feed import PriceUpdate, get_price_feed, region_key
+from app.services.quantile_sketch import BENCHMARK_METRICS, RegionalSoilBenchmarks, region_keys
+from app.services.regional_factors import get_district_factors, state_key
+from app.services.result_cache import BoundedLRUCache
+from app.services.soil_mapping import MAP_METRICS, TILE_CELLS, SoilMapEngine
+from app.services.soil_rules import SoilRules, get_soil_rules
+from app.services.soil_scoring import score_soil_batch
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Memoized analyses for repeated lab-rounded inputs (field camps, kiosks, quick tests)
+analysis_cache = BoundedLRUCache(settings.SOIL_ANALYSIS_CACHE_SIZE)
+
+# Requirements -> mix -> schedule -> economics, memoized per stage
+fertilizer_planner = FertilizerPlanner()
+
+# Fertilizer prices: versioned snapshots, with soil rules repriced once per version and region
+price_feed = get_price_feed()
+priced_rules_cache = BoundedLRUCache(64)
+
+# Streaming percentiles of logged analyses per district, state and country
+soil_benchmarks = RegionalSoilBenchmarks()
+
+# Interpolated nutrient surfaces from geolocated samples
+soil_map = SoilMapEngine()
+
 class SoilType(str, Enum):
     CLAY = "clay"
     LOAMY = "loamy"
@@ -71,6 +116,7 @@ class SoilAnalysisRequest(BaseModel):
     farm_size: float = Field(..., gt=0, description="Farm size in hectares")
     budget: Optional[float] = None
     season: Optional[str] = "current"
+    optimize_budget: bool = Field(False, description="Scale doses to fit the budget instead of dropping nutrients")
 
 class SoilAnalysisResponse(BaseModel):
     success: bool
@@ -78,87 +124,119 @@ class SoilAnalysisResponse(BaseModel):
     total_cost: float
     expected_yield_improvement: float
     environmental_impact: Dict[str, str]
+    location: Optional[str] = None  # canonical name resolved from soil_data.location
     error: Optional[str] = None
 
-# Soil analysis knowledge base
-SOIL_ANALYSIS_DATA = {
-    "ph_ranges": {
-        "very_acidic": {"min": 3.0, "max": 4.5, "crops": ["blueberry", "tea"], "issues": ["aluminum toxicity", "poor nutrient availability"]},
-        "acidic": {"min": 4.5, "max": 5.5, "crops": ["potato", "rice"], "issues": ["low phosphorus availability"]},
-        "slightly_acidic": {"min": 5.5, "max": 6.5, "crops": ["wheat", "maize", "soybean"], "issues": ["optimal for most crops"]},
-        "neutral": {"min": 6.5, "max": 7.5, "crops": ["most vegetables", "cotton"], "issues": ["ideal conditions"]},
-        "alkaline": {"min": 7.5, "max": 8.5, "crops": ["sugarcane", "cabbage"], "issues": ["iron deficiency possible"]},
-        "highly_alkaline": {"min": 8.5, "max": 11.0, "crops": ["barley"], "issues": ["micronutrient deficiency"]}
-    },
-    
-    "nutrient_levels": {
-        "nitrogen": {
-            "low": {"max": 150, "fertilizers": ["urea", "ammonium_sulphate"], "symptoms": ["yellowing leaves", "stunted growth"]},
-            "medium": {"min": 150, "max": 300, "fertilizers": ["balanced_npk"], "symptoms": ["normal growth"]},
-            "high": {"min": 300, "fertilizers": ["organic_compost"], "symptoms": ["excessive vegetative growth"]}
-        },
-        "phosphorus": {
-            "low": {"max": 15, "fertilizers": ["DAP", "single_super_phosphate"], "symptoms": ["purple leaves", "poor root development"]},
-            "medium": {"min": 15, "max": 30, "fertilizers": ["balanced_npk"], "symptoms": ["normal growth"]},
-            "high": {"min": 30, "fertilizers": ["organic_matter"], "symptoms": ["good flowering and fruiting"]}
-        },
-        "potassium": {
-            "low": {"max": 120, "fertilizers": ["muriate_of_potash", "potassium_sulphate"], "symptoms": ["leaf burn", "weak stems"]},
-            "medium": {"min": 120, "max": 280, "fertilizers": ["balanced_npk"], "symptoms": ["normal growth"]},
-            "high": {"min": 280, "fertilizers": ["organic_compost"], "symptoms": ["good disease resistance"]}
-        }
-    },
-
-    "fertilizer_costs": {  # Average costs in INR per kg
-        "urea": 6.50,
-        "DAP": 27.00,
-        "muriate_of_potash": 17.00,
-        "single_super_phosphate": 9.50,
-        "ammonium_sulphate": 8.00,
-        "potassium_sulphate": 45.00,
-        "balanced_npk": 22.00,
-        "organic_compost": 5.00,
-        "vermicompost": 8.00
-    },
-
-    "crop_requirements": {
-        "rice": {"ph": [5.5, 7.0], "n": 120, "p": 60, "k": 40, "yield_potential": 6.0},
-        "wheat": {"ph": [6.0, 7.5], "n": 120, "p": 60, "k": 40, "yield_potential": 4.5},
-        "maize": {"ph": [5.5, 7.0], "n": 120, "p": 60, "k": 50, "yield_potential": 8.0},
-        "cotton": {"ph": [5.8, 8.0], "n": 160, "p": 80, "k": 80, "yield_potential": 2.5},
-        "sugarcane": {"ph": [6.0, 7.5], "n": 280, "p": 90, "k": 160, "yield_potential": 80.0},
-        "tomato": {"ph": [6.0, 7.0], "n": 150, "p": 100, "k": 150, "yield_potential": 50.0},
-        "onion": {"ph": [6.0, 7.5], "n": 100, "p": 50, "k": 50, "yield_potential": 25.0},
-        "potato": {"ph": [5.2, 6.4], "n": 180, "p": 80, "k": 220, "yield_potential": 30.0}
-    }
+class GeoSoilSample(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    ph: Optional[float] = Field(None, ge=0, le=14)
+    nitrogen: Optional[float] = Field(None, ge=0)
+    phosphorus: Optional[float] = Field(None, ge=0)
+    potassium: Optional[float] = Field(None, ge=0)
+    organic_matter: Optional[float] = Field(None, ge=0, le=100)
+
+class SoilMapSamplesRequest(BaseModel):
+    samples: List[GeoSoilSample] = Field(..., min_length=1, max_length=50000)
+
+# Parameters a what-if sweep may vary, with the limits SoilData/SoilAnalysisRequest accept
+WHAT_IF_LIMITS = {
+    "ph": (3.0, 11.0),
+    "nitrogen": (0.0, 500.0),
+    "phosphorus": (0.0, 200.0),
+    "potassium": (0.0, 500.0),
+    "organic_matter": (0.0, 10.0),
+    "farm_size": (0.01, 10000.0),
+    "budget": (0.0, 1e9)
 }
+WHAT_IF_MAX_POINTS = 50000
+
+class SweepRange(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    steps: int = Field(11, ge=1, le=201)
+    values: Optional[List[float]] = Field(None, min_length=1, max_length=201, description="Explicit values instead of min/max/steps")
+
+    def points(self) -> np.ndarray:
+        if self.values is not None:
+            return np.asarray(self.values, dtype=np.float64)
+        if self.min is None or self.max is None:
+            raise ValueError("give either values or min and max")
+        return np.linspace(self.min, self.max, self.steps)
+
+class WhatIfRequest(BaseModel):
+    soil_data: SoilData
+    target_crop: CropType
+    farm_size: float = Field(..., gt=0, description="Farm size in hectares")
+    budget: Optional[float] = None
+    sweep: Dict[str, SweepRange] = Field(..., min_length=1, max_length=4, description="Parameter ranges to vary")
+
+class FertilizerPlanRequest(BaseModel):
+    soil_data: SoilData
+    target_crop: CropType
+    farm_size: float = Field(..., gt=0, description="Farm size in hectares")
+    planting_date: date
+    crop_price: float = Field(..., gt=0, description="Expected crop price in INR per tonne")
+    target_yield: Optional[float] = Field(None, gt=0, description="Target yield in tonnes per hectare")
+    region: Optional[str] = Field(None, description="District code (e.g. IN-PB-LUDHIANA) or state for regional factors")
+    lat: Optional[float] = Field(None, ge=-90, le=90, description="Plot latitude; selects the district when no region is given")
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    budget: Optional[float] = Field(None, ge=0, description="Fertilizer budget for the whole farm in INR")
+    organic_preference: bool = False
+    optimize: bool = Field(True, description="Solve the mix over the whole catalog instead of the DAP/Urea/MOP rules")
+    whole_bags: bool = False
+    risk_scenarios: int = Field(0, ge=0, le=MAX_RISK_SCENARIOS, description="Monte Carlo scenarios for ROI risk; 0 skips")
+
+class EconomicOptimumRequest(BaseModel):
+    soil_data: SoilData
+    target_crop: CropType
+    crop_price: float = Field(..., gt=0, description="Expected crop price in INR per tonne")
+    target_yield: Optional[float] = Field(None, gt=0, description="Target yield in tonnes per hectare")
+    region: Optional[str] = Field(None, description="District code (e.g. IN-PB-LUDHIANA) or state for regional factors")
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    nutrient_prices: Optional[Dict[str, float]] = Field(
+        None, description="INR per kg of elemental N, P or K (not P2O5/K2O); defaults to catalog prices"
+    )
+
+class ProcurementPlot(BaseModel):
+    plot_id: Optional[str] = None
+    target_crop: CropType
+    area: float = Field(..., gt=0, le=10000, description="Plot area in hectares")
+    ph: float = Field(..., ge=3.0, le=11.0)
+    nitrogen: float = Field(..., ge=0, le=500)
+    phosphorus: float = Field(..., ge=0, le=200)
+    potassium: float = Field(..., ge=0, le=500)
+    organic_matter: float = Field(..., ge=0, le=10)
+    planting_date: date
+    region: Optional[str] = None
+    location: Optional[str] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    target_yield: Optional[float] = Field(None, gt=0)
 
 def get_ph_category(ph: float) -> str:
     """Determine pH category"""
-    for category, data in SOIL_ANALYSIS_DATA["ph_ranges"].items():
-        if data["min"] <= ph <= data["max"]:
-            return category
-    return "unknown"
+    return get_soil_rules().ph_category(ph)
 
 def get_nutrient_level(nutrient: str, value: float) -> str:
     """Determine nutrient level category"""
-    levels = SOIL_ANALYSIS_DATA["nutrient_levels"].get(nutrient, {})
-    
-    if "low" in levels and value <= levels["low"]["max"]:
-        return "low"
-    elif "high" in levels and value >= levels["high"]["min"]:
-        return "high"
-    else:
-        return "medium"
+    return get_soil_rules().nutrient_level(nutrient, value)
 
-def calculate_fertilizer_needs(soil_data: SoilData, target_crop: CropType) -> List[FertilizerRecommendation]:
+def calculate_fertilizer_needs(
+    soil_data: SoilData,
+    target_crop: CropType,
+    rules: Optional[SoilRules] = None
+) -> List[FertilizerRecommendation]:
     """Calculate fertilizer recommendations based on soil data and crop requirements"""
     
-    crop_req = SOIL_ANALYSIS_DATA["crop_requirements"].get(target_crop.value, {})
+    rules = rules or get_soil_rules()
+    crop_req = rules.crop_requirements.get(target_crop.value, {})
+    costs = rules.fertilizer_costs
     recommendations = []
     
     # Nitrogen analysis
-    n_level = get_nutrient_level("nitrogen", soil_data.nitrogen)
+    n_level = rules.nutrient_level("nitrogen", soil_data.nitrogen)
     n_need = max(0, crop_req.get("n", 120) - soil_data.nitrogen)
     
     if n_need > 0:
@@ -170,11 +248,11 @@ def calculate_fertilizer_needs(soil_data: SoilData, target_crop: CropType) -> Li
             fertilizer_type=fertilizer.replace("_", " ").title(),
             application_method="Split application - 50% at planting, 25% at vegetative stage, 25% at flowering",
             timing="Pre-planting and top dressing",
-            cost_per_hectare=n_need * 2.17 * SOIL_ANALYSIS_DATA["fertilizer_costs"][fertilizer]
+            cost_per_hectare=n_need * 2.17 * costs[fertilizer]
         ))
     
     # Phosphorus analysis
-    p_level = get_nutrient_level("phosphorus", soil_data.phosphorus)
+    p_level = rules.nutrient_level("phosphorus", soil_data.phosphorus)
     p_need = max(0, crop_req.get("p", 60) - soil_data.phosphorus)
     
     if p_need > 0:
@@ -186,11 +264,11 @@ def calculate_fertilizer_needs(soil_data: SoilData, target_crop: CropType) -> Li
             fertilizer_type=fertilizer.replace("_", " ").title(),
             application_method="Basal application at planting",
             timing="At sowing/transplanting",
-            cost_per_hectare=p_need * 2.18 * SOIL_ANALYSIS_DATA["fertilizer_costs"][fertilizer]
+            cost_per_hectare=p_need * 2.18 * costs[fertilizer]
         ))
     
     # Potassium analysis
-    k_level = get_nutrient_level("potassium", soil_data.potassium)
+    k_level = rules.nutrient_level("potassium", soil_data.potassium)
     k_need = max(0, crop_req.get("k", 40) - soil_data.potassium)
     
     if k_need > 0:
@@ -202,17 +280,20 @@ def calculate_fertilizer_needs(soil_data: SoilData, target_crop: CropType) -> Li
             fertilizer_type=fertilizer.replace("_", " ").title(),
             application_method="Split application - 50% basal, 50% at flowering",
             timing="Basal and top dressing",
-            cost_per_hectare=k_need * 1.67 * SOIL_ANALYSIS_DATA["fertilizer_costs"][fertilizer]
+            cost_per_hectare=k_need * 1.67 * costs[fertilizer]
         ))
     
     return recommendations
 
-def analyze_soil_health(soil_data: SoilData, target_crop: CropType) -> SoilAnalysis:
+def analyze_soil_health(soil_data: SoilData, target_crop: CropType, rules: Optional[SoilRules] = None) -> SoilAnalysis:
     """Perform comprehensive soil analysis"""
     
+    # One rules version for the whole analysis, even if a reload lands mid-request
+    rules = rules or get_soil_rules()
+    
     # Calculate soil health score
-    ph_category = get_ph_category(soil_data.ph)
-    crop_req = SOIL_ANALYSIS_DATA["crop_requirements"].get(target_crop.value, {})
+    ph_category = rules.ph_category(soil_data.ph)
+    crop_req = rules.crop_requirements.get(target_crop.value, {})
     
     # pH score (0-30 points)
     ph_optimal_range = crop_req.get("ph", [6.0, 7.0])
@@ -223,9 +304,9 @@ def analyze_soil_health(soil_data: SoilData, target_crop: CropType) -> SoilAnaly
         ph_score = max(0, 30 - (ph_distance * 10))
     
     # Nutrient score (0-50 points)
-    n_level = get_nutrient_level("nitrogen", soil_data.nitrogen)
-    p_level = get_nutrient_level("phosphorus", soil_data.phosphorus)
-    k_level = get_nutrient_level("potassium", soil_data.potassium)
+    n_level = rules.nutrient_level("nitrogen", soil_data.nitrogen)
+    p_level = rules.nutrient_level("phosphorus", soil_data.phosphorus)
+    k_level = rules.nutrient_level("potassium", soil_data.potassium)
     
     nutrient_scores = {"low": 10, "medium": 16, "high": 15}  # Medium is optimal
     nutrient_score = sum([nutrient_scores.get(level, 10) for level in [n_level, p_level, k_level]])
@@ -280,14 +361,10 @@ def analyze_soil_health(soil_data: SoilData, target_crop: CropType) -> SoilAnaly
         fertility_status = "Very Poor"
     
     # Suitable crops based on current conditions
-    suitable_crops = []
-    for crop, requirements in SOIL_ANALYSIS_DATA["crop_requirements"].items():
-        crop_ph_range = requirements["ph"]
-        if crop_ph_range[0] <= soil_data.ph <= crop_ph_range[1]:
-            suitable_crops.append(crop.title())
+    suitable_crops = rules.suitable_crops(soil_data.ph)
     
     # Fertilizer needs
-    fertilizer_needs = calculate_fertilizer_needs(soil_data, target_crop)
+    fertilizer_needs = calculate_fertilizer_needs(soil_data, target_crop, rules)
     
     # Improvement plan
     improvement_plan = {
@@ -322,6 +399,36 @@ def analyze_soil_health(soil_data: SoilData, target_crop: CropType) -> SoilAnaly
         improvement_plan=improvement_plan
     )
 
+@lru_cache(maxsize=4096)
+def resolve_place(location: Optional[str]) -> Optional[Place]:
+    """Gazetteer place for a free-text location"""
+    if not location:
+        return None
+    try:
+        return get_gazetteer().resolve(location)
+    except Exception as e:
+        logger.warning(f"Gazetteer lookup failed for '{location}': {e}")
+        return None
+
+def reverse_place(lat: float, lon: float) -> Optional[Place]:
+    """Nearest gazetteer place to a coordinate"""
+    try:
+        nearest = get_gazetteer().reverse(lat, lon)
+    except Exception as e:
+        logger.warning(f"Gazetteer reverse lookup failed for ({lat}, {lon}): {e}")
+        return None
+    return nearest[0] if nearest else None
+
+def resolve_location_name(location: Optional[str]) -> Optional[str]:
+    """Canonical place name for a free-text location, via the offline gazetteer"""
+    place = resolve_place(location)
+    return place.canonical_name if place else None
+
+def resolve_regions(location: Optional[str]) -> Tuple[str, ...]:
+    """Benchmark regions for a free-text location, most specific first"""
+    place = resolve_place(location)
+    return region_keys(place.state, place.district) if place else region_keys()
+
 @router.post("/analyze", response_model=SoilAnalysisResponse)
 async def analyze_soil(
     request: SoilAnalysisRequest,
@@ -338,61 +445,33 @@ async def analyze_soil(
     """
     
     try:
-        # Perform soil analysis
-        analysis = analyze_soil_health(request.soil_data, request.target_crop)
-        
-        # Calculate total cost
-        total_cost = sum([rec.cost_per_hectare for rec in analysis.fertilizer_needs]) * request.farm_size
-        
-        # Apply budget constraints if provided
-        if request.budget and total_cost > request.budget:
-            # Prioritize fertilizer recommendations by importance
-            priority_order = ["phosphorus", "nitrogen", "potassium"]
-            filtered_recommendations = []
-            running_cost = 0
-            
-            for nutrient in priority_order:
-                for rec in analysis.fertilizer_needs:
-                    if rec.nutrient.lower() == nutrient:
-                        cost = rec.cost_per_hectare * request.farm_size
-                        if running_cost + cost <= request.budget:
-                            filtered_recommendations.append(rec)
-                            running_cost += cost
-            
-            analysis.fertilizer_needs = filtered_recommendations
-            total_cost = running_cost
-            
-            if len(filtered_recommendations) < len(analysis.fertilizer_needs):
-                analysis.warnings.append(f"Budget constraint: Only {len(filtered_recommendations)} of {len(analysis.fertilizer_needs)} fertilizer recommendations fit within budget")
-        
-        # Calculate expected yield improvement
-        base_yield_improvement = min(25.0, (100 - analysis.soil_health_score) * 0.5)
-        fertilizer_improvement = len(analysis.fertilizer_needs) * 5.0  # 5% per missing nutrient
-        expected_yield_improvement = min(40.0, base_yield_improvement + fertilizer_improvement)
-        
-        # Environmental impact assessment
-        environmental_impact = {
-            "water_retention": "Improved" if analysis.soil_health_score > 60 else "Needs improvement",
-            "nutrient_runoff_risk": "Low" if analysis.soil_health_score > 70 else "Medium" if analysis.soil_health_score > 50 else "High",
-            "carbon_sequestration": "Good" if request.soil_data.organic_matter > 2.0 else "Poor",
-            "biodiversity_impact": "Positive" if len(analysis.warnings) == 0 else "Neutral"
-        }
+        rules = get_soil_rules()
+        region = price_region(request.soil_data.location)
+        key = soil_analysis_cache_key(request, rules, region)
+        response = analysis_cache.get(key) if key else None
+        if key is None:
+            analysis_cache.record_bypass()
+        if response is None:
+            # Read before pricing: a price change while computing keeps the result out of the cache
+            epoch = analysis_cache.epoch
+            priced = priced_rules(rules, region)
+            response = compute_soil_analysis(request, priced)
+            if key:
+                analysis_cache.put(key, response, tags=analysis_price_tags(request, response, priced), epoch=epoch)
         
         # Log analysis for analytics (background task)
         background_tasks.add_task(
             log_soil_analysis,
-            request.soil_data.dict(),
+            request.soil_data.model_dump(),
             request.target_crop.value,
-            analysis.soil_health_score
+            response.analysis.soil_health_score,
+            request.farm_size,
+            response.total_cost
         )
         
-        return SoilAnalysisResponse(
-            success=True,
-            analysis=analysis,
-            total_cost=round(total_cost, 2),
-            expected_yield_improvement=round(expected_yield_improvement, 1),
-            environmental_impact=environmental_impact
-        )
+        # Cached responses are shared - attach the per-request location on a copy
+        location = resolve_location_name(request.soil_data.location)
+        return response.model_copy(update={"location": location}) if location else response
         
     except Exception as e:
         logger.error(f"Soil analysis error: {e}")
@@ -405,22 +484,792 @@ async def analyze_soil(
             error=str(e)
         )
 
+def quantize(value: Optional[float], scale: int) -> Optional[int]:
+    """Grid index of `value` at resolution 1/scale, or None when it is not exactly on the grid"""
+    if value is None:
+        return None
+    index = round(value * scale)
+    return index if index / scale == value else None
+
+def soil_analysis_cache_key(
+    request: SoilAnalysisRequest,
+    rules: SoilRules,
+    price_region: Optional[str] = None
+) -> Optional[tuple]:
+    """
+    Cache key for a request whose inputs sit on the lab reporting grid
+    (pH to 0.1, NPK to 1 kg/ha, organic matter to 0.01%, farm size to 0.01 ha,
+    budget to 1 INR). Off-grid inputs return None and are computed directly,
+    so the cache never fills with one-off values. Prices are not part of the
+    key; entries are tagged with their products and evicted when those change,
+    here or in another worker (the price feed polls the snapshot directory).
+    """
+    soil = request.soil_data
+    fields = (
+        quantize(soil.ph, 10),
+        quantize(soil.nitrogen, 1),
+        quantize(soil.phosphorus, 1),
+        quantize(soil.potassium, 1),
+        quantize(soil.organic_matter, 100),
+        quantize(request.farm_size, 100)
+    )
+    budget = quantize(request.budget, 1) if request.budget else 0
+    if None in fields or budget is None:
+        return None
+    return (rules.version, rules.mtime, price_region, request.target_crop.value, budget, request.optimize_budget) + fields
+
+def price_region(location: Optional[str]) -> Optional[str]:
+    """State of the location when the current price snapshot has regional prices for it"""
+    place = resolve_place(location)
+    region = region_key(place.state) if place else None
+    return region if region in price_feed.current().regional else None
+
+def priced_rules(rules: SoilRules, region: Optional[str] = None) -> SoilRules:
+    """`rules` with fertilizer costs from the current price snapshot, regional where reported"""
+    snapshot = price_feed.current()
+    key = (rules.version, rules.mtime, snapshot.version, region)
+    priced = priced_rules_cache.get(key)
+    if priced is None:
+        costs = {name: snapshot.price(price_feed.canonical(name), region) for name in rules.fertilizer_costs}
+        priced = rules.with_fertilizer_costs({name: price for name, price in costs.items() if price is not None})
+        priced_rules_cache.put(key, priced)
+    return priced
+
+def analysis_price_tags(request: SoilAnalysisRequest, response: SoilAnalysisResponse, rules: SoilRules) -> set:
+    """Products whose prices an analysis read: those recommended, or every priced product under a budget"""
+    if request.budget:
+        names = list(rules.fertilizer_costs)
+    else:
+        names = [rec.fertilizer_type for rec in response.analysis.fertilizer_needs]
+    return {price_feed.canonical(name) for name in names}
+
+BUDGET_NUTRIENT_COLUMNS = {"Nitrogen": 0, "Phosphorus": 1, "Potassium": 2}
+
+def optimize_budget_allocation(
+    needs: List[FertilizerRecommendation],
+    farm_size: float,
+    budget: float
+) -> List[FertilizerRecommendation]:
+    """
+    Reduce recommended doses so the budget buys the best coverage of the
+    least-covered nutrient, rather than dropping whole recommendations in
+    priority order. Each recommended product is one column of the mix LP.
+    """
+    doses = np.array([rec.recommended_amount * farm_size for rec in needs])
+    targets = np.zeros(len(BUDGET_NUTRIENT_COLUMNS))
+    content = np.zeros((len(needs), len(BUDGET_NUTRIENT_COLUMNS)))
+    for i, rec in enumerate(needs):
+        column = BUDGET_NUTRIENT_COLUMNS[rec.nutrient]
+        content[i, column] = 1.0  # coverage measured in kg of the recommended product
+        targets[column] = doses[i]
+    products = ProductMatrix(
+        ids=[rec.nutrient for rec in needs],
+        names=[rec.fertilizer_type for rec in needs],
+        content=content,
+        price=np.array([rec.cost_per_hectare / rec.recommended_amount for rec in needs]),
+        bag_kg=np.ones(len(needs))
+    )
+    mix = optimize_fertilizer_mix(products, targets, budget=budget, objective="max_coverage")
+    
+    scaled = []
+    for rec, amount, dose in zip(needs, mix.amounts, doses):
+        fraction = min(1.0, amount / dose)
+        if fraction > 1e-6:
+            scaled.append(rec.model_copy(update={
+                "recommended_amount": rec.recommended_amount * fraction,
+                "cost_per_hectare": rec.cost_per_hectare * fraction
+            }))
+    return scaled
+
+def compute_soil_analysis(request: SoilAnalysisRequest, rules: SoilRules) -> SoilAnalysisResponse:
+    """Full analysis, budget selection and impact assessment for one request"""
+    # Perform soil analysis
+    analysis = analyze_soil_health(request.soil_data, request.target_crop, rules)
+    
+    # Calculate total cost
+    total_cost = sum([rec.cost_per_hectare for rec in analysis.fertilizer_needs]) * request.farm_size
+    
+    # Apply budget constraints if provided
+    if request.budget and total_cost > request.budget and request.optimize_budget:
+        full_cost = total_cost
+        analysis.fertilizer_needs = optimize_budget_allocation(
+            analysis.fertilizer_needs, request.farm_size, request.budget
+        )
+        total_cost = sum(rec.cost_per_hectare for rec in analysis.fertilizer_needs) * request.farm_size
+        analysis.warnings.append(f"Budget constraint: Doses reduced to {total_cost / full_cost:.0%} of the full recommendation to fit within budget")
+    elif request.budget and total_cost > request.budget:
+        # Prioritize fertilizer recommendations by importance
+        priority_order = ["phosphorus", "nitrogen", "potassium"]
+        filtered_recommendations = []
+        running_cost = 0
+        
+        for nutrient in priority_order:
+            for rec in analysis.fertilizer_needs:
+                if rec.nutrient.lower() == nutrient:
+                    cost = rec.cost_per_hectare * request.farm_size
+                    if running_cost + cost <= request.budget:
+                        filtered_recommendations.append(rec)
+                        running_cost += cost
+        
+        analysis.fertilizer_needs = filtered_recommendations
+        total_cost = running_cost
+        
+        if len(filtered_recommendations) < len(analysis.fertilizer_needs):
+            analysis.warnings.append(f"Budget constraint: Only {len(filtered_recommendations)} of {len(analysis.fertilizer_needs)} fertilizer recommendations fit within budget")
+    
+    # Calculate expected yield improvement
+    base_yield_improvement = min(25.0, (100 - analysis.soil_health_score) * 0.5)
+    fertilizer_improvement = len(analysis.fertilizer_needs) * 5.0  # 5% per missing nutrient
+    expected_yield_improvement = min(40.0, base_yield_improvement + fertilizer_improvement)
+    
+    # Environmental impact assessment
+    environmental_impact = {
+        "water_retention": "Improved" if analysis.soil_health_score > 60 else "Needs improvement",
+        "nutrient_runoff_risk": "Low" if analysis.soil_health_score > 70 else "Medium" if analysis.soil_health_score > 50 else "High",
+        "carbon_sequestration": "Good" if request.soil_data.organic_matter > 2.0 else "Poor",
+        "biodiversity_impact": "Positive" if len(analysis.warnings) == 0 else "Neutral"
+    }
+    
+    return SoilAnalysisResponse(
+        success=True,
+        analysis=analysis,
+        total_cost=round(total_cost, 2),
+        expected_yield_improvement=round(expected_yield_improvement, 1),
+        environmental_impact=environmental_impact
+    )
+
+# Batch analysis settings
+BATCH_SCORING_SIZE = 5000
+BATCH_REQUIRED_COLUMNS = ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "soil_type", "target_crop"]
+SOIL_DATA_FIELDS = ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "soil_type", "location", "previous_crop"]
+
+class RequestStreamingResponse(StreamingResponse):
+    """Streaming response whose body generator reads the request body itself"""
+
+    async def __call__(self, scope, receive, send):
+        # StreamingResponse normally listens for disconnects on `receive`, which would
+        # swallow request body chunks; a disconnect surfaces from request.stream() instead
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def iter_request_lines(request: Request) -> AsyncIterator[List[str]]:
+    """Yield complete lines from the request body as chunks arrive, without buffering the upload"""
+    remainder = b""
+    first = True
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        data = remainder + chunk
+        lines = data.split(b"\n")
+        remainder = lines.pop()
+        if first and lines:
+            lines[0] = lines[0].removeprefix(b"\xef\xbb\xbf")
+            first = False
+        if lines:
+            yield [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines]
+    if remainder.strip():
+        if first:
+            remainder = remainder.removeprefix(b"\xef\xbb\xbf")
+        yield [remainder.decode("utf-8", errors="replace").rstrip("\r")]
+
+def parse_upload_rows(rows: List[Tuple[int, str]], fmt: str, header: Optional[List[str]]) -> List:
+    """Records of CSV or NDJSON lines; lines that are not valid JSON become the decode error"""
+    if fmt == "csv":
+        return [dict(zip(header, values)) for values in csv.reader(line for _, line in rows)]
+    records = []
+    for _, line in rows:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            records.append(e)
+    return records
+
+def describe_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+async def iter_upload_batches(
+    request: Request,
+    required_columns: List[str],
+    batch_size: int = BATCH_SCORING_SIZE
+) -> AsyncIterator[Tuple[List[Tuple[int, str]], str, Optional[List[str]]]]:
+    """
+    (rows, format, CSV header) batches of a streamed CSV or NDJSON upload;
+    raises ValueError when a CSV header lacks required columns
+    """
+    content_type = request.headers.get("content-type", "")
+    fmt: Optional[str] = None
+    header: Optional[List[str]] = None
+    pending: List[Tuple[int, str]] = []
+    row = 0
+    
+    async for lines in iter_request_lines(request):
+        for line in lines:
+            if not line.strip():
+                continue
+            if fmt is None:
+                fmt = "ndjson" if "json" in content_type or line.lstrip().startswith("{") else "csv"
+                if fmt == "csv":
+                    header = [column.strip().lower() for column in next(csv.reader([line]))]
+                    missing = [column for column in required_columns if column not in header]
+                    if missing:
+                        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+                    continue
+            pending.append((row, line))
+            row += 1
+        
+        if len(pending) >= batch_size:
+            yield pending, fmt, header
+            pending = []
+    
+    if pending:
+        yield pending, fmt, header
+
+def sample_to_request(record: Dict) -> SoilAnalysisRequest:
+    """Build a validated request from a nested (SoilAnalysisRequest) or flat record"""
+    if "soil_data" not in record:
+        record = {
+            "soil_data": {key: record[key] for key in SOIL_DATA_FIELDS if record.get(key) not in (None, "")},
+            "target_crop": record.get("target_crop"),
+            "farm_size": record.get("farm_size") or 1.0,
+            "budget": record.get("budget") or None
+        }
+    return SoilAnalysisRequest(**record)
+
+def process_sample_batch(rows: List[Tuple[int, str]], fmt: str, header: Optional[List[str]]) -> Tuple[str, int, int]:
+    """Validate and score one batch; returns NDJSON text and (scored, failed) counts"""
+    records = parse_upload_rows(rows, fmt, header)
+    
+    output = {}
+    valid: List[Tuple[int, Optional[str], SoilAnalysisRequest]] = []
+    for (row, _), record in zip(rows, records):
+        sample_id = record.get("sample_id") if isinstance(record, dict) else None
+        try:
+            if not isinstance(record, dict):
+                raise ValueError(f"Invalid JSON: {record}")
+            valid.append((row, sample_id, sample_to_request(record)))
+        except (ValidationError, ValueError, TypeError) as e:
+            output[row] = json.dumps({"row": row, "sample_id": sample_id, "success": False, "error": describe_error(e)})
+    
+    # Rows are priced like single analyses: grouped by the price region of their location
+    regions: Dict[Optional[str], Optional[str]] = {}
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, (_, _, request) in enumerate(valid):
+        location = request.soil_data.location
+        if location not in regions:
+            regions[location] = price_region(location)
+        groups.setdefault(regions[location], []).append(i)
+    
+    scored: Dict[int, Tuple[Any, int]] = {}  # index in valid -> (group scores, index in group)
+    rules = get_soil_rules()
+    for region, members in groups.items():
+        requests = [valid[i][2] for i in members]
+        group_scores = score_soil_batch(
+            priced_rules(rules, region).data,
+            ph=np.array([r.soil_data.ph for r in requests]),
+            nitrogen=np.array([r.soil_data.nitrogen for r in requests]),
+            phosphorus=np.array([r.soil_data.phosphorus for r in requests]),
+            potassium=np.array([r.soil_data.potassium for r in requests]),
+            organic_matter=np.array([r.soil_data.organic_matter for r in requests]),
+            target_crop=np.array([r.target_crop.value for r in requests]),
+            farm_size=np.array([r.farm_size for r in requests]),
+            budget=np.array([r.budget if r.budget is not None else np.nan for r in requests])
+        )
+        for j, i in enumerate(members):
+            scored[i] = (group_scores, j)
+    
+    if valid:
+        locations: Dict[str, Optional[str]] = {}
+        for index, (row, sample_id, request) in enumerate(valid):
+            scores, i = scored[index]
+            location = request.soil_data.location
+            if location and location not in locations:
+                locations[location] = resolve_location_name(location)
+            output[row] = json.dumps({
+                "row": row,
+                "sample_id": sample_id,
+                "success": True,
+                "soil_health_score": scores.soil_health_score[i],
+                "fertility_status": scores.fertility_status[i],
+                "ph_category": scores.ph_category[i],
+                "nutrient_levels": {name.lower(): needs.level[i] for name, needs in scores.nutrients.items()},
+                "fertilizer_needs": [
+                    {
+                        "nutrient": name,
+                        "fertilizer_type": needs.fertilizer[i].replace("_", " ").title(),
+                        "recommended_amount": float(needs.amount[i]),
+                        "cost_per_hectare": float(needs.cost_per_hectare[i])
+                    }
+                    for name, needs in ((name, scores.nutrients[name]) for name in scores.fertilizer_order(i))
+                    if needs.included[i]
+                ],
+                "suitable_crops": [crop for crop, ok in zip(scores.crop_names, scores.suitable_crops[i]) if ok],
+                "total_cost": round(float(scores.total_cost[i]), 2),
+                "expected_yield_improvement": round(float(scores.expected_yield_improvement[i]), 1),
+                "location": locations.get(location) if location else None
+            })
+    
+    text = "".join(output[row] + "\n" for row, _ in rows)
+    return text, len(valid), len(rows) - len(valid)
+
+async def stream_batch_results(request: Request) -> AsyncIterator[str]:
+    """Parse the upload incrementally and emit scored samples batch by batch"""
+    rows = scored = failed = 0
+    try:
+        async for pending, fmt, header in iter_upload_batches(request, BATCH_REQUIRED_COLUMNS):
+            text, ok, bad = await asyncio.to_thread(process_sample_batch, pending, fmt, header)
+            rows, scored, failed = rows + len(pending), scored + ok, failed + bad
+            yield text
+    except ValueError as e:
+        yield json.dumps({"success": False, "error": str(e)}) + "\n"
+        return
+    
+    logger.info(f"🧪 Batch soil analysis: {scored} scored, {failed} rejected")
+    yield json.dumps({"summary": {"rows": rows, "scored": scored, "failed": failed}}) + "\n"
+
+@router.post("/analyze/batch")
+async def analyze_soil_batch(request: Request):
+    """
+    Analyze a streamed upload of soil samples
+    
+    Accepts CSV (header row with ph, nitrogen, phosphorus, potassium, organic_matter,
+    soil_type, target_crop and optional sample_id, farm_size, budget, location) or
+    NDJSON (flat records or SoilAnalysisRequest objects). Results are streamed back
+    as NDJSON in input order, followed by a summary line.
+    """
+    return RequestStreamingResponse(stream_batch_results(request), media_type="application/x-ndjson")
+
+def what_if_grid(request: WhatIfRequest, rules: SoilRules) -> Dict:
+    """Score every combination of the swept parameters in one vectorized call"""
+    axes = {}
+    for name, sweep in request.sweep.items():
+        if name not in WHAT_IF_LIMITS:
+            raise ValueError(f"'{name}' cannot be swept; use one of {', '.join(WHAT_IF_LIMITS)}")
+        points = sweep.points()
+        low, high = WHAT_IF_LIMITS[name]
+        if points.min() < low or points.max() > high:
+            raise ValueError(f"{name} must stay within {low}-{high}")
+        axes[name] = points
+    
+    shape = tuple(len(points) for points in axes.values())
+    size = int(np.prod(shape))
+    if size > WHAT_IF_MAX_POINTS:
+        raise ValueError(f"Sweep has {size} combinations; the limit is {WHAT_IF_MAX_POINTS}")
+    
+    base = {
+        "ph": request.soil_data.ph,
+        "nitrogen": request.soil_data.nitrogen,
+        "phosphorus": request.soil_data.phosphorus,
+        "potassium": request.soil_data.potassium,
+        "organic_matter": request.soil_data.organic_matter,
+        "farm_size": request.farm_size,
+        "budget": request.budget if request.budget is not None else np.nan
+    }
+    grids = dict(zip(axes, np.meshgrid(*axes.values(), indexing="ij")))
+    columns = {
+        name: grids[name].ravel() if name in grids else np.full(size, value, dtype=np.float64)
+        for name, value in base.items()
+    }
+    scores = score_soil_batch(
+        rules.data,
+        target_crop=np.full(size, request.target_crop.value),
+        **columns
+    )
+    
+    return {
+        "axes": {name: points.tolist() for name, points in axes.items()},
+        "shape": list(shape),
+        "soil_health_score": np.reshape(scores.soil_health_score, shape).tolist(),
+        "fertility_status": scores.fertility_status.reshape(shape).tolist(),
+        "total_cost": np.round(scores.total_cost, 2).reshape(shape).tolist(),
+        "expected_yield_improvement": np.round(scores.expected_yield_improvement, 1).reshape(shape).tolist()
+    }
+
+@router.post("/what-if")
+async def soil_what_if(request: WhatIfRequest):
+    """
+    Outcomes over a grid of soil and budget values around a base sample, e.g.
+    pH 5.5-7.0 x nitrogen 100-300, so the UI can interpolate locally
+    """
+    try:
+        region = await asyncio.to_thread(price_region, request.soil_data.location)
+        grid = await asyncio.to_thread(what_if_grid, request, priced_rules(get_soil_rules(), region))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "target_crop": request.target_crop.value,
+        **grid
+    }
+
+def calculator_region(
+    region: Optional[str],
+    location: Optional[str],
+    lat: Optional[float] = None,
+    lon: Optional[float] = None
+) -> Optional[str]:
+    """
+    Regional factor key: an explicit district code or state, else the district
+    nearest the plot's coordinates within its state, else the resolved
+    location's own district, else that state. The state comes from the named
+    location, or from the nearest gazetteer place to the coordinates.
+    """
+    if region:
+        region = region.strip()
+        return region.upper() if get_district_factors().get(region) else state_key(region)
+    place = resolve_place(location)
+    located = lat is not None and lon is not None
+    if located and not place:
+        place = reverse_place(lat, lon)
+    if not place:
+        return None
+    districts = get_district_factors()
+    if located:
+        district = districts.locate(lat, lon, place.state)
+    else:
+        district = districts.find(place.state, place.district) or districts.locate(place.lat, place.lon, place.state)
+    return district.code if district else state_key(place.state)
+
+def plan_inputs(request: FertilizerPlanRequest) -> PlanInputs:
+    soil = request.soil_data
+    return PlanInputs(
+        crop=request.target_crop.value,
+        ph=soil.ph,
+        nitrogen=soil.nitrogen,
+        phosphorus=soil.phosphorus,
+        potassium=soil.potassium,
+        organic_matter=soil.organic_matter,
+        farm_size=request.farm_size,
+        planting_date=request.planting_date,
+        crop_price=request.crop_price,
+        target_yield=request.target_yield,
+        region=calculator_region(request.region, soil.location, request.lat, request.lon),
+        budget=request.budget,
+        organic_preference=request.organic_preference,
+        optimize=request.optimize,
+        whole_bags=request.whole_bags,
+        risk_scenarios=request.risk_scenarios
+    )
+
+@router.post("/plan")
+async def create_fertilizer_plan(request: FertilizerPlanRequest):
+    """
+    Complete fertilizer plan in one call: nutrient requirements, product mix,
+    dated application schedule and cost-benefit for the farm
+    """
+    inputs = plan_inputs(request)
+    try:
+        plan = await asyncio.to_thread(fertilizer_planner.plan, inputs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "target_crop": inputs.crop,
+        "region": inputs.region,
+        "farm_size": inputs.farm_size,
+        "planting_date": inputs.planting_date.isoformat(),
+        **asdict(plan)
+    }
+
+@router.post("/economic-optimum")
+async def get_economic_optimum(request: EconomicOptimumRequest):
+    """
+    Economically optimal N, P and K rates for current fertilizer and crop
+    prices, next to the fixed agronomic requirement. Rates and prices are per
+    kg of the element; `oxide_rate` gives the rate as N, P2O5 and K2O, the
+    form fertilizer labels use.
+    """
+    soil = request.soil_data
+    region = calculator_region(request.region, soil.location, request.lat, request.lon)
+    unknown = set(request.nutrient_prices or {}) - {"nitrogen", "phosphorus", "potassium"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown nutrients: {', '.join(sorted(unknown))}")
+    solver = NutrientEconomicsSolver()
+    try:
+        result = solver.optimal_rates(
+            request.target_crop.value,
+            SoilTestResult(soil.ph, soil.nitrogen, soil.phosphorus, soil.potassium, soil.organic_matter),
+            request.crop_price,
+            target_yield=request.target_yield,
+            region=region,
+            prices=request.nutrient_prices
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "target_crop": request.target_crop.value,
+        "region": region,
+        "catalog_version": solver.calculator.catalog.version,
+        "nutrients": {
+            nutrient: {
+                "economic_optimum": round(rate, 2),
+                "agronomic_requirement": round(result["requirements"][nutrient], 2),
+                "price_per_kg": round(result["nutrient_prices"][nutrient], 2),
+                "oxide_rate": round(rate * OXIDE_FACTOR[nutrient], 2)
+            }
+            for nutrient, rate in result["rates"].items()
+        },
+        "nutrient_cost_per_hectare": round(result["nutrient_cost"], 2),
+        "attainable_yield": result["attainable_yield"],
+        "unit": "kg/ha of elemental N, P, K",
+        "oxide_unit": "kg/ha of N, P2O5, K2O"
+    }
+
+PROCUREMENT_REQUIRED_COLUMNS = [
+    "target_crop", "area", "ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "planting_date"
+]
+
+def add_procurement_batch(
+    planner: ProcurementPlanner,
+    rows: List[Tuple[int, str]],
+    fmt: str,
+    header: Optional[List[str]]
+):
+    for (row, _), record in zip(rows, parse_upload_rows(rows, fmt, header)):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError(f"Invalid JSON: {record}")
+            plot = ProcurementPlot(**{key: value for key, value in record.items() if value not in (None, "")})
+        except (ValidationError, ValueError, TypeError) as e:
+            planner.reject(f"row {row}: {describe_error(e)}")
+            continue
+        planner.add_plot(PlotSpec(
+            crop=plot.target_crop.value,
+            area=plot.area,
+            ph=plot.ph,
+            nitrogen=plot.nitrogen,
+            phosphorus=plot.phosphorus,
+            potassium=plot.potassium,
+            organic_matter=plot.organic_matter,
+            planting_date=plot.planting_date,
+            region=calculator_region(plot.region, plot.location, plot.lat, plot.lon),
+            target_yield=plot.target_yield
+        ), label=f"row {row}" + (f" ({plot.plot_id})" if plot.plot_id else ""))
+
+@router.post("/procurement")
+async def plan_procurement(
+    request: Request,
+    order_cost: float = Query(DEFAULT_ORDER_COST, ge=0, description="Fixed cost per order in INR"),
+    holding_rate: float = Query(DEFAULT_HOLDING_RATE, ge=0, le=1, description="Holding cost per week, fraction of price"),
+    lead_weeks: int = Query(DEFAULT_LEAD_WEEKS, ge=0, le=26),
+    optimize: bool = Query(False, description="Solve each plot's mix over the whole catalog")
+):
+    """
+    Bulk fertilizer orders for a producer organisation
+    
+    Streams member plots as CSV (header row with target_crop, area, ph, nitrogen,
+    phosphorus, potassium, organic_matter, planting_date and optional plot_id,
+    region, location, lat, lon, target_yield) or NDJSON, aggregates every plot's schedule
+    into weekly demand per product and returns whole-bag order lots.
+    """
+    planner = ProcurementPlanner(optimize=optimize)
+    try:
+        async for rows, fmt, header in iter_upload_batches(request, PROCUREMENT_REQUIRED_COLUMNS):
+            await asyncio.to_thread(add_procurement_batch, planner, rows, fmt, header)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    orders = await asyncio.to_thread(planner.plan_orders, order_cost, holding_rate, lead_weeks)
+    logger.info(f"🚚 Procurement plan: {planner.plots} plots, {len(orders)} orders, {planner.rejected} rejected")
+    return {
+        "success": True,
+        "catalog_version": planner.catalog.version,
+        "plots": planner.plots,
+        "area": round(planner.area, 2),
+        "rejected": planner.rejected,
+        "errors": planner.errors,
+        "weekly_demand": {
+            product_id: [{"week": week.isoformat(), "kg": round(kg, 2)} for week, kg in weeks]
+            for product_id, weeks in planner.weekly_demand().items()
+        },
+        "orders": [asdict(order) for order in orders],
+        "total_purchase_cost": round(sum(order.purchase_cost for order in orders), 2),
+        "total_holding_cost": round(sum(order.holding_cost for order in orders), 2),
+        "total_order_cost": round(order_cost * len(orders), 2)
+    }
+
 @router.get("/fertilizer-prices")
-async def get_fertilizer_prices():
+async def get_fertilizer_prices(
+    region: Optional[str] = Query(None, description="State; its reported prices replace national ones")
+):
     """Get current fertilizer prices in INR per kg"""
+    snapshot = price_feed.current()
+    region = region_key(region)
+    region = region if region in snapshot.regional else None
     return {
         "success": True,
-        "prices": SOIL_ANALYSIS_DATA["fertilizer_costs"],
+        "prices": priced_rules(get_soil_rules(), region).fertilizer_costs,
+        "products": snapshot.costs(region),
+        "region": region,
         "currency": "INR",
         "unit": "per kg",
-        "last_updated": "2025-09-24"
+        "version": snapshot.version,
+        "last_updated": snapshot.effective_date,
+        "ingested_at": snapshot.ingested_at
+    }
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; without one configured they are off"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+
+@router.post("/fertilizer-prices", dependencies=[Depends(require_admin)])
+async def ingest_fertilizer_prices(
+    request: Request,
+    region: Optional[str] = Query(None, description="State the file's prices apply to; national if omitted"),
+    effective_date: Optional[date] = Query(None, description="Date the prices apply from; defaults to today")
+):
+    """
+    Ingest a CSV price file (product, price_per_kg and an optional region
+    column) as a new price version. Only cached analyses and plans priced
+    with a changed product are evicted.
+    """
+    text = (await request.body()).decode("utf-8-sig")
+    try:
+        update = await asyncio.to_thread(
+            price_feed.ingest_csv, text.splitlines(), "upload", effective_date, region
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "version": update.snapshot.version,
+        "effective_date": update.snapshot.effective_date,
+        "changed": sorted(update.changed)
+    }
+
+def invalidate_price_dependents(update: PriceUpdate):
+    """Evict the cached analyses and plan stages priced with a changed product"""
+    analyses = analysis_cache.invalidate(update.changed)
+    plans = fertilizer_planner.invalidate_products(update.changed)
+    logger.info(f"💰 Price version {update.snapshot.version}: evicted {analyses} analyses and {plans} plan stages")
+
+price_feed.subscribe(invalidate_price_dependents)
+
+@router.get("/benchmark")
+async def get_soil_benchmark(
+    location: Optional[str] = Query(None, description="Farm location; benchmarks its district, else state, else India"),
+    ph: Optional[float] = Query(None, ge=0, le=14),
+    nitrogen: Optional[float] = Query(None, ge=0),
+    phosphorus: Optional[float] = Query(None, ge=0),
+    potassium: Optional[float] = Query(None, ge=0),
+    organic_matter: Optional[float] = Query(None, ge=0),
+    soil_health_score: Optional[float] = Query(None, ge=0, le=100)
+):
+    """Percentile of soil test values among analyses from the same region, with the regional distribution"""
+    values = {
+        "ph": ph, "nitrogen": nitrogen, "phosphorus": phosphorus, "potassium": potassium,
+        "organic_matter": organic_matter, "soil_health_score": soil_health_score
+    }
+    benchmark = await asyncio.to_thread(lambda: soil_benchmarks.benchmark(resolve_regions(location), values))
+    return {
+        "success": True,
+        "location": resolve_location_name(location),
+        "metrics_supported": BENCHMARK_METRICS,
+        **benchmark
+    }
+
+def map_metric(metric: str) -> str:
+    if metric not in MAP_METRICS:
+        raise HTTPException(status_code=404, detail=f"Unknown soil map metric '{metric}'")
+    return metric
+
+def surface_values(values: np.ndarray) -> List[List[Optional[float]]]:
+    """Grid values for JSON, with empty cells as null"""
+    rounded = np.round(values, 2).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+@router.post("/map/samples")
+async def add_soil_map_samples(request: SoilMapSamplesRequest):
+    """Add geolocated lab samples to the soil map"""
+    samples = request.samples
+    added = soil_map.add_samples(
+        [s.lat for s in samples],
+        [s.lon for s in samples],
+        {metric: [getattr(s, metric) if getattr(s, metric) is not None else np.nan for s in samples]
+         for metric in MAP_METRICS}
+    )
+    await asyncio.to_thread(soil_map.flush)
+    return {"success": True, "added": added, "total_samples": soil_map.sample_count, "version": soil_map.version}
+
+@router.get("/map/estimate")
+async def estimate_plot_soil(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180)
+):
+    """Estimated soil pH and nutrients at a plot, interpolated from nearby samples"""
+    estimates = await asyncio.to_thread(
+        lambda: {metric: float(soil_map.estimate([lat], [lon], metric)[0]) for metric in MAP_METRICS}
+    )
+    return {
+        "success": True,
+        "lat": lat,
+        "lon": lon,
+        "estimates": {metric: None if np.isnan(v) else round(v, 2) for metric, v in estimates.items()},
+        "version": soil_map.version
+    }
+
+@router.get("/map/grid/{metric}")
+async def get_soil_map_grid(
+    metric: str,
+    min_lat: float = Query(..., ge=-90, le=90),
+    max_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lon: float = Query(..., ge=-180, le=180),
+    resolution: float = Query(0.01, gt=0.0005, le=1.0, description="Cell size in degrees")
+):
+    """Interpolated surface of one metric over a bounding box (e.g. a district)"""
+    metric = map_metric(metric)
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Bounding box minimum exceeds maximum")
+    try:
+        surface = await asyncio.to_thread(soil_map.grid, metric, min_lat, min_lon, max_lat, max_lon, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "metric": metric,
+        "resolution": resolution,
+        "lat": np.round(surface.lat, 6).tolist(),
+        "lon": np.round(surface.lon, 6).tolist(),
+        "values": surface_values(surface.values),
+        "version": surface.version
+    }
+
+@router.get("/map/tile/{metric}/{row}/{col}")
+async def get_soil_map_tile(
+    metric: str,
+    row: int,
+    col: int,
+    resolution: float = Query(0.01, gt=0.0005, le=1.0, description="Cell size in degrees")
+):
+    """One fixed tile of the global soil grid (tile 0/0 starts at 90S 180W)"""
+    metric = map_metric(metric)
+    rows, cols = (math.ceil(span / resolution / TILE_CELLS) for span in (180.0, 360.0))
+    if not (0 <= row < rows and 0 <= col < cols):
+        raise HTTPException(status_code=404, detail=f"Tile {row}/{col} is outside the {rows}x{cols} tile grid")
+    values = await asyncio.to_thread(soil_map.tile, metric, resolution, row, col)
+    return {
+        "success": True,
+        "metric": metric,
+        "resolution": resolution,
+        "row": row,
+        "col": col,
+        "values": surface_values(values),
+        "version": soil_map.version
     }
 
 @router.get("/crop-requirements/{crop_type}")
 async def get_crop_requirements(crop_type: CropType):
     """Get soil and nutrient requirements for a specific crop"""
     
-    requirements = SOIL_ANALYSIS_DATA["crop_requirements"].get(crop_type.value)
+    requirements = get_soil_rules().crop_requirements.get(crop_type.value)
     
     if not requirements:
         raise HTTPException(status_code=404, detail="Crop requirements not found")
@@ -434,7 +1283,7 @@ async def get_crop_requirements(crop_type: CropType):
 
 @router.post("/quick-test")
 async def quick_soil_test(
-    ph: float = Field(..., ge=3.0, le=11.0),
+    ph: float = Query(..., ge=3.0, le=11.0),
     crop: CropType = CropType.RICE
 ):
     """Quick soil test with minimal inputs - useful for demo purposes"""
@@ -477,17 +1326,43 @@ async def quick_soil_test(
     
     return await analyze_soil(request, BackgroundTasks())
 
-async def log_soil_analysis(soil_data: dict, crop: str, health_score: float):
+async def log_soil_analysis(
+    soil_data: dict,
+    crop: str,
+    health_score: float,
+    farm_size: Optional[float] = None,
+    total_cost: Optional[float] = None
+):
     """Log soil analysis for analytics (background task)"""
     try:
-        # This would typically save to database or analytics service
-        logger.info(f"Soil analysis logged: Crop={crop}, Score={health_score}, pH={soil_data.get('ph')}")
+        # Queued for the batch writer; never waits on the database
+        get_analytics_sink().record({
+            "crop": crop,
+            "soil_type": soil_data.get("soil_type"),
+            "location": soil_data.get("location"),
+            "health_score": health_score,
+            "ph": soil_data.get("ph"),
+            "nitrogen": soil_data.get("nitrogen"),
+            "phosphorus": soil_data.get("phosphorus"),
+            "potassium": soil_data.get("potassium"),
+            "organic_matter": soil_data.get("organic_matter"),
+            "farm_size": farm_size,
+            "total_cost": total_cost
+        })
+        # Sketch loads and periodic persists hit SQLite; keep them off the event loop
+        await asyncio.to_thread(
+            lambda: soil_benchmarks.add(
+                resolve_regions(soil_data.get("location")), dict(soil_data, soil_health_score=health_score)
+            )
+        )
+        logger.debug(f"Soil analysis logged: Crop={crop}, Score={health_score}, pH={soil_data.get('ph')}")
     except Exception as e:
         logger.error(f"Failed to log soil analysis: {e}")
 
 @router.get("/health")
 async def health_check():
     """Health check for soil analysis service"""
+    rules = get_soil_rules()
     return {
         "status": "healthy",
         "service": "Soil Analysis",
@@ -497,6 +1372,11 @@ async def health_check():
             "crop_recommendations": True,
             "budget_optimization": True
         },
-        "supported_crops": len(SOIL_ANALYSIS_DATA["crop_requirements"]),
-        "supported_fertilizers": len(SOIL_ANALYSIS_DATA["fertilizer_costs"])
+        "supported_crops": len(rules.crop_requirements),
+        "supported_fertilizers": len(rules.fertilizer_costs),
+        "rules_version": rules.version,
+        "price_version": price_feed.current().version,
+        "analysis_cache": analysis_cache.stats(),
+        "plan_cache": fertilizer_planner.stats(),
+        "analytics": get_analytics_sink().stats()
     }
\ No newline at end of file
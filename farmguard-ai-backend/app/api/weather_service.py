@@ -4,15 +4,26 @@ Provides reliable real-time weather data with enhanced alert system
 """
 
 from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import httpx
 import asyncio
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, date
 import os
 import logging
 from enum import Enum
 
+from app.core.config import settings
+from app.api.soil_analysis import CropType, SoilType
+from app.services.forecast_store import ForecastStore, StoredForecast, StoredForecastDay, cell_id
+from app.services.irrigation import (
+    PlotArrays, WeatherArrays, encode_crops, encode_soils, reference_evapotranspiration, schedule_irrigation
+)
+from app.services.climatology import ClimatologyEngine, DroughtSignal
+from app.services.pest_risk import PEST_NAMES, PestRiskEngine, risk_level
+from app.services.gazetteer import get_gazetteer
+
 logger = logging.getLogger(__name__)
 
 # Weather API configuration
@@ -23,6 +34,14 @@ WEATHERAPI_KEY = os.getenv("WEATHERAPI_KEY", "")
 
 router = APIRouter()
 
+# Local time-series store of every fetched forecast (offline fallback + history)
+forecast_store = ForecastStore()
+climatology = ClimatologyEngine(forecast_store)
+pest_risk = PestRiskEngine(forecast_store)
+
+# Caps concurrent weather lookups from batch endpoints (one per forecast cell)
+weather_fetch_slots = asyncio.Semaphore(settings.WEATHER_FETCH_CONCURRENCY)
+
 class AlertSeverity(str, Enum):
     LOW = "low"
     MEDIUM = "medium" 
@@ -80,8 +99,74 @@ class WeatherServiceResponse(BaseModel):
     source: str
     timestamp: str
     cached: bool = False
+    stale: bool = False
+    data_age_seconds: Optional[int] = None
+    error: Optional[str] = None
+
+class ForecastHistoryDay(BaseModel):
+    date: str
+    high: int
+    low: int
+    condition: str
+    humidity: int
+    windSpeed: int
+    rainfall: int
+    visibility: int
+    fetchedAt: str
+
+class ForecastHistoryResponse(BaseModel):
+    success: bool
+    lat: float
+    lon: float
+    start: str
+    end: str
+    days: List[ForecastHistoryDay]
+
+class IrrigationPlot(BaseModel):
+    plotId: str
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    crop: CropType
+    soilType: SoilType = SoilType.LOAMY
+    sowingDate: date
+    areaHa: float = Field(1.0, gt=0, description="Plot area in hectares")
+    currentDepletionMm: float = Field(0.0, ge=0, description="Root-zone water deficit today (0 = field capacity)")
+
+class IrrigationScheduleRequest(BaseModel):
+    plots: List[IrrigationPlot] = Field(..., min_length=1, max_length=10000)
+    efficiency: float = Field(0.7, gt=0, le=1, description="Irrigation application efficiency")
+
+class PestRiskPlot(BaseModel):
+    plotId: str
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    crop: CropType
+    sowingDate: date
+
+class PestRiskRegistration(BaseModel):
+    plots: List[PestRiskPlot] = Field(..., min_length=1, max_length=10000)
+
+class IrrigationDay(BaseModel):
+    date: str
+    et0: float
+    etc: float
+    netIrrigationMm: float
+    grossIrrigationMm: float
+    volumeM3: float
+
+class PlotIrrigationSchedule(BaseModel):
+    plotId: str
+    source: Optional[str] = None
+    days: List[IrrigationDay] = []
+    totalGrossIrrigationMm: float = 0
+    nextIrrigationDate: Optional[str] = None
     error: Optional[str] = None
 
+class IrrigationScheduleResponse(BaseModel):
+    success: bool
+    plots: List[PlotIrrigationSchedule]
+    timestamp: str
+
 async def fetch_openweather_data(lat: float, lon: float) -> Optional[Dict[Any, Any]]:
     """Fetch weather data from OpenWeatherMap API"""
     try:
@@ -163,6 +248,8 @@ def process_openweather_data(data: Dict[Any, Any]) -> WeatherResponse:
         avg_visibility = round((hours[0].get("visibility", 10000) / 1000))  # m to km
         
         day_name = day_names[index] if index < 2 else datetime.strptime(date, "%Y-%m-%d").strftime("%A")
+        et0 = daily_et0(high, low, avg_humidity, avg_wind_speed, data["city"]["coord"]["lat"],
+                        datetime.strptime(date, "%Y-%m-%d").timetuple().tm_yday)
         
         forecast.append(ProcessedWeatherData(
             date=date,
@@ -175,7 +262,7 @@ def process_openweather_data(data: Dict[Any, Any]) -> WeatherResponse:
             windSpeed=avg_wind_speed,
             rainfall=total_rainfall,
             visibility=avg_visibility,
-            farmingRecommendations=generate_farming_recommendations(condition, total_rainfall, avg_wind_speed)
+            farmingRecommendations=generate_farming_recommendations(condition, total_rainfall, avg_wind_speed, et0)
         ))
     
     # Generate alerts
@@ -207,7 +294,11 @@ def map_weather_icon(condition: str) -> str:
     }
     return icon_map.get(condition, "partly-cloudy")
 
-def generate_farming_recommendations(condition: str, rainfall: int, wind_speed: int) -> List[str]:
+def daily_et0(high: float, low: float, humidity: float, wind_speed: float, lat: float, day_of_year: int) -> float:
+    """Reference evapotranspiration (mm/day) for one forecast day"""
+    return round(float(reference_evapotranspiration(high, low, humidity, wind_speed, lat, day_of_year)), 1)
+
+def generate_farming_recommendations(condition: str, rainfall: int, wind_speed: int, et0: Optional[float] = None) -> List[str]:
     """Generate farming recommendations based on weather"""
     recommendations = []
     
@@ -225,9 +316,17 @@ def generate_farming_recommendations(condition: str, rainfall: int, wind_speed:
             "Irrigation needs may be reduced"
         ])
     else:
+        if et0 is None:
+            irrigation_advice = "Consider irrigation if soil moisture is low"
+        elif et0 >= 6:
+            irrigation_advice = f"High crop water demand (ET0 {et0} mm/day) - irrigate crops at critical stages"
+        elif et0 >= 3:
+            irrigation_advice = f"Moderate crop water demand (ET0 {et0} mm/day) - irrigate if topsoil is dry"
+        else:
+            irrigation_advice = f"Low crop water demand (ET0 {et0} mm/day) - irrigation can be delayed"
         recommendations.extend([
             "Good weather for field operations",
-            "Consider irrigation if soil moisture is low",
+            irrigation_advice,
             "Ideal time for spraying if needed"
         ])
     
@@ -383,6 +482,64 @@ def generate_weather_alerts(forecast: List[ProcessedWeatherData]) -> List[Weathe
     
     return sorted(alerts, key=lambda x: ["low", "medium", "high", "extreme", "critical"].index(x.severity))
 
+def generate_drought_alerts(signals: List[DroughtSignal]) -> List[WeatherAlert]:
+    """Generate drought alerts from accumulated climatology signals"""
+    alerts = []
+    
+    for signal in signals:
+        severity = AlertSeverity.HIGH if signal.severity == "high" else AlertSeverity.MEDIUM
+        
+        if signal.kind == "dry_spell":
+            alerts.append(WeatherAlert(
+                id=f"dry-spell-{signal.as_of.isoformat()}",
+                type="warning" if severity == AlertSeverity.HIGH else "advisory",
+                title="🏜️ PROLONGED DRY SPELL",
+                description=f"No significant rain for {signal.consecutive_dry_days} consecutive days during the cropping season.",
+                severity=severity,
+                validUntil=(datetime.now() + timedelta(days=1)).isoformat(),
+                category=AlertCategory.DROUGHT,
+                impact="Moisture stress on standing crops. Germination and tillering at risk.",
+                recommendedActions=[
+                    "PRIORITIZE irrigation for crops at critical growth stages",
+                    "APPLY mulch to conserve soil moisture",
+                    "DELAY fertilizer top dressing until soil moisture improves",
+                    "CONSIDER short-duration varieties for late sowing"
+                ]
+            ))
+        else:
+            alerts.append(WeatherAlert(
+                id=f"rainfall-deficit-{signal.as_of.isoformat()}",
+                type="warning" if severity == AlertSeverity.HIGH else "advisory",
+                title="🌵 RAINFALL DEFICIT - DROUGHT RISK",
+                description=f"Rainfall over the last {signal.window_days} days is {signal.rainfall_deficit_pct}% below normal.",
+                severity=severity,
+                validUntil=(datetime.now() + timedelta(days=1)).isoformat(),
+                category=AlertCategory.DROUGHT,
+                impact="Reduced soil moisture and groundwater recharge. Yield loss likely without irrigation.",
+                recommendedActions=[
+                    "SCHEDULE irrigation based on crop water demand",
+                    "USE drip or sprinkler irrigation where available",
+                    "MONITOR crops for wilting during afternoon hours",
+                    "PLAN contingency crops with local extension officers"
+                ]
+            ))
+    
+    return alerts
+
+def attach_drought_alerts(weather: WeatherResponse, lat: float, lon: float):
+    """Add drought alerts from the running climatology of the location's cell"""
+    try:
+        drought_alerts = generate_drought_alerts(climatology.drought_signals(lat, lon))
+    except Exception as e:
+        logger.error(f"Climatology lookup failed: {e}")
+        return
+    
+    if drought_alerts:
+        weather.alerts = sorted(
+            weather.alerts + drought_alerts,
+            key=lambda x: ["low", "medium", "high", "extreme", "critical"].index(x.severity)
+        )
+
 def get_enhanced_mock_weather() -> WeatherResponse:
     """Generate enhanced mock weather data with severe conditions"""
     import random
@@ -457,18 +614,120 @@ def get_enhanced_mock_weather() -> WeatherResponse:
         lastUpdated=datetime.now().isoformat()
     )
 
+def save_forecast_to_store(lat: float, lon: float, weather: WeatherResponse, source: str):
+    """Persist a processed forecast in compact form (runs in a worker thread)"""
+    forecast_store.save_forecast(
+        lat,
+        lon,
+        weather.location.name,
+        weather.location.country,
+        [
+            StoredForecastDay(
+                day=date.fromisoformat(day.date),
+                high=day.high,
+                low=day.low,
+                humidity=day.humidity,
+                wind_speed=day.windSpeed,
+                rainfall=day.rainfall,
+                visibility=day.visibility,
+                condition=day.condition
+            )
+            for day in weather.forecast
+        ],
+        source
+    )
+    climatology.update(lat, lon)
+    pest_risk.update(lat, lon)
+
+def build_weather_from_store(stored: StoredForecast) -> WeatherResponse:
+    """Rebuild a full weather response (recommendations, alerts) from a stored forecast"""
+    today = date.today()
+    forecast = []
+    
+    for day in stored.days:
+        offset = (day.day - today).days
+        day_name = "Today" if offset == 0 else "Tomorrow" if offset == 1 else day.day.strftime("%A")
+        forecast.append(ProcessedWeatherData(
+            date=day.day.isoformat(),
+            day=day_name,
+            high=day.high,
+            low=day.low,
+            condition=day.condition,
+            icon=map_weather_icon(day.condition),
+            humidity=day.humidity,
+            windSpeed=day.wind_speed,
+            rainfall=day.rainfall,
+            visibility=day.visibility,
+            farmingRecommendations=generate_farming_recommendations(
+                day.condition, day.rainfall, day.wind_speed,
+                daily_et0(day.high, day.low, day.humidity, day.wind_speed, stored.lat, day.day.timetuple().tm_yday)
+            )
+        ))
+    
+    return WeatherResponse(
+        location=WeatherLocation(name=stored.name, country=stored.country, lat=stored.lat, lon=stored.lon),
+        forecast=forecast,
+        alerts=generate_weather_alerts(forecast),
+        lastUpdated=datetime.fromtimestamp(stored.fetched_at).isoformat()
+    )
+
+async def load_stored_weather(lat: float, lon: float, max_age: Optional[int] = None) -> Optional[WeatherServiceResponse]:
+    """Serve the last known forecast for a location with staleness metadata"""
+    try:
+        stored = await asyncio.to_thread(forecast_store.latest_forecast, lat, lon)
+    except Exception as e:
+        logger.error(f"Forecast store read failed: {e}")
+        return None
+    
+    if stored is None or (max_age is not None and stored.age_seconds > max_age):
+        return None
+    
+    age = stored.age_seconds
+    weather = build_weather_from_store(stored)
+    await asyncio.to_thread(attach_drought_alerts, weather, lat, lon)
+    
+    return WeatherServiceResponse(
+        success=True,
+        data=weather,
+        source=f"local-store:{stored.source}",
+        timestamp=datetime.now().isoformat(),
+        cached=True,
+        stale=age > settings.WEATHER_CACHE_TTL,
+        data_age_seconds=age
+    )
+
 @router.get("/weather", response_model=WeatherServiceResponse)
 async def get_weather_data(
     lat: float = Query(30.9010, description="Latitude"),
     lon: float = Query(75.8573, description="Longitude"),
+    place: Optional[str] = Query(None, description="Village, town or district name (overrides lat/lon)"),
     force_refresh: bool = Query(False, description="Force refresh data")
 ):
     """
     Get weather data with enhanced alerts for farming
     """
+    if place:
+        resolved = get_gazetteer().resolve(place)
+        if resolved is None:
+            raise HTTPException(status_code=404, detail=f"Unknown place '{place}'")
+        
+        response = await fetch_weather_response(resolved.lat, resolved.lon, force_refresh)
+        response.data.location.name = resolved.canonical_name
+        return response
+    
+    return await fetch_weather_response(lat, lon, force_refresh)
+
+async def fetch_weather_response(lat: float, lon: float, force_refresh: bool = False) -> WeatherServiceResponse:
+    """Weather lookup chain: local store, providers, last known forecast, mock data"""
     try:
         logger.info(f"🌦️ Weather request: lat={lat}, lon={lon}")
         
+        # Serve a fresh stored forecast without hitting the network
+        if not force_refresh:
+            stored_response = await load_stored_weather(lat, lon, max_age=settings.WEATHER_CACHE_TTL)
+            if stored_response:
+                return stored_response
+        
         # Try OpenWeatherMap first
         weather_data = await fetch_openweather_data(lat, lon)
         
@@ -476,6 +735,12 @@ async def get_weather_data(
             processed_data = process_openweather_data(weather_data)
             logger.info(f"✅ OpenWeatherMap data processed: {len(processed_data.forecast)} days")
             
+            try:
+                await asyncio.to_thread(save_forecast_to_store, lat, lon, processed_data, "openweathermap-api")
+            except Exception as e:
+                logger.error(f"Failed to store forecast: {e}")
+            await asyncio.to_thread(attach_drought_alerts, processed_data, lat, lon)
+            
             return WeatherServiceResponse(
                 success=True,
                 data=processed_data,
@@ -490,6 +755,12 @@ async def get_weather_data(
             logger.info("✅ Using WeatherAPI fallback")
             # For now, fall through to mock data
         
+        # Providers unreachable - serve the last known forecast
+        stored_response = await load_stored_weather(lat, lon)
+        if stored_response:
+            logger.info(f"📦 Serving stored forecast ({stored_response.data_age_seconds}s old)")
+            return stored_response
+        
         # Use enhanced mock data as final fallback
         logger.info("📊 Using enhanced mock weather data")
         mock_data = get_enhanced_mock_weather()
@@ -504,6 +775,11 @@ async def get_weather_data(
     except Exception as e:
         logger.error(f"❌ Weather service error: {e}")
         
+        stored_response = await load_stored_weather(lat, lon)
+        if stored_response:
+            stored_response.error = "Serving last known forecast"
+            return stored_response
+        
         # Emergency fallback
         emergency_data = WeatherResponse(
             location=WeatherLocation(name="Ludhiana", country="IN", lat=lat, lon=lon),
@@ -532,4 +808,257 @@ async def get_weather_data(
             source="emergency-fallback",
             timestamp=datetime.now().isoformat(),
             error="Using emergency fallback data"
-        )
\ No newline at end of file
+        )
+
+@router.get("/geocode")
+async def geocode_place(
+    q: str = Query(..., min_length=1, description="Place name, optionally qualified: 'Khanna, Punjab'"),
+    limit: int = Query(5, ge=1, le=50)
+):
+    """
+    Resolve a village, town or district name using the offline gazetteer
+    """
+    places = get_gazetteer().search(q, limit=limit)
+    return {
+        "success": True,
+        "query": q,
+        "results": [
+            {**place.__dict__, "canonical_name": place.canonical_name}
+            for place in places
+        ]
+    }
+
+@router.get("/geocode/reverse")
+async def reverse_geocode(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude")
+):
+    """
+    Find the nearest known place to a coordinate using the offline gazetteer
+    """
+    result = get_gazetteer().reverse(lat, lon)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Gazetteer is empty")
+    
+    place, distance_km = result
+    return {
+        "success": True,
+        "place": {**place.__dict__, "canonical_name": place.canonical_name},
+        "distance_km": distance_km
+    }
+
+@router.get("/climatology")
+async def get_climatology(
+    lat: float = Query(30.9010, description="Latitude"),
+    lon: float = Query(75.8573, description="Longitude")
+):
+    """
+    Get running rainfall deficit, dry-spell and temperature anomaly aggregates for a location
+    """
+    summary = await asyncio.to_thread(climatology.summary, lat, lon)
+    alerts = generate_drought_alerts(await asyncio.to_thread(climatology.drought_signals, lat, lon))
+    
+    return {
+        "success": True,
+        "lat": lat,
+        "lon": lon,
+        "climatology": summary,
+        "alerts": alerts
+    }
+
+@router.get("/weather/history", response_model=ForecastHistoryResponse)
+async def get_weather_history(
+    lat: float = Query(30.9010, description="Latitude"),
+    lon: float = Query(75.8573, description="Longitude"),
+    start: date = Query(..., description="First day (YYYY-MM-DD)"),
+    end: date = Query(..., description="Last day (YYYY-MM-DD)")
+):
+    """
+    Get stored daily forecasts for a location over a date range
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    days = await asyncio.to_thread(forecast_store.history, lat, lon, start, end)
+    
+    return ForecastHistoryResponse(
+        success=True,
+        lat=lat,
+        lon=lon,
+        start=start.isoformat(),
+        end=end.isoformat(),
+        days=[
+            ForecastHistoryDay(
+                date=day.day.isoformat(),
+                high=day.high,
+                low=day.low,
+                condition=day.condition,
+                humidity=day.humidity,
+                windSpeed=day.wind_speed,
+                rainfall=day.rainfall,
+                visibility=day.visibility,
+                fetchedAt=datetime.fromtimestamp(day.fetched_at).isoformat()
+            )
+            for day in days
+        ]
+    )
+
+@router.post("/irrigation/schedule", response_model=IrrigationScheduleResponse)
+async def get_irrigation_schedule(request: IrrigationScheduleRequest):
+    """
+    Schedule irrigation for a batch of plots from the local or freshly fetched forecast
+    """
+    # One forecast lookup per store cell, shared by every plot inside it
+    cells: Dict[int, IrrigationPlot] = {}
+    for plot in request.plots:
+        cells.setdefault(cell_id(plot.lat, plot.lon), plot)
+    
+    async def fetch_bounded(plot: IrrigationPlot) -> WeatherServiceResponse:
+        async with weather_fetch_slots:
+            return await fetch_weather_response(plot.lat, plot.lon)
+    
+    responses = await asyncio.gather(*(fetch_bounded(p) for p in cells.values()))
+    forecasts = {
+        cell: response.data.forecast
+        for cell, response in zip(cells, responses)
+        if response.source == "openweathermap-api" or response.source.startswith("local-store:")
+    }
+    sources = {cell: response.source for cell, response in zip(cells, responses)}
+    
+    results: Dict[int, PlotIrrigationSchedule] = {}
+    scheduled = []
+    for index, plot in enumerate(request.plots):
+        cell = cell_id(plot.lat, plot.lon)
+        if cell in forecasts:
+            scheduled.append((index, plot, cell))
+        else:
+            results[index] = PlotIrrigationSchedule(
+                plotId=plot.plotId, source=sources[cell], error="No real forecast available for this location"
+            )
+    
+    # Plots whose forecasts cover the same dates are scheduled together, so every
+    # plot keeps its own horizon and each column of a batch is one calendar day
+    groups: Dict[tuple, List[tuple]] = {}
+    for entry in scheduled:
+        groups.setdefault(tuple(day.date for day in forecasts[entry[2]]), []).append(entry)
+    
+    for day_keys, members in groups.items():
+        dates = [date.fromisoformat(key) for key in day_keys]
+        rows = [forecasts[cell] for _, _, cell in members]
+        
+        def column(name: str):
+            return np.array([[getattr(day, name) for day in row] for row in rows], dtype=np.float64)
+        
+        plots = PlotArrays(
+            lat=np.array([plot.lat for _, plot, _ in members]),
+            crop_code=encode_crops([plot.crop for _, plot, _ in members]),
+            soil_code=encode_soils([plot.soilType for _, plot, _ in members]),
+            days_after_planting=np.array([(dates[0] - plot.sowingDate).days for _, plot, _ in members]),
+            initial_depletion_mm=np.array([plot.currentDepletionMm for _, plot, _ in members]),
+            area_ha=np.array([plot.areaHa for _, plot, _ in members])
+        )
+        weather = WeatherArrays(
+            tmax=column("high"),
+            tmin=column("low"),
+            humidity=column("humidity"),
+            wind_kmh=column("windSpeed"),
+            rainfall=column("rainfall"),
+            day_of_year=np.array([d.timetuple().tm_yday for d in dates])
+        )
+        schedule = await asyncio.to_thread(schedule_irrigation, plots, weather, request.efficiency)
+        
+        for i, (index, plot, cell) in enumerate(members):
+            irrigation_days = [
+                IrrigationDay(
+                    date=dates[d].isoformat(),
+                    et0=round(float(schedule.et0[i, d]), 2),
+                    etc=round(float(schedule.etc[i, d]), 2),
+                    netIrrigationMm=round(float(schedule.net_irrigation_mm[i, d]), 1),
+                    grossIrrigationMm=round(float(schedule.gross_irrigation_mm[i, d]), 1),
+                    volumeM3=round(float(schedule.volume_m3[i, d]), 1)
+                )
+                for d in range(len(dates))
+            ]
+            next_day = next((day.date for day in irrigation_days if day.netIrrigationMm > 0), None)
+            results[index] = PlotIrrigationSchedule(
+                plotId=plot.plotId,
+                source=sources[cell],
+                days=irrigation_days,
+                totalGrossIrrigationMm=round(float(schedule.gross_irrigation_mm[i].sum()), 1),
+                nextIrrigationDate=next_day
+            )
+    
+    logger.info(f"💧 Irrigation schedule: {len(scheduled)}/{len(request.plots)} plots across {len(cells)} cells")
+    
+    return IrrigationScheduleResponse(
+        success=True,
+        plots=[results[index] for index in range(len(request.plots))],
+        timestamp=datetime.now().isoformat()
+    )
+
+@router.post("/pest-risk/plots")
+async def register_pest_risk_plots(request: PestRiskRegistration):
+    """
+    Register plots for degree-day and leaf-wetness tracking (re-registering resets a plot)
+    """
+    registered = await asyncio.to_thread(
+        pest_risk.register_plots,
+        [(p.plotId, p.lat, p.lon, p.crop.value, p.sowingDate) for p in request.plots]
+    )
+    return {"success": True, "registered": registered}
+
+@router.get("/pest-risk/plots/{plot_id}")
+async def get_plot_pest_risk(plot_id: str):
+    """
+    Get accumulated degree-days, leaf wetness and ranked pest risks for a plot
+    """
+    risk = await asyncio.to_thread(pest_risk.plot_risk, plot_id)
+    if risk is None:
+        raise HTTPException(status_code=404, detail=f"Plot '{plot_id}' is not registered")
+    return {"success": True, **risk}
+
+@router.get("/pest-risk/map")
+async def get_pest_risk_map(
+    min_lat: float = Query(-90, ge=-90, le=90),
+    max_lat: float = Query(90, ge=-90, le=90),
+    min_lon: float = Query(-180, ge=-180, le=180),
+    max_lon: float = Query(180, ge=-180, le=180),
+    pest: Optional[str] = Query(None, description="Limit the map to one pest")
+):
+    """
+    Get per-cell pest risk aggregates for all registered plots inside a bounding box
+    """
+    if pest is not None and pest not in PEST_NAMES:
+        raise HTTPException(status_code=404, detail=f"Unknown pest '{pest}'")
+    
+    risk_map = await asyncio.to_thread(pest_risk.region_map)
+    columns = [PEST_NAMES.index(pest)] if pest else range(len(PEST_NAMES))
+    inside = np.flatnonzero(
+        (risk_map.lat >= min_lat) & (risk_map.lat <= max_lat) &
+        (risk_map.lon >= min_lon) & (risk_map.lon <= max_lon)
+    )
+    
+    regions = []
+    for i in inside:
+        risks = [
+            {
+                "pest": PEST_NAMES[j],
+                "plots": int(risk_map.plots[i, j]),
+                "mean_score": float(risk_map.mean_score[i, j]),
+                "max_score": float(risk_map.max_score[i, j]),
+                "level": risk_level(risk_map.mean_score[i, j]),
+                "high_risk_plots": int(risk_map.high_risk_plots[i, j])
+            }
+            for j in columns
+            if risk_map.plots[i, j] > 0
+        ]
+        if risks:
+            regions.append({
+                "cell": int(risk_map.cells[i]),
+                "lat": round(float(risk_map.lat[i]), 4),
+                "lon": round(float(risk_map.lon[i]), 4),
+                "risks": risks
+            })
+    
+    return {"success": True, "regions": regions}
+
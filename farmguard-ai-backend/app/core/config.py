@@ -4,7 +4,11 @@ Configuration settings for FARMGUARD AI Backend
 
 import os
 from typing import List, Optional
-from pydantic import BaseSettings
+
+try:
+    from pydantic_settings import BaseSettings
+except ImportError:  # pydantic v1
+    from pydantic import BaseSettings
 
 class Settings(BaseSettings):
     """Application settings"""
@@ -52,14 +56,30 @@ class Settings(BaseSettings):
     CACHE_TYPE: str = os.getenv("CACHE_TYPE", "memory")  # memory, redis, file
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "3600"))  # 1 hour
     REDIS_URL: Optional[str] = os.getenv("REDIS_URL")
+    SOIL_ANALYSIS_CACHE_SIZE: int = int(os.getenv("SOIL_ANALYSIS_CACHE_SIZE", "4096"))
+    FERTILIZER_PLAN_CACHE_SIZE: int = int(os.getenv("FERTILIZER_PLAN_CACHE_SIZE", "1024"))  # entries per plan stage
     
     # Database settings
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./data/farmguard.db")
     
+    # Analytics sink settings
+    ANALYTICS_DATABASE_URL: Optional[str] = os.getenv("ANALYTICS_DATABASE_URL")  # defaults to DATABASE_URL
+    ANALYTICS_FLUSH_SIZE: int = int(os.getenv("ANALYTICS_FLUSH_SIZE", "500"))
+    ANALYTICS_FLUSH_INTERVAL: float = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2.0"))  # seconds
+    ANALYTICS_QUEUE_SIZE: int = int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000"))
+    ANALYTICS_OVERFLOW: str = os.getenv("ANALYTICS_OVERFLOW", "spill")  # spill, drop
+    ANALYTICS_SPILL_PATH: str = os.getenv("ANALYTICS_SPILL_PATH", "./data/analytics_spill.jsonl")
+    SOIL_MAP_TILE_CACHE_SIZE: int = int(os.getenv("SOIL_MAP_TILE_CACHE_SIZE", "2048"))
+    SOIL_BENCHMARK_PERSIST_INTERVAL: float = float(os.getenv("SOIL_BENCHMARK_PERSIST_INTERVAL", "60"))  # seconds
+    
+    # Local forecast store settings
+    FORECAST_CELL_SIZE_DEG: float = float(os.getenv("FORECAST_CELL_SIZE_DEG", "0.1"))
+    
     # Weather API settings  
     WEATHER_API_KEY: Optional[str] = os.getenv("WEATHER_API_KEY")
     WEATHER_API_URL: str = "https://api.openweathermap.org/data/2.5"
     WEATHER_CACHE_TTL: int = int(os.getenv("WEATHER_CACHE_TTL", "1800"))  # 30 minutes
+    WEATHER_FETCH_CONCURRENCY: int = int(os.getenv("WEATHER_FETCH_CONCURRENCY", "8"))
     
     # Logging settings
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -68,6 +88,7 @@ class Settings(BaseSettings):
     # Security settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")  # X-Admin-Token for admin endpoints; unset disables them
     
     # Feature flags
     ENABLE_SPEECH_TO_TEXT: bool = os.getenv("ENABLE_SPEECH_TO_TEXT", "true").lower() == "true"
@@ -80,6 +101,12 @@ class Settings(BaseSettings):
     DATA_DIR: str = os.getenv("DATA_DIR", "./data")
     KNOWLEDGE_BASE_PATH: str = os.path.join(DATA_DIR, "agricultural_knowledge.json")
     CROP_PRICES_PATH: str = os.path.join(DATA_DIR, "crop_prices.json")
+    GAZETTEER_PATH: str = os.getenv("GAZETTEER_PATH", os.path.join(DATA_DIR, "gazetteer.bin"))
+    GAZETTEER_SOURCE_PATH: Optional[str] = os.getenv("GAZETTEER_SOURCE_PATH")  # defaults to bundled CSV
+    SOIL_RULES_PATH: Optional[str] = os.getenv("SOIL_RULES_PATH")  # defaults to bundled JSON, hot-reloaded
+    FERTILIZER_CATALOG_PATH: Optional[str] = os.getenv("FERTILIZER_CATALOG_PATH")  # defaults to bundled JSON, hot-reloaded
+    DISTRICT_FACTORS_PATH: Optional[str] = os.getenv("DISTRICT_FACTORS_PATH")  # surveyed district CSV; state factors without it
+    PRICE_SNAPSHOT_DIR: str = os.getenv("PRICE_SNAPSHOT_DIR", os.path.join(DATA_DIR, "price_snapshots"))
     
     # Agricultural knowledge settings
     SUPPORTED_LANGUAGES: List[str] = ["en", "hi", "kn", "pa", "ta"]
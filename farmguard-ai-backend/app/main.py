@@ -10,6 +10,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -17,6 +18,8 @@ from contextlib import asynccontextmanager
 from app.api import ai_chat, weather, market, crops, soil_analysis
 from app.core.config import settings
 from app.core.cache import CacheManager
+from app.services.analytics_sink import close_analytics_sink
+from app.services.gazetteer import get_gazetteer
 from app.models.llm_service import LLMService
 
 # Configure logging
@@ -37,6 +40,10 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Starting FARMGUARD AI Backend...")
     
     try:
+        # Open the offline gazetteer; a first start compiles it from the source CSV
+        gazetteer = await asyncio.to_thread(get_gazetteer)
+        logger.info(f"✅ Gazetteer loaded ({gazetteer.count} places)")
+        
         # Initialize cache
         await cache_manager.initialize()
         logger.info("✅ Cache manager initialized")
@@ -60,6 +67,9 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 Shutting down FARMGUARD AI Backend...")
     await cache_manager.close()
     await llm_service.close()
+    close_analytics_sink()
+    await asyncio.to_thread(soil_analysis.soil_benchmarks.persist)
+    await asyncio.to_thread(soil_analysis.soil_map.flush)
     logger.info("✅ Cleanup completed")
 
 # Create FastAPI app
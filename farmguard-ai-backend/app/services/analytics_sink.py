@@ -0,0 +1,280 @@
+"""
+Analytics Sink Service for FARMGUARD
+
+Buffers soil analysis events in a bounded in-memory queue and writes them
+to the database (SQLite or Postgres via SQLAlchemy) in batches from a
+background thread. Recording an event never blocks the request: when the
+queue is full, events are spilled to a JSONL file (replayed once the
+database catches up) or dropped, depending on configuration. Spilling is
+done by the writer thread too; the request only hands the event over.
+Replay commits its progress chunk by chunk, so a crash mid-replay re-sends
+at most one batch instead of losing the spill file.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_MODES = ("spill", "drop")
+FAILURE_BACKOFF = 30.0  # seconds before retrying spilled events after a failed write
+
+metadata = MetaData()
+
+soil_analyses = Table(
+    "soil_analyses",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("created_at", DateTime(timezone=True), nullable=False, index=True),
+    Column("crop", String(32), nullable=False),
+    Column("soil_type", String(32)),
+    Column("location", String(128)),
+    Column("health_score", Float),
+    Column("ph", Float),
+    Column("nitrogen", Float),
+    Column("phosphorus", Float),
+    Column("potassium", Float),
+    Column("organic_matter", Float),
+    Column("farm_size", Float),
+    Column("total_cost", Float)
+)
+
+EVENT_FIELDS = [column.name for column in soil_analyses.columns if column.name != "id"]
+
+class AnalyticsSink:
+    """Bounded queue of analysis events drained by one batch-writing thread"""
+
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        flush_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        overflow: Optional[str] = None,
+        spill_path: Optional[str] = None
+    ):
+        self.database_url = database_url or settings.ANALYTICS_DATABASE_URL or settings.DATABASE_URL
+        self.flush_size = flush_size or settings.ANALYTICS_FLUSH_SIZE
+        self.flush_interval = flush_interval or settings.ANALYTICS_FLUSH_INTERVAL
+        self.overflow = overflow or settings.ANALYTICS_OVERFLOW
+        if self.overflow not in OVERFLOW_MODES:
+            raise ValueError(f"Analytics overflow must be one of {OVERFLOW_MODES}, got '{self.overflow}'")
+        self.spill_path = spill_path or settings.ANALYTICS_SPILL_PATH
+
+        self._queue: "queue.Queue[Dict]" = queue.Queue(max_queue or settings.ANALYTICS_QUEUE_SIZE)
+        self._to_spill: deque = deque()  # overflow events waiting for the writer to spill them
+        self._engine: Optional[Engine] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._retry_at = 0.0
+
+        self.enqueued = 0
+        self.written = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    def record(self, event: Dict) -> bool:
+        """Queue one event without blocking; False if it was spilled or dropped"""
+        if self._thread is None:
+            self.start()
+        row = {field: event.get(field) for field in EVENT_FIELDS}
+        row["created_at"] = row["created_at"] or time.time()
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            if self.overflow == "drop" or len(self._to_spill) >= self._queue.maxsize:
+                self.dropped += 1
+            else:
+                self._to_spill.append(row)
+            return False
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None and not self._closing.is_set():
+                self._thread = threading.Thread(target=self._run, name="analytics-sink", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: float = 10.0):
+        """Flush queued events and stop the writer"""
+        self._closing.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"⚠️ Analytics writer still busy after {timeout}s, {self._queue.qsize()} events queued")
+        if self._engine is not None:
+            self._engine.dispose()
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "queued": self._queue.qsize(),
+            "pending_spill": len(self._to_spill),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "overflow": self.overflow
+        }
+
+    def _connect(self) -> Engine:
+        if self._engine is None:
+            if self.database_url.startswith("sqlite:///"):
+                directory = os.path.dirname(self.database_url[len("sqlite:///"):])
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            engine = create_engine(self.database_url, pool_pre_ping=True)
+            metadata.create_all(engine)
+            self._engine = engine
+        return self._engine
+
+    def _run(self):
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                while len(batch) < self.flush_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if self._to_spill:
+                self._spill_pending()
+
+            closing = self._closing.is_set()
+            if len(batch) >= self.flush_size or closing or time.monotonic() >= deadline:
+                if batch:
+                    if not self._write(batch):
+                        self._overflow(batch)
+                    batch = []
+                elif time.monotonic() >= self._retry_at:
+                    self._replay_spill()
+                deadline = time.monotonic() + self.flush_interval
+                if closing and self._queue.empty():
+                    self._spill_pending()
+                    break
+
+    def _write(self, rows: List[Dict]) -> bool:
+        records = [
+            dict(row, created_at=datetime.fromtimestamp(row["created_at"], tz=timezone.utc)) for row in rows
+        ]
+        try:
+            with self._connect().begin() as connection:
+                connection.execute(soil_analyses.insert(), records)
+        except Exception as e:
+            self.failed_batches += 1
+            self._retry_at = time.monotonic() + FAILURE_BACKOFF
+            logger.error(f"❌ Analytics batch of {len(rows)} events failed: {e}")
+            return False
+        self.written += len(rows)
+        return True
+
+    def _spill_pending(self):
+        rows = []
+        while self._to_spill:
+            rows.append(self._to_spill.popleft())
+        if rows:
+            self._overflow(rows)
+
+    def _overflow(self, rows: List[Dict]):
+        if self.overflow == "drop":
+            self.dropped += len(rows)
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(row) + "\n" for row in rows)
+            self.spilled += len(rows)
+        except OSError as e:
+            logger.error(f"❌ Could not spill {len(rows)} analytics events to {self.spill_path}: {e}")
+            self.dropped += len(rows)
+
+    def _replay_spill(self):
+        """
+        Move spilled events back into the database once the queue is idle.
+
+        The replay file is streamed in flush_size chunks. The byte offset
+        past each written chunk is saved next to it, and the file is removed
+        only once every chunk is in. A failed write or a crash resumes from
+        the saved offset.
+        """
+        replay_path = self.spill_path + ".replay"
+        offset_path = replay_path + ".offset"
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+        offset = self._read_offset(offset_path)
+        logger.info(f"📤 Replaying spilled analytics events from {replay_path} (byte {offset})")
+        with open(replay_path, "rb") as f:
+            f.seek(offset)
+            while True:
+                rows = []
+                while len(rows) < self.flush_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        rows.append(json.loads(line))
+                if not rows:
+                    break
+                if not self._write(rows):
+                    return  # the rest waits in the replay file for the next retry
+                self.spilled -= len(rows)
+                self._save_offset(offset_path, f.tell())
+        os.remove(replay_path)
+        if os.path.exists(offset_path):
+            os.remove(offset_path)
+
+    @staticmethod
+    def _read_offset(offset_path: str) -> int:
+        try:
+            with open(offset_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _save_offset(offset_path: str, offset: int):
+        temp_path = offset_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(temp_path, offset_path)
+
+_sink: Optional[AnalyticsSink] = None
+_sink_lock = threading.Lock()
+
+def get_analytics_sink() -> AnalyticsSink:
+    """Shared analytics sink; its writer thread starts with the first event"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AnalyticsSink()
+    return _sink
+
+def close_analytics_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
@@ -0,0 +1,235 @@
+"""
+Climatology Engine for FARMGUARD
+
+Folds every stored daily forecast into per-cell running aggregates
+(30-day rainfall vs normal, consecutive dry days, monthly temperature
+statistics) so drought conditions can be detected without rescanning
+history. Each day is folded exactly once, in O(1).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Deque, Dict, List, Optional
+
+from app.services.forecast_store import ForecastStore, StoredForecastDay, cell_id, sqlite_path_from_url
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 30
+DRY_DAY_MM = 2.5  # IMD rainy-day threshold
+MIN_MONTH_SAMPLES = 20  # observations before a cell's own monthly statistics are trusted
+MIN_WINDOW_COVERAGE = 21  # observed days in the window before deficits are reported
+MIN_NORMAL_RAINFALL_MM = 25.0  # ignore deficits in seasons that are normally dry
+
+# All-India normal rainfall by month (mm/month), used until a cell has its own history
+MONTHLY_NORMAL_RAINFALL_MM = [17.5, 21.0, 25.9, 35.0, 61.6, 165.3, 280.5, 254.9, 167.6, 75.2, 30.7, 14.2]
+MONSOON_MONTHS = {6, 7, 8, 9, 10}
+
+@dataclass
+class DroughtSignal:
+    severity: str  # medium, high
+    kind: str  # rainfall_deficit, dry_spell
+    rainfall_deficit_pct: float
+    consecutive_dry_days: int
+    window_days: int
+    as_of: date
+
+@dataclass
+class CellClimate:
+    last_day: int = 0  # ordinal of the last folded day
+    rain_window: Deque[float] = field(default_factory=deque)
+    normal_window: Deque[float] = field(default_factory=deque)
+    observed_window: Deque[int] = field(default_factory=deque)
+    rain_sum: float = 0.0
+    normal_sum: float = 0.0
+    observed_days: int = 0
+    consecutive_dry_days: int = 0
+    temp_count: List[int] = field(default_factory=lambda: [0] * 12)
+    temp_mean: List[float] = field(default_factory=lambda: [0.0] * 12)
+    temp_m2: List[float] = field(default_factory=lambda: [0.0] * 12)
+    rain_count: List[int] = field(default_factory=lambda: [0] * 12)
+    rain_mean: List[float] = field(default_factory=lambda: [0.0] * 12)
+    temperature_anomaly: Optional[float] = None
+
+    def _push(self, rainfall: float, normal: float, observed: int):
+        self.rain_window.append(rainfall)
+        self.normal_window.append(normal)
+        self.observed_window.append(observed)
+        self.rain_sum += rainfall
+        self.normal_sum += normal
+        self.observed_days += observed
+        if len(self.rain_window) > WINDOW_DAYS:
+            self.rain_sum -= self.rain_window.popleft()
+            self.normal_sum -= self.normal_window.popleft()
+            self.observed_days -= self.observed_window.popleft()
+
+    def normal_daily_rainfall(self, month: int) -> float:
+        if self.rain_count[month - 1] >= MIN_MONTH_SAMPLES:
+            return self.rain_mean[month - 1]
+        return MONTHLY_NORMAL_RAINFALL_MM[month - 1] / 30.0
+
+    def fold(self, day: StoredForecastDay):
+        """Fold one daily record into the running aggregates"""
+        ordinal = day.day.toordinal()
+        if ordinal <= self.last_day:
+            return
+
+        # Days with no record count towards neither actual nor normal rainfall,
+        # and a dry spell cannot be shown to continue across them
+        if self.last_day:
+            gap = min(ordinal - self.last_day - 1, WINDOW_DAYS)
+            for _ in range(gap):
+                self._push(0.0, 0.0, 0)
+            if gap:
+                self.consecutive_dry_days = 0
+
+        month = day.day.month
+        self._push(float(day.rainfall), self.normal_daily_rainfall(month), 1)
+        self.consecutive_dry_days = self.consecutive_dry_days + 1 if day.rainfall < DRY_DAY_MM else 0
+
+        # Anomaly against the cell's own history for this month, before this record joins it
+        index = month - 1
+        mean_temp = (day.high + day.low) / 2.0
+        if self.temp_count[index] >= MIN_MONTH_SAMPLES:
+            self.temperature_anomaly = round(mean_temp - self.temp_mean[index], 2)
+        else:
+            self.temperature_anomaly = None
+
+        # Welford updates
+        self.temp_count[index] += 1
+        delta = mean_temp - self.temp_mean[index]
+        self.temp_mean[index] += delta / self.temp_count[index]
+        self.temp_m2[index] += delta * (mean_temp - self.temp_mean[index])
+        self.rain_count[index] += 1
+        self.rain_mean[index] += (day.rainfall - self.rain_mean[index]) / self.rain_count[index]
+
+        self.last_day = ordinal
+
+    @property
+    def rainfall_deficit_pct(self) -> float:
+        if self.normal_sum <= 0:
+            return 0.0
+        return round(max(0.0, (self.normal_sum - self.rain_sum) / self.normal_sum * 100), 1)
+
+    def drought_signals(self) -> List[DroughtSignal]:
+        """Current drought conditions for the cell"""
+        if not self.last_day:
+            return []
+
+        as_of = date.fromordinal(self.last_day)
+        deficit = self.rainfall_deficit_pct
+        signals = []
+
+        if self.observed_days >= MIN_WINDOW_COVERAGE and self.normal_sum >= MIN_NORMAL_RAINFALL_MM:
+            if deficit >= 60:
+                severity = "high"
+            elif deficit >= 20:
+                severity = "medium"
+            else:
+                severity = None
+            if severity:
+                signals.append(DroughtSignal(severity, "rainfall_deficit", deficit,
+                                             self.consecutive_dry_days, len(self.rain_window), as_of))
+
+        if as_of.month in MONSOON_MONTHS and self.consecutive_dry_days >= 14:
+            severity = "high" if self.consecutive_dry_days >= 21 else "medium"
+            signals.append(DroughtSignal(severity, "dry_spell", deficit,
+                                         self.consecutive_dry_days, len(self.rain_window), as_of))
+
+        return signals
+
+    def summary(self) -> Dict:
+        month_index = date.fromordinal(self.last_day).month - 1 if self.last_day else None
+        temp_std = None
+        if month_index is not None and self.temp_count[month_index] > 1:
+            temp_std = round((self.temp_m2[month_index] / (self.temp_count[month_index] - 1)) ** 0.5, 2)
+        return {
+            "as_of": date.fromordinal(self.last_day).isoformat() if self.last_day else None,
+            "window_days": len(self.rain_window),
+            "observed_days": self.observed_days,
+            "rainfall_mm": round(self.rain_sum, 1),
+            "normal_rainfall_mm": round(self.normal_sum, 1),
+            "rainfall_deficit_pct": self.rainfall_deficit_pct,
+            "consecutive_dry_days": self.consecutive_dry_days,
+            "temperature_anomaly": self.temperature_anomaly,
+            "monthly_temperature_std": temp_std
+        }
+
+    def to_json(self) -> str:
+        state = self.__dict__.copy()
+        for key in ("rain_window", "normal_window", "observed_window"):
+            state[key] = list(state[key])
+        return json.dumps(state)
+
+    @classmethod
+    def from_json(cls, payload: str) -> "CellClimate":
+        state = json.loads(payload)
+        for key in ("rain_window", "normal_window", "observed_window"):
+            state[key] = deque(state[key])
+        return cls(**state)
+
+class ClimatologyEngine:
+    """Per-cell running climatology fed from the local forecast store"""
+
+    def __init__(self, store: ForecastStore, database_url: Optional[str] = None):
+        self.store = store
+        self.path = sqlite_path_from_url(database_url) if database_url else store.path
+        self._cells: Dict[int, CellClimate] = {}
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS climatology_cells (cell INTEGER PRIMARY KEY, state TEXT NOT NULL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _cell(self, cell: int) -> CellClimate:
+        climate = self._cells.get(cell)
+        if climate is None:
+            row = self._connect().execute(
+                "SELECT state FROM climatology_cells WHERE cell = ?", (cell,)
+            ).fetchone()
+            climate = CellClimate.from_json(row[0]) if row else CellClimate()
+            self._cells[cell] = climate
+        return climate
+
+    def update(self, lat: float, lon: float, through: Optional[date] = None) -> int:
+        """Fold stored days not yet seen, up to `through` (default yesterday); returns days folded"""
+        cell = cell_id(lat, lon)
+        through = through or date.today() - timedelta(days=1)
+
+        with self._lock:
+            climate = self._cell(cell)
+            start = date.fromordinal(climate.last_day + 1) if climate.last_day else through - timedelta(days=WINDOW_DAYS - 1)
+            if start > through:
+                return 0
+
+            days = self.store.history(lat, lon, start, through)
+            for day in days:
+                climate.fold(day)
+
+            if days:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO climatology_cells VALUES (?, ?)", (cell, climate.to_json())
+                    )
+
+        return len(days)
+
+    def summary(self, lat: float, lon: float) -> Dict:
+        with self._lock:
+            return self._cell(cell_id(lat, lon)).summary()
+
+    def drought_signals(self, lat: float, lon: float) -> List[DroughtSignal]:
+        with self._lock:
+            return self._cell(cell_id(lat, lon)).drought_signals()
@@ -6,14 +6,27 @@ climate conditions, and economic factors for Indian farming.
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+from dataclasses import asdict, dataclass
 from enum import Enum
 import json
 import math
 
+import numpy as np
+
+from app.services.fertilizer_catalog import (
+    DEFAULT_TIMINGS, OXIDE_FACTOR, CropRequirement, FertilizerCatalog, FertilizerCatalogRegistry, FertilizerGrade,
+    FertilizerProduct, RegionalFactors, get_catalog_registry
+)
+from app.services.fertilizer_optimizer import ProductMatrix, optimize_fertilizer_mix
+from app.services.regional_factors import DistrictFactorTable, get_district_factors
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_RISK_SCENARIOS = 20000
+MAX_RISK_SCENARIOS = 200000
+RISK_PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
 class ApplicationMethod(str, Enum):
     BROADCAST = "broadcast"
     BAND = "band"
@@ -21,14 +34,6 @@ class ApplicationMethod(str, Enum):
     DRIP = "drip"
     SPLIT = "split"
 
-class FertilizerGrade(str, Enum):
-    UREA = "urea"  # 46-0-0
-    DAP = "DAP"   # 18-46-0
-    SSP = "SSP"   # 0-16-0
-    MOP = "MOP"   # 0-0-60
-    NPK_COMPLEX = "npk_complex"  # Various ratios
-    ORGANIC = "organic"
-
 @dataclass
 class SoilTestResult:
     ph: float
@@ -39,25 +44,6 @@ class SoilTestResult:
     cation_exchange_capacity: Optional[float] = None
     electrical_conductivity: Optional[float] = None
 
-@dataclass
-class CropRequirement:
-    nitrogen: float  # kg/ha
-    phosphorus: float  # kg/ha
-    potassium: float  # kg/ha
-    growth_stages: Dict[str, float]  # N-P-K distribution by growth stage
-    critical_periods: List[str]  # Critical nutrient uptake periods
-
-@dataclass
-class FertilizerProduct:
-    name: str
-    grade: FertilizerGrade
-    n_content: float  # percentage
-    p2o5_content: float  # percentage
-    k2o_content: float  # percentage
-    price_per_kg: float  # INR
-    availability: bool = True
-    organic: bool = False
-
 @dataclass
 class ApplicationSchedule:
     stage: str
@@ -68,107 +54,118 @@ class ApplicationSchedule:
     method: ApplicationMethod
     weather_conditions: List[str]
 
+@dataclass
+class RiskAssumptions:
+    yield_response_mean: float = 0.25  # fractional yield gain from proper fertilization
+    yield_response_sd: float = 0.10
+    crop_price_cv: float = 0.15  # coefficient of variation of the market price
+    fertilizer_price_cv: float = 0.10  # per product, independent
+
+def _lognormal(rng: np.random.Generator, mean: float, cv: float, size) -> np.ndarray:
+    """Lognormal draws with the given mean and coefficient of variation"""
+    if cv <= 0:
+        return np.full(size, mean, dtype=np.float64)
+    sigma = math.sqrt(math.log1p(cv * cv))
+    return mean * rng.lognormal(-sigma * sigma / 2, sigma, size)
+
+def _percentiles(values: np.ndarray, digits: int = 2) -> Dict[str, Optional[float]]:
+    if len(values) == 0:
+        return {f"p{p}": None for p in RISK_PERCENTILES}
+    return {f"p{p}": round(float(v), digits) for p, v in zip(RISK_PERCENTILES, np.percentile(values, RISK_PERCENTILES))}
+
+def _encode(values, names: List[str], lower: bool = False) -> np.ndarray:
+    """Codes of `values` in `names` (-1 if absent); one vectorized comparison per name"""
+    values = np.asarray(values)
+    codes = np.full(len(values), -1, dtype=np.int16)
+    for code, name in enumerate(names):
+        codes[values == name] = code
+    if lower:
+        # Remaining values may differ only in case; resolve each distinct one once
+        rest = np.flatnonzero(codes < 0)
+        if len(rest):
+            lookup = {name: code for code, name in enumerate(names)}
+            distinct = {value: lookup.get(str(value).lower(), -1) for value in set(values[rest].tolist())}
+            codes[rest] = [distinct[value] for value in values[rest].tolist()]
+    return codes
+
 class FertilizerCalculator:
     """Advanced fertilizer calculator for Indian farming conditions"""
     
-    def __init__(self):
-        self.fertilizer_database = self._load_fertilizer_database()
-        self.crop_database = self._load_crop_database()
-        self.regional_factors = self._load_regional_factors()
+    def __init__(
+        self,
+        registry: Optional[FertilizerCatalogRegistry] = None,
+        catalog: Optional[FertilizerCatalog] = None,
+        districts: Optional[DistrictFactorTable] = None
+    ):
+        """Follows the registry's active catalog, or stays on `catalog` when one is given"""
+        self.registry = registry or get_catalog_registry()
+        self.pinned_catalog = catalog
+        self._districts = districts
     
-    def _load_fertilizer_database(self) -> Dict[str, FertilizerProduct]:
-        """Load fertilizer product database"""
-        return {
-            "urea": FertilizerProduct("Urea", FertilizerGrade.UREA, 46.0, 0.0, 0.0, 6.50),
-            "dap": FertilizerProduct("DAP", FertilizerGrade.DAP, 18.0, 46.0, 0.0, 27.00),
-            "ssp": FertilizerProduct("Single Super Phosphate", FertilizerGrade.SSP, 0.0, 16.0, 0.0, 9.50),
-            "mop": FertilizerProduct("Muriate of Potash", FertilizerGrade.MOP, 0.0, 0.0, 60.0, 17.00),
-            "npk_10_26_26": FertilizerProduct("NPK 10-26-26", FertilizerGrade.NPK_COMPLEX, 10.0, 26.0, 26.0, 22.00),
-            "npk_12_32_16": FertilizerProduct("NPK 12-32-16", FertilizerGrade.NPK_COMPLEX, 12.0, 32.0, 16.0, 24.00),
-            "npk_20_20_0_13": FertilizerProduct("NPK 20-20-0-13S", FertilizerGrade.NPK_COMPLEX, 20.0, 20.0, 0.0, 26.00),
-            "compost": FertilizerProduct("Farm Compost", FertilizerGrade.ORGANIC, 0.5, 0.3, 0.5, 5.00, True, True),
-            "vermicompost": FertilizerProduct("Vermicompost", FertilizerGrade.ORGANIC, 1.5, 1.0, 1.2, 8.00, True, True),
-        }
+    @property
+    def catalog(self) -> FertilizerCatalog:
+        """Catalog version in use; methods read it once so a price update never splits a calculation"""
+        return self.pinned_catalog or self.registry.current()
     
-    def _load_crop_database(self) -> Dict[str, CropRequirement]:
-        """Load crop nutrient requirement database"""
-        return {
-            "rice": CropRequirement(
-                nitrogen=120, phosphorus=60, potassium=40,
-                growth_stages={
-                    "basal": 0.25,        # 25% N, 100% P, 50% K
-                    "tillering": 0.50,    # 50% N
-                    "panicle": 0.25,      # 25% N, 50% K
-                    "grain_filling": 0.0
-                },
-                critical_periods=["tillering", "panicle_initiation"]
-            ),
-            "wheat": CropRequirement(
-                nitrogen=120, phosphorus=60, potassium=40,
-                growth_stages={
-                    "basal": 0.33,        # 33% N, 100% P, 100% K
-                    "crown_root": 0.33,   # 33% N
-                    "jointing": 0.34,     # 34% N
-                },
-                critical_periods=["crown_root_stage", "jointing"]
-            ),
-            "maize": CropRequirement(
-                nitrogen=120, phosphorus=60, potassium=50,
-                growth_stages={
-                    "basal": 0.25,        # 25% N, 100% P, 50% K
-                    "knee_high": 0.50,    # 50% N, 50% K
-                    "tasseling": 0.25,    # 25% N
-                },
-                critical_periods=["6_leaf_stage", "tasseling"]
-            ),
-            "cotton": CropRequirement(
-                nitrogen=160, phosphorus=80, potassium=80,
-                growth_stages={
-                    "basal": 0.25,        # 25% N, 100% P, 25% K
-                    "squaring": 0.50,     # 50% N, 50% K
-                    "flowering": 0.25,    # 25% N, 25% K
-                },
-                critical_periods=["squaring", "peak_flowering"]
-            ),
-            "sugarcane": CropRequirement(
-                nitrogen=280, phosphorus=90, potassium=160,
-                growth_stages={
-                    "planting": 0.25,     # 25% N, 100% P, 33% K
-                    "tillering": 0.50,    # 50% N, 33% K
-                    "grand_growth": 0.25, # 25% N, 34% K
-                },
-                critical_periods=["tillering", "grand_growth_phase"]
-            )
-        }
+    @property
+    def fertilizer_database(self) -> Mapping[str, FertilizerProduct]:
+        return self.catalog.products
     
-    def _load_regional_factors(self) -> Dict[str, Dict]:
-        """Load regional adjustment factors for different states/regions"""
-        return {
-            "punjab": {"rainfall": 1.1, "temperature": 1.0, "soil_factor": 1.1},
-            "haryana": {"rainfall": 1.0, "temperature": 1.1, "soil_factor": 1.0},
-            "uttar_pradesh": {"rainfall": 0.9, "temperature": 1.0, "soil_factor": 0.9},
-            "bihar": {"rainfall": 0.8, "temperature": 0.9, "soil_factor": 0.8},
-            "west_bengal": {"rainfall": 1.2, "temperature": 0.9, "soil_factor": 1.0},
-            "maharashtra": {"rainfall": 0.7, "temperature": 1.1, "soil_factor": 0.9},
-            "karnataka": {"rainfall": 0.8, "temperature": 1.0, "soil_factor": 1.0},
-            "tamil_nadu": {"rainfall": 0.6, "temperature": 1.1, "soil_factor": 0.9},
-            "gujarat": {"rainfall": 0.5, "temperature": 1.2, "soil_factor": 0.8},
-            "rajasthan": {"rainfall": 0.3, "temperature": 1.3, "soil_factor": 0.7},
-        }
+    @property
+    def crop_database(self) -> Mapping[str, CropRequirement]:
+        return self.catalog.crops
+    
+    @property
+    def regional_factors(self) -> Mapping[str, RegionalFactors]:
+        return self.catalog.regions
+    
+    @property
+    def district_factors(self) -> DistrictFactorTable:
+        if self._districts is None:
+            self._districts = get_district_factors()
+        return self._districts
+    
+    def resolve_regional_factors(
+        self,
+        region: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        catalog: Optional[FertilizerCatalog] = None
+    ) -> Optional[RegionalFactors]:
+        """
+        Factors of a district code, else of the district at (lat, lon) within
+        the state `region` names, else of that state
+        """
+        if not region:
+            return None
+        district = self.district_factors.get(region)
+        if district is None and lat is not None and lon is not None:
+            district = self.district_factors.locate(lat, lon, region)
+        if district:
+            return district.factors
+        return (catalog or self.catalog).regions.get(region.lower())
     
     def calculate_nutrient_requirements(
         self, 
         crop: str, 
         soil_test: SoilTestResult,
         target_yield: Optional[float] = None,
-        region: Optional[str] = None
+        region: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
     ) -> Dict[str, float]:
-        """Calculate adjusted nutrient requirements based on soil test and target yield"""
+        """
+        Calculate adjusted nutrient requirements based on soil test and target yield.
         
-        if crop not in self.crop_database:
+        `region` is a district code (e.g. IN-PB-LUDHIANA) or a state name;
+        with a state, plot coordinates select one of its districts.
+        """
+        
+        catalog = self.catalog
+        if crop not in catalog.crops:
             raise ValueError(f"Crop '{crop}' not found in database")
         
-        base_requirement = self.crop_database[crop]
+        base_requirement = catalog.crops[crop]
         
         # Base requirements
         n_required = base_requirement.nitrogen
@@ -211,17 +208,17 @@ class FertilizerCalculator:
         # Target yield adjustment (if provided)
         if target_yield:
             # Increase nutrient requirements for higher yields
-            yield_factor = min(target_yield / self._get_average_yield(crop), 2.0)
+            yield_factor = min(target_yield / base_requirement.average_yield, 2.0)
             n_deficit *= yield_factor
             p_deficit *= yield_factor
             k_deficit *= yield_factor
         
         # Regional adjustment
-        if region and region.lower() in self.regional_factors:
-            factors = self.regional_factors[region.lower()]
-            n_deficit *= factors["rainfall"] * factors["soil_factor"]
-            p_deficit *= factors["soil_factor"]
-            k_deficit *= factors["rainfall"] * factors["soil_factor"]
+        factors = self.resolve_regional_factors(region, lat, lon, catalog)
+        if factors:
+            n_deficit *= factors.rainfall * factors.soil_factor
+            p_deficit *= factors.soil_factor
+            k_deficit *= factors.rainfall * factors.soil_factor
         
         return {
             "nitrogen": max(0, n_deficit),
@@ -229,6 +226,110 @@ class FertilizerCalculator:
             "potassium": max(0, k_deficit)
         }
     
+    def encode_crops(self, crops) -> np.ndarray:
+        """Crop names to codes for calculate_nutrient_requirements_batch"""
+        codes = _encode(crops, list(self.crop_database))
+        if (codes < 0).any():
+            raise ValueError(f"Crop '{np.asarray(crops)[codes < 0][0]}' not found in database")
+        return codes
+    
+    def encode_regions(self, regions) -> np.ndarray:
+        """
+        State names and district codes to region codes: states first, then
+        districts; -1 (no regional adjustment) for unknown or missing regions
+        """
+        states = list(self.regional_factors)
+        codes = _encode(regions, states, lower=True)
+        unresolved = codes < 0
+        if unresolved.any():
+            districts = [district.code.lower() for district in self.district_factors.districts]
+            district_codes = _encode(np.asarray(regions)[unresolved], districts, lower=True)
+            codes[unresolved] = np.where(district_codes >= 0, district_codes + len(states), -1)
+        return codes
+    
+    def locate_regions(self, lat, lon, states) -> np.ndarray:
+        """Region codes of each point's district within its state; -1 where none is found"""
+        district = self.district_factors.locate_many(lat, lon, states)
+        return np.where(district >= 0, district + len(self.regional_factors), -1).astype(np.int16)
+    
+    def calculate_nutrient_requirements_batch(
+        self,
+        crop_code: np.ndarray,
+        ph: np.ndarray,
+        nitrogen: np.ndarray,
+        phosphorus: np.ndarray,
+        potassium: np.ndarray,
+        organic_matter: np.ndarray,
+        target_yield: Optional[np.ndarray] = None,
+        region_code: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        calculate_nutrient_requirements over columns of soil tests.
+        
+        Codes come from encode_crops and encode_regions / locate_regions;
+        `target_yield` uses NaN or 0 for "not given". Every step applies the scalar path's operations
+        in the same order, so results are identical.
+        """
+        catalog = self.catalog
+        crop_code = np.asarray(crop_code)
+        ph, nitrogen, phosphorus, potassium, organic_matter = (
+            np.asarray(column, dtype=np.float64) for column in (ph, nitrogen, phosphorus, potassium, organic_matter)
+        )
+        n_table, p_table, k_table, yield_table = catalog.crop_table
+        n_required = n_table[crop_code]
+        p_required = p_table[crop_code]
+        k_required = k_table[crop_code]
+        
+        # Soil test adjustments
+        n_deficit = np.maximum(0, n_required - nitrogen * 0.6)
+        p_deficit = np.select(
+            [phosphorus < 10, phosphorus < 25], [p_required, p_required * 0.7], p_required * 0.3
+        )
+        k_deficit = np.select(
+            [potassium < 110, potassium < 280], [k_required, k_required * 0.7], k_required * 0.3
+        )
+        
+        # pH adjustment factor
+        ph_factor = np.select(
+            [(6.0 <= ph) & (ph <= 7.5), ph < 5.5, ph > 8.0], [1.0, 0.7, 0.8], 0.9
+        )
+        n_deficit *= ph_factor
+        p_deficit *= ph_factor
+        k_deficit *= ph_factor
+        
+        # Organic matter adjustment
+        n_deficit *= np.select([organic_matter > 2.5, organic_matter < 1.0], [0.8, 1.2], 1.0)
+        
+        # Target yield adjustment (multiplying by 1.0 where none is given leaves values unchanged)
+        if target_yield is not None:
+            target_yield = np.asarray(target_yield, dtype=np.float64)
+            average = yield_table[crop_code]
+            given = np.nan_to_num(target_yield) != 0
+            yield_factor = np.where(given, np.minimum(np.where(given, target_yield, 1.0) / average, 2.0), 1.0)
+            n_deficit *= yield_factor
+            p_deficit *= yield_factor
+            k_deficit *= yield_factor
+        
+        # Regional adjustment
+        if region_code is not None:
+            region_code = np.asarray(region_code)
+            districts = self.district_factors
+            states = list(catalog.regions.values())
+            # States, then districts; the trailing entry is the identity for code -1
+            rainfall_soil = np.concatenate([
+                [f.rainfall * f.soil_factor for f in states], districts.rainfall * districts.soil_factor, [1.0]
+            ])[region_code]
+            soil_factor = np.concatenate([[f.soil_factor for f in states], districts.soil_factor, [1.0]])[region_code]
+            n_deficit *= rainfall_soil
+            p_deficit *= soil_factor
+            k_deficit *= rainfall_soil
+        
+        return {
+            "nitrogen": np.maximum(0, n_deficit),
+            "phosphorus": np.maximum(0, p_deficit),
+            "potassium": np.maximum(0, k_deficit)
+        }
+    
     def _get_ph_adjustment_factor(self, ph: float) -> float:
         """Get nutrient availability adjustment factor based on pH"""
         if 6.0 <= ph <= 7.5:
@@ -251,26 +352,33 @@ class FertilizerCalculator:
     
     def _get_average_yield(self, crop: str) -> float:
         """Get average yield for crops (tons/hectare)"""
-        yields = {
-            "rice": 3.5,
-            "wheat": 3.2,
-            "maize": 5.5,
-            "cotton": 1.8,
-            "sugarcane": 75.0
-        }
-        return yields.get(crop, 1.0)
+        requirement = self.catalog.crops.get(crop)
+        return requirement.average_yield if requirement else 1.0
     
     def recommend_fertilizers(
         self,
         nutrient_requirements: Dict[str, float],
         budget: Optional[float] = None,
-        organic_preference: bool = False
+        organic_preference: bool = False,
+        optimize: bool = False,
+        whole_bags: bool = False
     ) -> List[Dict]:
-        """Recommend optimal fertilizer combinations"""
+        """
+        Recommend optimal fertilizer combinations.
+
+        With `optimize` the mix is solved as a linear program over the whole
+        fertilizer database (cheapest mix meeting the requirements, or best
+        coverage within `budget`) instead of the fixed DAP/Urea/MOP rules.
+        """
         
         n_needed = nutrient_requirements["nitrogen"]
-        p_needed = nutrient_requirements["phosphorus"] * 2.29  # Convert P to P2O5
-        k_needed = nutrient_requirements["potassium"] * 1.20   # Convert K to K2O
+        p_needed = nutrient_requirements["phosphorus"] * OXIDE_FACTOR["phosphorus"]  # Convert P to P2O5
+        k_needed = nutrient_requirements["potassium"] * OXIDE_FACTOR["potassium"]    # Convert K to K2O
+        
+        if optimize:
+            return self._optimized_recommendations(
+                [n_needed, p_needed, k_needed], budget, organic_preference, whole_bags
+            )
         
         recommendations = []
         
@@ -378,6 +486,50 @@ class FertilizerCalculator:
         
         return recommendations
     
+    def price_dependencies(self, organic_preference: bool = False, optimize: bool = False) -> Tuple[str, ...]:
+        """Ids of the products whose prices recommend_fertilizers reads for these options"""
+        if optimize:
+            organic = True if organic_preference else None
+            return tuple(
+                product_id for product_id, product in self.catalog.products.items()
+                if product.availability and (organic is None or product.organic == organic)
+            )
+        return ("compost", "vermicompost") if organic_preference else ("dap", "urea", "mop")
+    
+    def _optimized_recommendations(
+        self,
+        targets: List[float],
+        budget: Optional[float],
+        organic_preference: bool,
+        whole_bags: bool
+    ) -> List[Dict]:
+        """LP-optimal mix over the fertilizer database, in recommend_fertilizers format"""
+        
+        catalog = self.catalog
+        products = ProductMatrix.from_products(
+            catalog.products, organic=True if organic_preference else None
+        )
+        mix = optimize_fertilizer_mix(products, targets, budget=budget or None, whole_bags=whole_bags)
+        if mix.status == "infeasible":
+            logger.warning(f"No fertilizer mix found for targets {targets}")
+            return []
+        
+        recommendations = []
+        for i, amount in mix.items(products):
+            product = catalog.products[products.ids[i]]
+            recommendations.append({
+                "fertilizer": product.name,
+                "amount": amount,
+                "cost": amount * products.price[i],
+                "nutrients_supplied": {
+                    "n": amount * product.n_content / 100,
+                    "p2o5": amount * product.p2o5_content / 100,
+                    "k2o": amount * product.k2o_content / 100
+                },
+                "application": catalog.application_guidance(product.grade)
+            })
+        return recommendations
+    
     def create_application_schedule(
         self,
         crop: str,
@@ -386,36 +538,33 @@ class FertilizerCalculator:
     ) -> List[ApplicationSchedule]:
         """Create detailed fertilizer application schedule"""
         
-        if crop not in self.crop_database:
+        catalog = self.catalog
+        if crop not in catalog.crops:
             raise ValueError(f"Crop '{crop}' not found in database")
         
-        crop_req = self.crop_database[crop]
+        crop_req = catalog.crops[crop]
         schedule = []
         
-        # Define application timings based on crop growth stages
-        application_timings = self._get_application_timings(crop)
-        
         for rec in fertilizer_recommendations:
             fertilizer_name = rec["fertilizer"]
             total_amount = rec["amount"]
             
-            # Determine split application based on fertilizer type
-            if "urea" in fertilizer_name.lower() or "n" in fertilizer_name.lower():
+            # Split by the product's grade, looked up by name or alias
+            role = catalog.schedule_role(fertilizer_name)
+            if role == "nitrogen":
                 # Split nitrogen application
-                for stage, percentage in crop_req.growth_stages.items():
-                    if percentage > 0:
-                        stage_amount = total_amount * percentage
-                        schedule.append(ApplicationSchedule(
-                            stage=stage,
-                            days_after_planting=application_timings.get(stage, 0),
-                            nutrient="Nitrogen",
-                            amount=stage_amount,
-                            fertilizer=fertilizer_name,
-                            method=ApplicationMethod.BROADCAST,
-                            weather_conditions=["Avoid application before heavy rain", "Apply in cool hours"]
-                        ))
+                for stage, percentage, days in crop_req.nitrogen_splits:
+                    schedule.append(ApplicationSchedule(
+                        stage=stage,
+                        days_after_planting=days,
+                        nutrient="Nitrogen",
+                        amount=total_amount * percentage,
+                        fertilizer=fertilizer_name,
+                        method=ApplicationMethod.BROADCAST,
+                        weather_conditions=["Avoid application before heavy rain", "Apply in cool hours"]
+                    ))
             
-            elif "dap" in fertilizer_name.lower() or "ssp" in fertilizer_name.lower():
+            elif role == "phosphorus":
                 # Phosphorus - usually basal application
                 schedule.append(ApplicationSchedule(
                     stage="basal",
@@ -427,7 +576,7 @@ class FertilizerCalculator:
                     weather_conditions=["Apply at planting", "Mix with soil"]
                 ))
             
-            elif "mop" in fertilizer_name.lower() or "potash" in fertilizer_name.lower():
+            elif role == "potassium":
                 # Potassium - split application
                 schedule.append(ApplicationSchedule(
                     stage="basal",
@@ -441,7 +590,7 @@ class FertilizerCalculator:
                 
                 schedule.append(ApplicationSchedule(
                     stage="reproductive",
-                    days_after_planting=application_timings.get("reproductive", 60),
+                    days_after_planting=crop_req.timings.get("reproductive", 60),
                     nutrient="Potassium",
                     amount=total_amount * 0.5,
                     fertilizer=fertilizer_name,
@@ -449,7 +598,7 @@ class FertilizerCalculator:
                     weather_conditions=["Apply during flower initiation", "Irrigate after application"]
                 ))
             
-            elif "compost" in fertilizer_name.lower() or "organic" in fertilizer_name.lower():
+            elif role == "organic":
                 # Organic fertilizers - pre-planting application
                 schedule.append(ApplicationSchedule(
                     stage="pre_planting",
@@ -460,49 +609,19 @@ class FertilizerCalculator:
                     method=ApplicationMethod.BROADCAST,
                     weather_conditions=["Apply 2-3 weeks before planting", "Incorporate well into soil"]
                 ))
+            
+            else:
+                logger.warning(f"Fertilizer '{fertilizer_name}' is not in the catalog, left out of the schedule")
         
         # Sort by application timing
         schedule.sort(key=lambda x: x.days_after_planting)
         
         return schedule
     
-    def _get_application_timings(self, crop: str) -> Dict[str, int]:
+    def _get_application_timings(self, crop: str) -> Mapping[str, int]:
         """Get application timings in days after planting for different crops"""
-        
-        timings = {
-            "rice": {
-                "basal": 0,
-                "tillering": 21,
-                "panicle": 45,
-                "reproductive": 45
-            },
-            "wheat": {
-                "basal": 0,
-                "crown_root": 21,
-                "jointing": 45,
-                "reproductive": 45
-            },
-            "maize": {
-                "basal": 0,
-                "knee_high": 30,
-                "tasseling": 60,
-                "reproductive": 60
-            },
-            "cotton": {
-                "basal": 0,
-                "squaring": 45,
-                "flowering": 75,
-                "reproductive": 75
-            },
-            "sugarcane": {
-                "planting": 0,
-                "tillering": 60,
-                "grand_growth": 120,
-                "reproductive": 120
-            }
-        }
-        
-        return timings.get(crop, {"basal": 0, "reproductive": 60})
+        requirement = self.catalog.crops.get(crop)
+        return requirement.timings if requirement else DEFAULT_TIMINGS
     
     def calculate_cost_benefit_analysis(
         self,
@@ -533,4 +652,52 @@ class FertilizerCalculator:
             "return_on_investment": round(roi, 1),
             "payback_period": "Within current season" if net_benefit > 0 else "Not profitable",
             "break_even_price": round(total_fertilizer_cost / additional_yield, 2) if additional_yield > 0 else 0
-        }
\ No newline at end of file
+        }
+    
+    def simulate_cost_benefit_analysis(
+        self,
+        fertilizer_recommendations: List[Dict],
+        crop: str,
+        farm_size: float,
+        expected_price_per_unit: float,
+        scenarios: int = DEFAULT_RISK_SCENARIOS,
+        assumptions: Optional[RiskAssumptions] = None,
+        seed: Optional[int] = None
+    ) -> Dict:
+        """
+        Risk-aware calculate_cost_benefit_analysis.
+        
+        Every scenario draws the yield response (normal, floored at zero), the
+        crop price (lognormal around expected_price_per_unit) and a price
+        multiplier for each fertilizer (lognormal around 1); all scenarios are
+        evaluated together as arrays.
+        """
+        if not 0 < scenarios <= MAX_RISK_SCENARIOS:
+            raise ValueError(f"scenarios must be between 1 and {MAX_RISK_SCENARIOS}")
+        assumptions = assumptions or RiskAssumptions()
+        rng = np.random.default_rng(seed)
+        
+        costs = np.array([rec["cost"] for rec in fertilizer_recommendations], dtype=np.float64) * farm_size
+        price_factors = _lognormal(rng, 1.0, assumptions.fertilizer_price_cv, (scenarios, len(costs)))
+        total_cost = price_factors @ costs
+        
+        response = np.maximum(rng.normal(assumptions.yield_response_mean, assumptions.yield_response_sd, scenarios), 0.0)
+        additional_yield = self._get_average_yield(crop) * response * farm_size
+        crop_price = _lognormal(rng, expected_price_per_unit, assumptions.crop_price_cv, scenarios)
+        
+        net_benefit = additional_yield * crop_price - total_cost
+        with np.errstate(divide="ignore", invalid="ignore"):
+            roi = np.where(total_cost > 0, net_benefit / total_cost * 100, 0.0)
+            break_even = total_cost / additional_yield
+        
+        return {
+            "scenarios": scenarios,
+            "expected_net_benefit": round(float(net_benefit.mean()), 2),
+            "expected_return_on_investment": round(float(roi.mean()), 1),
+            "probability_of_loss": round(float((net_benefit < 0).mean()), 4),
+            "return_on_investment": _percentiles(roi, 1),
+            "net_benefit": _percentiles(net_benefit),
+            # Scenarios with no yield response cannot break even at any price
+            "break_even_price": _percentiles(break_even[additional_yield > 0]),
+            "assumptions": asdict(assumptions)
+        }
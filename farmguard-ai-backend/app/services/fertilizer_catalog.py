@@ -0,0 +1,351 @@
+"""
+Fertilizer Catalog Service for FARMGUARD
+
+Fertilizer products, crop nutrient requirements and regional adjustment
+factors with per-crop yield response curves, loaded once per process from a versioned JSON data file into
+frozen records with precomputed indices: products by id, name and grade,
+each grade's schedule role, and each crop's stage splits with their
+application days. Every calculator shares the active catalog; a reloaded
+file or a price update builds a new catalog and swaps it in with a single
+assignment, so a request holding a catalog always sees one version.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from enum import Enum
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "fertilizer_catalog.json")
+RELOAD_CHECK_INTERVAL = 2.0  # seconds between data file mtime checks
+SCHEDULE_ROLES = ("nitrogen", "phosphorus", "potassium", "organic")
+DEFAULT_TIMINGS = MappingProxyType({"basal": 0, "reproductive": 60})
+NUTRIENTS = ("nitrogen", "phosphorus", "potassium")
+# Requirements are kg of elemental N, P and K; product labels give N, P2O5 and K2O
+OXIDE_FACTOR = MappingProxyType({"nitrogen": 1.0, "phosphorus": 2.29, "potassium": 1.20})
+RESPONSE_MODELS = ("quadratic_plateau", "mitscherlich")
+
+class FertilizerGrade(str, Enum):
+    UREA = "urea"  # 46-0-0
+    DAP = "DAP"   # 18-46-0
+    SSP = "SSP"   # 0-16-0
+    MOP = "MOP"   # 0-0-60
+    NPK_COMPLEX = "npk_complex"  # Various ratios
+    ORGANIC = "organic"
+
+@dataclass(frozen=True, slots=True)
+class FertilizerProduct:
+    name: str
+    grade: FertilizerGrade
+    n_content: float  # percentage
+    p2o5_content: float  # percentage
+    k2o_content: float  # percentage
+    price_per_kg: float  # INR
+    availability: bool = True
+    organic: bool = False
+    bag_kg: float = 50.0
+
+@dataclass(frozen=True, slots=True)
+class GradeGuidance:
+    role: str  # one of SCHEDULE_ROLES
+    application: str
+
+@dataclass(frozen=True, slots=True)
+class ResponseCurve:
+    """Relative yield (1.0 = attainable yield) against applied nutrient in kg/ha"""
+    model: str  # one of RESPONSE_MODELS
+    zero_yield: float  # relative yield without the nutrient
+    plateau_rate: float = 0.0  # kg/ha where a quadratic-plateau curve levels off
+    rate_constant: float = 0.0  # per kg/ha, Mitscherlich curvature
+
+@dataclass(frozen=True, slots=True)
+class CropRequirement:
+    nitrogen: float  # kg/ha
+    phosphorus: float  # kg/ha
+    potassium: float  # kg/ha
+    growth_stages: Mapping[str, float]  # N-P-K distribution by growth stage
+    critical_periods: Tuple[str, ...]  # Critical nutrient uptake periods
+    average_yield: float = 1.0  # tons/hectare
+    timings: Mapping[str, int] = field(default_factory=lambda: DEFAULT_TIMINGS)  # days after planting by stage
+    nitrogen_splits: Tuple[Tuple[str, float, int], ...] = ()  # (stage, fraction, days) with fraction > 0
+    response: Mapping[str, ResponseCurve] = field(default_factory=dict)  # nutrient -> yield response curve
+
+@dataclass(frozen=True, slots=True)
+class RegionalFactors:
+    rainfall: float
+    temperature: float
+    soil_factor: float
+
+@dataclass(frozen=True, slots=True, eq=False)
+class FertilizerCatalog:
+    """One immutable version of the catalog with its lookup indices"""
+
+    version: str
+    products: Mapping[str, FertilizerProduct]
+    grades: Mapping[FertilizerGrade, GradeGuidance]
+    crops: Mapping[str, CropRequirement]
+    regions: Mapping[str, RegionalFactors]
+    source: Optional[str] = None
+    mtime: int = 0
+    data: Mapping = field(default_factory=dict, repr=False)
+    product_by_name: Mapping[str, str] = field(default_factory=dict, repr=False)  # lower-case id/name/alias -> id
+    products_by_grade: Mapping[FertilizerGrade, Tuple[str, ...]] = field(default_factory=dict, repr=False)
+    crop_table: Tuple[np.ndarray, ...] = field(default=(), repr=False)  # (N, P, K, average yield) in crop order
+    # nutrient -> (quadratic-plateau flag, zero yield, plateau rate, rate constant) in crop order, NaN without a curve
+    response_table: Mapping[str, Tuple[np.ndarray, ...]] = field(default_factory=dict, repr=False)
+    agronomy_key: Tuple = ()  # changes with crop or regional data, not with prices
+
+    @classmethod
+    def from_data(cls, data: Dict, source: Optional[str] = None, mtime: int = 0) -> "FertilizerCatalog":
+        grades = {
+            FertilizerGrade(grade): GradeGuidance(spec["role"], spec["application"])
+            for grade, spec in data["grades"].items()
+        }
+        for grade, guidance in grades.items():
+            if guidance.role not in SCHEDULE_ROLES:
+                raise ValueError(f"Grade '{grade.value}' has unknown schedule role '{guidance.role}'")
+
+        products: Dict[str, FertilizerProduct] = {}
+        product_by_name: Dict[str, str] = {}
+        products_by_grade: Dict[FertilizerGrade, List[str]] = {grade: [] for grade in grades}
+        for product_id, spec in data["products"].items():
+            product = FertilizerProduct(
+                name=spec["name"],
+                grade=FertilizerGrade(spec["grade"]),
+                n_content=float(spec["n"]),
+                p2o5_content=float(spec["p2o5"]),
+                k2o_content=float(spec["k2o"]),
+                price_per_kg=float(spec["price_per_kg"]),
+                availability=bool(spec.get("availability", True)),
+                organic=bool(spec.get("organic", False)),
+                bag_kg=float(spec.get("bag_kg", 50.0))
+            )
+            if product.grade not in grades:
+                raise ValueError(f"Product '{product_id}' has grade '{product.grade.value}' without guidance")
+            products[product_id] = product
+            products_by_grade[product.grade].append(product_id)
+            for name in [product_id, product.name, *spec.get("aliases", [])]:
+                key = name.lower()
+                if product_by_name.get(key, product_id) != product_id:
+                    raise ValueError(f"Name '{name}' refers to both '{product_by_name[key]}' and '{product_id}'")
+                product_by_name[key] = product_id
+
+        crops = {}
+        for crop, spec in data["crops"].items():
+            stages = {stage: float(fraction) for stage, fraction in spec["growth_stages"].items()}
+            timings = {stage: int(days) for stage, days in spec.get("timings", DEFAULT_TIMINGS).items()}
+            response = {}
+            for nutrient, curve in spec.get("response", {}).items():
+                response[nutrient] = ResponseCurve(
+                    model=curve["model"],
+                    zero_yield=float(curve["zero_yield"]),
+                    plateau_rate=float(curve.get("plateau_rate", 0.0)),
+                    rate_constant=float(curve.get("rate_constant", 0.0))
+                )
+                _validate_curve(f"{crop} {nutrient}", response[nutrient])
+            crops[crop] = CropRequirement(
+                nitrogen=float(spec["nitrogen"]),
+                phosphorus=float(spec["phosphorus"]),
+                potassium=float(spec["potassium"]),
+                growth_stages=MappingProxyType(stages),
+                critical_periods=tuple(spec.get("critical_periods", ())),
+                average_yield=float(spec.get("average_yield", 1.0)),
+                timings=MappingProxyType(timings),
+                nitrogen_splits=tuple(
+                    (stage, fraction, timings.get(stage, 0)) for stage, fraction in stages.items() if fraction > 0
+                ),
+                response=MappingProxyType(response)
+            )
+
+        regions = {region: RegionalFactors(**factors) for region, factors in data["regions"].items()}
+
+        crop_table = []
+        for name in ("nitrogen", "phosphorus", "potassium", "average_yield"):
+            column = np.array([getattr(c, name) for c in crops.values()], dtype=np.float64)
+            column.setflags(write=False)
+            crop_table.append(column)
+
+        response_table = {}
+        for nutrient in NUTRIENTS:
+            curves = [c.response.get(nutrient) for c in crops.values()]
+            columns = (
+                np.array([c is not None and c.model == "quadratic_plateau" for c in curves]),
+                np.array([c.zero_yield if c else np.nan for c in curves], dtype=np.float64),
+                np.array([c.plateau_rate if c else np.nan for c in curves], dtype=np.float64),
+                np.array([c.rate_constant if c else np.nan for c in curves], dtype=np.float64)
+            )
+            for column in columns:
+                column.setflags(write=False)
+            response_table[nutrient] = columns
+
+        return cls(
+            version=str(data.get("version", "unversioned")),
+            products=MappingProxyType(products),
+            grades=MappingProxyType(grades),
+            crops=MappingProxyType(crops),
+            regions=MappingProxyType(regions),
+            source=source,
+            mtime=mtime,
+            data=MappingProxyType(data),
+            product_by_name=MappingProxyType(product_by_name),
+            products_by_grade=MappingProxyType({grade: tuple(ids) for grade, ids in products_by_grade.items()}),
+            crop_table=tuple(crop_table),
+            response_table=MappingProxyType(response_table),
+            agronomy_key=(str(data.get("version", "unversioned")), mtime)
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "FertilizerCatalog":
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls.from_data(data, source=path, mtime=mtime)
+
+    def find_product(self, name: str) -> Optional[str]:
+        """Product id for an id, display name or alias (case-insensitive)"""
+        return self.product_by_name.get(name.lower())
+
+    def schedule_role(self, name: str) -> Optional[str]:
+        """How a named fertilizer is scheduled; None if it is not in the catalog"""
+        product_id = self.find_product(name)
+        if product_id is None:
+            return None
+        return self.grades[self.products[product_id].grade].role
+
+    def application_guidance(self, grade: FertilizerGrade) -> str:
+        return self.grades[grade].application
+
+    def with_prices(self, prices: Dict[str, float], version: Optional[str] = None) -> "FertilizerCatalog":
+        """New catalog version with `prices` (INR/kg by product id) applied"""
+        unknown = [product_id for product_id in prices if product_id not in self.products]
+        if unknown:
+            raise ValueError(f"Unknown fertilizer products: {', '.join(sorted(unknown))}")
+        invalid = [product_id for product_id, price in prices.items() if not float(price) > 0]
+        if invalid:
+            raise ValueError(f"Prices must be positive: {', '.join(sorted(invalid))}")
+
+        data = json.loads(json.dumps(dict(self.data)))
+        for product_id, price in prices.items():
+            data["products"][product_id]["price_per_kg"] = float(price)
+        data["version"] = version or datetime.now(timezone.utc).isoformat(timespec="seconds")
+        catalog = FertilizerCatalog.from_data(data, source=self.source, mtime=self.mtime)
+        return replace(catalog, agronomy_key=self.agronomy_key)
+
+def _validate_curve(name: str, curve: ResponseCurve):
+    if curve.model not in RESPONSE_MODELS:
+        raise ValueError(f"Response curve for {name} has unknown model '{curve.model}'")
+    if not 0 <= curve.zero_yield < 1:
+        raise ValueError(f"Response curve for {name} needs a zero yield in [0, 1)")
+    if curve.model == "quadratic_plateau" and not curve.plateau_rate > 0:
+        raise ValueError(f"Response curve for {name} needs a positive plateau rate")
+    if curve.model == "mitscherlich" and not curve.rate_constant > 0:
+        raise ValueError(f"Response curve for {name} needs a positive rate constant")
+
+class FertilizerCatalogRegistry:
+    """Holds the active FertilizerCatalog and swaps in a rebuilt one on file change or price update"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._catalog: Optional[FertilizerCatalog] = None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._overrides: Dict[str, float] = {}  # in-memory prices kept across file reloads
+        self._override_version: Optional[str] = None
+
+    def current(self) -> FertilizerCatalog:
+        catalog = self._catalog
+        if catalog is None or time.monotonic() >= self._next_check:
+            catalog = self._check()
+        return catalog
+
+    def _check(self) -> FertilizerCatalog:
+        with self._lock:
+            self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+            try:
+                changed = self._catalog is None or os.stat(self.path).st_mtime_ns != self._catalog.mtime
+            except OSError as e:
+                if self._catalog is None:
+                    raise
+                logger.error(f"Fertilizer catalog file unavailable, keeping version {self._catalog.version}: {e}")
+                changed = False
+            if changed:
+                self.reload()
+            return self._catalog
+
+    def reload(self) -> FertilizerCatalog:
+        """Load the data file; on error the previous version stays active"""
+        try:
+            catalog = FertilizerCatalog.from_file(self.path)
+            if self._overrides:
+                overrides = {product: price for product, price in self._overrides.items() if product in catalog.products}
+                catalog = catalog.with_prices(overrides, self._override_version)
+        except Exception as e:
+            if self._catalog is None:
+                raise
+            logger.error(f"❌ Invalid fertilizer catalog in {self.path}, keeping version {self._catalog.version}: {e}")
+            return self._catalog
+        self._catalog = catalog
+        logger.info(f"🧪 Fertilizer catalog version {catalog.version} loaded from {self.path}")
+        return catalog
+
+    def update_prices(self, prices: Dict[str, float], version: Optional[str] = None,
+                      persist: bool = False) -> FertilizerCatalog:
+        """
+        Apply new prices as a new catalog version. By default the prices are
+        held in memory and re-applied whenever the file reloads; the price
+        feed keeps its own snapshots for restarts and other processes. With
+        `persist` the data file is rewritten atomically instead, which is
+        only for registries over a writable copy, never the bundled
+        app/data catalog.
+        """
+        self.current()
+        with self._lock:
+            catalog = self._catalog.with_prices(prices, version)
+            if not persist:
+                self._overrides.update(prices)
+                self._override_version = catalog.version
+            else:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(dict(catalog.data), f, indent=2)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                catalog = replace(catalog, mtime=os.stat(self.path).st_mtime_ns)
+                for product in prices:
+                    # The file now holds these prices; an older override must not win on reload
+                    self._overrides.pop(product, None)
+            self._catalog = catalog
+        logger.info(f"💰 Fertilizer prices updated for {len(prices)} products, catalog version {catalog.version}")
+        return catalog
+
+_registry: Optional[FertilizerCatalogRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_catalog_registry() -> FertilizerCatalogRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = FertilizerCatalogRegistry(settings.FERTILIZER_CATALOG_PATH or DEFAULT_CATALOG_PATH)
+    return _registry
+
+def get_fertilizer_catalog() -> FertilizerCatalog:
+    """Active fertilizer catalog (reloaded when the data file changes)"""
+    return get_catalog_registry().current()
@@ -0,0 +1,215 @@
+"""
+Fertilizer Optimizer Service for FARMGUARD
+
+Chooses a fertilizer mix by linear programming instead of greedy rules.
+Given N, P2O5 and K2O targets, it finds either the cheapest mix that
+meets them, or, when the budget cannot cover that, the mix with the
+highest nutrient coverage the budget allows. Products can optionally be
+bought in whole bags, which turns the LP into a small integer program.
+Solved with HiGHS through scipy.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+logger = logging.getLogger(__name__)
+
+NUTRIENTS = ["n", "p2o5", "k2o"]
+DEFAULT_BAG_KG = 50.0
+# Coverage weights follow the agronomic priority used elsewhere: P > N > K
+DEFAULT_COVERAGE_WEIGHTS = (1.01, 1.02, 1.0)
+COVERAGE_TIE_BREAK = 1e-3  # weighted coverage, after the worst-covered nutrient
+COST_TIE_BREAK = 1e-6  # among equal-coverage mixes, prefer the cheaper one
+BAG_MIP_GAP = 0.01  # whole-bag solves stop within 1% of the best possible cost
+PRUNE_ABOVE = 32  # catalog size above which dominated products are dropped first
+BAG_CANDIDATES = 8  # whole-bag solves above this many products search a reduced set
+
+@dataclass
+class ProductMatrix:
+    """Fertilizer catalog as arrays: nutrient fractions (products, 3) and prices"""
+    ids: List[str]
+    names: List[str]
+    content: np.ndarray  # fraction of N, P2O5, K2O
+    price: np.ndarray  # INR per kg
+    bag_kg: np.ndarray
+
+    @classmethod
+    def from_products(
+        cls,
+        products: Dict,
+        prices: Optional[Dict[str, float]] = None,
+        organic: Optional[bool] = None
+    ) -> "ProductMatrix":
+        """
+        Build from FertilizerProduct records keyed by id. `prices` overrides
+        (e.g. regional prices) by id; `organic` restricts to organic (True)
+        or mineral (False) products.
+        """
+        prices = prices or {}
+        selected = [
+            (key, product) for key, product in products.items()
+            if product.availability and (organic is None or product.organic == organic)
+        ]
+        return cls(
+            ids=[key for key, _ in selected],
+            names=[product.name for _, product in selected],
+            content=np.array(
+                [[p.n_content, p.p2o5_content, p.k2o_content] for _, p in selected], dtype=np.float64
+            ).reshape(-1, 3) / 100.0,
+            price=np.array([prices.get(key, p.price_per_kg) for key, p in selected], dtype=np.float64),
+            bag_kg=np.array([getattr(p, "bag_kg", DEFAULT_BAG_KG) for _, p in selected], dtype=np.float64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+@dataclass
+class FertilizerMix:
+    status: str  # optimal, budget_limited, infeasible
+    amounts: np.ndarray  # kg of each product
+    cost: float
+    supplied: np.ndarray  # kg of N, P2O5, K2O
+    coverage: np.ndarray  # supplied / target, capped at 1 (1 where the target is 0)
+
+    def items(self, products: ProductMatrix, min_kg: float = 0.01) -> List[Tuple[int, float]]:
+        """(product index, kg) for products in the mix, largest first"""
+        used = np.flatnonzero(self.amounts > min_kg)
+        return sorted(((int(i), float(self.amounts[i])) for i in used), key=lambda item: -item[1])
+
+def nondominated(products: ProductMatrix, screen: int = 16) -> np.ndarray:
+    """
+    Indices of products not dominated per rupee: a product is never needed
+    when another supplies at least as much of every nutrient per rupee spent.
+    Screens against the best `screen` products first, then compares the
+    survivors pairwise, so large catalogs shrink to a few dozen columns.
+    """
+    priced = products.price > 0
+    value = np.divide(products.content, products.price[:, None], out=np.zeros_like(products.content),
+                      where=priced[:, None])
+
+    def dominated_by(candidates: np.ndarray, points: np.ndarray) -> np.ndarray:
+        at_least = np.ones((len(candidates), len(points)), dtype=bool)
+        better = np.zeros_like(at_least)
+        for column in range(value.shape[1]):
+            a, b = value[candidates, column][:, None], value[points, column][None, :]
+            at_least &= a >= b
+            better |= a > b
+        return (at_least & better).any(axis=0)
+
+    order = np.argsort(-value.sum(axis=1))
+    survivors = order[~dominated_by(order[:screen], order)]
+    survivors = survivors[~dominated_by(survivors, survivors)]
+    # Free products are always worth keeping
+    return np.union1d(survivors, np.flatnonzero(~priced))
+
+def _finish(status: str, amounts: np.ndarray, products: ProductMatrix, targets: np.ndarray) -> FertilizerMix:
+    amounts = np.maximum(amounts, 0.0)
+    supplied = products.content.T @ amounts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coverage = np.where(targets > 0, np.minimum(1.0, supplied / targets), 1.0)
+    return FertilizerMix(status, amounts, float(products.price @ amounts), supplied, coverage)
+
+def optimize_fertilizer_mix(
+    products: ProductMatrix,
+    targets: Sequence[float],
+    budget: Optional[float] = None,
+    objective: str = "min_cost",
+    weights: Sequence[float] = DEFAULT_COVERAGE_WEIGHTS,
+    whole_bags: bool = False
+) -> FertilizerMix:
+    """
+    Optimal fertilizer mix for N, P2O5 and K2O `targets` (kg).
+
+    objective="min_cost" meets every target at the lowest cost and falls back
+    to maximum coverage when that exceeds `budget`; "max_coverage" always
+    maximizes coverage of the worst-covered nutrient within the budget. With
+    `whole_bags` the amounts are whole multiples of each product's bag size
+    (dominance pruning makes large whole-bag solves a close approximation).
+    """
+    targets = np.maximum(np.asarray(targets, dtype=np.float64), 0.0)
+    m = len(products)
+    if m == 0:
+        return _finish("infeasible", np.zeros(0), products, targets)
+    if not targets.any():
+        return _finish("optimal", np.zeros(m), products, targets)
+
+    # Only non-dominated products can appear in an optimal (continuous) mix
+    columns = nondominated(products) if m > PRUNE_ABOVE else np.arange(m)
+    if whole_bags and len(columns) > BAG_CANDIDATES:
+        columns = _bag_candidates(products, columns, targets, budget, objective, weights)
+    n = len(columns)
+
+    # Decision variables are bags when buying whole bags, kilograms otherwise
+    unit = products.bag_kg[columns] if whole_bags else np.ones(n)
+    content = products.content[columns].T * unit  # (3, n) nutrient per unit
+    price = products.price[columns] * unit
+    needed = targets > 0
+
+    def expand(x: np.ndarray) -> np.ndarray:
+        amounts = np.zeros(m)
+        amounts[columns] = x[:n] * unit
+        return amounts
+
+    if objective == "min_cost":
+        rows = [LinearConstraint(content[needed], lb=targets[needed])]
+        if budget is not None:
+            rows.append(LinearConstraint(price[None, :], ub=budget))
+        x = _solve(price, rows, Bounds(0, np.inf), whole_bags, n)
+        if x is not None:
+            return _finish("optimal", expand(x), products, targets)
+        if budget is None:
+            return _finish("infeasible", np.zeros(m), products, targets)
+
+    if budget is None:
+        raise ValueError("max_coverage needs a budget")
+
+    # Variables: amounts x, coverage s_j <= min(1, supplied_j / target_j), floor t <= s_j.
+    # Maximize the worst-covered nutrient first (law of the minimum), then weighted
+    # coverage, then prefer the cheaper of otherwise equal mixes.
+    k = int(needed.sum())
+    w = np.asarray(weights, dtype=np.float64)[needed]
+    c = np.concatenate([price * COST_TIE_BREAK / max(budget, 1.0), -COVERAGE_TIE_BREAK * w, [-1.0]])
+    coverage_rows = np.hstack([-content[needed], np.diag(targets[needed]), np.zeros((k, 1))])
+    floor_rows = np.hstack([np.zeros((k, n)), -np.eye(k), np.ones((k, 1))])
+    budget_row = np.concatenate([price, np.zeros(k + 1)])[None, :]
+    rows = [
+        LinearConstraint(np.vstack([coverage_rows, floor_rows]), ub=np.zeros(2 * k)),
+        LinearConstraint(budget_row, ub=budget)
+    ]
+    bounds = Bounds(np.zeros(n + k + 1), np.concatenate([np.full(n, np.inf), np.ones(k + 1)]))
+    x = _solve(c, rows, bounds, whole_bags, n, k + 1)
+    if x is None:
+        return _finish("infeasible", np.zeros(m), products, targets)
+
+    mix = _finish("budget_limited", expand(x), products, targets)
+    if mix.coverage.min() >= 1.0 - 1e-9:
+        mix.status = "optimal"
+    return mix
+
+def _bag_candidates(products: ProductMatrix, columns: np.ndarray, targets: np.ndarray,
+                    budget: Optional[float], objective: str, weights: Sequence[float]) -> np.ndarray:
+    """
+    Products worth considering for a whole-bag mix: those in the continuous
+    optimum, plus the cheapest few sources of each nutrient to round with.
+    """
+    subset = ProductMatrix(
+        [products.ids[i] for i in columns], [products.names[i] for i in columns],
+        products.content[columns], products.price[columns], products.bag_kg[columns]
+    )
+    relaxed = optimize_fertilizer_mix(subset, targets, budget, objective, weights)
+    keep = set(columns[relaxed.amounts > 0].tolist())
+    value = subset.content / np.maximum(subset.price, 1e-9)[:, None]
+    for nutrient in np.flatnonzero(targets > 0):
+        keep.update(columns[np.argsort(-value[:, nutrient])[:2]].tolist())
+    return np.array(sorted(keep))
+
+def _solve(c: np.ndarray, constraints: List[LinearConstraint], bounds: Bounds,
+           whole_bags: bool, n: int, extra: int = 0) -> Optional[np.ndarray]:
+    integrality = np.concatenate([np.full(n, 1 if whole_bags else 0), np.zeros(extra)])
+    options = {"mip_rel_gap": BAG_MIP_GAP} if whole_bags else {}
+    result = milp(c, constraints=constraints, bounds=bounds, integrality=integrality, options=options)
+    return result.x if result.status == 0 else None
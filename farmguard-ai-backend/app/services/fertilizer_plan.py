@@ -0,0 +1,164 @@
+"""
+Fertilizer Plan Service for FARMGUARD
+
+Runs the FertilizerCalculator pipeline (nutrient requirements -> product
+mix -> application schedule -> cost-benefit) for one field in one call.
+Each stage is memoized on the inputs it actually depends on, so a request
+that only moves the planting date, the crop price or fertilizer prices
+reuses the upstream stages and recomputes only what is downstream. Mix
+and later stages are keyed by the prices of just the products the mix
+can use and tagged with them, so a price change evicts only those plans.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.fertilizer_catalog import FertilizerCatalog, get_fertilizer_catalog
+from app.services.fertilizer_calculator import ApplicationSchedule, FertilizerCalculator, SoilTestResult
+from app.services.result_cache import BoundedLRUCache
+
+logger = logging.getLogger(__name__)
+
+PLAN_STAGES = ["requirements", "mix", "schedule", "economics"]
+RISK_SEED = 0  # fixed so a cached and a recomputed simulation agree
+
+@dataclass(frozen=True)
+class PlanInputs:
+    crop: str
+    ph: float
+    nitrogen: float  # kg/ha
+    phosphorus: float  # kg/ha
+    potassium: float  # kg/ha
+    organic_matter: float  # percentage
+    farm_size: float  # hectares
+    planting_date: date
+    crop_price: float  # INR per tonne of produce
+    target_yield: Optional[float] = None  # tons/hectare
+    region: Optional[str] = None
+    budget: Optional[float] = None  # INR for the whole farm
+    organic_preference: bool = False
+    optimize: bool = True
+    whole_bags: bool = False
+    risk_scenarios: int = 0  # Monte Carlo scenarios for the economics; 0 skips the simulation
+
+@dataclass
+class FertilizerPlan:
+    catalog_version: str
+    requirements: Dict[str, float]  # kg/ha
+    fertilizers: List[Dict]  # per hectare, in recommend_fertilizers format
+    schedule: List[Dict]  # dated, for the whole farm
+    economics: Dict
+    stages: Dict[str, str] = field(default_factory=dict)  # stage -> "computed" or "cached"
+
+class FertilizerPlanner:
+    """Memoized plan pipeline; one LRU cache per stage"""
+
+    def __init__(self, cache_size: Optional[int] = None):
+        size = cache_size if cache_size is not None else settings.FERTILIZER_PLAN_CACHE_SIZE
+        self.caches = {stage: BoundedLRUCache(size) for stage in PLAN_STAGES}
+
+    def _stage(self, stage: str, key: Tuple, products: Tuple[str, ...], compute, trace: Dict[str, str]):
+        cache = self.caches[stage]
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.put(key, value, tags=products)
+            trace[stage] = "computed"
+        else:
+            trace[stage] = "cached"
+        return value
+
+    def plan(self, inputs: PlanInputs, catalog: Optional[FertilizerCatalog] = None) -> FertilizerPlan:
+        """Full plan on one catalog version; raises ValueError for crops without requirements"""
+        catalog = catalog or get_fertilizer_catalog()
+        calculator = FertilizerCalculator(catalog=catalog)
+        trace: Dict[str, str] = {}
+
+        # Requirements depend on crop and regional data only, so price updates keep them
+        requirements_key = (
+            catalog.agronomy_key, inputs.crop, inputs.ph, inputs.nitrogen, inputs.phosphorus,
+            inputs.potassium, inputs.organic_matter, inputs.target_yield, inputs.region
+        )
+        requirements = self._stage("requirements", requirements_key, (), lambda: calculator.calculate_nutrient_requirements(
+            inputs.crop,
+            SoilTestResult(inputs.ph, inputs.nitrogen, inputs.phosphorus, inputs.potassium, inputs.organic_matter),
+            target_yield=inputs.target_yield,
+            region=inputs.region
+        ), trace)
+
+        # The calculator works per hectare, so a farm budget becomes a per-hectare one
+        budget_per_hectare = inputs.budget / inputs.farm_size if inputs.budget else None
+        products = calculator.price_dependencies(inputs.organic_preference, inputs.optimize)
+        prices = tuple(catalog.products[product_id].price_per_kg for product_id in products)
+        mix_key = (
+            requirements_key, products, prices, budget_per_hectare,
+            inputs.organic_preference, inputs.optimize, inputs.whole_bags
+        )
+        fertilizers = self._stage("mix", mix_key, products, lambda: calculator.recommend_fertilizers(
+            requirements,
+            budget=budget_per_hectare,
+            organic_preference=inputs.organic_preference,
+            optimize=inputs.optimize,
+            whole_bags=inputs.whole_bags
+        ), trace)
+
+        # Schedules are kept in days after planting; dates are attached per request
+        schedule = self._stage("schedule", mix_key, products, lambda: calculator.create_application_schedule(
+            inputs.crop, fertilizers, inputs.planting_date.isoformat()
+        ), trace)
+
+        def economics_stage() -> Dict:
+            economics = calculator.calculate_cost_benefit_analysis(
+                fertilizers, inputs.crop, inputs.farm_size, inputs.crop_price
+            )
+            if inputs.risk_scenarios:
+                economics["risk"] = calculator.simulate_cost_benefit_analysis(
+                    fertilizers, inputs.crop, inputs.farm_size, inputs.crop_price,
+                    scenarios=inputs.risk_scenarios, seed=RISK_SEED
+                )
+            return economics
+
+        economics_key = (mix_key, inputs.farm_size, inputs.crop_price, inputs.risk_scenarios)
+        economics = self._stage("economics", economics_key, products, economics_stage, trace)
+
+        return FertilizerPlan(
+            catalog_version=catalog.version,
+            requirements={nutrient: round(amount, 2) for nutrient, amount in requirements.items()},
+            fertilizers=[_fertilizer_entry(rec) for rec in fertilizers],
+            schedule=[_dated_application(a, inputs.planting_date, inputs.farm_size) for a in schedule],
+            economics=dict(economics),
+            stages=trace
+        )
+
+    def invalidate_products(self, products) -> int:
+        """Evict cached stages priced with any of `products`; returns the number removed"""
+        products = set(products)
+        return sum(cache.invalidate(products) for cache in self.caches.values())
+
+    def stats(self) -> Dict[str, Dict]:
+        return {stage: cache.stats() for stage, cache in self.caches.items()}
+
+def _fertilizer_entry(rec: Dict) -> Dict:
+    return {
+        "fertilizer": rec["fertilizer"],
+        "amount_per_hectare": round(rec["amount"], 2),
+        "cost_per_hectare": round(rec["cost"], 2),
+        "nutrients_supplied": {nutrient: round(kg, 2) for nutrient, kg in rec["nutrients_supplied"].items()},
+        "application": rec["application"]
+    }
+
+def _dated_application(application: ApplicationSchedule, planting_date: date, farm_size: float) -> Dict:
+    return {
+        "date": (planting_date + timedelta(days=application.days_after_planting)).isoformat(),
+        "days_after_planting": application.days_after_planting,
+        "stage": application.stage,
+        "nutrient": application.nutrient,
+        "fertilizer": application.fertilizer,
+        "amount_per_hectare": round(application.amount, 2),
+        "total_amount": round(application.amount * farm_size, 2),
+        "method": application.method.value,
+        "weather_conditions": list(application.weather_conditions)
+    }
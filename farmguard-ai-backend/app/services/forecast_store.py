@@ -0,0 +1,213 @@
+"""
+Local Forecast Store for FARMGUARD
+
+Persists every fetched forecast in a compact SQLite time-series table so the
+weather service can keep serving the last known forecast when providers are
+unreachable, and answer history range queries for a location.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Iterable, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_cells (
+    cell INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    country TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS forecast_days (
+    cell INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    low INTEGER NOT NULL,
+    humidity INTEGER NOT NULL,
+    wind_speed INTEGER NOT NULL,
+    rainfall INTEGER NOT NULL,
+    visibility INTEGER NOT NULL,
+    condition TEXT NOT NULL,
+    PRIMARY KEY (cell, day)
+) WITHOUT ROWID;
+"""
+
+@dataclass
+class StoredForecastDay:
+    day: date
+    high: int
+    low: int
+    humidity: int
+    wind_speed: int  # km/h
+    rainfall: int  # mm
+    visibility: int  # km
+    condition: str
+    fetched_at: int = 0  # unix seconds, set by the store
+
+@dataclass
+class StoredForecast:
+    cell: int
+    name: str
+    country: str
+    lat: float
+    lon: float
+    fetched_at: int  # unix seconds
+    source: str
+    days: List[StoredForecastDay] = field(default_factory=list)
+
+    @property
+    def age_seconds(self) -> int:
+        return max(0, int(time.time()) - self.fetched_at)
+
+def cell_id(lat: float, lon: float, cell_size: Optional[float] = None) -> int:
+    """Map a coordinate onto the integer id of its forecast grid cell"""
+    size = cell_size or settings.FORECAST_CELL_SIZE_DEG
+    columns = math.ceil(360.0 / size)
+    row = int(math.floor((min(max(lat, -90.0), 90.0) + 90.0) / size))
+    column = int(math.floor(((lon + 180.0) % 360.0) / size))
+    return row * columns + column
+
+LOCAL_STORE_FILE = "farmguard_local.db"
+
+def sqlite_path_from_url(database_url: str) -> str:
+    """
+    File path of a sqlite:/// database URL. The local stores (forecasts,
+    climatology, pest risk, sketches, soil map) are SQLite files, so for
+    any other database a local file under DATA_DIR is used instead.
+    """
+    if database_url.startswith("sqlite:///"):
+        return database_url[len("sqlite:///"):]
+    path = os.path.join(settings.DATA_DIR, LOCAL_STORE_FILE)
+    logger.warning(f"⚠️ DATABASE_URL is not SQLite; local stores use {path}")
+    return path
+
+class ForecastStore:
+    """Append-and-overwrite time-series store of daily forecasts keyed by (cell, day)"""
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.path = sqlite_path_from_url(database_url or settings.DATABASE_URL)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def save_forecast(
+        self,
+        lat: float,
+        lon: float,
+        name: str,
+        country: str,
+        days: Iterable[StoredForecastDay],
+        source: str,
+        fetched_at: Optional[int] = None
+    ) -> int:
+        """Write one fetched forecast; newer forecasts replace older ones for the same day"""
+        cell = cell_id(lat, lon)
+        fetched_at = fetched_at or int(time.time())
+        rows = [
+            (cell, d.day.toordinal(), fetched_at, d.high, d.low, d.humidity,
+             d.wind_speed, d.rainfall, d.visibility, d.condition)
+            for d in days
+        ]
+
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO forecast_cells VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (cell, name, country, lat, lon, fetched_at, source)
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO forecast_days VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+
+        return cell
+
+    def latest_forecast(self, lat: float, lon: float, from_day: Optional[date] = None) -> Optional[StoredForecast]:
+        """Return the last known forecast for a location, starting at `from_day` (default today)"""
+        cell = cell_id(lat, lon)
+        start = (from_day or date.today()).toordinal()
+
+        with self._lock:
+            connection = self._connect()
+            meta = connection.execute(
+                "SELECT name, country, lat, lon, fetched_at, source FROM forecast_cells WHERE cell = ?",
+                (cell,)
+            ).fetchone()
+            if meta is None:
+                return None
+            rows = connection.execute(
+                "SELECT * FROM forecast_days WHERE cell = ? AND day >= ? ORDER BY day",
+                (cell, start)
+            ).fetchall()
+
+        if not rows:
+            return None
+
+        name, country, cell_lat, cell_lon, fetched_at, source = meta
+        return StoredForecast(
+            cell=cell,
+            name=name,
+            country=country,
+            lat=cell_lat,
+            lon=cell_lon,
+            fetched_at=fetched_at,
+            source=source,
+            days=[_row_to_day(row) for row in rows]
+        )
+
+    def history(self, lat: float, lon: float, start: date, end: date) -> List[StoredForecastDay]:
+        """Range query over stored days for a location (inclusive)"""
+        cell = cell_id(lat, lon)
+
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT * FROM forecast_days WHERE cell = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (cell, start.toordinal(), end.toordinal())
+            ).fetchall()
+
+        return [_row_to_day(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+def _row_to_day(row: tuple) -> StoredForecastDay:
+    _, day, fetched_at, high, low, humidity, wind_speed, rainfall, visibility, condition = row
+    return StoredForecastDay(
+        day=date.fromordinal(day),
+        fetched_at=fetched_at,
+        high=high,
+        low=low,
+        humidity=humidity,
+        wind_speed=wind_speed,
+        rainfall=rainfall,
+        visibility=visibility,
+        condition=condition
+    )
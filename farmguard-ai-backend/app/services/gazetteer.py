@@ -0,0 +1,266 @@
+"""
+Offline Gazetteer Service for FARMGUARD
+
+Resolves Indian village, town and district names to coordinates (and back)
+without network access. The source CSV is compiled into a compact binary
+file that is memory-mapped at runtime:
+
+    header | kd-ordered unit vectors (float32) | lat/lon (float32)
+           | label offsets (uint32) | sorted name index (uint32) | key offsets (uint32)
+           | split axes (uint8) | kind (uint8) | label blob | key blob
+
+Name lookups binary-search the sorted key index; reverse geocoding walks an
+implicit KD-tree (see app.services.spatial_index).
+"""
+
+import csv
+import difflib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.spatial_index import KDTree, to_unit_vectors, build_kd_order
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FGGZ"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIIII")  # magic, version, count, label blob size, key blob size
+
+# Lower rank wins when several places share a name
+PLACE_KINDS = ["district", "town", "village"]
+
+DEFAULT_SOURCE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer_places.csv")
+
+@dataclass
+class Place:
+    name: str
+    kind: str
+    district: str
+    state: str
+    lat: float
+    lon: float
+
+    @property
+    def canonical_name(self) -> str:
+        parts = [self.name]
+        if self.district and self.district != self.name:
+            parts.append(self.district)
+        parts.append(self.state)
+        return ", ".join(parts)
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation so 'Sri Muktsar Sahib' == 'sri-muktsar sahib'"""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", ascii_name.lower()).strip()
+
+def build_gazetteer(source_path: str, output_path: str) -> int:
+    """Compile a places CSV (name,kind,district,state,lat,lon) into the binary format"""
+    names, kinds, labels, lats, lons = [], [], [], [], []
+
+    with open(source_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            kind = row["kind"].strip().lower()
+            if kind not in PLACE_KINDS:
+                raise ValueError(f"Unknown place kind '{kind}' for {row['name']}")
+            names.append(row["name"].strip())
+            kinds.append(PLACE_KINDS.index(kind))
+            labels.append("\x1f".join([row["name"].strip(), row["district"].strip(), row["state"].strip()]))
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+
+    count = len(names)
+    points = to_unit_vectors(lats, lons)
+    order, split_axes = build_kd_order(points)
+
+    label_blob, label_offsets = _pack_strings([labels[i] for i in order])
+
+    # Name index: tree positions sorted by normalized key, ties broken by kind
+    keys = [normalize_name(names[i]) for i in order]
+    kind_array = np.asarray(kinds, dtype=np.uint8)[order]
+    name_index = sorted(range(count), key=lambda i: (keys[i], kind_array[i]))
+    key_blob, key_offsets = _pack_strings([keys[i] for i in name_index])
+
+    tmp_path = f"{output_path}.tmp"
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, count, len(label_blob), len(key_blob)))
+        f.write(points[order].astype("<f4").tobytes())
+        f.write(np.asarray(lats, dtype="<f4")[order].tobytes())
+        f.write(np.asarray(lons, dtype="<f4")[order].tobytes())
+        f.write(label_offsets.tobytes())
+        f.write(np.asarray(name_index, dtype="<u4").tobytes())
+        f.write(key_offsets.tobytes())
+        f.write(split_axes.tobytes())
+        f.write(kind_array.tobytes())
+        f.write(label_blob)
+        f.write(key_blob)
+
+    os.replace(tmp_path, output_path)
+    logger.info(f"Gazetteer compiled: {count} places -> {output_path}")
+    return count
+
+def _pack_strings(values: List[str]) -> Tuple[bytes, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+class Gazetteer:
+    """Read-only view over a compiled, memory-mapped gazetteer file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, label_size, key_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported gazetteer file: {path}")
+
+        self.count = count
+        offset = HEADER.size
+
+        def take(dtype: str, length: int) -> np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(self._map, dtype=dtype, count=length, offset=offset)
+            offset += array.nbytes
+            return array
+
+        points = take("<f4", count * 3).reshape(count, 3)
+        self._lat = take("<f4", count)
+        self._lon = take("<f4", count)
+        self._label_offsets = take("<u4", count + 1)
+        self._name_index = take("<u4", count)
+        self._key_offsets = take("<u4", count + 1)
+        split_axes = take("u1", count)
+        self._kind = take("u1", count)
+        self._labels = memoryview(self._map)[offset:offset + label_size]
+        self._keys = memoryview(self._map)[offset + label_size:offset + label_size + key_size]
+
+        self._tree = KDTree(points, split_axes)
+
+    def _key(self, rank: int) -> str:
+        return bytes(self._keys[self._key_offsets[rank]:self._key_offsets[rank + 1]]).decode("utf-8")
+
+    def _place(self, index: int) -> Place:
+        label = bytes(self._labels[self._label_offsets[index]:self._label_offsets[index + 1]]).decode("utf-8")
+        name, district, state = label.split("\x1f")
+        return Place(
+            name=name,
+            kind=PLACE_KINDS[self._kind[index]],
+            district=district,
+            state=state,
+            lat=round(float(self._lat[index]), 5),
+            lon=round(float(self._lon[index]), 5)
+        )
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _prefix_ranks(self, prefix: str, limit: int) -> List[int]:
+        ranks = []
+        rank = self._lower_bound(prefix)
+        while rank < self.count and len(ranks) < limit and self._key(rank).startswith(prefix):
+            ranks.append(rank)
+            rank += 1
+        return ranks
+
+    def _fuzzy_candidates(self, key: str) -> dict:
+        """
+        Keys sharing the first character whose length allows a 0.75 match.
+
+        difflib's ratio is at most 2 * min(a, b) / (a + b), so a name
+        shorter than 0.6x or longer than 1/0.6x the query can never reach
+        the cutoff. Lengths come from the key offsets, so only names of a
+        plausible length are decoded.
+        """
+        lo = self._lower_bound(key[0])
+        hi = self._lower_bound(chr(ord(key[0]) + 1))
+        lengths = np.diff(self._key_offsets[lo:hi + 1].astype(np.int64))
+        plausible = np.flatnonzero((lengths * 5 >= len(key) * 3) & (len(key) * 5 >= lengths * 3))
+        return {self._key(lo + int(i)): lo + int(i) for i in plausible}
+
+    def search(self, query: str, limit: int = 5) -> List[Place]:
+        """Prefix search on place names, falling back to fuzzy matching"""
+        name, _, qualifier = query.partition(",")
+        key = normalize_name(name)
+        if not key:
+            return []
+
+        qualifier = normalize_name(qualifier)
+        scan_limit = limit * 20 if qualifier else limit
+
+        ranks = self._prefix_ranks(key, scan_limit)
+        if not ranks:
+            # Fuzzy fallback over names sharing the first character
+            candidates = self._fuzzy_candidates(key)
+            for match in difflib.get_close_matches(key, list(candidates), n=scan_limit, cutoff=0.75):
+                rank = self._lower_bound(match)
+                while rank < self.count and self._key(rank) == match:
+                    ranks.append(rank)
+                    rank += 1
+
+        # Exact names first, then by kind (districts before towns before villages)
+        ranks.sort(key=lambda r: (self._key(r) != key, self._kind[self._name_index[r]], len(self._key(r))))
+        places = [self._place(int(self._name_index[r])) for r in ranks]
+
+        if qualifier:
+            places = [
+                p for p in places
+                if qualifier in (normalize_name(p.district), normalize_name(p.state))
+            ]
+
+        return places[:limit]
+
+    def resolve(self, query: str) -> Optional[Place]:
+        """Best single match for a place name (e.g. 'Khanna' or 'Khanna, Punjab')"""
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
+
+    def reverse(self, lat: float, lon: float) -> Optional[Tuple[Place, float]]:
+        """Nearest known place to a coordinate, with its distance in km"""
+        result = self._tree.nearest(lat, lon)
+        if result is None:
+            return None
+        index, distance = result
+        return self._place(index), round(distance, 2)
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Load the shared gazetteer, compiling it from the source CSV when missing
+    or outdated. The app opens it at startup, off the event loop, so request
+    handlers find it loaded.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                source = settings.GAZETTEER_SOURCE_PATH or DEFAULT_SOURCE_PATH
+                path = settings.GAZETTEER_PATH
+                if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+                    build_gazetteer(source, path)
+                _gazetteer = Gazetteer(path)
+    return _gazetteer
@@ -0,0 +1,254 @@
+"""
+Irrigation Scheduling Service for FARMGUARD
+
+Computes FAO-56 Penman-Monteith reference evapotranspiration from the daily
+forecast fields we already parse (temperature range, humidity, wind), turns
+it into crop water demand with stage-dependent crop coefficients, and runs a
+root-zone water balance to schedule irrigation. Everything operates on NumPy
+arrays of shape (plots, days) so thousands of plots are scheduled per call.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STEFAN_BOLTZMANN = 4.903e-9  # MJ K-4 m-2 day-1
+SOLAR_CONSTANT = 0.0820  # MJ m-2 min-1
+WIND_HEIGHT_M = 10.0  # forecast wind is reported at 10 m
+HARGREAVES_KRS = 0.16  # interior locations; 0.19 for coastal
+DEFAULT_ELEVATION_M = 250.0
+DEFAULT_IRRIGATION_EFFICIENCY = 0.7  # surface irrigation
+MIN_CHUNK_SIZE = 20000
+
+@dataclass(frozen=True)
+class CropCoefficients:
+    kc_ini: float
+    kc_mid: float
+    kc_end: float
+    stage_days: tuple  # initial, development, mid-season, late-season
+    root_depth_m: float  # maximum effective rooting depth
+    depletion_fraction: float  # FAO-56 p: share of TAW usable before stress
+
+# FAO-56 Tables 11, 12 and 22, with stage lengths for Indian growing seasons
+CROP_COEFFICIENTS: Dict[str, CropCoefficients] = {
+    "rice": CropCoefficients(1.05, 1.20, 0.90, (30, 30, 60, 30), 0.5, 0.20),
+    "wheat": CropCoefficients(0.40, 1.15, 0.30, (20, 25, 60, 30), 1.5, 0.55),
+    "maize": CropCoefficients(0.30, 1.20, 0.35, (20, 35, 40, 30), 1.5, 0.55),
+    "sugarcane": CropCoefficients(0.40, 1.25, 0.75, (35, 60, 190, 120), 1.5, 0.65),
+    "cotton": CropCoefficients(0.35, 1.15, 0.60, (30, 50, 60, 55), 1.4, 0.65),
+    "soybean": CropCoefficients(0.40, 1.15, 0.50, (20, 30, 60, 25), 1.0, 0.50),
+    "onion": CropCoefficients(0.70, 1.05, 0.75, (15, 25, 70, 40), 0.45, 0.30),
+    "potato": CropCoefficients(0.50, 1.15, 0.75, (25, 30, 45, 30), 0.5, 0.35),
+    "tomato": CropCoefficients(0.60, 1.15, 0.80, (30, 40, 40, 25), 1.0, 0.40),
+    "cabbage": CropCoefficients(0.70, 1.05, 0.95, (40, 60, 50, 15), 0.6, 0.45),
+}
+
+# Available water capacity by soil type (mm water per m of soil)
+SOIL_WATER_CAPACITY_MM_PER_M = {
+    "sandy": 70.0,
+    "red": 100.0,
+    "loamy": 140.0,
+    "alluvial": 150.0,
+    "silt": 160.0,
+    "clay": 180.0,
+    "black": 190.0,
+}
+
+CROP_CODES = list(CROP_COEFFICIENTS)
+SOIL_CODES = list(SOIL_WATER_CAPACITY_MM_PER_M)
+
+# Per-crop parameter columns indexed by crop code
+_KC = np.array([[c.kc_ini, c.kc_mid, c.kc_end] for c in CROP_COEFFICIENTS.values()])
+_STAGE_ENDS = np.cumsum([c.stage_days for c in CROP_COEFFICIENTS.values()], axis=1)
+_ROOT_DEPTH = np.array([c.root_depth_m for c in CROP_COEFFICIENTS.values()])
+_DEPLETION_FRACTION = np.array([c.depletion_fraction for c in CROP_COEFFICIENTS.values()])
+_SOIL_AWC = np.array(list(SOIL_WATER_CAPACITY_MM_PER_M.values()))
+
+@dataclass
+class PlotArrays:
+    """Struct-of-arrays description of the plots to schedule (length n)"""
+    lat: np.ndarray
+    crop_code: np.ndarray  # index into CROP_CODES
+    soil_code: np.ndarray  # index into SOIL_CODES
+    days_after_planting: np.ndarray  # on the first forecast day
+    initial_depletion_mm: np.ndarray  # root-zone depletion on the first forecast day
+    area_ha: np.ndarray
+
+@dataclass
+class WeatherArrays:
+    """Daily forecast fields aligned with the plots, shape (n, days)"""
+    tmax: np.ndarray  # °C
+    tmin: np.ndarray  # °C
+    humidity: np.ndarray  # mean relative humidity, %
+    wind_kmh: np.ndarray  # at 10 m
+    rainfall: np.ndarray  # mm
+    day_of_year: np.ndarray  # shape (days,) or (n, days)
+
+@dataclass
+class IrrigationSchedule:
+    et0: np.ndarray  # mm/day, (n, days)
+    etc: np.ndarray  # mm/day, (n, days)
+    net_irrigation_mm: np.ndarray  # (n, days), zero on days without irrigation
+    gross_irrigation_mm: np.ndarray  # (n, days)
+    volume_m3: np.ndarray  # (n, days)
+    final_depletion_mm: np.ndarray  # (n,)
+    readily_available_water_mm: np.ndarray  # (n,)
+
+def encode_crops(crops: List[str]) -> np.ndarray:
+    return np.array([CROP_CODES.index(str(getattr(c, "value", c)).lower()) for c in crops], dtype=np.int16)
+
+def encode_soils(soils: List[Optional[str]]) -> np.ndarray:
+    return np.array([SOIL_CODES.index(str(getattr(s, "value", s) or "loamy").lower()) for s in soils], dtype=np.int16)
+
+def reference_evapotranspiration(
+    tmax: np.ndarray,
+    tmin: np.ndarray,
+    humidity: np.ndarray,
+    wind_kmh: np.ndarray,
+    lat: np.ndarray,
+    day_of_year: np.ndarray,
+    elevation_m: float = DEFAULT_ELEVATION_M
+) -> np.ndarray:
+    """FAO-56 Penman-Monteith ET0 (mm/day); radiation estimated from the temperature range (Hargreaves)"""
+    tmax = np.asarray(tmax, dtype=np.float64)
+    tmin = np.minimum(np.asarray(tmin, dtype=np.float64), tmax)
+    tmean = (tmax + tmin) / 2.0
+
+    pressure = 101.3 * ((293.0 - 0.0065 * elevation_m) / 293.0) ** 5.26
+    gamma = 0.000665 * pressure
+
+    def saturation_vapour_pressure(t):
+        return 0.6108 * np.exp(17.27 * t / (t + 237.3))
+
+    delta = 4098.0 * saturation_vapour_pressure(tmean) / (tmean + 237.3) ** 2
+    es = (saturation_vapour_pressure(tmax) + saturation_vapour_pressure(tmin)) / 2.0
+    ea = es * np.clip(humidity, 0, 100) / 100.0
+
+    u2 = (np.asarray(wind_kmh, dtype=np.float64) / 3.6) * 4.87 / np.log(67.8 * WIND_HEIGHT_M - 5.42)
+
+    # Extraterrestrial radiation (eq. 21)
+    phi = np.radians(np.asarray(lat, dtype=np.float64))[..., None] if np.ndim(tmax) > 1 else np.radians(lat)
+    angle = 2.0 * np.pi * np.asarray(day_of_year) / 365.0
+    dr = 1.0 + 0.033 * np.cos(angle)
+    declination = 0.409 * np.sin(angle - 1.39)
+    ws = np.arccos(np.clip(-np.tan(phi) * np.tan(declination), -1.0, 1.0))
+    ra = (24.0 * 60.0 / np.pi) * SOLAR_CONSTANT * dr * (
+        ws * np.sin(phi) * np.sin(declination) + np.cos(phi) * np.cos(declination) * np.sin(ws)
+    )
+
+    rs = HARGREAVES_KRS * np.sqrt(tmax - tmin) * ra
+    rso = (0.75 + 2e-5 * elevation_m) * ra
+    rns = (1.0 - 0.23) * rs
+    relative_shortwave = np.clip(np.divide(rs, rso, out=np.ones_like(rs), where=rso > 0), 0.3, 1.0)
+    rnl = STEFAN_BOLTZMANN * (((tmax + 273.16) ** 4 + (tmin + 273.16) ** 4) / 2.0) \
+        * (0.34 - 0.14 * np.sqrt(ea)) * (1.35 * relative_shortwave - 0.35)
+    rn = rns - rnl
+
+    et0 = (0.408 * delta * rn + gamma * (900.0 / (tmean + 273.0)) * u2 * (es - ea)) \
+        / (delta + gamma * (1.0 + 0.34 * u2))
+    return np.maximum(et0, 0.0)
+
+def crop_coefficient(crop_code: np.ndarray, days_after_planting: np.ndarray) -> np.ndarray:
+    """Piecewise-linear FAO-56 Kc curve; zero outside the growing season"""
+    d = np.asarray(days_after_planting, dtype=np.float64)
+    ends = _STAGE_ENDS[crop_code]
+    kc = _KC[crop_code]
+    if d.ndim > 1:
+        ends = ends[:, None, :]
+        kc = kc[:, None, :]
+    ini_end, dev_end, mid_end, late_end = (ends[..., i] for i in range(4))
+    kc_ini, kc_mid, kc_end = (kc[..., i] for i in range(3))
+
+    dev_progress = np.clip((d - ini_end) / (dev_end - ini_end), 0.0, 1.0)
+    late_progress = np.clip((d - mid_end) / (late_end - mid_end), 0.0, 1.0)
+    value = np.where(
+        d <= ini_end, kc_ini,
+        np.where(d <= dev_end, kc_ini + dev_progress * (kc_mid - kc_ini),
+                 np.where(d <= mid_end, kc_mid, kc_mid + late_progress * (kc_end - kc_mid)))
+    )
+    return np.where((d >= 0) & (d <= late_end), value, 0.0)
+
+def effective_rainfall(rainfall: np.ndarray) -> np.ndarray:
+    """Rain reaching the root zone: light showers (<= 5 mm) are lost, 80% of the rest counts"""
+    rainfall = np.asarray(rainfall, dtype=np.float64)
+    return np.where(rainfall > 5.0, 0.8 * rainfall, 0.0)
+
+def _schedule_chunk(plots: PlotArrays, weather: WeatherArrays, efficiency: float) -> IrrigationSchedule:
+    n, days = weather.tmax.shape
+    et0 = reference_evapotranspiration(
+        weather.tmax, weather.tmin, weather.humidity, weather.wind_kmh, plots.lat, weather.day_of_year
+    )
+    dap = plots.days_after_planting[:, None] + np.arange(days)[None, :]
+    etc = et0 * crop_coefficient(plots.crop_code, dap)
+    rain = effective_rainfall(weather.rainfall)
+
+    # Root zone grows from 0.3 m to its maximum over the initial + development stages
+    dev_end = _STAGE_ENDS[plots.crop_code, 1]
+    max_root = _ROOT_DEPTH[plots.crop_code]
+    root_depth = 0.3 + (max_root - 0.3) * np.clip(plots.days_after_planting / dev_end, 0.0, 1.0)
+    taw = _SOIL_AWC[plots.soil_code] * np.maximum(root_depth, 0.3)
+    raw = _DEPLETION_FRACTION[plots.crop_code] * taw
+
+    depletion = np.minimum(np.asarray(plots.initial_depletion_mm, dtype=np.float64), taw)
+    net = np.zeros((n, days))
+    for d in range(days):
+        depletion = np.clip(depletion - rain[:, d] + etc[:, d], 0.0, taw)
+        irrigate = depletion > raw
+        net[:, d] = np.where(irrigate, depletion, 0.0)
+        depletion = np.where(irrigate, 0.0, depletion)
+
+    gross = net / efficiency
+    return IrrigationSchedule(
+        et0=et0,
+        etc=etc,
+        net_irrigation_mm=net,
+        gross_irrigation_mm=gross,
+        volume_m3=gross * 10.0 * plots.area_ha[:, None],  # 1 mm over 1 ha = 10 m3
+        final_depletion_mm=depletion,
+        readily_available_water_mm=raw
+    )
+
+def schedule_irrigation(
+    plots: PlotArrays,
+    weather: WeatherArrays,
+    efficiency: float = DEFAULT_IRRIGATION_EFFICIENCY,
+    workers: Optional[int] = None
+) -> IrrigationSchedule:
+    """
+    Schedule irrigation for a batch of plots.
+
+    Large batches are split into contiguous chunks evaluated on a thread pool;
+    NumPy releases the GIL inside its kernels, so chunks run on separate cores.
+    """
+    n = len(plots.lat)
+    workers = workers or os.cpu_count() or 1
+    chunks = max(1, min(workers, n // MIN_CHUNK_SIZE))
+    if chunks == 1:
+        return _schedule_chunk(plots, weather, efficiency)
+
+    bounds = np.linspace(0, n, chunks + 1, dtype=int)
+
+    def run(i: int) -> IrrigationSchedule:
+        part = slice(bounds[i], bounds[i + 1])
+        return _schedule_chunk(
+            PlotArrays(*(getattr(plots, f)[part] for f in PlotArrays.__dataclass_fields__)),
+            WeatherArrays(
+                *(getattr(weather, f)[part] for f in ("tmax", "tmin", "humidity", "wind_kmh", "rainfall")),
+                weather.day_of_year[part] if weather.day_of_year.ndim > 1 else weather.day_of_year
+            ),
+            efficiency
+        )
+
+    with ThreadPoolExecutor(max_workers=chunks) as executor:
+        parts = list(executor.map(run, range(chunks)))
+
+    return IrrigationSchedule(*(
+        np.concatenate([getattr(p, f) for p in parts])
+        for f in IrrigationSchedule.__dataclass_fields__
+    ))
@@ -0,0 +1,207 @@
+"""
+Nutrient Economics Service for FARMGUARD
+
+Economically optimal nutrient rates (EONR) from per-crop yield response
+curves. Each crop's catalog entry carries a quadratic-plateau or
+Mitscherlich curve per nutrient, giving relative yield against applied
+kg/ha; the optimum is the rate where one more kg of nutrient adds yield
+worth exactly its price. Both curves have closed-form optima, so a whole
+user base is re-optimized in a few array operations after a price change.
+
+Rates, curves and nutrient prices are all per kg of elemental N, P and K,
+the units of the FertilizerCalculator requirement; catalog prices, which
+products quote per kg of P2O5 and K2O, are converted with OXIDE_FACTOR.
+
+Farms are placed on their crop's curve through the FertilizerCalculator
+requirement: a plot needing twice the crop's base requirement (poor soil,
+high target yield) gets the curve stretched twice as wide. Nutrients are
+optimized independently, as in the single-nutrient trials the curves
+come from.
+"""
+
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from app.services.fertilizer_catalog import NUTRIENTS, OXIDE_FACTOR, FertilizerCatalog, ResponseCurve
+from app.services.fertilizer_calculator import FertilizerCalculator, SoilTestResult
+
+logger = logging.getLogger(__name__)
+
+NUTRIENT_CONTENT = {"nitrogen": "n_content", "phosphorus": "p2o5_content", "potassium": "k2o_content"}
+
+def nutrient_prices(catalog: FertilizerCatalog) -> Dict[str, float]:
+    """INR per kg of elemental N, P and K from the cheapest available mineral product supplying it"""
+    prices = {}
+    for nutrient, content in NUTRIENT_CONTENT.items():
+        # Product contents are % N, P2O5 and K2O; one kg of P or K takes OXIDE_FACTOR kg of the oxide
+        costs = [
+            product.price_per_kg / (getattr(product, content) / 100) * OXIDE_FACTOR[nutrient]
+            for product in catalog.products.values()
+            if product.availability and not product.organic and getattr(product, content) > 0
+        ]
+        if not costs:
+            raise ValueError(f"No available fertilizer supplies {nutrient}")
+        prices[nutrient] = min(costs)
+    return prices
+
+def _quadratic_plateau(rate, zero_yield, plateau_rate):
+    shortfall = 1 - np.minimum(rate, plateau_rate) / plateau_rate
+    return 1 - (1 - zero_yield) * shortfall ** 2
+
+def _mitscherlich(rate, zero_yield, rate_constant):
+    return 1 - (1 - zero_yield) * np.exp(-rate_constant * rate)
+
+def relative_yield(curve: ResponseCurve, rate) -> np.ndarray:
+    """Fraction of attainable yield at `rate` kg/ha"""
+    rate = np.asarray(rate, dtype=np.float64)
+    if curve.model == "quadratic_plateau":
+        return _quadratic_plateau(rate, curve.zero_yield, curve.plateau_rate)
+    return _mitscherlich(rate, curve.zero_yield, curve.rate_constant)
+
+def optimal_curve_rate(
+    quadratic: np.ndarray,
+    zero_yield: np.ndarray,
+    plateau_rate: np.ndarray,
+    rate_constant: np.ndarray,
+    price_ratio: np.ndarray
+) -> np.ndarray:
+    """
+    Rate where the curve's slope equals `price_ratio` (nutrient price over the
+    value of the attainable yield, per kg); 0 where even the first kg does not pay
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qp = plateau_rate * (1 - price_ratio * plateau_rate / (2 * (1 - zero_yield)))
+        qp = np.clip(qp, 0, plateau_rate)
+        mitscherlich = np.log((1 - zero_yield) * rate_constant / price_ratio) / rate_constant
+        mitscherlich = np.maximum(mitscherlich, 0)
+    return np.where(quadratic, qp, mitscherlich)
+
+def fit_response_curve(
+    rates: Sequence[float],
+    yields: Sequence[float],
+    model: str = "quadratic_plateau"
+) -> Tuple[ResponseCurve, float]:
+    """
+    Least-squares curve through trial data (kg/ha applied, tonnes/ha harvested).
+    Returns the curve and the attainable yield it is relative to.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    yields = np.asarray(yields, dtype=np.float64)
+    if len(rates) < 4 or len(rates) != len(yields):
+        raise ValueError("Fitting a response curve needs at least 4 (rate, yield) pairs")
+    top = float(yields.max())
+    if model == "quadratic_plateau":
+        function = lambda x, ymax, y0, xp: ymax * _quadratic_plateau(x, y0, xp)
+        guess = [top, 0.6, max(float(rates.max()), 1.0)]
+        bounds = ([0, 0, 1e-6], [np.inf, 0.999, np.inf])
+    elif model == "mitscherlich":
+        function = lambda x, ymax, y0, c: ymax * _mitscherlich(x, y0, c)
+        guess = [top, 0.6, 3.0 / max(float(rates.max()), 1.0)]
+        bounds = ([0, 0, 1e-9], [np.inf, 0.999, np.inf])
+    else:
+        raise ValueError(f"Unknown response model '{model}'")
+    (ymax, y0, shape), _ = curve_fit(function, rates, yields, p0=guess, bounds=bounds, maxfev=10000)
+    if model == "quadratic_plateau":
+        curve = ResponseCurve(model, float(y0), plateau_rate=float(shape))
+    else:
+        curve = ResponseCurve(model, float(y0), rate_constant=float(shape))
+    return curve, float(ymax)
+
+class NutrientEconomicsSolver:
+    """Economic optimum N, P and K rates for one farm or columns of many"""
+
+    def __init__(self, calculator: Optional[FertilizerCalculator] = None):
+        self.calculator = calculator or FertilizerCalculator()
+
+    def optimal_rates_batch(
+        self,
+        crop_code: np.ndarray,
+        ph: np.ndarray,
+        nitrogen: np.ndarray,
+        phosphorus: np.ndarray,
+        potassium: np.ndarray,
+        organic_matter: np.ndarray,
+        crop_price,
+        target_yield: Optional[np.ndarray] = None,
+        region_code: Optional[np.ndarray] = None,
+        prices: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        EONR in kg/ha of elemental N, P and K, with the agronomic requirement it replaces.
+
+        Arguments are as for calculate_nutrient_requirements_batch, plus the
+        crop price in INR per tonne (scalar or per farm) and optional nutrient
+        prices in INR per kg of N, P or K overriding the catalog's. Crops without a curve for a
+        nutrient keep the agronomic requirement.
+        """
+        calculator = self.calculator
+        catalog = calculator.catalog
+        crop_code = np.asarray(crop_code)
+        crop_price = np.broadcast_to(np.asarray(crop_price, dtype=np.float64), crop_code.shape)
+        if not (crop_price > 0).all():
+            raise ValueError("Crop prices must be positive")
+        prices = {**nutrient_prices(catalog), **(prices or {})}
+        if not all(prices[nutrient] > 0 for nutrient in NUTRIENTS):
+            raise ValueError("Nutrient prices must be positive")
+
+        requirements = calculator.calculate_nutrient_requirements_batch(
+            crop_code, ph, nitrogen, phosphorus, potassium, organic_matter, target_yield, region_code
+        )
+
+        # Attainable yield: the target where given, else the crop average
+        attainable = catalog.crop_table[3][crop_code]
+        if target_yield is not None:
+            target_yield = np.nan_to_num(np.asarray(target_yield, dtype=np.float64))
+            attainable = np.where(target_yield > 0, target_yield, attainable)
+
+        rates = {}
+        for i, nutrient in enumerate(NUTRIENTS):
+            agronomic = requirements[nutrient]
+            base = catalog.crop_table[i][crop_code]
+            # Stretch the curve by the farm's requirement relative to the crop's base requirement
+            scale = np.divide(agronomic, base, out=np.zeros_like(agronomic), where=base > 0)
+            quadratic, zero_yield, plateau_rate, rate_constant = (
+                column[crop_code] for column in catalog.response_table[nutrient]
+            )
+            price_ratio = scale * prices[nutrient] / (crop_price * attainable)
+            optimum = scale * optimal_curve_rate(quadratic, zero_yield, plateau_rate, rate_constant, price_ratio)
+            optimum = np.where(scale > 0, optimum, 0.0)
+            rates[nutrient] = np.where(np.isnan(zero_yield), agronomic, optimum)
+
+        return {"rates": rates, "requirements": requirements, "attainable_yield": attainable}
+
+    def optimal_rates(
+        self,
+        crop: str,
+        soil_test: SoilTestResult,
+        crop_price: float,
+        target_yield: Optional[float] = None,
+        region: Optional[str] = None,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        prices: Optional[Dict[str, float]] = None
+    ) -> Dict:
+        """optimal_rates_batch for one farm, with its costs at those rates"""
+        calculator = self.calculator
+        region_code = calculator.encode_regions([region])
+        if lat is not None and lon is not None:
+            located = calculator.locate_regions([lat], [lon], [region])
+            region_code = np.where(located >= 0, located, region_code)
+        result = self.optimal_rates_batch(
+            calculator.encode_crops([crop]),
+            [soil_test.ph], [soil_test.nitrogen], [soil_test.phosphorus], [soil_test.potassium],
+            [soil_test.organic_matter], crop_price,
+            target_yield=[target_yield or 0.0], region_code=region_code, prices=prices
+        )
+        prices = {**nutrient_prices(calculator.catalog), **(prices or {})}
+        rates = {nutrient: float(rate[0]) for nutrient, rate in result["rates"].items()}
+        return {
+            "rates": rates,
+            "requirements": {nutrient: float(amount[0]) for nutrient, amount in result["requirements"].items()},
+            "nutrient_prices": prices,
+            "nutrient_cost": sum(rates[nutrient] * prices[nutrient] for nutrient in NUTRIENTS),
+            "attainable_yield": float(result["attainable_yield"][0])
+        }
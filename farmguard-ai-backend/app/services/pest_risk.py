@@ -0,0 +1,423 @@
+"""
+Pest Risk Service for FARMGUARD
+
+Accumulates growing degree-days and leaf-wetness per registered plot from
+the local forecast store. Each completed day is folded into every plot in
+its weather cell exactly once; the forecast outlook is applied on top when
+scoring. Risk for the major pests and diseases of each crop is scored for
+all plots at once and aggregated into per-cell region maps, which are
+cached until new weather or plots arrive.
+"""
+
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.forecast_store import ForecastStore, StoredForecastDay, cell_id, sqlite_path_from_url
+from app.services.irrigation import CROP_CODES, CROP_COEFFICIENTS, encode_crops
+
+logger = logging.getLogger(__name__)
+
+WETNESS_MEMORY_DAYS = 7
+WETNESS_DECAY = 1.0 - 1.0 / WETNESS_MEMORY_DAYS
+HIGH_RISK_SCORE = 70
+MEDIUM_RISK_SCORE = 40
+
+@dataclass(frozen=True)
+class Pest:
+    name: str
+    crops: Tuple[str, ...]
+    kind: str  # insect, disease
+    base_temp: float  # lower development threshold, °C
+    upper_temp: float  # horizontal cutoff, °C
+    degree_days: float  # degree-days for one generation / latent period
+    optimum_temp: Tuple[float, float]
+    humidity_range: Tuple[float, float]
+    wetness_hours: float  # daily leaf-wetness hours that favour infection (diseases)
+    advice: str
+
+# Indicative thresholds from published phenology studies; tune per region as data accumulates
+PESTS: List[Pest] = [
+    Pest("Yellow stem borer", ("rice",), "insect", 15.0, 35.0, 560, (25, 30), (70, 100), 0,
+         "Install pheromone traps and clip egg masses at transplanting"),
+    Pest("Brown planthopper", ("rice",), "insect", 10.0, 33.0, 400, (25, 30), (80, 100), 0,
+         "Check plant bases for hoppers and drain fields alternately"),
+    Pest("Rice blast", ("rice",), "disease", 10.0, 35.0, 150, (24, 28), (90, 100), 10,
+         "Avoid excess nitrogen and scout for spindle-shaped leaf lesions"),
+    Pest("Wheat aphid", ("wheat",), "insect", 5.0, 30.0, 110, (15, 25), (50, 90), 0,
+         "Scout ear heads and conserve ladybird beetles"),
+    Pest("Yellow rust", ("wheat",), "disease", 2.0, 23.0, 150, (10, 15), (85, 100), 6,
+         "Look for yellow stripes on leaves and keep fungicide ready"),
+    Pest("Fall armyworm", ("maize",), "insect", 10.9, 35.0, 560, (25, 30), (60, 100), 0,
+         "Inspect whorls for fresh damage and frass"),
+    Pest("Pink bollworm", ("cotton",), "insect", 13.0, 35.0, 500, (25, 32), (50, 90), 0,
+         "Monitor with pheromone traps and remove rosette flowers"),
+    Pest("Whitefly", ("cotton", "tomato"), "insect", 10.0, 35.0, 300, (27, 33), (30, 70), 0,
+         "Use yellow sticky traps and check leaf undersides"),
+    Pest("Early shoot borer", ("sugarcane",), "insect", 12.0, 38.0, 600, (28, 35), (30, 70), 0,
+         "Remove dead hearts and irrigate to keep soil moist"),
+    Pest("Tobacco caterpillar", ("soybean", "cabbage"), "insect", 10.0, 35.0, 530, (25, 30), (70, 100), 0,
+         "Collect egg masses and early instar larvae"),
+    Pest("Onion thrips", ("onion",), "insect", 11.5, 35.0, 230, (25, 30), (30, 70), 0,
+         "Check leaf axils for thrips and silvery streaks"),
+    Pest("Late blight", ("potato", "tomato"), "disease", 7.0, 27.0, 120, (15, 22), (90, 100), 10,
+         "Apply protective fungicide before wet spells"),
+    Pest("Fruit borer", ("tomato", "cotton"), "insect", 11.0, 35.0, 520, (25, 30), (50, 80), 0,
+         "Install pheromone traps and remove bored fruits"),
+    Pest("Diamondback moth", ("cabbage",), "insect", 7.3, 32.0, 290, (20, 30), (40, 80), 0,
+         "Scout for windowing damage on leaves"),
+]
+
+PEST_NAMES = [pest.name for pest in PESTS]
+_BASE = np.array([p.base_temp for p in PESTS])
+_UPPER = np.array([p.upper_temp for p in PESTS])
+_DEGREE_DAYS = np.array([p.degree_days for p in PESTS])
+_WETNESS_HOURS = np.array([p.wetness_hours for p in PESTS])
+_IS_DISEASE = np.array([p.kind == "disease" for p in PESTS])
+# crop code x pest applicability
+_APPLICABLE = np.array([[crop in p.crops for p in PESTS] for crop in CROP_CODES])
+_SEASON_DAYS = np.array([sum(CROP_COEFFICIENTS[crop].stage_days) for crop in CROP_CODES])
+
+def degree_days(high: float, low: float) -> np.ndarray:
+    """Daily degree-days for every pest (modified average method with horizontal cutoff)"""
+    tmax = np.minimum(high, _UPPER)
+    tmin = np.clip(low, _BASE, _UPPER)
+    return np.maximum(0.0, (tmax + tmin) / 2.0 - _BASE)
+
+def wetness_hours(humidity: float, rainfall: float) -> float:
+    """Estimated leaf-wetness hours from daily mean humidity and rain"""
+    hours = 24.0 * min(1.0, max(0.0, (humidity - 60.0) / 35.0))
+    if rainfall >= 1:
+        hours += 6.0
+    return min(hours, 24.0)
+
+def climate_suitability(days: List[StoredForecastDay]) -> np.ndarray:
+    """Share of days inside each pest's favourable temperature and humidity window"""
+    if not days:
+        return np.zeros(len(PESTS))
+    favourable = np.zeros(len(PESTS))
+    for day in days:
+        mean_temp = (day.high + day.low) / 2.0
+        favourable += np.array([
+            p.optimum_temp[0] <= mean_temp <= p.optimum_temp[1]
+            and p.humidity_range[0] <= day.humidity <= p.humidity_range[1]
+            for p in PESTS
+        ])
+    return favourable / len(days)
+
+def risk_level(score: float) -> str:
+    if score >= HIGH_RISK_SCORE:
+        return "high"
+    if score >= MEDIUM_RISK_SCORE:
+        return "medium"
+    return "low"
+
+@dataclass
+class CellOutlook:
+    """Forecast contribution for a cell, applied on top of the folded state"""
+    suitability: np.ndarray  # (pests,)
+    degree_days: np.ndarray  # (pests,) summed over the forecast days
+    wetness_decay: float  # multiplier for the folded wetness average
+    wetness_offset: float
+
+    @classmethod
+    def from_days(cls, days: List[StoredForecastDay]) -> "CellOutlook":
+        offset = 0.0
+        total = np.zeros(len(PESTS))
+        for day in days:
+            offset = offset * WETNESS_DECAY + wetness_hours(day.humidity, day.rainfall) * (1 - WETNESS_DECAY)
+            total += degree_days(day.high, day.low)
+        return cls(climate_suitability(days), total, WETNESS_DECAY ** len(days), offset)
+
+@dataclass
+class RegionRiskMap:
+    cells: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    plots: np.ndarray  # (cells, pests) plots where the pest applies
+    mean_score: np.ndarray  # (cells, pests)
+    max_score: np.ndarray
+    high_risk_plots: np.ndarray
+
+class PestRiskEngine:
+    """Per-plot degree-day and wetness accumulation stored as parallel arrays"""
+
+    def __init__(self, store: ForecastStore, database_url: Optional[str] = None):
+        self.store = store
+        self.path = sqlite_path_from_url(database_url) if database_url else store.path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._loaded = False
+
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._cell_rows: Dict[int, List[int]] = {}
+        self._outlook: Dict[int, CellOutlook] = {}
+        self._size = 0
+        self._allocate(1024)
+
+        self._version = 0
+        self._map_cache: Optional[Tuple[Tuple[int, date], RegionRiskMap]] = None
+
+    def _allocate(self, capacity: int):
+        def grow(name: str, shape: tuple, dtype):
+            array = np.zeros(shape, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:self._size] = old[:self._size]
+            setattr(self, name, array)
+
+        grow("_cell", (capacity,), np.int64)
+        grow("_lat", (capacity,), np.float64)
+        grow("_lon", (capacity,), np.float64)
+        grow("_crop", (capacity,), np.int16)
+        grow("_sowing", (capacity,), np.int64)
+        grow("_last_day", (capacity,), np.int64)
+        grow("_observed", (capacity,), np.int32)
+        grow("_gdd", (capacity, len(PESTS)), np.float32)
+        grow("_wetness", (capacity,), np.float32)
+        self._capacity = capacity
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pest_plots (
+                    plot_id TEXT PRIMARY KEY,
+                    cell INTEGER NOT NULL,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    crop TEXT NOT NULL,
+                    sowing_day INTEGER NOT NULL,
+                    last_day INTEGER NOT NULL,
+                    observed_days INTEGER NOT NULL,
+                    gdd BLOB NOT NULL,
+                    wetness REAL NOT NULL
+                )
+            """)
+            self._connection = connection
+        return self._connection
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        rows = self._connect().execute("SELECT * FROM pest_plots").fetchall()
+        for plot_id, cell, lat, lon, crop, sowing, last_day, observed, gdd, wetness in rows:
+            if crop not in CROP_CODES:
+                continue
+            row = self._row_for(plot_id, cell)
+            self._lat[row], self._lon[row] = lat, lon
+            self._crop[row] = CROP_CODES.index(crop)
+            self._sowing[row] = sowing
+            state = np.frombuffer(gdd, dtype=np.float32)
+            if len(state) == len(PESTS):
+                self._last_day[row], self._observed[row] = last_day, observed
+                self._gdd[row], self._wetness[row] = state, wetness
+            else:
+                # Pest table changed since the state was saved - refold from sowing
+                self._last_day[row], self._observed[row] = sowing - 1, 0
+        for cell, cell_rows in self._cell_rows.items():
+            self._refresh_outlook(cell, float(self._lat[cell_rows[0]]), float(self._lon[cell_rows[0]]))
+        if rows:
+            logger.info(f"🐛 Loaded {self._size} plots for pest risk tracking")
+
+    def _row_for(self, plot_id: str, cell: int) -> int:
+        row = self._index.get(plot_id)
+        if row is None:
+            if self._size == self._capacity:
+                self._allocate(self._capacity * 2)
+            row = self._size
+            self._size += 1
+            self._ids.append(plot_id)
+            self._index[plot_id] = row
+        elif self._cell[row] != cell:
+            self._cell_rows[int(self._cell[row])].remove(row)
+        else:
+            return row
+        self._cell[row] = cell
+        self._cell_rows.setdefault(cell, []).append(row)
+        return row
+
+    def _refresh_outlook(self, cell: int, lat: float, lon: float, today: Optional[date] = None):
+        forecast = self.store.latest_forecast(lat, lon, from_day=today)
+        if forecast is None:
+            self._outlook.pop(cell, None)
+        else:
+            self._outlook[cell] = CellOutlook.from_days(forecast.days)
+
+    def _fold_cell(self, cell: int, lat: float, lon: float, through: date) -> int:
+        rows = np.array(self._cell_rows.get(cell, []), dtype=np.int64)
+        if len(rows) == 0:
+            return 0
+        start = date.fromordinal(int(max(self._last_day[rows].min() + 1, self._sowing[rows].min())))
+        if start > through:
+            return 0
+
+        days = self.store.history(lat, lon, start, through)
+        for day in days:
+            ordinal = day.day.toordinal()
+            active = rows[(self._sowing[rows] <= ordinal) & (self._last_day[rows] < ordinal)]
+            if len(active) == 0:
+                continue
+            self._gdd[active] += degree_days(day.high, day.low).astype(np.float32)
+            self._wetness[active] = self._wetness[active] * WETNESS_DECAY \
+                + wetness_hours(day.humidity, day.rainfall) * (1 - WETNESS_DECAY)
+            self._last_day[active] = ordinal
+            self._observed[active] += 1
+
+        self._persist(rows)
+        return len(days)
+
+    def _persist(self, rows: np.ndarray):
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO pest_plots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (self._ids[row], int(self._cell[row]), float(self._lat[row]), float(self._lon[row]),
+                     CROP_CODES[self._crop[row]], int(self._sowing[row]), int(self._last_day[row]),
+                     int(self._observed[row]), self._gdd[row].tobytes(), float(self._wetness[row]))
+                    for row in rows.tolist()
+                ]
+            )
+
+    def register_plots(self, plots: List[Tuple[str, float, float, str, date]], through: Optional[date] = None) -> int:
+        """Register (plot_id, lat, lon, crop, sowing_date) plots and fold their stored history"""
+        through = through or date.today() - timedelta(days=1)
+        crops = encode_crops([plot[3] for plot in plots])
+
+        with self._lock:
+            self._load()
+            touched: Dict[int, Tuple[float, float]] = {}
+            for (plot_id, lat, lon, _, sowing), crop in zip(plots, crops):
+                cell = cell_id(lat, lon)
+                row = self._row_for(plot_id, cell)
+                self._lat[row], self._lon[row], self._crop[row] = lat, lon, crop
+                self._sowing[row] = sowing.toordinal()
+                self._last_day[row] = sowing.toordinal() - 1
+                self._observed[row] = 0
+                self._gdd[row] = 0
+                self._wetness[row] = 0
+                touched[cell] = (lat, lon)
+
+            for cell, (lat, lon) in touched.items():
+                self._fold_cell(cell, lat, lon, through)
+                self._refresh_outlook(cell, lat, lon, through + timedelta(days=1))
+            self._version += 1
+
+        return len(plots)
+
+    def update(self, lat: float, lon: float, through: Optional[date] = None) -> int:
+        """Fold newly completed days for every plot in the cell and refresh its outlook"""
+        through = through or date.today() - timedelta(days=1)
+        cell = cell_id(lat, lon)
+
+        with self._lock:
+            self._load()
+            if cell not in self._cell_rows:
+                return 0
+            folded = self._fold_cell(cell, lat, lon, through)
+            self._refresh_outlook(cell, lat, lon, through + timedelta(days=1))
+            self._version += 1
+        return folded
+
+    def _scores(self, rows: np.ndarray, today: date) -> np.ndarray:
+        """Risk scores (rows, pests); NaN where the pest does not apply or the crop is out of season"""
+        crop = self._crop[rows]
+        gdd = self._gdd[rows].astype(np.float64)
+        wetness = self._wetness[rows].astype(np.float64)
+        suitability = np.zeros((len(rows), len(PESTS)))
+
+        for cell in np.unique(self._cell[rows]):
+            outlook = self._outlook.get(int(cell))
+            if outlook is None:
+                continue
+            mask = self._cell[rows] == cell
+            gdd[mask] += outlook.degree_days
+            wetness[mask] = wetness[mask] * outlook.wetness_decay + outlook.wetness_offset
+            suitability[mask] = outlook.suitability
+
+        development = np.minimum(1.0, gdd / _DEGREE_DAYS)
+        wet = np.minimum(1.0, wetness[:, None] / np.where(_WETNESS_HOURS > 0, _WETNESS_HOURS, 1.0))
+        score = np.where(
+            _IS_DISEASE,
+            100 * (0.2 * development + 0.3 * suitability + 0.5 * wet),
+            100 * (0.55 * development + 0.45 * suitability)
+        )
+
+        days_after_sowing = today.toordinal() - self._sowing[rows]
+        in_season = (days_after_sowing >= 0) & (days_after_sowing <= _SEASON_DAYS[crop])
+        applicable = _APPLICABLE[crop] & in_season[:, None]
+        return np.where(applicable, np.round(score, 1), np.nan)
+
+    def plot_risk(self, plot_id: str, today: Optional[date] = None) -> Optional[Dict]:
+        """Accumulated state and ranked pest risks for one plot"""
+        today = today or date.today()
+        with self._lock:
+            self._load()
+            row = self._index.get(plot_id)
+            if row is None:
+                return None
+            scores = self._scores(np.array([row]), today)[0]
+            risks = [
+                {
+                    "pest": PESTS[i].name,
+                    "kind": PESTS[i].kind,
+                    "score": float(scores[i]),
+                    "level": risk_level(scores[i]),
+                    "generations": round(float(self._gdd[row, i]) / PESTS[i].degree_days, 2),
+                    "advice": PESTS[i].advice
+                }
+                for i in np.flatnonzero(~np.isnan(scores))
+            ]
+            return {
+                "plot_id": plot_id,
+                "crop": CROP_CODES[self._crop[row]],
+                "days_after_sowing": today.toordinal() - int(self._sowing[row]),
+                "observed_days": int(self._observed[row]),
+                "leaf_wetness_hours": round(float(self._wetness[row]), 1),
+                "risks": sorted(risks, key=lambda r: r["score"], reverse=True)
+            }
+
+    def region_map(self, today: Optional[date] = None) -> RegionRiskMap:
+        """Per-cell risk aggregates for all plots, recomputed only after new weather or plots"""
+        today = today or date.today()
+        with self._lock:
+            self._load()
+            key = (self._version, today)
+            if self._map_cache is not None and self._map_cache[0] == key:
+                return self._map_cache[1]
+
+            rows = np.arange(self._size)
+            scores = self._scores(rows, today)
+            cells, inverse = np.unique(self._cell[rows], return_inverse=True)
+            applies = ~np.isnan(scores)
+            filled = np.where(applies, scores, 0.0)
+
+            counts = np.empty((len(cells), len(PESTS)))
+            sums = np.empty_like(counts)
+            high = np.empty_like(counts)
+            maxima = np.full_like(counts, np.nan)
+            for i in range(len(PESTS)):
+                counts[:, i] = np.bincount(inverse, weights=applies[:, i], minlength=len(cells))
+                sums[:, i] = np.bincount(inverse, weights=filled[:, i], minlength=len(cells))
+                high[:, i] = np.bincount(inverse, weights=filled[:, i] >= HIGH_RISK_SCORE, minlength=len(cells))
+                column = np.full(len(cells), -np.inf)
+                np.maximum.at(column, inverse[applies[:, i]], scores[applies[:, i], i])
+                maxima[:, i] = np.where(np.isfinite(column), column, np.nan)
+
+            lat = np.bincount(inverse, weights=self._lat[rows], minlength=len(cells)) / np.maximum(np.bincount(inverse, minlength=len(cells)), 1)
+            lon = np.bincount(inverse, weights=self._lon[rows], minlength=len(cells)) / np.maximum(np.bincount(inverse, minlength=len(cells)), 1)
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.round(sums / counts, 1)
+
+            risk_map = RegionRiskMap(cells, lat, lon, counts.astype(np.int64), mean, maxima, high.astype(np.int64))
+            self._map_cache = (key, risk_map)
+            return risk_map
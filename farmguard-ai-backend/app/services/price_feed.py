@@ -0,0 +1,334 @@
+"""
+Price Feed Service for FARMGUARD
+
+Versioned fertilizer price snapshots. Price files (CSV rows of product,
+price_per_kg and an optional state) are merged onto the current snapshot
+to make a new version, written atomically to the snapshot directory and
+swapped in with a single assignment, so lookups are served from memory
+and a request always prices against one version. National prices of
+catalog products are pushed into the fertilizer catalog in memory (the
+snapshot directory, not the catalog file, is the durable record); listeners
+are told which products changed so they can evict only the cached results
+that used them. Other processes sharing the snapshot directory poll it
+the way the catalog registry polls its file and swap in (and announce)
+any newer version.
+
+Products are keyed by fertilizer catalog id where the name resolves in
+the catalog (so "DAP" and "Diammonium Phosphate" are one product) and by
+their snake_case name otherwise.
+"""
+
+import csv
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from app.core.config import settings
+from app.services.fertilizer_catalog import FertilizerCatalogRegistry, get_catalog_registry
+from app.services.soil_rules import get_soil_rules
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_HISTORY = 100  # versions listed by history()
+RELOAD_CHECK_INTERVAL = 2.0  # seconds between snapshot directory checks
+PRICE_FILE_COLUMNS = ["product", "price_per_kg"]
+
+def region_key(region: Optional[str]) -> Optional[str]:
+    """State name to the lower_snake key regional prices are stored under"""
+    return region.strip().lower().replace(" ", "_") if region and region.strip() else None
+
+@dataclass(frozen=True, slots=True)
+class PriceSnapshot:
+    version: str
+    effective_date: str  # ISO date the prices apply from
+    ingested_at: str
+    prices: Mapping[str, float]  # product -> INR/kg, national
+    regional: Mapping[str, Mapping[str, float]] = field(default_factory=dict)  # state -> product -> INR/kg
+    source: Optional[str] = None
+
+    def price(self, product: str, region: Optional[str] = None) -> Optional[float]:
+        """Price in `region` where one is reported, else the national price"""
+        regional = self.regional.get(region) if region else None
+        if regional and product in regional:
+            return regional[product]
+        return self.prices.get(product)
+
+    def costs(self, region: Optional[str] = None) -> Dict[str, float]:
+        return {**self.prices, **self.regional.get(region, {})} if region else dict(self.prices)
+
+    def to_data(self) -> Dict:
+        return {
+            "version": self.version,
+            "effective_date": self.effective_date,
+            "ingested_at": self.ingested_at,
+            "source": self.source,
+            "prices": dict(self.prices),
+            "regional": {region: dict(prices) for region, prices in self.regional.items()}
+        }
+
+    @classmethod
+    def from_data(cls, data: Dict) -> "PriceSnapshot":
+        return cls(
+            version=data["version"],
+            effective_date=data["effective_date"],
+            ingested_at=data["ingested_at"],
+            prices=MappingProxyType({product: float(price) for product, price in data["prices"].items()}),
+            regional=MappingProxyType({
+                region: MappingProxyType({product: float(price) for product, price in prices.items()})
+                for region, prices in data.get("regional", {}).items()
+            }),
+            source=data.get("source")
+        )
+
+@dataclass(frozen=True)
+class PriceUpdate:
+    snapshot: PriceSnapshot
+    changed: FrozenSet[str]  # products whose national or any regional price changed
+
+def changed_products(
+    current: PriceSnapshot,
+    prices: Mapping[str, float],
+    regional: Mapping[str, Mapping[str, float]]
+) -> FrozenSet[str]:
+    """Products whose national or any regional price differs between `current` and the given prices"""
+    return frozenset(
+        product for product in set(prices) | set(current.prices)
+        if prices.get(product) != current.prices.get(product)
+    ) | frozenset(
+        product for state in set(regional) | set(current.regional)
+        for product in set(regional.get(state, {})) | set(current.regional.get(state, {}))
+        if regional.get(state, {}).get(product) != current.regional.get(state, {}).get(product)
+    )
+
+class PriceFeed:
+    """Holds the active PriceSnapshot; ingesting a price file swaps in the next version"""
+
+    def __init__(self, directory: str, catalog_registry: Optional[FertilizerCatalogRegistry] = None):
+        self.directory = directory
+        self.catalog_registry = catalog_registry or get_catalog_registry()
+        self.listeners: List[Callable[[PriceUpdate], None]] = []
+        self._snapshot: Optional[PriceSnapshot] = None
+        self._history: deque = deque(maxlen=SNAPSHOT_HISTORY)
+        self._lock = threading.Lock()
+        self._disk_version: Optional[str] = None  # version of the newest snapshot file seen; None for a baseline
+        self._next_check = 0.0
+
+    def current(self) -> PriceSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() >= self._next_check:
+            with self._lock:
+                update = self._refresh()
+                snapshot = self._snapshot
+            if update:
+                self._notify(update)
+        return snapshot
+
+    def _refresh(self) -> Optional[PriceUpdate]:
+        """Load the first snapshot, or swap in a newer one another process wrote; call with the lock held"""
+        self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+        if self._snapshot is None:
+            self._snapshot = self._load()
+            return None
+        found = self._read_latest(newer_than=self._disk_version)
+        if found is None:
+            return None
+        snapshot, path = found
+        changed = changed_products(self._snapshot, snapshot.prices, snapshot.regional)
+        self._apply_to_catalog(snapshot, snapshot.prices)
+        self._snapshot = snapshot
+        self._disk_version = snapshot.version
+        self._history.append((snapshot.version, changed))
+        logger.info(f"💰 Price snapshot {snapshot.version} picked up from {path}: {len(changed)} products changed")
+        return PriceUpdate(snapshot, changed)
+
+    def _read_latest(self, newer_than: Optional[str] = None) -> Optional[Tuple[PriceSnapshot, str]]:
+        """Newest readable snapshot file (versions sort in ingestion order), if newer than `newer_than`"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".json")) \
+            if os.path.isdir(self.directory) else []
+        for name in reversed(names):
+            if newer_than is not None and name[:-len(".json")] <= newer_than:
+                return None
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return PriceSnapshot.from_data(json.load(f)), path
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"❌ Skipping unreadable price snapshot {path}: {e}")
+        return None
+
+    def _load(self) -> PriceSnapshot:
+        """Latest snapshot on disk, else a baseline from the catalog and soil rules prices"""
+        found = self._read_latest()
+        if found is not None:
+            snapshot, path = found
+            self._disk_version = snapshot.version
+            self._history.append((snapshot.version, None))
+            self._apply_to_catalog(snapshot, snapshot.prices)
+            logger.info(f"💰 Price snapshot {snapshot.version} loaded from {path}")
+            return snapshot
+
+        catalog = self.catalog_registry.current()
+        prices = {product_id: product.price_per_kg for product_id, product in catalog.products.items()}
+        for name, price in get_soil_rules().fertilizer_costs.items():
+            prices.setdefault(self.canonical(name), float(price))
+        snapshot = PriceSnapshot(
+            version=f"baseline-{catalog.version}",
+            effective_date=catalog.version,
+            ingested_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            prices=MappingProxyType(prices),
+            source=catalog.source
+        )
+        self._history.append((snapshot.version, None))
+        return snapshot
+
+    def _apply_to_catalog(self, snapshot: PriceSnapshot, products: Iterable[str]):
+        """Push national prices of catalog products among `products` into the catalog, in memory"""
+        catalog = self.catalog_registry.current()
+        catalog_prices = {
+            product: snapshot.prices[product] for product in products
+            if product in catalog.products and product in snapshot.prices
+            and snapshot.prices[product] != catalog.products[product].price_per_kg
+        }
+        if catalog_prices:
+            self.catalog_registry.update_prices(catalog_prices, version=snapshot.version, persist=False)
+
+    def canonical(self, name: str) -> str:
+        """Product key for a catalog id, display name, alias or snake_case name"""
+        catalog = self.catalog_registry.current()
+        name = name.strip()
+        return (
+            catalog.find_product(name)
+            or catalog.find_product(name.replace("_", " "))
+            or name.lower().replace(" ", "_")
+        )
+
+    def subscribe(self, listener: Callable[[PriceUpdate], None]):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def ingest_rows(
+        self,
+        rows: Iterable[Dict[str, str]],
+        source: Optional[str] = None,
+        effective_date: Optional[date] = None,
+        region: Optional[str] = None
+    ) -> PriceUpdate:
+        """
+        Merge price rows onto the current snapshot. A row's `region` column,
+        else `region`, makes it a regional price; rows without either are
+        national. Raises ValueError (nothing applied) on an invalid row.
+        """
+        updates: List[tuple] = []
+        for line, row in enumerate(rows, start=2):  # line 1 is the header
+            product = (row.get("product") or "").strip()
+            if not product:
+                raise ValueError(f"row {line}: product is required")
+            try:
+                price = float(row.get("price_per_kg") or "")
+            except ValueError:
+                raise ValueError(f"row {line}: price_per_kg must be a number") from None
+            if not price > 0:
+                raise ValueError(f"row {line}: price_per_kg must be positive")
+            updates.append((self.canonical(product), price, region_key(row.get("region")) or region_key(region)))
+        if not updates:
+            raise ValueError("Price file has no rows")
+
+        with self._lock:
+            # Merge onto the newest version, including one another process just wrote
+            picked_up = self._refresh()
+            current = self._snapshot
+            prices = dict(current.prices)
+            regional = {state: dict(state_prices) for state, state_prices in current.regional.items()}
+            for product, price, state in updates:
+                (regional.setdefault(state, {}) if state else prices)[product] = price
+            changed = changed_products(current, prices, regional)
+            if changed:
+                now = datetime.now(timezone.utc)
+                version = now.strftime("%Y%m%dT%H%M%S%fZ")  # sorts in ingestion order
+                snapshot = PriceSnapshot.from_data({
+                    "version": version,
+                    "effective_date": (effective_date or now.date()).isoformat(),
+                    "ingested_at": now.isoformat(timespec="seconds"),
+                    "source": source,
+                    "prices": prices,
+                    "regional": regional
+                })
+
+                # Snapshot first: if writing it fails, neither the feed nor the catalog changes
+                self._persist(snapshot)
+                self._apply_to_catalog(snapshot, changed)
+                self._snapshot = snapshot
+                self._disk_version = version
+                self._history.append((version, changed))
+
+        if picked_up:
+            self._notify(picked_up)
+        if not changed:
+            return PriceUpdate(current, changed)
+        logger.info(f"💰 Price snapshot {version} from {source or 'upload'}: {len(changed)} products changed")
+        update = PriceUpdate(snapshot, changed)
+        self._notify(update)
+        return update
+
+    def _notify(self, update: PriceUpdate):
+        for listener in list(self.listeners):
+            try:
+                listener(update)
+            except Exception as e:
+                logger.error(f"Price change listener failed: {e}")
+
+    def ingest_csv(
+        self,
+        lines: Iterable[str],
+        source: Optional[str] = None,
+        effective_date: Optional[date] = None,
+        region: Optional[str] = None
+    ) -> PriceUpdate:
+        """Ingest CSV price rows (product, price_per_kg[, region]) with a header line"""
+        reader = csv.DictReader(lines)
+        missing = [column for column in PRICE_FILE_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Price file is missing columns: {', '.join(missing)}")
+        return self.ingest_rows(list(reader), source=source, effective_date=effective_date, region=region)
+
+    def ingest_file(self, path: str, effective_date: Optional[date] = None, region: Optional[str] = None) -> PriceUpdate:
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.ingest_csv(f, source=os.path.basename(path), effective_date=effective_date, region=region)
+
+    def _persist(self, snapshot: PriceSnapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(snapshot.to_data(), f, indent=2)
+            os.replace(tmp_path, os.path.join(self.directory, f"{snapshot.version}.json"))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def history(self) -> List[Dict]:
+        """Recent versions, oldest first, with the products each one changed where known"""
+        return [
+            {"version": version, "changed": sorted(changed) if changed is not None else None}
+            for version, changed in self._history
+        ]
+
+_feed: Optional[PriceFeed] = None
+_feed_lock = threading.Lock()
+
+def get_price_feed() -> PriceFeed:
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = PriceFeed(settings.PRICE_SNAPSHOT_DIR)
+    return _feed
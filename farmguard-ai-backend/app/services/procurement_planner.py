@@ -0,0 +1,209 @@
+"""
+Procurement Planner Service for FARMGUARD
+
+Bulk fertilizer procurement for a farmer producer organisation. Member
+plots are streamed through the FertilizerCalculator pipeline one at a
+time and their application schedules folded into weekly demand per
+product, so memory depends on products x weeks, not on member count.
+Plots sharing a crop, soil test and region reuse one cached schedule.
+Order lots are then chosen per product with the Wagner-Whitin dynamic
+program, trading a fixed cost per order against holding stock, in whole
+bags.
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.fertilizer_catalog import FertilizerCatalog, get_fertilizer_catalog
+from app.services.fertilizer_calculator import FertilizerCalculator, SoilTestResult
+from app.services.result_cache import BoundedLRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER_COST = 2500.0  # INR per order: transport, loading, paperwork
+DEFAULT_HOLDING_RATE = 0.002  # fraction of the product price per week in store
+DEFAULT_LEAD_WEEKS = 1  # orders are placed this many weeks before delivery
+TEMPLATE_CACHE_SIZE = 4096
+MAX_REPORTED_ERRORS = 100
+
+@dataclass(frozen=True)
+class PlotSpec:
+    crop: str
+    area: float  # hectares
+    ph: float
+    nitrogen: float  # kg/ha
+    phosphorus: float  # kg/ha
+    potassium: float  # kg/ha
+    organic_matter: float  # percentage
+    planting_date: date
+    region: Optional[str] = None
+    target_yield: Optional[float] = None  # tons/hectare
+
+@dataclass
+class LotOrder:
+    product_id: str
+    product: str
+    delivery_week: date  # Monday of the week the lot must arrive
+    order_by: date
+    covers_until: date  # Monday of the last week of demand the lot covers
+    demand_kg: float
+    bags: int
+    bag_kg: float
+    purchase_cost: float
+    holding_cost: float
+
+def week_index(day: date) -> int:
+    """Weeks since 0001-01-01, a Monday"""
+    return (day.toordinal() - 1) // 7
+
+def week_start(index: int) -> date:
+    return date.fromordinal(index * 7 + 1)
+
+def wagner_whitin(
+    weeks: List[int],
+    demand: List[float],
+    order_cost: float,
+    holding_cost_per_week: float,
+    bag_kg: Optional[float] = None,
+    unit_price: float = 0.0
+) -> List[Tuple[int, int]]:
+    """
+    Optimal lots for demand[t] (kg) needed in weeks[t] (sorted): a list of
+    (first, last) index ranges, each delivered in weeks[first]. A lot costs
+    `order_cost`, holding per kg and week until use, and with `bag_kg` the
+    price of the unused part of its last bag.
+    """
+    n = len(weeks)
+    best = [0.0] + [math.inf] * n  # best[j]: cheapest cover of demand[:j]
+    choice = [0] * (n + 1)
+    for last in range(n):
+        holding = 0.0
+        lot = demand[last]
+        tail = 0.0  # demand after the first week of the lot
+        # Extend the lot backwards: delivering at `first` holds the later weeks' demand longer
+        for first in range(last, -1, -1):
+            if first < last:
+                tail += demand[first + 1]
+                lot += demand[first]
+                holding += tail * (weeks[first + 1] - weeks[first]) * holding_cost_per_week
+            surplus = (math.ceil(lot / bag_kg - 1e-9) * bag_kg - lot) * unit_price if bag_kg else 0.0
+            cost = best[first] + order_cost + holding + surplus
+            if cost < best[last + 1]:
+                best[last + 1] = cost
+                choice[last + 1] = first
+    lots = []
+    end = n
+    while end > 0:
+        first = choice[end]
+        lots.append((first, end - 1))
+        end = first
+    return lots[::-1]
+
+class ProcurementPlanner:
+    """Weekly product demand of many plots, aggregated in one streaming pass"""
+
+    def __init__(self, catalog: Optional[FertilizerCatalog] = None, optimize: bool = False):
+        self.catalog = catalog or get_fertilizer_catalog()
+        self.calculator = FertilizerCalculator(catalog=self.catalog)
+        self.optimize = optimize
+        self.templates = BoundedLRUCache(TEMPLATE_CACHE_SIZE)
+        self.demand: Dict[str, Dict[int, float]] = {}  # product id -> week index -> kg
+        self.plots = 0
+        self.area = 0.0
+        self.rejected = 0
+        self.errors: List[str] = []
+
+    def _template(self, plot: PlotSpec) -> Tuple[Tuple[str, int, float], ...]:
+        """(product id, days after planting, kg/ha) of every application for this plot's inputs"""
+        key = (plot.crop, plot.ph, plot.nitrogen, plot.phosphorus, plot.potassium,
+               plot.organic_matter, plot.region, plot.target_yield)
+        template = self.templates.get(key)
+        if template is None:
+            requirements = self.calculator.calculate_nutrient_requirements(
+                plot.crop,
+                SoilTestResult(plot.ph, plot.nitrogen, plot.phosphorus, plot.potassium, plot.organic_matter),
+                target_yield=plot.target_yield,
+                region=plot.region
+            )
+            recommendations = self.calculator.recommend_fertilizers(requirements, optimize=self.optimize)
+            schedule = self.calculator.create_application_schedule(
+                plot.crop, recommendations, plot.planting_date.isoformat()
+            )
+            template = tuple(
+                (self.catalog.find_product(a.fertilizer), a.days_after_planting, a.amount)
+                for a in schedule if a.amount > 0
+            )
+            self.templates.put(key, template)
+        return template
+
+    def add_plot(self, plot: PlotSpec, label: Optional[str] = None) -> bool:
+        try:
+            template = self._template(plot)
+        except ValueError as e:
+            self.reject(f"{label or 'plot'}: {e}")
+            return False
+        for product_id, days, kg_per_hectare in template:
+            weeks = self.demand.setdefault(product_id, {})
+            week = week_index(plot.planting_date + timedelta(days=days))
+            weeks[week] = weeks.get(week, 0.0) + kg_per_hectare * plot.area
+        self.plots += 1
+        self.area += plot.area
+        return True
+
+    def add_plots(self, plots: Iterable[PlotSpec]) -> int:
+        return sum(self.add_plot(plot) for plot in plots)
+
+    def reject(self, error: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(error)
+
+    def weekly_demand(self) -> Dict[str, List[Tuple[date, float]]]:
+        return {
+            product_id: [(week_start(week), kg) for week, kg in sorted(weeks.items())]
+            for product_id, weeks in self.demand.items()
+        }
+
+    def plan_orders(
+        self,
+        order_cost: float = DEFAULT_ORDER_COST,
+        holding_rate: float = DEFAULT_HOLDING_RATE,
+        lead_weeks: int = DEFAULT_LEAD_WEEKS
+    ) -> List[LotOrder]:
+        """Cheapest whole-bag order lots for the aggregated demand, by delivery week"""
+        orders = []
+        for product_id, weeks in self.demand.items():
+            product = self.catalog.products[product_id]
+            ordered = sorted((week, kg) for week, kg in weeks.items() if kg > 0)
+            if not ordered:
+                continue
+            week_list = [week for week, _ in ordered]
+            demand = [kg for _, kg in ordered]
+            holding_per_week = product.price_per_kg * holding_rate
+            lots = wagner_whitin(
+                week_list, demand, order_cost, holding_per_week, bag_kg=product.bag_kg, unit_price=product.price_per_kg
+            )
+            for first, last in lots:
+                lot_kg = sum(demand[first:last + 1])
+                bags = math.ceil(lot_kg / product.bag_kg - 1e-9)
+                delivery = week_start(week_list[first])
+                orders.append(LotOrder(
+                    product_id=product_id,
+                    product=product.name,
+                    delivery_week=delivery,
+                    order_by=delivery - timedelta(weeks=lead_weeks),
+                    covers_until=week_start(week_list[last]),
+                    demand_kg=round(lot_kg, 2),
+                    bags=bags,
+                    bag_kg=product.bag_kg,
+                    purchase_cost=round(bags * product.bag_kg * product.price_per_kg, 2),
+                    holding_cost=round(sum(
+                        kg * (week - week_list[first]) * holding_per_week
+                        for week, kg in zip(week_list[first:last + 1], demand[first:last + 1])
+                    ), 2)
+                ))
+        orders.sort(key=lambda order: (order.delivery_week, order.product_id))
+        return orders
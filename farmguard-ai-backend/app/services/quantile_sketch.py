@@ -0,0 +1,249 @@
+"""
+Quantile Sketch Service for FARMGUARD
+
+Streaming KLL quantile sketches (Karnin, Lang & Liberty, 2016) of soil
+test values per region. Each analysis updates the sketches of its
+district, state and the whole country in amortized O(1); percentile and
+distribution queries read a few hundred retained items regardless of how
+many analyses have been seen. Sketches are persisted to SQLite
+periodically, only those that changed.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.forecast_store import sqlite_path_from_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = 200  # rank error around 1.7/k, i.e. under 1 percentile point
+MIN_LEVEL_CAPACITY = 8
+CAPACITY_DECAY = 2.0 / 3.0
+COUNTRY_REGION = "India"
+BENCHMARK_METRICS = ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "soil_health_score"]
+BENCHMARK_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+MIN_BENCHMARK_SAMPLES = 30  # below this a region falls back to its parent
+
+class KLLSketch:
+    """Mergeable quantile sketch; items at level h stand for 2**h observations"""
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._size = 0
+        self._rng = random.Random(seed)
+        self._view: Optional[Tuple[List[float], List[int]]] = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(MIN_LEVEL_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value: float):
+        self.levels[0].append(value)
+        self.count += 1
+        self._size += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self._view = None
+        if self._size >= self._max_size():
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._size = sum(len(items) for items in self.levels)
+        self._view = None
+        while self._size >= self._max_size():
+            self._compress()
+
+    def _compress(self):
+        """Compact the lowest full level: sort it and promote every other item"""
+        for level, items in enumerate(self.levels):
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items.sort()
+            leftover = [items.pop()] if len(items) % 2 else []
+            self.levels[level + 1].extend(items[self._rng.randint(0, 1)::2])
+            self.levels[level] = leftover
+            self._size = sum(len(items) for items in self.levels)
+            return
+
+    def _sorted_view(self) -> Tuple[List[float], List[int]]:
+        if self._view is None:
+            weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+            self._view = ([value for value, _ in weighted], list(accumulate(weight for _, weight in weighted)))
+        return self._view
+
+    def rank(self, value: float) -> float:
+        """Estimated fraction of observations <= value"""
+        if self.count == 0:
+            return math.nan
+        values, cumulative = self._sorted_view()
+        index = bisect_right(values, value)
+        return cumulative[index - 1] / cumulative[-1] if index else 0.0
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        values, cumulative = self._sorted_view()
+        return values[min(bisect_left(cumulative, q * cumulative[-1]), len(values) - 1)]
+
+    def to_json(self) -> str:
+        return json.dumps({"k": self.k, "count": self.count, "min": self.min, "max": self.max, "levels": self.levels})
+
+    @classmethod
+    def from_json(cls, text: str) -> "KLLSketch":
+        state = json.loads(text)
+        sketch = cls(state["k"])
+        sketch.levels = state["levels"] or [[]]
+        sketch.count = state["count"]
+        sketch.min = state["min"]
+        sketch.max = state["max"]
+        sketch._size = sum(len(items) for items in sketch.levels)
+        return sketch
+
+def region_keys(state: Optional[str] = None, district: Optional[str] = None) -> Tuple[str, ...]:
+    """Regions an analysis counts towards, most specific first"""
+    keys = [COUNTRY_REGION]
+    if state:
+        keys.append(state)
+        if district:
+            keys.append(f"{state}/{district}")
+    return tuple(reversed(keys))
+
+class RegionalSoilBenchmarks:
+    """One sketch per (region, metric), loaded lazily and persisted when dirty"""
+
+    def __init__(self, database_url: Optional[str] = None, k: int = DEFAULT_K,
+                 persist_interval: Optional[float] = None):
+        self.database_url = database_url
+        self.k = k
+        self.persist_interval = persist_interval if persist_interval is not None else settings.SOIL_BENCHMARK_PERSIST_INTERVAL
+        self._sketches: Dict[str, Dict[str, KLLSketch]] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._next_persist = time.monotonic() + self.persist_interval
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            path = sqlite_path_from_url(self.database_url or settings.DATABASE_URL)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS soil_benchmarks ("
+                "region TEXT NOT NULL, metric TEXT NOT NULL, sketch TEXT NOT NULL, "
+                "PRIMARY KEY (region, metric))"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _region(self, region: str) -> Dict[str, KLLSketch]:
+        sketches = self._sketches.get(region)
+        if sketches is None:
+            rows = self._connect().execute(
+                "SELECT metric, sketch FROM soil_benchmarks WHERE region = ?", (region,)
+            ).fetchall()
+            sketches = {metric: KLLSketch.from_json(sketch) for metric, sketch in rows}
+            self._sketches[region] = sketches
+        return sketches
+
+    def add(self, regions: Sequence[str], values: Dict[str, Optional[float]]):
+        """Fold one analysis into every region it belongs to"""
+        with self._lock:
+            for region in regions:
+                sketches = self._region(region)
+                for metric in BENCHMARK_METRICS:
+                    value = values.get(metric)
+                    if value is None:
+                        continue
+                    if metric not in sketches:
+                        sketches[metric] = KLLSketch(self.k)
+                    sketches[metric].update(float(value))
+                self._dirty.add(region)
+            due = time.monotonic() >= self._next_persist
+        if due:
+            self.persist()
+
+    def persist(self) -> int:
+        """Write sketches changed since the last persist; returns regions written"""
+        with self._lock:
+            self._next_persist = time.monotonic() + self.persist_interval
+            if not self._dirty:
+                return 0
+            rows = [
+                (region, metric, sketch.to_json())
+                for region in self._dirty for metric, sketch in self._sketches[region].items()
+            ]
+            written = len(self._dirty)
+            self._dirty.clear()
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO soil_benchmarks VALUES (?, ?, ?)", rows)
+        logger.info(f"📊 Persisted soil benchmark sketches for {written} regions")
+        return written
+
+    def benchmark(self, regions: Sequence[str], values: Dict[str, Optional[float]]) -> Dict:
+        """
+        Percentiles of `values` and the distribution of every metric in the
+        most specific region with enough samples (regions ordered most
+        specific first).
+        """
+        with self._lock:
+            chosen, sketches = regions[-1], {}
+            for region in regions:
+                sketches = self._region(region)
+                scores = sketches.get("soil_health_score")
+                if scores is not None and scores.count >= MIN_BENCHMARK_SAMPLES:
+                    chosen = region
+                    break
+            else:
+                sketches = self._region(chosen)
+
+            metrics = {}
+            for metric, sketch in sketches.items():
+                value = values.get(metric)
+                metrics[metric] = {
+                    "count": sketch.count,
+                    "value": value,
+                    "percentile": round(sketch.rank(value) * 100, 1) if value is not None else None,
+                    "quantiles": {f"p{int(q * 100)}": round(sketch.quantile(q), 2) for q in BENCHMARK_QUANTILES},
+                    "min": sketch.min,
+                    "max": sketch.max
+                }
+        return {
+            "region": chosen,
+            "sample_count": max((m["count"] for m in metrics.values()), default=0),
+            "metrics": metrics
+        }
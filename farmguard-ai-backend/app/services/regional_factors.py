@@ -0,0 +1,145 @@
+"""
+Regional Factors Service for FARMGUARD
+
+District-resolution rainfall, temperature and soil adjustment factors,
+keyed by administrative code (ISO 3166-2 state code plus district, e.g.
+IN-PB-LUDHIANA). Coordinates resolve to the nearest district centroid
+within MAX_DISTRICT_DISTANCE_KM *in the point's own state*: a centroid
+says nothing about where a border runs, so a district across a state line
+is never taken and the point keeps its state's factors instead. A KD-tree
+built once at load answers a batch of plots in one vectorized query.
+Factor columns are kept as arrays for the batch requirement calculation.
+
+The table is loaded from DISTRICT_FACTORS_PATH (surveyed district values);
+without one it is empty and every location uses its state's factors.
+"""
+
+import csv
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core.config import settings
+from app.services.fertilizer_catalog import RegionalFactors
+from app.services.spatial_index import EARTH_RADIUS_KM, to_unit_vectors
+
+logger = logging.getLogger(__name__)
+
+MAX_DISTRICT_DISTANCE_KM = 150.0  # farther from every centroid, a point gets no district
+LOCATE_CANDIDATES = 16  # nearest centroids searched for one in the point's state
+
+def state_key(state: Optional[str]) -> str:
+    """Catalog region key of a state name ("West Bengal" -> "west_bengal")"""
+    return state.strip().lower().replace(" ", "_") if state else ""
+
+@dataclass(frozen=True, slots=True)
+class DistrictFactors:
+    code: str
+    district: str
+    state: str
+    lat: float
+    lon: float
+    factors: RegionalFactors
+
+class DistrictFactorTable:
+    """District factors with lookup by code and by coordinates"""
+
+    def __init__(self, districts: Sequence[DistrictFactors], max_distance_km: float = MAX_DISTRICT_DISTANCE_KM):
+        self.districts: List[DistrictFactors] = list(districts)
+        self.index_by_code: Dict[str, int] = {d.code: i for i, d in enumerate(self.districts)}
+        self.index_by_name: Dict[Tuple[str, str], int] = {
+            (state_key(d.state), d.district.lower()): i for i, d in enumerate(self.districts)
+        }
+        self.state_keys = np.array([state_key(d.state) for d in self.districts], dtype=object)
+        self.max_distance_km = max_distance_km
+        self.rainfall = np.array([d.factors.rainfall for d in self.districts], dtype=np.float64)
+        self.temperature = np.array([d.factors.temperature for d in self.districts], dtype=np.float64)
+        self.soil_factor = np.array([d.factors.soil_factor for d in self.districts], dtype=np.float64)
+        self._tree = cKDTree(to_unit_vectors(
+            [d.lat for d in self.districts], [d.lon for d in self.districts]
+        )) if self.districts else None
+        self._max_chord = 2.0 * math.sin(min(math.pi, max_distance_km / EARTH_RADIUS_KM) / 2.0)
+
+    @classmethod
+    def from_csv(cls, path: str, max_distance_km: float = MAX_DISTRICT_DISTANCE_KM) -> "DistrictFactorTable":
+        with open(path, newline="", encoding="utf-8") as f:
+            districts = [
+                DistrictFactors(
+                    code=row["code"].strip().upper(),
+                    district=row["district"].strip(),
+                    state=row["state"].strip(),
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    factors=RegionalFactors(
+                        rainfall=float(row["rainfall"]),
+                        temperature=float(row["temperature"]),
+                        soil_factor=float(row["soil_factor"])
+                    )
+                )
+                for row in csv.DictReader(f)
+            ]
+        logger.info(f"🗺️ Loaded regional factors for {len(districts)} districts from {path}")
+        return cls(districts, max_distance_km)
+
+    def __len__(self) -> int:
+        return len(self.districts)
+
+    def get(self, code: str) -> Optional[DistrictFactors]:
+        index = self.index_by_code.get(code.strip().upper())
+        return self.districts[index] if index is not None else None
+
+    def find(self, state: Optional[str], district: Optional[str]) -> Optional[DistrictFactors]:
+        """District by its state and district names, as the gazetteer gives them"""
+        if not state or not district:
+            return None
+        index = self.index_by_name.get((state_key(state), district.strip().lower()))
+        return self.districts[index] if index is not None else None
+
+    def locate_many(
+        self,
+        lat: Sequence[float],
+        lon: Sequence[float],
+        states: Sequence[Optional[str]]
+    ) -> np.ndarray:
+        """
+        District index of each point: the nearest centroid within range that
+        lies in that point's state; -1 where there is none or no state is known
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        n = len(self.districts)
+        if self._tree is None or len(lat) == 0:
+            return np.full(len(lat), -1, dtype=np.int64)
+        k = min(n, LOCATE_CANDIDATES)
+        _, index = self._tree.query(to_unit_vectors(lat, lon), k=k, distance_upper_bound=self._max_chord)
+        index = index.reshape(len(lat), k)
+        wanted = np.array([state_key(state) for state in states], dtype=object)
+        # Misses come back as index == n; candidates are ordered nearest first
+        match = (index < n) & (self.state_keys[np.minimum(index, n - 1)] == wanted[:, None]) & (wanted[:, None] != "")
+        first = match.argmax(axis=1)
+        return np.where(match.any(axis=1), index[np.arange(len(lat)), first], -1)
+
+    def locate(self, lat: float, lon: float, state: Optional[str]) -> Optional[DistrictFactors]:
+        index = int(self.locate_many([lat], [lon], [state])[0])
+        return self.districts[index] if index >= 0 else None
+
+_table: Optional[DistrictFactorTable] = None
+_table_lock = threading.Lock()
+
+def get_district_factors() -> DistrictFactorTable:
+    """Shared district factor table, loaded on first use; empty without DISTRICT_FACTORS_PATH"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                if settings.DISTRICT_FACTORS_PATH:
+                    _table = DistrictFactorTable.from_csv(settings.DISTRICT_FACTORS_PATH)
+                else:
+                    logger.info("🗺️ No DISTRICT_FACTORS_PATH set; using state regional factors")
+                    _table = DistrictFactorTable([])
+    return _table
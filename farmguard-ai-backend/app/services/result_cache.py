@@ -0,0 +1,118 @@
+"""
+Result Cache Service for FARMGUARD
+
+Bounded in-process LRU cache for computed results, with hit/miss/eviction
+counters so its effectiveness can be monitored from health endpoints.
+Entries can carry tags naming the inputs they depend on (e.g. fertilizer
+products), so a change to one input evicts just the entries built from it.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class BoundedLRUCache:
+    """
+    Thread-safe LRU cache holding at most `maxsize` entries.
+
+    A result computed while its inputs may be changing should be stored with
+    the `epoch` read before computing; if one of its tags is invalidated in
+    the meantime the stale result is dropped instead of cached.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._tags: Dict[Hashable, frozenset] = {}  # key -> tags, for tagged entries only
+        self._keys_by_tag: Dict[Hashable, Set[Hashable]] = {}
+        self._invalidated_at: Dict[Hashable, int] = {}  # tag -> epoch of its last invalidation
+        self._lock = threading.Lock()
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), epoch: Optional[int] = None):
+        if self.maxsize <= 0:
+            return
+        tags = frozenset(tags)
+        with self._lock:
+            if epoch is not None and any(self._invalidated_at.get(tag, -1) > epoch for tag in tags):
+                return
+            self._untag(key)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if tags:
+                self._tags[key] = tags
+                for tag in tags:
+                    self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._untag(evicted)
+                self.evictions += 1
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """Remove every entry carrying one of `tags`; returns how many were removed"""
+        with self._lock:
+            self.epoch += 1
+            removed = 0
+            for tag in set(tags):
+                self._invalidated_at[tag] = self.epoch
+                for key in self._keys_by_tag.pop(tag, ()):
+                    if key in self._entries:
+                        del self._entries[key]
+                        self._untag(key)
+                        removed += 1
+            self.invalidations += removed
+            return removed
+
+    def _untag(self, key: Hashable):
+        for tag in self._tags.pop(key, ()):
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def record_bypass(self):
+        """Count a lookup that was not cacheable"""
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._keys_by_tag.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,268 @@
+"""
+Soil Mapping Service for FARMGUARD
+
+Interpolates geolocated soil samples into pH and nutrient surfaces with
+inverse distance weighting over the k nearest samples, found through a
+KD-tree on unit-sphere coordinates, so cost grows as n log n rather than
+with every sample-to-cell pair. Surfaces are computed on a global grid
+aligned to the requested resolution and cut into fixed tiles; tiles are
+computed in parallel and cached until the sample set changes. Only lab
+samples posted with their own coordinates feed the map; analyses, which
+carry at most a place name, do not.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core.config import settings
+from app.services.forecast_store import sqlite_path_from_url
+from app.services.result_cache import BoundedLRUCache
+from app.services.spatial_index import EARTH_RADIUS_KM, to_unit_vectors
+
+logger = logging.getLogger(__name__)
+
+MAP_METRICS = ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter"]
+DEFAULT_NEIGHBOURS = 12
+IDW_POWER = 2.0
+MAX_NEIGHBOUR_KM = 25.0  # cells with no sample this close are left empty
+TILE_CELLS = 64  # grid cells per tile side
+MAX_GRID_CELLS = 1_000_000
+REBUILD_INTERVAL = 60.0  # seconds new samples may wait before the index is rebuilt
+MIN_DISTANCE = 1e-9  # chord length treated as "at the sample"
+
+def km_to_chord(km: float) -> float:
+    return 2.0 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2.0)
+
+@dataclass
+class SoilSurface:
+    metric: str
+    lat: np.ndarray  # (rows,) cell centres, south to north
+    lon: np.ndarray  # (cols,) cell centres, west to east
+    values: np.ndarray  # (rows, cols), NaN where no sample is within range
+    version: int
+
+@dataclass
+class _SampleIndex:
+    tree: Optional[cKDTree]
+    values: np.ndarray  # (n, len(MAP_METRICS))
+    version: int
+
+class SoilMapEngine:
+    """Geolocated soil samples with cached, tiled IDW surfaces"""
+
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        neighbours: int = DEFAULT_NEIGHBOURS,
+        power: float = IDW_POWER,
+        max_distance_km: float = MAX_NEIGHBOUR_KM,
+        cache_size: Optional[int] = None,
+        workers: Optional[int] = None
+    ):
+        self.database_url = database_url
+        self.neighbours = neighbours
+        self.power = power
+        self.max_distance_km = max_distance_km
+        self.workers = workers or os.cpu_count() or 1
+        self.tiles = BoundedLRUCache(cache_size or settings.SOIL_MAP_TILE_CACHE_SIZE)
+
+        self._lat = np.zeros(0)
+        self._lon = np.zeros(0)
+        self._values = np.zeros((0, len(MAP_METRICS)))
+        self._pending: List[Tuple[float, float, List[float]]] = []
+        self._rebuild_at = 0.0
+        self._index: Optional[_SampleIndex] = None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._loaded = False
+        self.version = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            path = sqlite_path_from_url(self.database_url or settings.DATABASE_URL)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS soil_map_samples ("
+                "lat REAL NOT NULL, lon REAL NOT NULL, " + ", ".join(f"{m} REAL" for m in MAP_METRICS) + ")"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _load(self):
+        rows = self._connect().execute(f"SELECT lat, lon, {', '.join(MAP_METRICS)} FROM soil_map_samples").fetchall()
+        if rows:
+            data = np.array(rows, dtype=np.float64)
+            self._lat, self._lon, self._values = data[:, 0], data[:, 1], data[:, 2:]
+        self._loaded = True
+        logger.info(f"🗺️ Loaded {len(rows)} soil map samples")
+
+    @property
+    def sample_count(self) -> int:
+        return len(self._lat) + len(self._pending)
+
+    def add_samples(self, lat: Sequence[float], lon: Sequence[float], values: Dict[str, Sequence[float]]) -> int:
+        """Add a batch of samples and rebuild the index on the next query"""
+        n = len(lat)
+        columns = [np.asarray(values.get(metric, np.full(n, np.nan)), dtype=np.float64) for metric in MAP_METRICS]
+        with self._lock:
+            self._pending.extend(
+                (float(lat[i]), float(lon[i]), [float(column[i]) for column in columns]) for i in range(n)
+            )
+            self._rebuild_at = 0.0
+        return n
+
+    def flush(self) -> int:
+        """Persist and index queued samples now; returns the number merged"""
+        with self._lock:
+            return self._merge_pending()
+
+    def close(self):
+        """Persist queued samples and release the database connection"""
+        with self._lock:
+            if self._pending:
+                self._merge_pending()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _merge_pending(self) -> int:
+        if not self._loaded:
+            self._load()
+        pending, self._pending = self._pending, []
+        self._rebuild_at = time.monotonic() + REBUILD_INTERVAL
+        if not pending and self._index is not None:
+            return 0
+
+        if pending:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    f"INSERT INTO soil_map_samples VALUES ({', '.join('?' * (2 + len(MAP_METRICS)))})",
+                    [(lat, lon, *row) for lat, lon, row in pending]
+                )
+            self._lat = np.concatenate([self._lat, [p[0] for p in pending]])
+            self._lon = np.concatenate([self._lon, [p[1] for p in pending]])
+            self._values = np.vstack([self._values, np.array([p[2] for p in pending]).reshape(-1, len(MAP_METRICS))])
+
+        tree = cKDTree(to_unit_vectors(self._lat, self._lon)) if len(self._lat) else None
+        self.version += 1
+        self._index = _SampleIndex(tree, self._values, self.version)
+        return len(pending)
+
+    def _current_index(self) -> _SampleIndex:
+        with self._lock:
+            if self._index is None or (self._pending and time.monotonic() >= self._rebuild_at):
+                self._merge_pending()
+            return self._index
+
+    def _interpolate(self, index: _SampleIndex, metric: str, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """IDW estimate at each (lat, lon); NaN where no sample lies within range"""
+        column = MAP_METRICS.index(metric)
+        if index.tree is None:
+            return np.full(lat.shape, np.nan)
+        # Samples without this metric are skipped by giving them zero weight
+        known = np.isfinite(index.values[:, column])
+        k = min(self.neighbours, index.tree.n)
+        distance, neighbour = index.tree.query(
+            to_unit_vectors(lat.ravel(), lon.ravel()), k=k,
+            distance_upper_bound=km_to_chord(self.max_distance_km)
+        )
+        distance = distance.reshape(-1, k)
+        neighbour = neighbour.reshape(-1, k)
+        found = np.isfinite(distance)
+        neighbour = np.where(found, neighbour, 0)
+        found &= known[neighbour]
+        weights = np.where(found, 1.0 / np.maximum(distance, MIN_DISTANCE) ** self.power, 0.0)
+        samples = np.where(found, index.values[neighbour, column], 0.0)
+        total = weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimate = (weights * samples).sum(axis=1) / total
+        estimate[total == 0] = np.nan
+        return estimate.reshape(lat.shape)
+
+    def estimate(self, lat: Sequence[float], lon: Sequence[float], metric: str) -> np.ndarray:
+        """Estimated metric at plot locations"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return self._interpolate(self._current_index(), metric, lat, lon)
+
+    def _tile_axes(self, resolution: float, row: int, col: int) -> Tuple[np.ndarray, np.ndarray]:
+        cells = np.arange(TILE_CELLS)
+        lat = (row * TILE_CELLS + cells + 0.5) * resolution - 90.0
+        lon = (col * TILE_CELLS + cells + 0.5) * resolution - 180.0
+        return lat, lon
+
+    def tile(self, metric: str, resolution: float, row: int, col: int) -> np.ndarray:
+        """
+        (TILE_CELLS, TILE_CELLS) surface for one tile of the global grid with
+        `resolution`-degree cells; tile (0, 0) starts at 90S 180W.
+        """
+        return self._tile(self._current_index(), metric, resolution, row, col)
+
+    def _tile(self, index: _SampleIndex, metric: str, resolution: float, row: int, col: int) -> np.ndarray:
+        key = (index.version, metric, resolution, row, col)
+        values = self.tiles.get(key)
+        if values is None:
+            lat, lon = self._tile_axes(resolution, row, col)
+            grid_lat, grid_lon = np.meshgrid(lat, lon, indexing="ij")
+            values = self._interpolate(index, metric, grid_lat, grid_lon)
+            self.tiles.put(key, values)
+        return values
+
+    def grid(
+        self,
+        metric: str,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        resolution: float
+    ) -> SoilSurface:
+        """Surface over a bounding box, assembled from cached tiles"""
+        first_row, last_row = (int(math.floor((v + 90.0) / resolution)) for v in (min_lat, max_lat))
+        first_col, last_col = (int(math.floor((v + 180.0) / resolution)) for v in (min_lon, max_lon))
+        rows, cols = last_row - first_row + 1, last_col - first_col + 1
+        if rows * cols > MAX_GRID_CELLS:
+            raise ValueError(f"Grid of {rows}x{cols} cells exceeds {MAX_GRID_CELLS}; use a coarser resolution")
+
+        index = self._current_index()
+        tiles = [
+            (tile_row, tile_col)
+            for tile_row in range(first_row // TILE_CELLS, last_row // TILE_CELLS + 1)
+            for tile_col in range(first_col // TILE_CELLS, last_col // TILE_CELLS + 1)
+        ]
+        workers = max(1, min(self.workers, len(tiles)))
+        if workers == 1:
+            computed = [self._tile(index, metric, resolution, r, c) for r, c in tiles]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                computed = list(executor.map(lambda rc: self._tile(index, metric, resolution, *rc), tiles))
+
+        values = np.empty((rows, cols))
+        for (tile_row, tile_col), tile in zip(tiles, computed):
+            # Overlap of this tile with the requested cell range, in both coordinate frames
+            top, left = tile_row * TILE_CELLS, tile_col * TILE_CELLS
+            r0, r1 = max(first_row, top), min(last_row + 1, top + TILE_CELLS)
+            c0, c1 = max(first_col, left), min(last_col + 1, left + TILE_CELLS)
+            values[r0 - first_row:r1 - first_row, c0 - first_col:c1 - first_col] = tile[r0 - top:r1 - top, c0 - left:c1 - left]
+
+        return SoilSurface(
+            metric=metric,
+            lat=(np.arange(first_row, last_row + 1) + 0.5) * resolution - 90.0,
+            lon=(np.arange(first_col, last_col + 1) + 0.5) * resolution - 180.0,
+            values=values,
+            version=index.version
+        )
@@ -0,0 +1,165 @@
+"""
+Soil Rules Service for FARMGUARD
+
+Loads the soil analysis knowledge base (pH ranges, nutrient thresholds,
+fertilizer costs, crop requirements) from a JSON data file and compiles it
+into lookup tables: pH categories and pH-suitable crops become interval
+indexes answered with one binary search. The file is watched and reloaded
+on change; a new table set replaces the old one in a single assignment, so
+requests always see one consistent version.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "soil_analysis_data.json")
+RELOAD_CHECK_INTERVAL = 2.0  # seconds between data file mtime checks
+
+class IntervalIndex:
+    """
+    Closed-interval stabbing queries in O(log n).
+
+    Interval endpoints split the axis into points and open segments; the
+    matching values (in their original order) are precomputed for each.
+    """
+
+    def __init__(self, intervals: Sequence[Tuple[float, float, Any]]):
+        self.bounds = sorted({bound for lo, hi, _ in intervals for bound in (lo, hi)})
+        self.at_point: List[Tuple[Any, ...]] = [
+            tuple(value for lo, hi, value in intervals if lo <= x <= hi) for x in self.bounds
+        ]
+        # segment i lies between bounds[i - 1] and bounds[i]
+        self.in_segment: List[Tuple[Any, ...]] = []
+        for i in range(len(self.bounds) + 1):
+            if 0 < i < len(self.bounds):
+                left, right = self.bounds[i - 1], self.bounds[i]
+                self.in_segment.append(tuple(value for lo, hi, value in intervals if lo <= left and right <= hi))
+            else:
+                self.in_segment.append(())
+
+    def lookup(self, x: float) -> Tuple[Any, ...]:
+        i = bisect_left(self.bounds, x)
+        if i < len(self.bounds) and self.bounds[i] == x:
+            return self.at_point[i]
+        return self.in_segment[i]
+
+class SoilRules:
+    """Compiled, read-only view of one version of the soil knowledge base"""
+
+    def __init__(self, data: Dict, source: Optional[str] = None, mtime: int = 0):
+        self.data = data
+        self.version = str(data.get("version", "unversioned"))
+        self.source = source
+        self.mtime = mtime
+
+        self.ph_index = IntervalIndex([
+            (float(bounds["min"]), float(bounds["max"]), category)
+            for category, bounds in data["ph_ranges"].items()
+        ])
+        self.crop_ph_index = IntervalIndex([
+            (float(req["ph"][0]), float(req["ph"][1]), crop.title())
+            for crop, req in data["crop_requirements"].items()
+        ])
+
+        # nutrient -> (low max, high min); a missing level never matches
+        self.nutrient_thresholds: Dict[str, Tuple[float, float]] = {}
+        for nutrient, levels in data["nutrient_levels"].items():
+            low_max = float(levels["low"]["max"]) if "low" in levels else float("-inf")
+            high_min = float(levels["high"]["min"]) if "high" in levels else float("inf")
+            self.nutrient_thresholds[nutrient] = (low_max, high_min)
+
+        self.fertilizer_costs: Dict[str, float] = data["fertilizer_costs"]
+        self.crop_requirements: Dict[str, Dict] = data["crop_requirements"]
+
+    def ph_category(self, ph: float) -> str:
+        categories = self.ph_index.lookup(ph)
+        return categories[0] if categories else "unknown"
+
+    def nutrient_level(self, nutrient: str, value: float) -> str:
+        low_max, high_min = self.nutrient_thresholds.get(nutrient, (float("-inf"), float("inf")))
+        if value <= low_max:
+            return "low"
+        elif value >= high_min:
+            return "high"
+        return "medium"
+
+    def suitable_crops(self, ph: float) -> List[str]:
+        return list(self.crop_ph_index.lookup(ph))
+
+    def with_fertilizer_costs(self, costs: Dict[str, float]) -> "SoilRules":
+        """The same rules priced with `costs` (INR/kg by fertilizer_costs key) where given"""
+        priced = copy.copy(self)
+        priced.fertilizer_costs = {**self.fertilizer_costs, **costs}
+        priced.data = {**self.data, "fertilizer_costs": priced.fertilizer_costs}
+        return priced
+
+    @classmethod
+    def from_file(cls, path: str) -> "SoilRules":
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data, source=path, mtime=mtime)
+
+class SoilRulesRegistry:
+    """Holds the active SoilRules and swaps in a recompiled set when the data file changes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rules: Optional[SoilRules] = None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+
+    def current(self) -> SoilRules:
+        rules = self._rules
+        if rules is None or time.monotonic() >= self._next_check:
+            rules = self._check()
+        return rules
+
+    def _check(self) -> SoilRules:
+        with self._lock:
+            self._next_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+            try:
+                changed = self._rules is None or os.stat(self.path).st_mtime_ns != self._rules.mtime
+            except OSError as e:
+                if self._rules is None:
+                    raise
+                logger.error(f"Soil rules file unavailable, keeping version {self._rules.version}: {e}")
+                changed = False
+            if changed:
+                self.reload()
+            return self._rules
+
+    def reload(self) -> SoilRules:
+        """Compile the data file; on error the previous version stays active"""
+        try:
+            rules = SoilRules.from_file(self.path)
+        except Exception as e:
+            if self._rules is None:
+                raise
+            logger.error(f"❌ Invalid soil rules in {self.path}, keeping version {self._rules.version}: {e}")
+            return self._rules
+        self._rules = rules
+        logger.info(f"🧪 Soil rules version {rules.version} loaded from {self.path}")
+        return rules
+
+_registry: Optional[SoilRulesRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_soil_rules() -> SoilRules:
+    """Active compiled soil rules (reloaded when the data file changes)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SoilRulesRegistry(settings.SOIL_RULES_PATH or DEFAULT_RULES_PATH)
+    return _registry.current()
@@ -0,0 +1,185 @@
+"""
+Soil Scoring Service for FARMGUARD
+
+Vectorized form of the soil health scoring and fertilizer need rules used by
+the /soil/analyze endpoint. Every rule operates on NumPy columns so a whole
+batch of lab samples is scored at once. Arithmetic follows the per-request
+path operation for operation, so both give identical numbers.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUTRIENT_SCORES = {"low": 10, "medium": 16, "high": 15}  # Medium is optimal
+FERTILITY_THRESHOLDS = [(80, "Excellent"), (65, "Good"), (50, "Fair"), (35, "Poor")]
+LEVELS = np.array(["low", "medium", "high"], dtype=object)
+
+# Per nutrient: soil analysis key, crop requirement key and default, product factor,
+# fertilizer when the level is low / otherwise
+FERTILIZER_RULES = [
+    ("Nitrogen", "nitrogen", "n", 120, 2.17, "urea", "balanced_npk"),
+    ("Phosphorus", "phosphorus", "p", 60, 2.18, "DAP", "single_super_phosphate"),
+    ("Potassium", "potassium", "k", 40, 1.67, "muriate_of_potash", "balanced_npk"),
+]
+BUDGET_PRIORITY = ["Phosphorus", "Nitrogen", "Potassium"]
+
+@dataclass
+class NutrientNeeds:
+    level: np.ndarray  # "low", "medium", "high"
+    need: np.ndarray  # kg/ha of nutrient
+    amount: np.ndarray  # kg/ha of product
+    fertilizer: np.ndarray  # product key in fertilizer_costs
+    cost_per_hectare: np.ndarray
+    included: np.ndarray  # recommended and within budget
+
+@dataclass
+class SoilScoreBatch:
+    soil_health_score: List[float]  # rounded like the per-request response
+    fertility_status: np.ndarray
+    ph_category: np.ndarray
+    nutrients: Dict[str, NutrientNeeds]
+    suitable_crops: np.ndarray  # (samples, crops) bool
+    crop_names: List[str]
+    total_cost: np.ndarray
+    expected_yield_improvement: np.ndarray
+    budget_constrained: np.ndarray  # needs listed in BUDGET_PRIORITY order, as /analyze does
+
+    def fertilizer_order(self, i: int) -> List[str]:
+        return BUDGET_PRIORITY if self.budget_constrained[i] else list(self.nutrients)
+
+def nutrient_levels(data: Dict, nutrient: str, values: np.ndarray) -> np.ndarray:
+    """Vector form of get_nutrient_level"""
+    levels = data["nutrient_levels"].get(nutrient, {})
+    index = np.ones(len(values), dtype=np.int8)
+    if "high" in levels:
+        index = np.where(values >= levels["high"]["min"], 2, index)
+    if "low" in levels:
+        index = np.where(values <= levels["low"]["max"], 0, index)
+    return LEVELS[index]
+
+def ph_categories(data: Dict, ph: np.ndarray) -> np.ndarray:
+    """Vector form of get_ph_category (first matching range wins)"""
+    categories = np.full(len(ph), "unknown", dtype=object)
+    unmatched = np.ones(len(ph), dtype=bool)
+    for category, bounds in data["ph_ranges"].items():
+        match = unmatched & (bounds["min"] <= ph) & (ph <= bounds["max"])
+        categories[match] = category
+        unmatched &= ~match
+    return categories
+
+def score_soil_batch(
+    data: Dict,
+    ph: np.ndarray,
+    nitrogen: np.ndarray,
+    phosphorus: np.ndarray,
+    potassium: np.ndarray,
+    organic_matter: np.ndarray,
+    target_crop: np.ndarray,
+    farm_size: np.ndarray,
+    budget: Optional[np.ndarray] = None
+) -> SoilScoreBatch:
+    """
+    Score a batch of soil samples.
+
+    `data` is the soil knowledge base (SoilRules.data); `target_crop` holds crop
+    names. `budget` uses NaN (or 0) for samples without a budget.
+    """
+    crop_names, crop_index = np.unique(np.asarray(target_crop, dtype=str), return_inverse=True)
+    requirements = [data["crop_requirements"].get(crop, {}) for crop in crop_names]
+
+    def requirement(key: str, default):
+        return np.array([req.get(key, default) for req in requirements], dtype=np.float64)[crop_index]
+
+    ph_ranges = np.array([req.get("ph", [6.0, 7.0]) for req in requirements], dtype=np.float64)[crop_index]
+    ph_low, ph_high = ph_ranges[:, 0], ph_ranges[:, 1]
+
+    # pH score (0-30 points)
+    in_range = (ph_low <= ph) & (ph <= ph_high)
+    ph_distance = np.minimum(np.abs(ph - ph_low), np.abs(ph - ph_high))
+    ph_score = np.where(in_range, 30.0, np.maximum(0, 30 - (ph_distance * 10)))
+
+    # Nutrient score (0-50 points)
+    values = {"nitrogen": nitrogen, "phosphorus": phosphorus, "potassium": potassium}
+    levels = {nutrient: nutrient_levels(data, nutrient, column) for nutrient, column in values.items()}
+    nutrient_score = sum(
+        np.select([levels[n] == level for level in NUTRIENT_SCORES], list(NUTRIENT_SCORES.values()))
+        for n in values
+    )
+    nutrient_score = np.minimum(50, nutrient_score)
+
+    # Organic matter score (0-20 points)
+    om_score = np.select(
+        [organic_matter >= 3.0, organic_matter >= 1.5, organic_matter >= 0.5], [20, 15, 10], default=5
+    )
+
+    total_score = ph_score + nutrient_score + om_score
+    fertility_status = np.select(
+        [total_score >= threshold for threshold, _ in FERTILITY_THRESHOLDS],
+        [status for _, status in FERTILITY_THRESHOLDS],
+        default="Very Poor"
+    ).astype(object)
+    # Python rounding, so scores match the per-request response exactly
+    soil_health_score = [round(score, 1) for score in total_score.tolist()]
+
+    # Fertilizer needs
+    costs = data["fertilizer_costs"]
+    nutrients: Dict[str, NutrientNeeds] = {}
+    total_cost = np.zeros(len(ph))
+    for name, nutrient, key, default, factor, low_product, other_product in FERTILIZER_RULES:
+        need = np.maximum(0, requirement(key, default) - values[nutrient])
+        low = levels[nutrient] == "low"
+        amount = need * factor
+        cost = amount * np.where(low, costs[low_product], costs[other_product])
+        recommended = need > 0
+        nutrients[name] = NutrientNeeds(
+            level=levels[nutrient],
+            need=need,
+            amount=amount,
+            fertilizer=np.where(low, low_product, other_product).astype(object),
+            cost_per_hectare=cost,
+            included=recommended
+        )
+        total_cost = total_cost + np.where(recommended, cost, 0.0)
+    total_cost = total_cost * farm_size
+
+    # Budget constraint: greedy in priority order, as in /analyze without optimize_budget
+    constrained = np.zeros(len(ph), dtype=bool)
+    if budget is not None:
+        budget = np.nan_to_num(np.asarray(budget, dtype=np.float64), nan=0.0)
+        constrained = (budget > 0) & (total_cost > budget)
+        if constrained.any():
+            running = np.zeros(len(ph))
+            for name in BUDGET_PRIORITY:
+                needs = nutrients[name]
+                cost = needs.cost_per_hectare * farm_size
+                fits = needs.included & (running + cost <= budget)
+                needs.included = np.where(constrained, fits, needs.included)
+                running = running + np.where(constrained & fits, cost, 0.0)
+            total_cost = np.where(constrained, running, total_cost)
+
+    # Suitable crops by pH
+    all_crops = list(data["crop_requirements"])
+    crop_ph = np.array([data["crop_requirements"][crop]["ph"] for crop in all_crops], dtype=np.float64)
+    suitable = (crop_ph[:, 0][None, :] <= ph[:, None]) & (ph[:, None] <= crop_ph[:, 1][None, :])
+
+    # Expected yield improvement
+    recommended_count = sum(needs.included.astype(int) for needs in nutrients.values())
+    base_yield_improvement = np.minimum(25.0, (100 - np.asarray(soil_health_score)) * 0.5)
+    expected_yield_improvement = np.minimum(40.0, base_yield_improvement + recommended_count * 5.0)
+
+    return SoilScoreBatch(
+        soil_health_score=soil_health_score,
+        fertility_status=fertility_status,
+        ph_category=ph_categories(data, ph),
+        nutrients=nutrients,
+        suitable_crops=suitable,
+        crop_names=[crop.title() for crop in all_crops],
+        total_cost=total_cost,
+        expected_yield_improvement=expected_yield_improvement,
+        budget_constrained=constrained
+    )
@@ -0,0 +1,106 @@
+"""
+Spatial Index Utilities for FARMGUARD
+
+Implicit (pointer-free) KD-tree over unit-sphere coordinates. The tree is
+just a permutation of the points plus one split-axis byte per point, so it
+can be written to disk and queried straight from a memory-mapped file.
+"""
+
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """Convert degrees to (n, 3) unit vectors; chord distance is monotonic in great-circle distance"""
+    lat_rad = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)], axis=-1)
+
+def chord_to_km(chord: float) -> float:
+    """Convert a unit-sphere chord length to great-circle kilometres"""
+    return 2.0 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2.0))
+
+def build_kd_order(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the implicit KD-tree layout for `points` (n, 3).
+
+    Returns (order, split_axes): `points[order]` is the tree layout, where the
+    node of range [lo, hi) sits at (lo + hi) // 2, and `split_axes[i]` is the
+    axis that node i splits on (unused for leaf ranges).
+    """
+    n = len(points)
+    order = np.arange(n)
+    split_axes = np.zeros(n, dtype=np.uint8)
+    stack = [(0, n)]
+
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo <= LEAF_SIZE:
+            continue
+        segment = order[lo:hi]
+        coords = points[segment]
+        axis = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+        mid = (hi - lo) // 2
+        order[lo:hi] = segment[np.argpartition(coords[:, axis], mid)]
+        split_axes[lo + mid] = axis
+        stack.append((lo, lo + mid))
+        stack.append((lo + mid + 1, hi))
+
+    return order, split_axes
+
+class KDTree:
+    """Nearest-neighbour queries over points already laid out by `build_kd_order`"""
+
+    def __init__(self, points: np.ndarray, split_axes: np.ndarray):
+        self.points = points
+        self.split_axes = split_axes
+        self.size = len(points)
+
+    @classmethod
+    def build(cls, lat: Sequence[float], lon: Sequence[float]) -> Tuple["KDTree", np.ndarray]:
+        """Build a tree from coordinates; returns the tree and the permutation applied"""
+        points = to_unit_vectors(lat, lon)
+        order, split_axes = build_kd_order(points)
+        return cls(np.ascontiguousarray(points[order]), split_axes), order
+
+    def nearest(self, lat: float, lon: float) -> Optional[Tuple[int, float]]:
+        """Return (tree index, distance in km) of the closest point"""
+        if self.size == 0:
+            return None
+
+        lat_rad, lon_rad = math.radians(lat), math.radians(lon)
+        query = (math.cos(lat_rad) * math.cos(lon_rad), math.cos(lat_rad) * math.sin(lon_rad), math.sin(lat_rad))
+        query_array = np.asarray(query)
+        points = self.points
+        axes = self.split_axes
+        best = [-1, math.inf]
+
+        def search(lo: int, hi: int):
+            if hi - lo <= LEAF_SIZE:
+                distances = ((points[lo:hi] - query_array) ** 2).sum(axis=1)
+                i = int(distances.argmin())
+                if distances[i] < best[1]:
+                    best[0], best[1] = lo + i, float(distances[i])
+                return
+            mid = (lo + hi) // 2
+            px, py, pz = points[mid].tolist()
+            d = (px - query[0]) ** 2 + (py - query[1]) ** 2 + (pz - query[2]) ** 2
+            if d < best[1]:
+                best[0], best[1] = mid, d
+            diff = query[axes[mid]] - (px, py, pz)[axes[mid]]
+            if diff < 0:
+                search(lo, mid)
+                if diff * diff < best[1]:
+                    search(mid + 1, hi)
+            else:
+                search(mid + 1, hi)
+                if diff * diff < best[1]:
+                    search(lo, mid)
+
+        search(0, self.size)
+        return best[0], chord_to_km(math.sqrt(best[1]))
@@ -0,0 +1,43 @@
+"""
+Cost-Benefit Simulation Benchmark for FARMGUARD
+
+Times FertilizerCalculator.simulate_cost_benefit_analysis for increasing
+scenario counts on a typical DAP/Urea/MOP recommendation; the request
+budget is 50 ms.
+
+Run from farmguard-ai-backend:  python -m benchmarks.bench_cost_benefit_simulation
+"""
+
+import argparse
+import statistics
+import time
+
+from app.services.fertilizer_calculator import FertilizerCalculator
+
+REQUIREMENTS = {"nitrogen": 100.0, "phosphorus": 30.0, "potassium": 30.0}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[10_000, 20_000, 50_000, 100_000, 200_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    calculator = FertilizerCalculator()
+    recommendations = calculator.recommend_fertilizers(REQUIREMENTS)
+
+    print(f"{'scenarios':>9} {'median ms':>10} {'p95 ms':>8} {'P(loss)':>8} {'ROI p50':>8}")
+    for scenarios in args.scenarios:
+        times = []
+        for seed in range(args.repeats):
+            start = time.perf_counter()
+            result = calculator.simulate_cost_benefit_analysis(
+                recommendations, "rice", 2.0, 22000.0, scenarios=scenarios, seed=seed
+            )
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(f"{scenarios:>9,} {statistics.median(times):>10.2f} {p95:>8.2f} "
+              f"{result['probability_of_loss']:>8.3f} {result['return_on_investment']['p50']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
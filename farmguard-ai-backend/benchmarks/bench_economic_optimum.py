@@ -0,0 +1,52 @@
+"""
+Economic Optimum Benchmark for FARMGUARD
+
+Times NutrientEconomicsSolver.optimal_rates_batch over a synthetic user
+base, once at catalog prices and again after a urea price change, the
+re-optimization run for every farm when prices move.
+
+Run from farmguard-ai-backend:  python -m benchmarks.bench_economic_optimum
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.services.fertilizer_calculator import FertilizerCalculator
+from app.services.nutrient_economics import NutrientEconomicsSolver, nutrient_prices
+from benchmarks.bench_nutrient_requirements import synthetic_cards
+
+CROP_PRICES = {"rice": 22000.0, "wheat": 22750.0, "maize": 22250.0, "cotton": 70000.0, "sugarcane": 3400.0}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--farms", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    calculator = FertilizerCalculator()
+    solver = NutrientEconomicsSolver(calculator)
+    cards = synthetic_cards(calculator, args.farms)
+    crop_code = calculator.encode_crops(cards["crop"])
+    region_code = calculator.encode_regions(cards["region"])
+    crop_price = np.array([CROP_PRICES.get(crop, 20000.0) for crop in calculator.crop_database])[crop_code]
+    columns = [cards[name] for name in ("ph", "nitrogen", "phosphorus", "potassium", "organic_matter")]
+
+    timings = {}
+    prices = nutrient_prices(calculator.catalog)
+    for label, override in [("catalog prices", None), ("urea +20%", {"nitrogen": prices["nitrogen"] * 1.2})]:
+        start = time.perf_counter()
+        result = solver.optimal_rates_batch(
+            crop_code, *columns, crop_price, target_yield=cards["target_yield"], region_code=region_code, prices=override
+        )
+        timings[label] = (time.perf_counter() - start, result["rates"])
+
+    print(f"farms:             {args.farms:,}")
+    for label, (seconds, rates) in timings.items():
+        print(f"{label + ':':<18} {seconds:8.2f} s  ({args.farms / seconds / 1e6:.1f}M farms/s), "
+              f"mean N {rates['nitrogen'].mean():.1f} kg/ha")
+    baseline, repriced = timings["catalog prices"][1], timings["urea +20%"][1]
+    print(f"N rate lowered:    {np.mean(repriced['nitrogen'] < baseline['nitrogen']):.0%} of farms")
+
+if __name__ == "__main__":
+    main()
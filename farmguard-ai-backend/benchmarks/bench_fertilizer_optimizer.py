@@ -0,0 +1,62 @@
+"""
+Fertilizer Optimizer Benchmark for FARMGUARD
+
+Times optimize_fertilizer_mix on synthetic catalogs of increasing size, for
+continuous and whole-bag mixes, with and without a binding budget.
+
+Run from farmguard-ai-backend:  python -m benchmarks.bench_fertilizer_optimizer
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.services.fertilizer_optimizer import ProductMatrix, nondominated, optimize_fertilizer_mix
+
+TARGETS = [120.0, 60.0, 40.0]  # kg N, P2O5, K2O
+
+def synthetic_catalog(size: int, seed: int = 0) -> ProductMatrix:
+    """Random straight and complex grades with regional price spread"""
+    rng = np.random.default_rng(seed)
+    content = rng.uniform(0.0, 0.5, (size, 3)) * (rng.random((size, 3)) < 0.6)
+    content[content.sum(axis=1) == 0, 0] = 0.46
+    return ProductMatrix(
+        ids=[f"p{i}" for i in range(size)],
+        names=[f"Product {i}" for i in range(size)],
+        content=content,
+        price=rng.uniform(5.0, 60.0, size),
+        bag_kg=rng.choice([25.0, 45.0, 50.0], size)
+    )
+
+def time_solve(catalog: ProductMatrix, repeats: int, **kwargs) -> float:
+    optimize_fertilizer_mix(catalog, TARGETS, **kwargs)  # warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        optimize_fertilizer_mix(catalog, TARGETS, **kwargs)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 250, 500, 1000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'products':>8} {'kept':>5} {'min cost':>9} {'budget':>9} {'bags':>9} {'bags+budget':>12}  (median ms)")
+    for size in args.sizes:
+        catalog = synthetic_catalog(size)
+        cheapest = optimize_fertilizer_mix(catalog, TARGETS).cost
+        budget = cheapest * 0.6
+        row = [
+            time_solve(catalog, args.repeats),
+            time_solve(catalog, args.repeats, budget=budget),
+            time_solve(catalog, args.repeats, whole_bags=True),
+            time_solve(catalog, args.repeats, budget=budget, whole_bags=True)
+        ]
+        print(f"{size:>8} {len(nondominated(catalog)):>5} {row[0]:>9.2f} {row[1]:>9.2f} {row[2]:>9.2f} {row[3]:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Nutrient Requirement Benchmark for FARMGUARD
+
+Compares FertilizerCalculator.calculate_nutrient_requirements, called once
+per soil health card, with calculate_nutrient_requirements_batch on the
+same columns, and checks that both give identical results. Also times
+locating plots in districts of their state from coordinates (needs
+DISTRICT_FACTORS_PATH; without it no district is found).
+
+Run from farmguard-ai-backend:  python -m benchmarks.bench_nutrient_requirements
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.services.fertilizer_calculator import FertilizerCalculator, SoilTestResult
+
+def synthetic_cards(calculator: FertilizerCalculator, size: int, seed: int = 0):
+    """Soil health card columns with a mix of crops, states and target yields"""
+    rng = np.random.default_rng(seed)
+    return {
+        "crop": rng.choice(list(calculator.crop_database), size),
+        "region": rng.choice(list(calculator.regional_factors) + [""], size),
+        "ph": np.round(rng.uniform(4.0, 9.5, size), 1),
+        "nitrogen": np.round(rng.uniform(50, 450, size)),
+        "phosphorus": np.round(rng.uniform(2, 60, size), 1),
+        "potassium": np.round(rng.uniform(60, 450, size)),
+        "organic_matter": np.round(rng.uniform(0.1, 4.0, size), 2),
+        "target_yield": np.where(rng.random(size) < 0.3, rng.uniform(1, 8, size), np.nan)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--scalar-records", type=int, default=100_000, help="records timed on the scalar path")
+    args = parser.parse_args()
+
+    calculator = FertilizerCalculator()
+    cards = synthetic_cards(calculator, args.records)
+
+    start = time.perf_counter()
+    crop_code = calculator.encode_crops(cards["crop"])
+    region_code = calculator.encode_regions(cards["region"])
+    encoded = time.perf_counter()
+    batch = calculator.calculate_nutrient_requirements_batch(
+        crop_code, cards["ph"], cards["nitrogen"], cards["phosphorus"], cards["potassium"],
+        cards["organic_matter"], cards["target_yield"], region_code
+    )
+    finished = time.perf_counter()
+
+    scalar_records = min(args.scalar_records, args.records)
+    start_scalar = time.perf_counter()
+    mismatches = 0
+    for i in range(scalar_records):
+        target_yield = cards["target_yield"][i]
+        result = calculator.calculate_nutrient_requirements(
+            cards["crop"][i],
+            SoilTestResult(cards["ph"][i], cards["nitrogen"][i], cards["phosphorus"][i],
+                           cards["potassium"][i], cards["organic_matter"][i]),
+            None if np.isnan(target_yield) else target_yield,
+            cards["region"][i] or None
+        )
+        mismatches += sum(result[key] != batch[key][i] for key in result)
+    scalar_seconds = (time.perf_counter() - start_scalar) / scalar_records * args.records
+
+    # Plots with GPS coordinates as well as a state, located in one KD-tree query
+    rng_points = np.random.default_rng(1)
+    lat = rng_points.uniform(8.0, 32.0, args.records)
+    lon = rng_points.uniform(69.0, 89.0, args.records)
+    start_locate = time.perf_counter()
+    located = calculator.locate_regions(lat, lon, cards["region"])
+    locate_seconds = time.perf_counter() - start_locate
+
+    batch_seconds = finished - encoded
+    print(f"records:           {args.records:,}")
+    print(f"scalar (est.):     {scalar_seconds:8.2f} s  ({scalar_records:,} timed)")
+    print(f"encode codes:      {encoded - start:8.2f} s")
+    print(f"locate districts:  {locate_seconds:8.2f} s  ({np.mean(located >= 0):.0%} in a district of their state)")
+    print(f"batch:             {batch_seconds:8.2f} s  ({args.records / batch_seconds / 1e6:.1f}M records/s)")
+    print(f"speedup:           {scalar_seconds / batch_seconds:8.0f}x (batch), "
+          f"{scalar_seconds / (finished - start):.0f}x (with encoding)")
+    print(f"mismatches:        {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,35 @@ from app.api.soil_analysis import (
     get_ph_category, get_nutrient_level
 )
 from app.services.fertilizer_calculator import (
-    FertilizerCalculator, SoilTestResult
+    FertilizerCalculator, RiskAssumptions, SoilTestResult
 )
+from app.core.config import settings
+from app.services.analytics_sink import AnalyticsSink
+from app.services.fertilizer_catalog import (
+    DEFAULT_CATALOG_PATH, FertilizerCatalog, FertilizerCatalogRegistry, RegionalFactors, ResponseCurve,
+    get_fertilizer_catalog
+)
+from app.services.fertilizer_plan import FertilizerPlanner, PlanInputs
+from app.services.nutrient_economics import NutrientEconomicsSolver, fit_response_curve, nutrient_prices, relative_yield
+from app.services.price_feed import PriceFeed
+from app.services.procurement_planner import PlotSpec, ProcurementPlanner, wagner_whitin
+from app.services.result_cache import BoundedLRUCache
+from app.services.fertilizer_optimizer import ProductMatrix, optimize_fertilizer_mix
+from app.services.quantile_sketch import KLLSketch, RegionalSoilBenchmarks, region_keys
+from app.services.regional_factors import DistrictFactors, DistrictFactorTable
+from app.services.soil_mapping import SoilMapEngine
+from app.services.soil_rules import DEFAULT_RULES_PATH, SoilRulesRegistry, get_soil_rules
+from app.services.soil_scoring import score_soil_batch
+from app.api.soil_analysis import SoilAnalysisRequest, analysis_cache, quantize, soil_analysis_cache_key
+import app.api.soil_analysis as soil_analysis_api
+import dataclasses
+import datetime
+import itertools
+import json
+import math
+import time
+import numpy as np
+from scipy.optimize import linprog
 
 # Create test client
 client = TestClient(app)
@@ -294,6 +321,90 @@ class TestFertilizerCalculator:
         total_cost = sum(rec["cost"] for rec in recommendations)
         assert total_cost <= budget
     
+    def test_batch_requirements_match_scalar(self):
+        """Test the array-backed batch gives exactly the per-record requirements"""
+        rng = np.random.default_rng(3)
+        n = 3000
+        crops = rng.choice(list(self.calculator.crop_database), n)
+        regions = rng.choice(list(self.calculator.regional_factors) + ["Punjab", "atlantis", None], n)
+        ph = np.round(rng.uniform(4.0, 9.5, n), 1)
+        nitrogen = rng.uniform(0, 400, n)
+        phosphorus = np.round(rng.uniform(0, 40, n))
+        potassium = np.round(rng.uniform(50, 350, n))
+        organic_matter = np.round(rng.uniform(0, 4, n), 1)
+        target_yield = np.where(rng.random(n) < 0.5, np.nan, rng.uniform(0.5, 10, n))
+        # Tier boundaries
+        phosphorus[:40] = [10, 25] * 20
+        potassium[:40] = [110, 280] * 20
+        ph[:40] = [5.5, 6.0, 7.5, 8.0] * 10
+        organic_matter[:40] = [1.0, 2.5] * 20
+        
+        batch = self.calculator.calculate_nutrient_requirements_batch(
+            self.calculator.encode_crops(crops), ph, nitrogen, phosphorus, potassium, organic_matter,
+            target_yield, self.calculator.encode_regions(regions)
+        )
+        
+        for i in range(n):
+            expected = self.calculator.calculate_nutrient_requirements(
+                crops[i],
+                SoilTestResult(ph[i], nitrogen[i], phosphorus[i], potassium[i], organic_matter[i]),
+                None if np.isnan(target_yield[i]) else target_yield[i],
+                regions[i]
+            )
+            assert {key: batch[key][i] for key in expected} == expected
+        
+        with pytest.raises(ValueError):
+            self.calculator.encode_crops(["rice", "quinoa"])
+    
+    def test_district_factors(self):
+        """Test district codes and coordinates select district factors in scalar and batch paths"""
+        table = DistrictFactorTable([
+            DistrictFactors("IN-PB-LUDHIANA", "Ludhiana", "Punjab", 30.901, 75.857, RegionalFactors(1.3, 1.0, 1.2)),
+            DistrictFactors("IN-RJ-BIKANER", "Bikaner", "Rajasthan", 28.022, 73.312, RegionalFactors(0.2, 1.4, 0.6))
+        ])
+        calculator = FertilizerCalculator(districts=table)
+        soil = SoilTestResult(6.5, 150, 12, 150, 1.0)
+        state = calculator.calculate_nutrient_requirements("wheat", soil, region="punjab")
+        district = calculator.calculate_nutrient_requirements("wheat", soil, region="in-pb-ludhiana")
+        located = calculator.calculate_nutrient_requirements("wheat", soil, region="punjab", lat=30.95, lon=75.8)
+        remote = calculator.calculate_nutrient_requirements("wheat", soil, lat=10.0, lon=92.0)
+        # Ludhiana's centroid is the nearest, but the plot is across the state line
+        haryana = calculator.calculate_nutrient_requirements("wheat", soil, region="haryana", lat=30.95, lon=75.8)
+        
+        assert district == located
+        assert district["phosphorus"] == pytest.approx(state["phosphorus"] / 1.1 * 1.2)
+        assert remote == calculator.calculate_nutrient_requirements("wheat", soil)
+        assert haryana == calculator.calculate_nutrient_requirements("wheat", soil, region="haryana")
+        
+        lat, lon = np.array([30.95, 28.1, 10.0, 30.95]), np.array([75.8, 73.3, 92.0, 75.8])
+        states = ["punjab", "Rajasthan", "gujarat", "haryana"]
+        codes = calculator.locate_regions(lat, lon, states)
+        assert list(codes >= 0) == [True, True, False, False]
+        codes = np.where(codes >= 0, codes, calculator.encode_regions(states))
+        batch = calculator.calculate_nutrient_requirements_batch(
+            calculator.encode_crops(["wheat"] * 4), [6.5] * 4, [150] * 4, [12] * 4, [150] * 4, [1.0] * 4,
+            region_code=codes
+        )
+        for i in range(4):
+            expected = calculator.calculate_nutrient_requirements(
+                "wheat", soil, region=states[i].lower(), lat=lat[i], lon=lon[i]
+            )
+            assert {key: batch[key][i] for key in expected} == expected
+        assert list(calculator.encode_regions(["IN-RJ-BIKANER", "Rajasthan"])) == [len(calculator.regional_factors) + 1, 9]
+    
+    def test_calculator_region_keeps_the_location_state(self, monkeypatch):
+        """Test a nearer district centroid across a state border never replaces the location's state"""
+        table = DistrictFactorTable([
+            DistrictFactors("IN-BR-PURNIA", "Purnia", "Bihar", 25.778, 87.475, RegionalFactors(1.2, 1.1, 1.0))
+        ])
+        monkeypatch.setattr(soil_analysis_api, "get_district_factors", lambda: table)
+        
+        assert soil_analysis_api.calculator_region(None, "Siliguri") == "west_bengal"
+        assert soil_analysis_api.calculator_region(None, "Purnia") == "IN-BR-PURNIA"
+        assert soil_analysis_api.calculator_region(None, None, 25.9, 87.6) == "IN-BR-PURNIA"
+        assert soil_analysis_api.calculator_region(None, "Siliguri", 26.0, 87.7) == "west_bengal"
+        assert soil_analysis_api.calculator_region("West Bengal", None) == "west_bengal"
+    
     def test_application_schedule(self):
         """Test fertilizer application schedule creation"""
         recommendations = [{
@@ -311,6 +422,57 @@ class TestFertilizerCalculator:
         assert all(hasattr(app, 'days_after_planting') for app in schedule)
         assert all(app.amount > 0 for app in schedule)
     
+    def test_schedule_follows_catalog_grades(self):
+        """Test products are scheduled by grade, not by letters in their names"""
+        recommendations = [
+            {"fertilizer": "Single Super Phosphate", "amount": 100, "cost": 950},
+            {"fertilizer": "NPK 10-26-26", "amount": 50, "cost": 1100},
+            {"fertilizer": "potash", "amount": 40, "cost": 680},
+            {"fertilizer": "Unlisted Blend", "amount": 10, "cost": 100}
+        ]
+        
+        schedule = self.calculator.create_application_schedule("wheat", recommendations, "2024-11-01")
+        by_product = {}
+        for application in schedule:
+            by_product.setdefault(application.fertilizer, []).append(application)
+        
+        assert [a.nutrient for a in by_product["Single Super Phosphate"]] == ["Phosphorus"]
+        assert [a.stage for a in by_product["NPK 10-26-26"]] == ["basal"]
+        assert [a.days_after_planting for a in by_product["potash"]] == [0, 45]
+        assert "Unlisted Blend" not in by_product
+    
+    def test_price_update_swaps_catalog(self, tmp_path):
+        """Test a price update is a new catalog version shared by calculators, persisted only on request"""
+        path = tmp_path / "fertilizer_catalog.json"
+        with open(DEFAULT_CATALOG_PATH) as f:
+            path.write_text(f.read())
+        source = path.read_text()
+        registry = FertilizerCatalogRegistry(str(path))
+        calculator = FertilizerCalculator(registry)
+        original = registry.current()
+        
+        in_memory = registry.update_prices({"urea": 6.8}, version="test-1")
+        
+        assert calculator.fertilizer_database["urea"].price_per_kg == 6.8
+        assert path.read_text() == source
+        assert registry.reload().products["urea"].price_per_kg == 6.8
+        
+        updated = registry.update_prices({"urea": 7.0}, version="test-2", persist=True)
+        
+        assert calculator.catalog is updated
+        assert in_memory.products["urea"].price_per_kg == 6.8
+        assert calculator.fertilizer_database["urea"].price_per_kg == 7.0
+        assert original.products["urea"].price_per_kg == 6.5
+        assert FertilizerCatalogRegistry(str(path)).current().version == "test-2"
+        assert registry.reload().products["urea"].price_per_kg == 7.0
+        with pytest.raises(ValueError):
+            registry.update_prices({"guano": 3.0})
+        with pytest.raises(AttributeError):
+            updated.products["urea"].price_per_kg = 1.0
+        
+        recommendations = calculator.recommend_fertilizers({"nitrogen": 92, "phosphorus": 0, "potassium": 0})
+        assert recommendations[0]["cost"] == pytest.approx(200 * 7.0)
+    
     def test_cost_benefit_analysis(self):
         """Test cost-benefit analysis calculations"""
         recommendations = [{
@@ -333,6 +495,936 @@ class TestFertilizerCalculator:
         assert "return_on_investment" in analysis
         assert analysis["total_fertilizer_cost"] > 0
 
+    def test_cost_benefit_simulation(self):
+        """Test the Monte Carlo analysis reduces to the deterministic one without uncertainty"""
+        recommendations = self.calculator.recommend_fertilizers(
+            {"nitrogen": 100, "phosphorus": 30, "potassium": 30}
+        )
+        fixed = self.calculator.calculate_cost_benefit_analysis(recommendations, "rice", 2.0, 22000.0)
+        certain = self.calculator.simulate_cost_benefit_analysis(
+            recommendations, "rice", 2.0, 22000.0, scenarios=100,
+            assumptions=RiskAssumptions(yield_response_sd=0, crop_price_cv=0, fertilizer_price_cv=0)
+        )
+        assert set(certain["return_on_investment"].values()) == {fixed["return_on_investment"]}
+        assert certain["net_benefit"]["p50"] == pytest.approx(fixed["net_benefit"], abs=0.01)
+        assert certain["probability_of_loss"] == 0
+        
+        start = time.perf_counter()
+        risky = self.calculator.simulate_cost_benefit_analysis(recommendations, "rice", 2.0, 22000.0, seed=7)
+        assert time.perf_counter() - start < 0.5
+        roi = list(risky["return_on_investment"].values())
+        assert roi == sorted(roi) and roi[0] < fixed["return_on_investment"] < roi[-1]
+        assert 0 < risky["probability_of_loss"] < 0.5
+        assert risky == self.calculator.simulate_cost_benefit_analysis(recommendations, "rice", 2.0, 22000.0, seed=7)
+        
+        with pytest.raises(ValueError):
+            self.calculator.simulate_cost_benefit_analysis(recommendations, "rice", 2.0, 22000.0, scenarios=0)
+
+class TestSoilRules:
+    """Test compiled soil rule tables and hot reload"""
+    
+    def test_compiled_lookups_match_linear_scan(self):
+        """Test interval lookups agree with scanning the raw tables, including range boundaries"""
+        rules = get_soil_rules()
+        data = rules.data
+        probes = sorted({b for r in data["ph_ranges"].values() for b in (r["min"], r["max"])} |
+                        {p for req in data["crop_requirements"].values() for p in req["ph"]} |
+                        {round(x * 0.05, 2) for x in range(40, 240)})
+        
+        for ph in probes:
+            expected_category = next(
+                (c for c, r in data["ph_ranges"].items() if r["min"] <= ph <= r["max"]), "unknown"
+            )
+            expected_crops = [c.title() for c, req in data["crop_requirements"].items()
+                              if req["ph"][0] <= ph <= req["ph"][1]]
+            assert rules.ph_category(ph) == expected_category
+            assert rules.suitable_crops(ph) == expected_crops
+    
+    def test_hot_reload_swaps_rules(self, tmp_path):
+        """Test an updated data file is picked up and an invalid one is ignored"""
+        path = tmp_path / "soil_rules.json"
+        with open(DEFAULT_RULES_PATH) as f:
+            data = json.load(f)
+        path.write_text(json.dumps(data))
+        registry = SoilRulesRegistry(str(path))
+        original = registry.current()
+        
+        data["version"] = "test-2"
+        data["nutrient_levels"]["nitrogen"]["low"]["max"] = 200
+        path.write_text(json.dumps(data))
+        os.utime(path, ns=(original.mtime + 10**9, original.mtime + 10**9))
+        reloaded = registry.reload()
+        
+        assert reloaded.version == "test-2"
+        assert reloaded.nutrient_level("nitrogen", 180) == "low"
+        assert original.nutrient_level("nitrogen", 180) == "medium"
+        
+        path.write_text("{ not json")
+        assert registry.reload() is reloaded
+
+class TestSoilAnalysisCache:
+    """Test memoization of soil analysis results"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        analysis_cache.clear()
+        self.request = {
+            "soil_data": {"ph": 6.3, "nitrogen": 100, "phosphorus": 12, "potassium": 90,
+                          "organic_matter": 1.25, "soil_type": "loamy"},
+            "target_crop": "wheat",
+            "farm_size": 2.5,
+            "budget": 3000
+        }
+    
+    def test_quantize_only_accepts_grid_values(self):
+        """Test values off the reporting grid are not cacheable"""
+        assert quantize(6.3, 10) == 63
+        assert quantize(6.33, 10) is None
+        assert quantize(120.0, 1) == 120
+        assert quantize(None, 1) is None
+        
+        off_grid = dict(self.request, soil_data=dict(self.request["soil_data"], nitrogen=100.5))
+        assert soil_analysis_cache_key(SoilAnalysisRequest(**off_grid), get_soil_rules()) is None
+    
+    def test_repeated_requests_are_served_from_cache(self):
+        """Test identical requests hit the cache and return identical results"""
+        first = client.post("/soil/analyze", json=self.request).json()
+        hits = analysis_cache.hits
+        second = client.post("/soil/analyze", json=self.request).json()
+        
+        assert second == first
+        assert analysis_cache.hits == hits + 1
+        
+        other_budget = client.post("/soil/analyze", json=dict(self.request, budget=50000)).json()
+        assert other_budget["total_cost"] != first["total_cost"]
+        
+        stats = client.get("/soil/health").json()["analysis_cache"]
+        assert stats["size"] == 2
+        assert stats["hits"] >= 1
+
+class TestBatchSoilAnalysis:
+    """Test streamed batch soil analysis"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        rng = np.random.default_rng(42)
+        crops = [crop.value for crop in CropType]
+        self.samples = [
+            {
+                "sample_id": f"S{i}",
+                "ph": round(float(rng.uniform(3.5, 10.5)), 2),
+                "nitrogen": round(float(rng.uniform(0, 400)), 1),
+                "phosphorus": round(float(rng.uniform(0, 80)), 1),
+                "potassium": round(float(rng.uniform(0, 400)), 1),
+                "organic_matter": round(float(rng.uniform(0, 5)), 2),
+                "soil_type": "loamy",
+                "target_crop": crops[i % len(crops)],
+                "farm_size": 2.0
+            }
+            for i in range(200)
+        ]
+    
+    def test_vectorized_scores_match_single_analysis(self):
+        """Test batch scoring gives exactly the per-sample scores and fertilizer needs"""
+        columns = {key: np.array([s[key] for s in self.samples]) for key in
+                   ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "target_crop", "farm_size"]}
+        batch = score_soil_batch(get_soil_rules().data, **columns)
+        
+        for i, sample in enumerate(self.samples):
+            soil_data = SoilData(**{k: sample[k] for k in ["ph", "nitrogen", "phosphorus", "potassium", "organic_matter", "soil_type"]})
+            analysis = analyze_soil_health(soil_data, CropType(sample["target_crop"]))
+            
+            assert batch.soil_health_score[i] == analysis.soil_health_score
+            assert batch.fertility_status[i] == analysis.fertility_status
+            assert [c for c, ok in zip(batch.crop_names, batch.suitable_crops[i]) if ok] == analysis.suitable_crops
+            expected = {rec.nutrient: rec.cost_per_hectare for rec in analysis.fertilizer_needs}
+            actual = {name: needs.cost_per_hectare[i] for name, needs in batch.nutrients.items() if needs.included[i]}
+            assert actual == expected
+    
+    def test_csv_upload_streams_results(self):
+        """Test CSV uploads are scored in input order with a summary line"""
+        columns = list(self.samples[0])
+        lines = [",".join(columns)] + [",".join(str(s[c]) for c in columns) for s in self.samples]
+        lines[3] = lines[3].replace("loamy", "marsh")
+        
+        response = client.post("/soil/analyze/batch", content="\n".join(lines), headers={"content-type": "text/csv"})
+        
+        assert response.status_code == 200
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["sample_id"] for r in results[:-1]] == [s["sample_id"] for s in self.samples]
+        assert results[2]["success"] is False
+        assert results[-1]["summary"] == {"rows": 200, "scored": 199, "failed": 1}
+    
+    def test_ndjson_upload_matches_single_endpoint(self):
+        """Test NDJSON requests give the same totals as /soil/analyze"""
+        request = {
+            "soil_data": {"ph": 6.5, "nitrogen": 100, "phosphorus": 10, "potassium": 90,
+                          "organic_matter": 1.2, "soil_type": "loamy"},
+            "target_crop": "wheat",
+            "farm_size": 2.0,
+            "budget": 3000
+        }
+        single = client.post("/soil/analyze", json=request).json()
+        
+        response = client.post("/soil/analyze/batch", content=json.dumps(request) + "\n",
+                               headers={"content-type": "application/x-ndjson"})
+        result = json.loads(response.text.splitlines()[0])
+        
+        assert result["soil_health_score"] == single["analysis"]["soil_health_score"]
+        assert result["total_cost"] == single["total_cost"]
+        assert [f["nutrient"] for f in result["fertilizer_needs"]] == \
+            [f["nutrient"] for f in single["analysis"]["fertilizer_needs"]]
+
+class TestFertilizerOptimizer:
+    """Test LP-based fertilizer mix selection"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.calculator = FertilizerCalculator()
+        self.products = ProductMatrix.from_products(self.calculator.fertilizer_database)
+        self.requirements = {"nitrogen": 120, "phosphorus": 26, "potassium": 33}
+    
+    def test_optimized_mix_meets_requirements_at_lower_cost(self):
+        """Test the LP mix supplies every nutrient for no more than the rule-based mix"""
+        rules_based = self.calculator.recommend_fertilizers(self.requirements)
+        optimized = self.calculator.recommend_fertilizers(self.requirements, optimize=True)
+        
+        supplied = {key: sum(rec["nutrients_supplied"][key] for rec in optimized) for key in ["n", "p2o5", "k2o"]}
+        assert supplied["n"] >= 120 - 1e-6
+        assert supplied["p2o5"] >= 26 * 2.29 - 1e-6
+        assert supplied["k2o"] >= 33 * 1.20 - 1e-6
+        assert sum(rec["cost"] for rec in optimized) <= sum(rec["cost"] for rec in rules_based) + 1e-6
+    
+    def test_budget_and_whole_bags(self):
+        """Test budget-limited mixes stay within budget and buy whole bags"""
+        mix = optimize_fertilizer_mix(self.products, [120, 60, 40], budget=2000, whole_bags=True)
+        
+        assert mix.status == "budget_limited"
+        assert mix.cost <= 2000
+        assert np.allclose(mix.amounts / self.products.bag_kg, np.round(mix.amounts / self.products.bag_kg))
+        assert mix.coverage.min() > 0.2
+        
+        # Pruning dominated products keeps large catalogs exact for continuous mixes
+        rng = np.random.default_rng(7)
+        m = 300
+        catalog = ProductMatrix([str(i) for i in range(m)], [str(i) for i in range(m)],
+                                rng.uniform(0, 0.5, (m, 3)), rng.uniform(5, 60, m), np.full(m, 50.0))
+        pruned = optimize_fertilizer_mix(catalog, [120, 60, 40])
+        full = linprog(catalog.price, A_ub=-catalog.content.T, b_ub=-np.array([120, 60, 40]))
+        assert pruned.status == "optimal"
+        assert pruned.cost == pytest.approx(full.fun, rel=1e-6)
+    
+    def test_analyze_scales_doses_to_budget(self):
+        """Test optimize_budget keeps every nutrient at a reduced dose within budget"""
+        request = {
+            "soil_data": {"ph": 5.8, "nitrogen": 50.0, "phosphorus": 8.0, "potassium": 80.0,
+                          "organic_matter": 1.2, "soil_type": "red"},
+            "target_crop": "cotton",
+            "farm_size": 1.0,
+            "budget": 2000.0
+        }
+        greedy = client.post("/soil/analyze", json=request).json()
+        optimized = client.post("/soil/analyze", json=dict(request, optimize_budget=True)).json()
+        
+        assert optimized["total_cost"] <= request["budget"] + 0.01
+        assert len(optimized["analysis"]["fertilizer_needs"]) >= len(greedy["analysis"]["fertilizer_needs"])
+        assert optimized["total_cost"] >= greedy["total_cost"]
+
+class TestAnalyticsSink:
+    """Test buffered analytics writes"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.event = {"crop": "wheat", "soil_type": "loamy", "health_score": 72.5, "ph": 6.5}
+    
+    def count_rows(self, database_url):
+        from sqlalchemy import create_engine, text
+        with create_engine(database_url).connect() as connection:
+            return connection.execute(text("SELECT COUNT(*) FROM soil_analyses")).scalar()
+    
+    def test_events_are_written_in_batches(self, tmp_path):
+        """Test queued events reach the database by the time the sink closes"""
+        url = f"sqlite:///{tmp_path}/analytics.db"
+        sink = AnalyticsSink(url, flush_size=50, flush_interval=0.05, max_queue=1000,
+                             spill_path=str(tmp_path / "spill.jsonl"))
+        for _ in range(120):
+            assert sink.record(self.event)
+        sink.close()
+        
+        assert self.count_rows(url) == 120
+        assert sink.stats()["written"] == 120
+        assert sink.stats()["failed_batches"] == 0
+    
+    def test_failed_writes_spill_and_replay(self, tmp_path):
+        """Test events survive an unavailable database via the spill file"""
+        spill_path = str(tmp_path / "spill.jsonl")
+        (tmp_path / "not_a_dir").write_text("")
+        broken = AnalyticsSink(f"sqlite:///{tmp_path}/not_a_dir/analytics.db", flush_size=10,
+                               flush_interval=0.05, spill_path=spill_path)
+        for _ in range(25):
+            broken.record(self.event)
+        broken.close()
+        assert broken.stats()["spilled"] == 25
+        assert broken.stats()["written"] == 0
+        
+        url = f"sqlite:///{tmp_path}/analytics.db"
+        healthy = AnalyticsSink(url, flush_size=10, flush_interval=0.05, spill_path=spill_path)
+        healthy.start()
+        deadline = time.monotonic() + 5
+        while healthy.stats()["written"] < 25 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        healthy.close()
+        
+        assert self.count_rows(url) == 25
+        assert not os.path.exists(spill_path)
+    
+    def test_interrupted_replay_resumes_without_losing_events(self, tmp_path):
+        """Test a replay that fails halfway keeps the unwritten events for the next retry"""
+        spill_path = str(tmp_path / "spill.jsonl")
+        with open(spill_path, "w") as f:
+            for i in range(25):
+                f.write(json.dumps(dict(self.event, created_at=1700000000.0 + i)) + "\n")
+        url = f"sqlite:///{tmp_path}/analytics.db"
+        sink = AnalyticsSink(url, flush_size=10, flush_interval=60, spill_path=spill_path)
+        write = sink._write
+        calls = []
+        
+        def failing_second_write(rows):
+            calls.append(len(rows))
+            return write(rows) if len(calls) == 1 else False
+        
+        sink._write = failing_second_write
+        sink._replay_spill()
+        
+        assert calls == [10, 10]
+        assert self.count_rows(url) == 10
+        assert os.path.exists(spill_path + ".replay")
+        
+        sink._write = write
+        sink._replay_spill()
+        sink.close()
+        
+        assert self.count_rows(url) == 25
+        assert not os.path.exists(spill_path + ".replay")
+        assert not os.path.exists(spill_path + ".replay.offset")
+    
+    def test_drop_mode_never_blocks(self, tmp_path):
+        """Test a full queue drops events instead of blocking the caller"""
+        sink = AnalyticsSink(f"sqlite:///{tmp_path}/analytics.db", max_queue=1, overflow="drop",
+                             flush_interval=60)
+        sink._closing.set()  # keep the writer from draining while the queue fills
+        results = [sink.record(self.event) for _ in range(10)]
+        
+        assert results[0] is True
+        assert sink.stats()["dropped"] == 9
+
+    def test_spill_happens_on_writer_thread(self, tmp_path):
+        """Test a full queue hands events to the writer instead of writing the spill file itself"""
+        spill_path = str(tmp_path / "spill.jsonl")
+        sink = AnalyticsSink(f"sqlite:///{tmp_path}/analytics.db", max_queue=4, flush_interval=60,
+                             spill_path=spill_path)
+        sink._closing.set()  # no writer thread; the test runs its loop below
+        results = [sink.record(self.event) for _ in range(10)]
+
+        assert results == [True] * 4 + [False] * 6
+        assert sink.stats()["pending_spill"] == 4  # held up to the queue size, the rest dropped
+        assert sink.stats()["dropped"] == 2
+        assert not os.path.exists(spill_path)
+
+        sink._run()
+
+        stats = sink.stats()
+        assert stats["written"] == 4
+        assert stats["spilled"] == 4
+        assert stats["pending_spill"] == 0
+        with open(spill_path) as f:
+            assert len(f.readlines()) == 4
+
+class TestSoilBenchmarks:
+    """Test regional percentile benchmarks"""
+    
+    def test_sketch_ranks_match_exact_percentiles(self):
+        """Test KLL ranks stay within one percentile point and survive persistence"""
+        rng = np.random.default_rng(5)
+        values = rng.normal(6.5, 0.8, 50000)
+        sketch = KLLSketch(seed=1)
+        for value in values.tolist():
+            sketch.update(value)
+        
+        ordered = np.sort(values)
+        for probe in np.quantile(values, [0.05, 0.25, 0.5, 0.75, 0.95]):
+            exact = np.searchsorted(ordered, probe, side="right") / len(values)
+            assert abs(sketch.rank(probe) - exact) < 0.01
+        assert sum(len(level) for level in sketch.levels) < 1000
+        
+        restored = KLLSketch.from_json(sketch.to_json())
+        assert restored.count == 50000
+        assert restored.quantile(0.5) == sketch.quantile(0.5)
+    
+    def test_sparse_district_falls_back_and_persists(self, tmp_path):
+        """Test small districts use their state's distribution and sketches reload from the database"""
+        url = f"sqlite:///{tmp_path}/benchmarks.db"
+        benchmarks = RegionalSoilBenchmarks(url, persist_interval=3600)
+        for i in range(40):
+            benchmarks.add(region_keys("Punjab", "Ludhiana"), {"ph": 6.0 + i * 0.05, "soil_health_score": 50 + i})
+        for i in range(5):
+            benchmarks.add(region_keys("Punjab", "Patiala"), {"ph": 8.0, "soil_health_score": 40})
+        
+        district = benchmarks.benchmark(region_keys("Punjab", "Ludhiana"), {"ph": 6.5})
+        assert district["region"] == "Punjab/Ludhiana"
+        assert district["metrics"]["ph"]["percentile"] == pytest.approx(27.5, abs=1)
+        
+        sparse = benchmarks.benchmark(region_keys("Punjab", "Patiala"), {"soil_health_score": 60})
+        assert sparse["region"] == "Punjab"
+        assert sparse["sample_count"] == 45
+        
+        assert benchmarks.persist() == 4
+        reloaded = RegionalSoilBenchmarks(url)
+        assert reloaded.benchmark(region_keys("Punjab", "Ludhiana"), {"ph": 6.5}) == district
+    
+    def test_benchmark_endpoint(self):
+        """Test the benchmark endpoint reports the region distribution"""
+        response = client.get("/soil/benchmark", params={"location": "Ludhiana", "ph": 6.5})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["region"] in region_keys("Punjab", "Ludhiana")
+
+class TestSoilMap:
+    """Test interpolated soil nutrient maps"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        rng = np.random.default_rng(11)
+        self.lat = rng.uniform(30.5, 31.5, 5000)
+        self.lon = rng.uniform(75.5, 76.5, 5000)
+        self.ph = 6.5 + 0.5 * np.sin(self.lat * 4) + 0.3 * np.cos(self.lon * 3)
+    
+    def test_idw_surface_follows_samples(self, tmp_path):
+        """Test interpolation reproduces a smooth field and tiles agree with point estimates"""
+        engine = SoilMapEngine(f"sqlite:///{tmp_path}/map.db", workers=2)
+        engine.add_samples(self.lat, self.lon, {"ph": self.ph})
+        
+        surface = engine.grid("ph", 30.8, 75.8, 31.2, 76.2, 0.01)
+        truth = 6.5 + 0.5 * np.sin(surface.lat * 4)[:, None] + 0.3 * np.cos(surface.lon * 3)[None, :]
+        assert np.abs(surface.values - truth).max() < 0.05
+        
+        grid_lat, grid_lon = np.meshgrid(surface.lat, surface.lon, indexing="ij")
+        assert np.allclose(engine.estimate(grid_lat, grid_lon, "ph"), surface.values)
+        assert engine.estimate([self.lat[0]], [self.lon[0]], "ph")[0] == pytest.approx(self.ph[0])
+        
+        # Far from every sample and for metrics without samples there is no estimate
+        assert np.isnan(engine.estimate([20.0], [80.0], "ph")[0])
+        assert np.isnan(engine.estimate([31.0], [76.0], "nitrogen")[0])
+        
+        hits = engine.tiles.hits
+        engine.grid("ph", 30.9, 75.9, 31.1, 76.1, 0.01)
+        assert engine.tiles.hits > hits
+        
+        # Samples persist with the map
+        reloaded = SoilMapEngine(f"sqlite:///{tmp_path}/map.db")
+        assert reloaded.estimate([31.0], [76.0], "ph")[0] == pytest.approx(engine.estimate([31.0], [76.0], "ph")[0])
+    
+    @pytest.fixture
+    def map_engine(self, tmp_path, monkeypatch):
+        """Endpoint map backed by a throwaway database instead of ./data"""
+        engine = SoilMapEngine(f"sqlite:///{tmp_path}/map.db")
+        monkeypatch.setattr(soil_analysis_api, "soil_map", engine)
+        yield engine
+        engine.close()
+    
+    def test_map_endpoints(self, map_engine):
+        """Test sample upload, plot estimates and grid queries"""
+        samples = [
+            {"lat": float(lat), "lon": float(lon), "ph": float(ph), "nitrogen": 200.0}
+            for lat, lon, ph in zip(self.lat[:500], self.lon[:500], self.ph[:500])
+        ]
+        response = client.post("/soil/map/samples", json={"samples": samples})
+        assert response.status_code == 200
+        assert response.json()["added"] == 500
+        
+        estimate = client.get("/soil/map/estimate", params={"lat": 31.0, "lon": 76.0}).json()
+        assert 5.5 < estimate["estimates"]["ph"] < 7.5
+        assert estimate["estimates"]["nitrogen"] == pytest.approx(200.0)
+        
+        grid = client.get("/soil/map/grid/ph", params={
+            "min_lat": 30.9, "max_lat": 31.1, "min_lon": 75.9, "max_lon": 76.1, "resolution": 0.02
+        }).json()
+        assert len(grid["values"]) == len(grid["lat"])
+        assert len(grid["values"][0]) == len(grid["lon"])
+        
+        assert client.get("/soil/map/grid/zinc", params={
+            "min_lat": 30.9, "max_lat": 31.1, "min_lon": 75.9, "max_lon": 76.1
+        }).status_code == 404
+
+class TestWhatIf:
+    """Test what-if sweeps over soil parameters"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.request = {
+            "soil_data": {"ph": 5.8, "nitrogen": 120, "phosphorus": 15, "potassium": 100,
+                          "organic_matter": 1.1, "soil_type": "loamy"},
+            "target_crop": "wheat",
+            "farm_size": 2.0,
+            "budget": 4000,
+            "sweep": {"ph": {"min": 5.0, "max": 7.5, "steps": 6}, "nitrogen": {"values": [50, 150, 250]}}
+        }
+    
+    def test_sweep_matches_single_analyses(self):
+        """Test every grid point equals the /soil/analyze result for those inputs"""
+        response = client.post("/soil/what-if", json=self.request)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["shape"] == [6, 3]
+        
+        for i, ph in enumerate(data["axes"]["ph"]):
+            for j, nitrogen in enumerate(data["axes"]["nitrogen"]):
+                single = dict(self.request, soil_data=dict(self.request["soil_data"], ph=ph, nitrogen=nitrogen))
+                del single["sweep"]
+                expected = client.post("/soil/analyze", json=single).json()
+                assert data["soil_health_score"][i][j] == expected["analysis"]["soil_health_score"]
+                assert data["fertility_status"][i][j] == expected["analysis"]["fertility_status"]
+                assert data["total_cost"][i][j] == expected["total_cost"]
+                assert data["expected_yield_improvement"][i][j] == expected["expected_yield_improvement"]
+    
+    def test_invalid_sweeps_are_rejected(self):
+        """Test unknown parameters, out-of-range values and oversized grids"""
+        unknown = dict(self.request, sweep={"zinc": {"min": 0, "max": 1}})
+        assert client.post("/soil/what-if", json=unknown).status_code == 400
+        
+        out_of_range = dict(self.request, sweep={"ph": {"min": 2.0, "max": 7.0}})
+        assert client.post("/soil/what-if", json=out_of_range).status_code == 400
+        
+        axis = {"min": 0, "max": 10, "steps": 201}
+        oversized = dict(self.request, sweep={"nitrogen": axis, "phosphorus": axis, "potassium": axis})
+        assert client.post("/soil/what-if", json=oversized).status_code == 400
+
+class TestFertilizerPlan:
+    """Test the one-call fertilizer plan and its stage memoization"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.request = {
+            "soil_data": {"ph": 6.4, "nitrogen": 140, "phosphorus": 12, "potassium": 150,
+                          "organic_matter": 0.9, "soil_type": "alluvial"},
+            "target_crop": "rice",
+            "farm_size": 2.0,
+            "planting_date": "2025-06-20",
+            "crop_price": 22000,
+            "region": "Punjab"
+        }
+    
+    def test_plan_matches_calculator(self):
+        """Test the endpoint returns the calculator's results with a dated schedule"""
+        response = client.post("/soil/plan", json=self.request)
+        assert response.status_code == 200
+        data = response.json()
+        
+        calculator = FertilizerCalculator()
+        requirements = calculator.calculate_nutrient_requirements(
+            "rice", SoilTestResult(6.4, 140, 12, 150, 0.9), region="punjab"
+        )
+        assert data["requirements"] == {k: round(v, 2) for k, v in requirements.items()}
+        mix = calculator.recommend_fertilizers(requirements, optimize=True)
+        assert [f["fertilizer"] for f in data["fertilizers"]] == [rec["fertilizer"] for rec in mix]
+        
+        basal = [a for a in data["schedule"] if a["days_after_planting"] == 0]
+        assert basal and all(a["date"] == "2025-06-20" for a in basal)
+        assert all(a["total_amount"] == pytest.approx(a["amount_per_hectare"] * 2.0, abs=0.02) for a in data["schedule"])
+        assert data["economics"]["total_fertilizer_cost"] > 0
+        assert "risk" not in data["economics"]
+        
+        risky = client.post("/soil/plan", json=dict(self.request, risk_scenarios=5000)).json()
+        assert risky["economics"]["risk"]["scenarios"] == 5000
+        assert risky["stages"]["mix"] == "cached"
+        
+        unsupported = dict(self.request, target_crop="onion")
+        assert client.post("/soil/plan", json=unsupported).status_code == 400
+    
+    def test_only_downstream_stages_rerun(self, tmp_path):
+        """Test date, crop price and fertilizer price changes reuse upstream stages"""
+        planner = FertilizerPlanner(cache_size=16)
+        inputs = PlanInputs("wheat", 7.0, 100, 20, 200, 1.5, 1.5, datetime.date(2025, 11, 1), 25000)
+        catalog = get_fertilizer_catalog()
+        
+        first = planner.plan(inputs, catalog)
+        assert set(first.stages.values()) == {"computed"}
+        
+        later = planner.plan(dataclasses.replace(inputs, planting_date=datetime.date(2025, 11, 15)), catalog)
+        assert set(later.stages.values()) == {"cached"}
+        assert later.schedule[0]["date"] != first.schedule[0]["date"]
+        
+        repriced = planner.plan(dataclasses.replace(inputs, crop_price=30000), catalog)
+        assert repriced.stages == {"requirements": "cached", "mix": "cached", "schedule": "cached", "economics": "computed"}
+        
+        cheaper = planner.plan(inputs, catalog.with_prices({"urea": 5.0}, version="test-2"))
+        assert cheaper.stages == {"requirements": "cached", "mix": "computed", "schedule": "computed", "economics": "computed"}
+        assert cheaper.catalog_version == "test-2"
+
+class TestProcurementPlanner:
+    """Test bulk procurement across member plots"""
+    
+    def test_weekly_demand_and_lots(self):
+        """Test aggregated demand equals the per-plot schedules and lots are optimal"""
+        calculator = FertilizerCalculator()
+        catalog = get_fertilizer_catalog()
+        planner = ProcurementPlanner(catalog)
+        rng = np.random.default_rng(3)
+        expected = {}
+        for i in range(300):
+            plot = PlotSpec(
+                crop=str(rng.choice(["rice", "wheat", "maize"])), area=float(rng.uniform(0.5, 3)),
+                ph=6.5, nitrogen=float(rng.choice([120, 200])), phosphorus=15, potassium=150, organic_matter=1.2,
+                planting_date=datetime.date(2025, 6, 2) + datetime.timedelta(days=int(rng.integers(0, 28)))
+            )
+            assert planner.add_plot(plot)
+            requirements = calculator.calculate_nutrient_requirements(
+                plot.crop, SoilTestResult(plot.ph, plot.nitrogen, plot.phosphorus, plot.potassium, plot.organic_matter)
+            )
+            schedule = calculator.create_application_schedule(
+                plot.crop, calculator.recommend_fertilizers(requirements), plot.planting_date.isoformat()
+            )
+            for application in schedule:
+                day = plot.planting_date + datetime.timedelta(days=application.days_after_planting)
+                key = (catalog.find_product(application.fertilizer), day - datetime.timedelta(days=day.weekday()))
+                expected[key] = expected.get(key, 0.0) + application.amount * plot.area
+        assert not planner.add_plot(dataclasses.replace(plot, crop="onion"))
+        
+        demand = {(product, week): kg for product, weeks in planner.weekly_demand().items() for week, kg in weeks}
+        assert demand.keys() == expected.keys()
+        assert all(demand[key] == pytest.approx(expected[key]) for key in expected)
+        assert len(planner.templates) == 6 and planner.rejected == 1
+        
+        orders = planner.plan_orders(order_cost=5000, holding_rate=0.002)
+        for product, weeks in planner.weekly_demand().items():
+            lots = [order for order in orders if order.product_id == product]
+            assert sum(order.demand_kg for order in lots) == pytest.approx(sum(kg for _, kg in weeks), abs=0.1)
+            assert all(order.bags * order.bag_kg >= order.demand_kg - 0.01 for order in lots)
+            assert len(lots) < len(weeks)
+    
+    def test_wagner_whitin_matches_exhaustive_search(self):
+        """Test lot sizing against every way of splitting the weeks into lots"""
+        def cost(weeks, demand, lots):
+            total = 0.0
+            for first, last in lots:
+                lot = sum(demand[first:last + 1])
+                total += 300 + sum(demand[t] * (weeks[t] - weeks[first]) * 0.8 for t in range(first, last + 1))
+                total += (math.ceil(lot / 50 - 1e-9) * 50 - lot) * 6.5
+            return total
+        
+        rng = np.random.default_rng(5)
+        for _ in range(50):
+            n = int(rng.integers(1, 7))
+            weeks = sorted(int(w) for w in rng.choice(30, n, replace=False))
+            demand = list(rng.uniform(5, 400, n))
+            best = min(
+                cost(weeks, demand, [(a, b - 1) for a, b in zip((0,) + cuts, cuts + (n,))])
+                for r in range(n) for cuts in itertools.combinations(range(1, n), r)
+            )
+            lots = wagner_whitin(weeks, demand, 300, 0.8, bag_kg=50, unit_price=6.5)
+            assert cost(weeks, demand, lots) == pytest.approx(best)
+    
+    def test_procurement_endpoint(self):
+        """Test a CSV upload of member plots becomes weekly demand and orders"""
+        rows = ["plot_id,target_crop,area,ph,nitrogen,phosphorus,potassium,organic_matter,planting_date,region"]
+        rows += [f"p{i},wheat,1.5,7.0,150,12,140,1.0,2025-11-{3 + i % 14:02d},Punjab" for i in range(40)]
+        rows.append("bad,wheat,-1,7.0,150,12,140,1.0,2025-11-03,Punjab")
+        response = client.post("/soil/procurement?order_cost=4000", content="\n".join(rows),
+                               headers={"content-type": "text/csv"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["plots"] == 40 and data["rejected"] == 1
+        assert data["errors"][0].startswith("row 40: area")
+        assert data["area"] == 60.0
+        assert {order["product_id"] for order in data["orders"]} == set(data["weekly_demand"])
+        assert data["total_order_cost"] == 4000 * len(data["orders"])
+        
+        missing = client.post("/soil/procurement", content="target_crop,area\nwheat,1", headers={"content-type": "text/csv"})
+        assert missing.status_code == 400
+
+class TestNutrientEconomics:
+    """Test economic optimum rates from yield response curves"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.solver = NutrientEconomicsSolver()
+        self.soil = SoilTestResult(6.5, 100, 8, 150, 1.5)
+    
+    def test_optimum_equates_marginal_return_and_price(self):
+        """Test the closed-form optimum is where one more kg just pays for itself"""
+        catalog = self.solver.calculator.catalog
+        prices = nutrient_prices(catalog)
+        assert prices["nitrogen"] == pytest.approx(6.5 / 0.46)
+        # Per kg of elemental P and K, the units of the requirements (DAP 46% P2O5, MOP 60% K2O)
+        assert prices["phosphorus"] == pytest.approx(27.0 / 0.46 * 2.29)
+        assert prices["potassium"] == pytest.approx(17.0 / 0.60 * 1.20)
+        
+        result = self.solver.optimal_rates("rice", self.soil, 22000, region="punjab")
+        requirements = self.solver.calculator.calculate_nutrient_requirements("rice", self.soil, region="punjab")
+        assert result["requirements"] == pytest.approx(requirements)
+        for i, nutrient in enumerate(["nitrogen", "phosphorus", "potassium"]):
+            curve = catalog.crops["rice"].response[nutrient]
+            scale = requirements[nutrient] / catalog.crop_table[i][0]
+            rate = result["rates"][nutrient]
+            assert rate > 0
+            value = lambda x: 22000 * 3.5 * relative_yield(curve, x / scale) - prices[nutrient] * x
+            assert value(rate) >= max(value(rate - 1), value(rate + 1))
+        
+        cheaper_crop = self.solver.optimal_rates("rice", self.soil, 8000, region="punjab")
+        assert all(cheaper_crop["rates"][n] < result["rates"][n] for n in result["rates"])
+        costly_urea = self.solver.optimal_rates("rice", self.soil, 22000, region="punjab", prices={"nitrogen": 60.0})
+        assert costly_urea["rates"]["nitrogen"] < result["rates"]["nitrogen"]
+        assert costly_urea["rates"]["phosphorus"] == result["rates"]["phosphorus"]
+        with pytest.raises(ValueError):
+            self.solver.optimal_rates("rice", self.soil, 0)
+    
+    def test_batch_matches_single_farm(self):
+        """Test the vectorized solver over many farms agrees with one-farm calls"""
+        calculator = self.solver.calculator
+        rng = np.random.default_rng(3)
+        crops = rng.choice(list(calculator.crop_database), 200)
+        columns = [np.round(rng.uniform(lo, hi, 200), 1) for lo, hi in [(4.5, 9), (0, 400), (2, 40), (50, 400), (0.2, 3)]]
+        crop_price = rng.uniform(3000, 70000, 200)
+        target_yield = np.where(rng.random(200) < 0.3, rng.uniform(1, 6, 200), 0.0)
+        regions = rng.choice(list(calculator.regional_factors) + [""], 200)
+        batch = self.solver.optimal_rates_batch(
+            calculator.encode_crops(crops), *columns, crop_price,
+            target_yield=target_yield, region_code=calculator.encode_regions(regions)
+        )
+        for i in range(0, 200, 7):
+            single = self.solver.optimal_rates(
+                crops[i], SoilTestResult(*(column[i] for column in columns)), crop_price[i],
+                target_yield=target_yield[i] or None, region=regions[i] or None
+            )
+            assert {n: batch["rates"][n][i] for n in single["rates"]} == pytest.approx(single["rates"])
+    
+    def test_fit_recovers_curve_and_missing_curves_fall_back(self):
+        """Test fitting trial data and crops without a curve keeping the agronomic requirement"""
+        rates = np.arange(0, 241, 30.0)
+        truth = ResponseCurve("quadratic_plateau", 0.55, plateau_rate=150)
+        curve, ymax = fit_response_curve(rates, 4.0 * relative_yield(truth, rates))
+        assert ymax == pytest.approx(4.0, rel=1e-3)
+        assert curve.plateau_rate == pytest.approx(150, rel=1e-2)
+        mitscherlich = ResponseCurve("mitscherlich", 0.8, rate_constant=0.03)
+        curve, ymax = fit_response_curve(rates, 5.0 * relative_yield(mitscherlich, rates), "mitscherlich")
+        assert curve.rate_constant == pytest.approx(0.03, rel=1e-2)
+        
+        data = json.loads(json.dumps(dict(get_fertilizer_catalog().data)))
+        del data["crops"]["wheat"]["response"]["nitrogen"]
+        solver = NutrientEconomicsSolver(FertilizerCalculator(catalog=FertilizerCatalog.from_data(data)))
+        result = solver.optimal_rates("wheat", self.soil, 22750)
+        assert result["rates"]["nitrogen"] == result["requirements"]["nitrogen"]
+        
+        data["crops"]["wheat"]["response"]["potassium"]["model"] = "linear"
+        with pytest.raises(ValueError):
+            FertilizerCatalog.from_data(data)
+    
+    def test_economic_optimum_endpoint(self):
+        """Test the endpoint reports optimum and agronomic rates"""
+        request = {
+            "soil_data": {"ph": 6.5, "nitrogen": 100, "phosphorus": 8, "potassium": 150,
+                          "organic_matter": 1.5, "soil_type": "alluvial"},
+            "target_crop": "rice",
+            "crop_price": 22000,
+            "region": "Punjab"
+        }
+        response = client.post("/soil/economic-optimum", json=request)
+        assert response.status_code == 200
+        data = response.json()
+        expected = self.solver.optimal_rates("rice", self.soil, 22000, region="punjab")
+        assert data["nutrients"]["nitrogen"]["economic_optimum"] == round(expected["rates"]["nitrogen"], 2)
+        assert data["nutrients"]["potassium"]["agronomic_requirement"] == round(expected["requirements"]["potassium"], 2)
+        assert data["nutrients"]["phosphorus"]["oxide_rate"] == round(expected["rates"]["phosphorus"] * 2.29, 2)
+        assert data["unit"] == "kg/ha of elemental N, P, K"
+        
+        assert client.post("/soil/economic-optimum", json=dict(request, target_crop="onion")).status_code == 400
+        assert client.post("/soil/economic-optimum", json=dict(request, nutrient_prices={"sulphur": 10})).status_code == 400
+
+class TestPriceFeed:
+    """Test versioned price snapshots and price-dependent cache eviction"""
+    
+    def setup_method(self):
+        """Setup test fixtures"""
+        analysis_cache.clear()
+    
+    def teardown_method(self):
+        """Drop analyses priced by a test feed"""
+        analysis_cache.clear()
+    
+    def make_feed(self, tmp_path) -> PriceFeed:
+        path = tmp_path / "fertilizer_catalog.json"
+        with open(DEFAULT_CATALOG_PATH) as f:
+            path.write_text(f.read())
+        return PriceFeed(str(tmp_path / "snapshots"), FertilizerCatalogRegistry(str(path)))
+    
+    def test_tagged_entries_are_invalidated(self):
+        """Test invalidation removes only tagged entries and rejects results computed across it"""
+        cache = BoundedLRUCache(3)
+        cache.put("a", 1, tags=["urea"])
+        cache.put("b", 2, tags=["dap", "mop"])
+        cache.put("c", 3)
+        epoch = cache.epoch
+        assert cache.invalidate({"mop"}) == 1
+        assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+        cache.put("b", 2, tags=["dap", "mop"], epoch=epoch)
+        assert cache.get("b") is None
+        cache.put("b", 2, tags=["dap"], epoch=epoch)
+        cache.put("d", 4, tags=["urea"])
+        assert len(cache) == 3 and cache.get("a") is None
+        assert cache.invalidate({"urea"}) == 1 and cache.stats()["invalidations"] == 2
+    
+    def test_ingest_versions_snapshots(self, tmp_path):
+        """Test price files make persisted versions with regional overrides and update the catalog"""
+        feed = self.make_feed(tmp_path)
+        baseline = feed.current()
+        assert baseline.price("urea") == 6.5 and baseline.price("balanced_npk") == 22.0
+        
+        prices = tmp_path / "prices.csv"
+        prices.write_text("product,price_per_kg,region\nUrea,7.0,\nDiammonium Phosphate,29.5,Punjab\n")
+        update = feed.ingest_file(str(prices), effective_date=datetime.date(2025, 10, 1))
+        snapshot = update.snapshot
+        assert update.changed == {"urea", "dap"}
+        assert snapshot.version != baseline.version and snapshot.effective_date == "2025-10-01"
+        assert snapshot.price("urea", "punjab") == 7.0
+        assert snapshot.price("dap", "punjab") == 29.5 and snapshot.price("dap", "bihar") == 27.0
+        assert feed.catalog_registry.current().products["urea"].price_per_kg == 7.0
+        assert feed.catalog_registry.current().products["dap"].price_per_kg == 27.0
+        assert baseline.price("urea") == 6.5
+        
+        assert feed.ingest_rows([{"product": "urea", "price_per_kg": "7.0"}]).snapshot is snapshot
+        with pytest.raises(ValueError):
+            feed.ingest_rows([{"product": "mop", "price_per_kg": "18"}, {"product": "ssp", "price_per_kg": "-1"}])
+        assert feed.current() is snapshot and snapshot.price("mop") == 17.0
+        
+        reloaded = PriceFeed(feed.directory, feed.catalog_registry).current()
+        assert reloaded.version == snapshot.version and reloaded.price("dap", "punjab") == 29.5
+        
+        # The catalog file is never rewritten; a fresh process gets the prices from the snapshot
+        catalog_path = feed.catalog_registry.path
+        assert FertilizerCatalogRegistry(catalog_path).current().products["urea"].price_per_kg == 6.5
+        restarted = PriceFeed(feed.directory, FertilizerCatalogRegistry(catalog_path))
+        restarted.current()
+        assert restarted.catalog_registry.current().products["urea"].price_per_kg == 7.0
+        assert restarted.catalog_registry.reload().products["urea"].price_per_kg == 7.0
+    
+    def test_other_processes_pick_up_new_versions(self, tmp_path):
+        """Test a feed sharing the snapshot directory swaps in and announces versions written elsewhere"""
+        writer = self.make_feed(tmp_path)
+        reader = PriceFeed(writer.directory, FertilizerCatalogRegistry(writer.catalog_registry.path))
+        updates = []
+        reader.subscribe(updates.append)
+        baseline = reader.current()
+        
+        written = writer.ingest_rows([{"product": "urea", "price_per_kg": "7.5"}]).snapshot
+        assert reader.current() is baseline  # until the next directory check
+        reader._next_check = 0.0
+        assert reader.current().version == written.version
+        assert [update.changed for update in updates] == [{"urea"}]
+        assert reader.catalog_registry.current().products["urea"].price_per_kg == 7.5
+        
+        # An ingest merges onto the newest version on disk, not the one it last saw
+        writer.ingest_rows([{"product": "mop", "price_per_kg": "18"}])
+        merged = reader.ingest_rows([{"product": "dap", "price_per_kg": "28"}]).snapshot
+        assert (merged.price("urea"), merged.price("mop"), merged.price("dap")) == (7.5, 18.0, 28.0)
+        assert [update.changed for update in updates] == [{"urea"}, {"mop"}, {"dap"}]
+    
+    def test_price_change_evicts_only_dependent_plans(self, tmp_path):
+        """Test a price change re-runs only the plans that could use the changed product"""
+        feed = self.make_feed(tmp_path)
+        planner = FertilizerPlanner(cache_size=16)
+        feed.subscribe(lambda update: planner.invalidate_products(update.changed))
+        mineral = PlanInputs("rice", 6.5, 100, 12, 150, 1.0, 1.0, datetime.date(2025, 6, 20), 22000, optimize=False)
+        organic = dataclasses.replace(mineral, organic_preference=True)
+        planner.plan(mineral, feed.catalog_registry.current())
+        planner.plan(organic, feed.catalog_registry.current())
+        
+        feed.ingest_rows([{"product": "Vermicompost", "price_per_kg": "9.0"}])
+        catalog = feed.catalog_registry.current()
+        assert set(planner.plan(mineral, catalog).stages.values()) == {"cached"}
+        repriced = planner.plan(organic, catalog)
+        assert repriced.stages["mix"] == "computed" and repriced.stages["requirements"] == "cached"
+        assert planner.stats()["mix"]["invalidations"] == 1
+    
+    def test_price_endpoints(self, tmp_path, monkeypatch):
+        """Test uploads version prices and evict only analyses that used a changed product"""
+        feed = self.make_feed(tmp_path)
+        feed.subscribe(soil_analysis_api.invalidate_price_dependents)
+        monkeypatch.setattr(soil_analysis_api, "price_feed", feed)
+        request = {
+            "soil_data": {"ph": 6.5, "nitrogen": 100, "phosphorus": 80, "potassium": 300,
+                          "organic_matter": 1.5, "soil_type": "loamy"},
+            "target_crop": "wheat",
+            "farm_size": 2.0
+        }
+        before = client.post("/soil/analyze", json=request).json()
+        assert [rec["fertilizer_type"] for rec in before["analysis"]["fertilizer_needs"]] == ["Urea"]
+        
+        upload = "product,price_per_kg\nDAP,30\n"
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+        assert client.post("/soil/fertilizer-prices", content=upload).status_code == 403
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", "s3cret")
+        assert client.post("/soil/fertilizer-prices", content=upload).status_code == 401
+        assert client.post("/soil/fertilizer-prices", content=upload, headers={"X-Admin-Token": "guess"}).status_code == 401
+        assert feed.history()[-1]["changed"] is None
+        
+        admin = {"X-Admin-Token": "s3cret"}
+        response = client.post("/soil/fertilizer-prices", content=upload, headers=admin)
+        assert response.status_code == 200 and response.json()["changed"] == ["dap"]
+        assert len(analysis_cache) == 1
+        
+        response = client.post("/soil/fertilizer-prices?region=Punjab&effective_date=2025-10-01",
+                               content="product,price_per_kg\nurea,8.0\n", headers=admin)
+        assert response.json()["changed"] == ["urea"]
+        assert len(analysis_cache) == 0
+        assert client.post("/soil/analyze", json=request).json()["total_cost"] == before["total_cost"]
+        punjab = client.post("/soil/analyze", json=dict(request, soil_data=dict(request["soil_data"], location="Ludhiana, Punjab"))).json()
+        assert punjab["total_cost"] == pytest.approx(before["total_cost"] * 8.0 / 6.5)
+        
+        prices = client.get("/soil/fertilizer-prices", params={"region": "Punjab"}).json()
+        assert prices["prices"]["urea"] == 8.0 and prices["prices"]["DAP"] == 30.0
+        assert prices["version"] == feed.current().version and prices["last_updated"] == "2025-10-01"
+        assert client.get("/soil/fertilizer-prices").json()["prices"]["urea"] == 6.5
+        assert client.post("/soil/fertilizer-prices", content="product,cost\nurea,8\n", headers=admin).status_code == 400
+
+    def test_batch_rows_use_regional_prices(self, tmp_path, monkeypatch):
+        """Test each batch row is priced like /soil/analyze for its own location"""
+        feed = self.make_feed(tmp_path)
+        feed.ingest_rows([{"product": "urea", "price_per_kg": "8.0"}], region="Punjab")
+        monkeypatch.setattr(soil_analysis_api, "price_feed", feed)
+        soil = {"ph": 6.5, "nitrogen": 100, "phosphorus": 80, "potassium": 300, "organic_matter": 1.5, "soil_type": "loamy"}
+        requests = [
+            {"soil_data": dict(soil, location=location), "target_crop": "wheat", "farm_size": 2.0}
+            for location in ["Ludhiana, Punjab", "Patna", "Khanna"]
+        ] + [{"soil_data": soil, "target_crop": "wheat", "farm_size": 2.0}]
+
+        response = client.post("/soil/analyze/batch", content="".join(json.dumps(r) + "\n" for r in requests),
+                               headers={"content-type": "application/x-ndjson"})
+        results = [json.loads(line) for line in response.text.splitlines()[:-1]]
+
+        singles = [client.post("/soil/analyze", json=r).json()["total_cost"] for r in requests]
+        assert [r["total_cost"] for r in results] == singles
+        assert singles[0] == singles[2] > singles[1] == singles[3]
+
+    def test_what_if_uses_regional_prices(self, tmp_path, monkeypatch):
+        """Test a sweep around a sample prices the grid like /soil/analyze for its location"""
+        feed = self.make_feed(tmp_path)
+        feed.ingest_rows([{"product": "urea", "price_per_kg": "8.0"}], region="Punjab")
+        monkeypatch.setattr(soil_analysis_api, "price_feed", feed)
+        request = {
+            "soil_data": {"ph": 6.5, "nitrogen": 100, "phosphorus": 80, "potassium": 300,
+                          "organic_matter": 1.5, "soil_type": "loamy", "location": "Ludhiana, Punjab"},
+            "target_crop": "wheat",
+            "farm_size": 2.0,
+            "sweep": {"nitrogen": {"values": [100, 150]}}
+        }
+
+        grid = client.post("/soil/what-if", json=request).json()
+        single = client.post("/soil/analyze", json={k: v for k, v in request.items() if k != "sweep"}).json()
+
+        assert grid["total_cost"][0] == single["total_cost"]
+
 class TestSoilAnalysisIntegration:
     """Integration tests for soil analysis system"""
     
@@ -0,0 +1,342 @@
+"""
+Test Suite for Weather Service Module
+
+Tests the local forecast store and the weather analytics built on top of it.
+"""
+
+import pytest
+from datetime import date, timedelta
+import sys
+import os
+
+# Add the parent directory to sys.path to import app modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.config import settings
+from app.services.forecast_store import ForecastStore, StoredForecastDay, cell_id
+from app.services.gazetteer import Gazetteer, build_gazetteer, DEFAULT_SOURCE_PATH
+from app.services.climatology import CellClimate, ClimatologyEngine
+from app.services.irrigation import (
+    PlotArrays, WeatherArrays, crop_coefficient, encode_crops, encode_soils,
+    reference_evapotranspiration, schedule_irrigation
+)
+from app.services.pest_risk import PEST_NAMES, PestRiskEngine, degree_days
+import numpy as np
+
+def make_day(day: date, rainfall: int = 0, high: int = 32, low: int = 20) -> StoredForecastDay:
+    return StoredForecastDay(
+        day=day, high=high, low=low, humidity=60, wind_speed=10,
+        rainfall=rainfall, visibility=10, condition="Clear"
+    )
+
+class TestForecastStore:
+    """Test the local forecast store"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.today = date.today()
+
+    def test_latest_forecast_roundtrip(self, tmp_path):
+        """Test stored forecasts are served back for the same cell"""
+        store = ForecastStore(f"sqlite:///{tmp_path}/forecast.db")
+        days = [make_day(self.today + timedelta(days=i)) for i in range(5)]
+        store.save_forecast(30.90, 75.85, "Ludhiana", "IN", days, "openweathermap-api", fetched_at=1000)
+
+        stored = store.latest_forecast(30.91, 75.86)
+
+        assert stored is not None
+        assert stored.name == "Ludhiana"
+        assert stored.fetched_at == 1000
+        assert [d.day for d in stored.days] == [d.day for d in days]
+        assert stored.age_seconds > 0
+
+    def test_newer_forecast_replaces_overlapping_days(self, tmp_path):
+        """Test a newer fetch overwrites the same days and keeps older history"""
+        store = ForecastStore(f"sqlite:///{tmp_path}/forecast.db")
+        start = self.today - timedelta(days=3)
+        store.save_forecast(30.9, 75.8, "Ludhiana", "IN",
+                            [make_day(start + timedelta(days=i), rainfall=1) for i in range(5)],
+                            "openweathermap-api", fetched_at=1000)
+        store.save_forecast(30.9, 75.8, "Ludhiana", "IN",
+                            [make_day(self.today + timedelta(days=i), rainfall=9) for i in range(5)],
+                            "openweathermap-api", fetched_at=2000)
+
+        history = store.history(30.9, 75.8, start, self.today + timedelta(days=10))
+
+        assert len(history) == 8
+        assert history[0].rainfall == 1 and history[0].fetched_at == 1000
+        assert all(d.rainfall == 9 and d.fetched_at == 2000 for d in history[3:])
+
+    def test_unknown_location_has_no_forecast(self, tmp_path):
+        """Test cells without stored data return nothing"""
+        store = ForecastStore(f"sqlite:///{tmp_path}/forecast.db")
+        assert store.latest_forecast(12.97, 77.59) is None
+        assert cell_id(12.97, 77.59) != cell_id(30.9, 75.8)
+
+    def test_non_sqlite_database_falls_back_to_local_file(self, tmp_path, monkeypatch):
+        """Test a server DATABASE_URL does not break the store"""
+        monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+        store = ForecastStore("postgresql://farmguard@db/farmguard")
+
+        store.save_forecast(30.9, 75.8, "Ludhiana", "IN", [make_day(self.today)], "openweathermap-api")
+
+        assert store.path.startswith(str(tmp_path))
+        assert store.latest_forecast(30.9, 75.8) is not None
+
+class TestGazetteer:
+    """Test the offline gazetteer"""
+
+    def open_gazetteer(self, tmp_path) -> Gazetteer:
+        path = str(tmp_path / "gazetteer.bin")
+        build_gazetteer(DEFAULT_SOURCE_PATH, path)
+        return Gazetteer(path)
+
+    def test_name_lookup(self, tmp_path):
+        """Test exact, prefix, qualified and fuzzy name lookups"""
+        gazetteer = self.open_gazetteer(tmp_path)
+
+        assert gazetteer.resolve("Ludhiana").canonical_name == "Ludhiana, Punjab"
+        assert gazetteer.resolve("khanna").district == "Ludhiana"
+        assert gazetteer.resolve("Sri Muktsar").name == "Sri Muktsar Sahib"
+        assert gazetteer.resolve("Patiyala").name == "Patiala"
+        assert gazetteer.resolve("Kanpur, Bihar") is None
+        assert gazetteer.resolve("Nowhereville") is None
+
+    def test_fuzzy_lookup_reaches_late_names(self, tmp_path):
+        """Test a misspelling is matched even behind thousands of names with the same first letter"""
+        source = tmp_path / "places.csv"
+        rows = ["name,kind,district,state,lat,lon"]
+        rows += [f"Sa{i:05d}pur,village,Sirsa,Haryana,{29 + i / 1e4:.4f},75.0" for i in range(8000)]
+        rows.append("Suratgarh,town,Sri Ganganagar,Rajasthan,29.3167,73.9")
+        source.write_text("\n".join(rows) + "\n")
+        path = str(tmp_path / "villages.bin")
+        build_gazetteer(str(source), path)
+
+        assert Gazetteer(path).resolve("Suratgrh").name == "Suratgarh"
+
+    def test_reverse_geocoding(self, tmp_path):
+        """Test nearest-place lookup from coordinates"""
+        gazetteer = self.open_gazetteer(tmp_path)
+
+        place, distance_km = gazetteer.reverse(30.71, 76.20)
+
+        assert place.name == "Khanna"
+        assert distance_km < 5
+
+class TestClimatology:
+    """Test incremental climatology and drought detection"""
+
+    def test_dry_monsoon_month_raises_drought_signals(self):
+        """Test a dry July produces deficit and dry-spell signals"""
+        climate = CellClimate()
+        for i in range(30):
+            climate.fold(make_day(date(2025, 7, 1) + timedelta(days=i)))
+
+        kinds = {signal.kind: signal.severity for signal in climate.drought_signals()}
+
+        assert climate.consecutive_dry_days == 30
+        assert climate.rainfall_deficit_pct == 100.0
+        assert kinds == {"rainfall_deficit": "high", "dry_spell": "high"}
+
+    def test_rain_resets_dry_spell_and_days_fold_once(self):
+        """Test rain resets the dry streak and repeated days are ignored"""
+        climate = CellClimate()
+        start = date(2025, 8, 1)
+        for i in range(10):
+            climate.fold(make_day(start + timedelta(days=i)))
+        climate.fold(make_day(start + timedelta(days=10), rainfall=40))
+        climate.fold(make_day(start + timedelta(days=5), rainfall=100))
+
+        assert climate.consecutive_dry_days == 0
+        assert climate.rain_sum == 40
+        assert climate.drought_signals() == []
+
+    def test_missing_days_break_dry_spell(self):
+        """Test a gap in the record restarts the dry-day count"""
+        climate = CellClimate()
+        start = date(2025, 7, 1)
+        for i in range(10):
+            climate.fold(make_day(start + timedelta(days=i)))
+        for i in range(15, 20):
+            climate.fold(make_day(start + timedelta(days=i)))
+
+        assert climate.consecutive_dry_days == 5
+
+    def test_engine_folds_new_stored_days_only(self, tmp_path):
+        """Test the engine reads each stored day once and persists its state"""
+        store = ForecastStore(f"sqlite:///{tmp_path}/forecast.db")
+        through = date(2025, 7, 31)
+        days = [make_day(through - timedelta(days=i)) for i in range(40)]
+        store.save_forecast(30.9, 75.8, "Ludhiana", "IN", days, "test")
+
+        engine = ClimatologyEngine(store)
+        assert engine.update(30.9, 75.8, through=through) == 30
+        assert engine.update(30.9, 75.8, through=through) == 0
+
+        reloaded = ClimatologyEngine(store)
+        assert reloaded.summary(30.9, 75.8)["consecutive_dry_days"] == 30
+
+class TestIrrigation:
+    """Test evapotranspiration and irrigation scheduling"""
+
+    def make_batch(self, n: int, days: int = 5, rainfall: float = 0.0):
+        rng = np.random.default_rng(7)
+        plots = PlotArrays(
+            lat=rng.uniform(10, 32, n),
+            crop_code=encode_crops(["wheat", "rice", "cotton"] * (n // 3) + ["maize"] * (n % 3)),
+            soil_code=encode_soils(["loamy"] * n),
+            days_after_planting=rng.integers(0, 120, n),
+            initial_depletion_mm=rng.uniform(0, 20, n),
+            area_ha=np.ones(n)
+        )
+        weather = WeatherArrays(
+            tmax=rng.uniform(30, 40, (n, days)),
+            tmin=rng.uniform(18, 26, (n, days)),
+            humidity=rng.uniform(30, 80, (n, days)),
+            wind_kmh=rng.uniform(3, 20, (n, days)),
+            rainfall=np.full((n, days), rainfall),
+            day_of_year=np.arange(150, 150 + days)
+        )
+        return plots, weather
+
+    def test_reference_evapotranspiration_is_seasonal(self):
+        """Test ET0 is high in a hot dry summer and low in winter"""
+        summer = reference_evapotranspiration(40, 27, 45, 10, 30.9, 170)
+        winter = reference_evapotranspiration(20, 6, 70, 5, 30.9, 15)
+
+        assert 6 < summer < 10
+        assert 1 < winter < 3
+
+    def test_crop_coefficient_follows_growth_stages(self):
+        """Test Kc rises from initial to mid-season and is zero after harvest"""
+        wheat = encode_crops(["wheat"] * 4)
+        kc = crop_coefficient(wheat, np.array([5, 60, 110, 200]))
+
+        assert kc[0] == pytest.approx(0.40)
+        assert kc[1] == pytest.approx(1.15)
+        assert kc[2] < kc[1]
+        assert kc[3] == 0
+
+    def test_rain_reduces_irrigation(self):
+        """Test heavy rain removes the need to irrigate"""
+        dry = schedule_irrigation(*self.make_batch(300))
+        wet = schedule_irrigation(*self.make_batch(300, rainfall=40))
+
+        assert dry.net_irrigation_mm.sum() > 0
+        assert wet.net_irrigation_mm.sum() == 0
+
+    def test_chunked_schedule_matches_single_pass(self):
+        """Test splitting plots across workers gives identical results"""
+        plots, weather = self.make_batch(45000)
+
+        single = schedule_irrigation(plots, weather, workers=1)
+        chunked = schedule_irrigation(plots, weather, workers=2)
+
+        assert np.array_equal(single.volume_m3, chunked.volume_m3)
+        assert np.array_equal(single.final_depletion_mm, chunked.final_depletion_mm)
+
+    def test_schedule_endpoint_keeps_each_plot_horizon(self, monkeypatch):
+        """Test plots with different forecast dates are aligned by date and lookups are bounded"""
+        import asyncio
+        from types import SimpleNamespace
+        from app.api import weather_service
+
+        start = date(2025, 5, 1)
+        horizons = {30.9: (0, 5), 12.9: (1, 3)}  # lat -> (first day offset, days)
+        in_flight, peak = 0, 0
+
+        async def fake_fetch(lat, lon, force_refresh=False):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            offset, days = horizons[lat] if lat in horizons else (0, 4)
+            forecast = [
+                SimpleNamespace(date=(start + timedelta(days=offset + i)).isoformat(), high=38, low=24,
+                                humidity=40, windSpeed=10, rainfall=0)
+                for i in range(days)
+            ]
+            return SimpleNamespace(source="openweathermap-api", data=SimpleNamespace(forecast=forecast))
+
+        monkeypatch.setattr(weather_service, "fetch_weather_response", fake_fetch)
+        monkeypatch.setattr(weather_service, "weather_fetch_slots", asyncio.Semaphore(2))
+        plots = [
+            weather_service.IrrigationPlot(plotId="a", lat=30.9, lon=75.8, crop="wheat", sowingDate=date(2025, 3, 1)),
+            weather_service.IrrigationPlot(plotId="b", lat=12.9, lon=77.6, crop="rice", sowingDate=date(2025, 3, 1))
+        ] + [
+            weather_service.IrrigationPlot(plotId=f"c{i}", lat=20.0 + i, lon=80.0, crop="maize", sowingDate=date(2025, 3, 1))
+            for i in range(6)
+        ]
+
+        response = asyncio.run(weather_service.get_irrigation_schedule(
+            weather_service.IrrigationScheduleRequest(plots=plots)
+        ))
+        schedules = {plot.plotId: plot for plot in response.plots}
+
+        assert [d.date for d in schedules["a"].days] == [(start + timedelta(days=i)).isoformat() for i in range(5)]
+        assert [d.date for d in schedules["b"].days] == [(start + timedelta(days=1 + i)).isoformat() for i in range(3)]
+        assert len(schedules["c0"].days) == 4
+        assert peak == 2
+
+class TestPestRisk:
+    """Test incremental degree-day accumulation and pest risk maps"""
+
+    def setup_method(self):
+        """Setup test fixtures"""
+        self.through = date(2025, 8, 31)
+        self.days = [make_day(self.through - timedelta(days=i), rainfall=5, high=33, low=25) for i in range(40)]
+
+    def make_engine(self, tmp_path) -> PestRiskEngine:
+        store = ForecastStore(f"sqlite:///{tmp_path}/forecast.db")
+        store.save_forecast(30.9, 75.8, "Ludhiana", "IN", self.days[10:], "test")
+        return PestRiskEngine(store)
+
+    def test_incremental_updates_match_full_accumulation(self, tmp_path):
+        """Test folding new days later gives the same degree-days as folding them at once"""
+        engine = self.make_engine(tmp_path)
+        sowing = self.through - timedelta(days=35)
+        engine.register_plots([("p1", 30.9, 75.8, "rice", sowing)], through=self.through)
+        engine.store.save_forecast(30.9, 75.8, "Ludhiana", "IN", self.days[:10], "test")
+        engine.update(30.9, 75.8, through=self.through)
+        engine.update(30.9, 75.8, through=self.through)
+
+        risk = engine.plot_risk("p1", today=self.through + timedelta(days=1))
+        expected = 36 * degree_days(33, 25)[PEST_NAMES.index("Brown planthopper")]
+
+        assert risk["observed_days"] == 36
+        planthopper = next(r for r in risk["risks"] if r["pest"] == "Brown planthopper")
+        assert planthopper["generations"] == pytest.approx(expected / 400, abs=0.01)
+        assert {r["pest"] for r in risk["risks"]} == {"Yellow stem borer", "Brown planthopper", "Rice blast"}
+
+    def test_region_map_aggregates_plots_per_cell(self, tmp_path):
+        """Test region maps count plots per pest and are cached until new data arrives"""
+        engine = self.make_engine(tmp_path)
+        sowing = self.through - timedelta(days=20)
+        engine.register_plots([
+            ("p1", 30.90, 75.80, "rice", sowing),
+            ("p2", 30.91, 75.81, "rice", sowing),
+            ("p3", 12.97, 77.59, "wheat", sowing),
+        ], through=self.through)
+
+        today = self.through + timedelta(days=1)
+        risk_map = engine.region_map(today=today)
+        stem_borer = PEST_NAMES.index("Yellow stem borer")
+
+        assert len(risk_map.cells) == 2
+        assert sorted(risk_map.plots[:, stem_borer].tolist()) == [0, 2]
+        assert engine.region_map(today=today) is risk_map
+
+        engine.update(30.9, 75.8, through=self.through)
+        assert engine.region_map(today=today) is not risk_map
+
+    def test_state_survives_restart(self, tmp_path):
+        """Test plot state is persisted and reloaded"""
+        engine = self.make_engine(tmp_path)
+        engine.register_plots([("p1", 30.9, 75.8, "cotton", self.through - timedelta(days=15))], through=self.through)
+
+        reloaded = PestRiskEngine(engine.store)
+
+        assert reloaded.plot_risk("p1")["observed_days"] == 6
+        assert reloaded.plot_risk("missing") is None
+
@@ -0,0 +1,100 @@
+"""
+Decode pool benchmark for the image inference service
+
+Concurrent uploads of a large JPEG are decoded and preprocessed, once
+inline on the event loop (as the handlers used to) and once through
+DecodePool, while a LoopLagMonitor and a stand-in /health probe measure
+how long the loop is blocked. The preprocessing here is a resize to
+640x640 float32, the shape the detectors take.
+
+Run from services/image-inference:  python -m benchmarks.bench_decode_pool
+"""
+
+import argparse
+import asyncio
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils.decode_pool import DEFAULT_DECODE_WORKERS, DecodePool, LoopLagMonitor
+
+def resize_640(image: Image.Image) -> np.ndarray:
+    return np.asarray(image.resize((640, 640), Image.BILINEAR), dtype=np.float32) / 255.0
+
+def synthetic_jpeg(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    # Smooth gradient plus noise so the JPEG is photo-sized, not trivially compressible
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(pixels + rng.integers(-20, 20, pixels.shape), 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+async def run(content: bytes, uploads: int, concurrency: int, pool: DecodePool = None):
+    monitor = LoopLagMonitor(interval=0.01, window=100_000)
+    monitor.start()
+    health_ms = []
+
+    async def health():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0)
+            health_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.02)
+
+    async def upload(semaphore):
+        async with semaphore:
+            if pool is None:
+                image = Image.open(BytesIO(content))
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                resize_640(image)
+                await asyncio.sleep(0)
+            else:
+                with await pool.decode(content) as decoded:
+                    decoded.array.sum()
+
+    probe = asyncio.create_task(health())
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(semaphore) for _ in range(uploads)))
+    elapsed = time.perf_counter() - start
+    probe.cancel()
+    await monitor.stop()
+    health_ms.sort()
+    return {
+        "images_per_s": uploads / elapsed,
+        "lag": monitor.stats(),
+        "health_p99_ms": health_ms[int(len(health_ms) * 0.99)] if health_ms else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000], help="upload width height")
+    parser.add_argument("--uploads", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: cores)")
+    args = parser.parse_args()
+
+    content = synthetic_jpeg(*args.size)
+    print(f"upload: {args.size[0]}x{args.size[1]} JPEG, {len(content) / 1e6:.1f} MB")
+
+    pool = DecodePool(args.workers or DEFAULT_DECODE_WORKERS, preprocess=resize_640)
+    pool.start()
+    asyncio.run(run(content, pool.workers, pool.workers, pool))  # start the worker processes
+
+    print(f"{'mode':<12} {'img/s':>7} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11} {'health p99 ms':>14}")
+    for label, mode_pool in [("inline", None), (f"pool x{pool.workers}", pool)]:
+        result = asyncio.run(run(content, args.uploads, args.concurrency, mode_pool))
+        lag = result["lag"]
+        print(f"{label:<12} {result['images_per_s']:>7.1f} {lag['p50_ms']:>11.1f} {lag['p99_ms']:>11.1f} "
+              f"{lag['max_ms']:>11.1f} {result['health_p99_ms']:>14.1f}")
+
+    print("pool stages (ms):", {stage: stats["mean_ms"] for stage, stats in pool.stats()["stages"].items()})
+    pool.close()
+
+if __name__ == "__main__":
+    main()
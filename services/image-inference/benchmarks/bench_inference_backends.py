@@ -0,0 +1,138 @@
+"""
+Inference backend comparison for the image inference service
+
+Runs the pest detector and crop classifier on every available backend and
+precision (torch fp32 when weights are given; ONNX Runtime and OpenVINO,
+fp32 and INT8, for the exported files in --model-dir) over a folder of
+validation photos. It reports latency at batch 1, throughput at the
+micro-batch size, and agreement with the fp32 reference: top-1 agreement
+and largest probability change for the classifier; matched-box F1
+(IoU >= 0.5, same class) for the detector. Backends whose package or
+model file is missing are skipped.
+
+Run from services/image-inference:
+    python -m benchmarks.bench_inference_backends --images data/validation \
+        --yolo weights/pest_yolov8n.pt --classifier weights/crop_efficientnet_b0.pt
+"""
+
+import argparse
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from scripts.export_models import calibration_images
+from utils.inference_backend import (
+    BACKENDS, ONNX_MODEL_DIR, PRECISIONS, InferenceBackend, classifier_input, letterbox, load_backend,
+    load_torch_module, softmax, yolo_detections
+)
+
+def box_f1(reference, candidate, iou_threshold: float = 0.5) -> float:
+    """F1 of candidate detections against reference ones, greedy same-class IoU matching"""
+    ref_boxes, _, ref_classes = reference
+    boxes, _, classes = candidate
+    if not len(ref_boxes) and not len(boxes):
+        return 1.0
+    matched, used = 0, set()
+    for box, cls in zip(boxes, classes):
+        best, best_iou = None, iou_threshold
+        for j, (ref_box, ref_cls) in enumerate(zip(ref_boxes, ref_classes)):
+            if j in used or ref_cls != cls:
+                continue
+            width = max(0.0, min(box[2], ref_box[2]) - max(box[0], ref_box[0]))
+            height = max(0.0, min(box[3], ref_box[3]) - max(box[1], ref_box[1]))
+            overlap = width * height
+            union = (box[2] - box[0]) * (box[3] - box[1]) + (ref_box[2] - ref_box[0]) * (ref_box[3] - ref_box[1]) - overlap
+            iou = overlap / union if union > 0 else 0.0
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return 2 * matched / (len(boxes) + len(ref_boxes))
+
+def timed(backend: InferenceBackend, inputs: np.ndarray, batch: int, runs: int) -> Tuple[float, float]:
+    """(batch-1 p50 latency ms, images/s at `batch`)"""
+    backend.run(inputs[:1])  # first call builds kernels
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        backend.run(inputs[i % len(inputs):i % len(inputs) + 1])
+        latencies.append(time.perf_counter() - start)
+    batches = [inputs[i:i + batch] for i in range(0, len(inputs) - batch + 1, batch)] or [inputs]
+    start = time.perf_counter()
+    count = 0
+    for chunk in batches:
+        backend.run(chunk)
+        count += len(chunk)
+    return float(np.median(latencies)) * 1000, count / (time.perf_counter() - start)
+
+def outputs(backend: InferenceBackend, inputs: np.ndarray, batch: int) -> np.ndarray:
+    return np.concatenate([backend.run(inputs[i:i + batch])[0] for i in range(0, len(inputs), batch)])
+
+def candidates(model: str, model_dir: str, torch_module) -> List[Tuple[str, str]]:
+    found = [("torch", "fp32")] if torch_module is not None else []
+    for backend in BACKENDS[1:]:
+        for precision in PRECISIONS:
+            if os.path.exists(os.path.join(model_dir, f"{model}.{precision}.onnx")):
+                found.append((backend, precision))
+    return found
+
+def compare(model: str, inputs: np.ndarray, accuracy, args, torch_module=None):
+    print(f"\n{model} ({len(inputs)} images)")
+    print(f"{'backend':<12} {'precision':<9} {'p50 ms (b=1)':>12} {f'img/s (b={args.batch})':>14}  agreement")
+    reference: Optional[np.ndarray] = None
+    for backend_name, precision in candidates(model, args.model_dir, torch_module):
+        try:
+            backend = load_backend(model, backend_name, precision, torch_module, args.model_dir, args.threads)
+        except RuntimeError as e:
+            print(f"{backend_name:<12} {precision:<9} skipped: {e}")
+            continue
+        latency_ms, throughput = timed(backend, inputs, args.batch, args.runs)
+        result = outputs(backend, inputs, args.batch)
+        if reference is None and precision == "fp32":
+            reference = result
+            agreement = "reference"
+        else:
+            agreement = accuracy(reference, result) if reference is not None else "no fp32 reference"
+        print(f"{backend_name:<12} {precision:<9} {latency_ms:>12.1f} {throughput:>14.1f}  {agreement}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", required=True, help="validation photos, not the calibration set")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--model-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--yolo", help="torch reference weights for the detector")
+    parser.add_argument("--classifier", help="torch reference checkpoint for the classifier")
+    parser.add_argument("--batch", type=int, default=8, help="micro-batch size for throughput")
+    parser.add_argument("--runs", type=int, default=50, help="batch-1 calls timed")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    photos = []
+    for path in calibration_images(args.images, args.count, seed=1):
+        with Image.open(path) as image:
+            photos.append(image.convert("RGB"))
+
+    letterboxed = [letterbox(photo) for photo in photos]
+    detector_inputs = np.stack([chw for chw, _ in letterboxed])
+    boxes = [box for _, box in letterboxed]
+
+    def detector_accuracy(reference: np.ndarray, result: np.ndarray) -> str:
+        f1 = [box_f1(r, c) for r, c in zip(yolo_detections(reference, boxes), yolo_detections(result, boxes))]
+        return f"box F1 {np.mean(f1):.3f} (min {np.min(f1):.2f})"
+
+    def classifier_accuracy(reference: np.ndarray, result: np.ndarray) -> str:
+        ref_p, p = softmax(reference), softmax(result)
+        top1 = np.mean(ref_p.argmax(axis=1) == p.argmax(axis=1))
+        return f"top-1 {top1:.1%}, max |dp| {np.abs(ref_p - p).max():.3f}"
+
+    compare("pest_detector", detector_inputs, detector_accuracy, args,
+            load_torch_module("detector", args.yolo) if args.yolo else None)
+    compare("crop_classifier", np.stack([classifier_input(photo) for photo in photos]), classifier_accuracy, args,
+            load_torch_module("classifier", args.classifier) if args.classifier else None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-batching benchmark for the image inference service
+
+Concurrent clients send single images through a MicroBatcher wrapping a
+CPU model, once with batching disabled (max_batch=1) and then with a range
+of batch sizes and wait windows. The model is a float32 NumPy network of
+about the cost of a small classifier head, so the benchmark runs without
+the PyTorch/YOLO weights; what it measures is the same effect, one GEMM
+over N images against N matrix-vector products.
+
+Run from services/image-inference:  python -m benchmarks.bench_micro_batching
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+from utils.batching import MicroBatcher
+
+class SyntheticModel:
+    """Three dense layers over a flattened 64x64x3 image"""
+
+    def __init__(self, hidden: int = 1024, classes: int = 38, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.weights = [
+            rng.standard_normal((64 * 64 * 3, hidden), dtype=np.float32) * 0.01,
+            rng.standard_normal((hidden, hidden), dtype=np.float32) * 0.03,
+            rng.standard_normal((hidden, classes), dtype=np.float32) * 0.03
+        ]
+
+    def __call__(self, images):
+        x = np.stack(images).reshape(len(images), -1)
+        for weights in self.weights[:-1]:
+            x = np.maximum(x @ weights, 0)
+        logits = x @ self.weights[-1]
+        return list(np.argmax(logits, axis=1))
+
+async def run(model, clients: int, requests: int, max_batch: int, max_wait_ms: float, images):
+    batcher = MicroBatcher(model, max_batch=max_batch, max_wait_ms=max_wait_ms, name="synthetic")
+    latencies = []
+
+    async def client(offset: int):
+        for i in range(requests):
+            start = time.perf_counter()
+            await batcher.submit(images[(offset + i) % len(images)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    elapsed = time.perf_counter() - start
+    stats = batcher.stats()
+    await batcher.close()
+    latencies.sort()
+    return {
+        "throughput": clients * requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "mean_batch": stats["mean_batch_size"]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32, help="concurrent requests in flight")
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[2.0, 5.0])
+    args = parser.parse_args()
+
+    model = SyntheticModel()
+    images = list(np.random.default_rng(1).random((64, 64, 64, 3), dtype=np.float32))
+    model(images[:8])  # warm up BLAS
+
+    print(f"{'max_batch':>9} {'wait ms':>8} {'img/s':>8} {'speedup':>8} {'mean batch':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    baseline = None
+    for max_batch in args.batches:
+        for wait_ms in ([0.0] if max_batch == 1 else args.wait_ms):
+            result = asyncio.run(run(model, args.clients, args.requests, max_batch, wait_ms, images))
+            baseline = baseline or result["throughput"]
+            print(f"{max_batch:>9} {wait_ms:>8.1f} {result['throughput']:>8.0f} "
+                  f"{result['throughput'] / baseline:>7.1f}x {result['mean_batch']:>10.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+
+if __name__ == "__main__":
+    main()
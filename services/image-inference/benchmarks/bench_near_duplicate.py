@@ -0,0 +1,98 @@
+"""
+Near-duplicate index benchmark for the image inference service
+
+Two parts. First, how far re-uploads drift in pHash bits: synthetic photos
+are re-encoded, re-cropped, resized and brightened, and the distances are
+compared with those between unrelated photos, which is what
+NEAR_DUPLICATE_MAX_DISTANCE has to separate. Second, lookup cost: the
+multi-index NearDuplicateIndex against a NumPy linear Hamming scan over
+the same hashes, at a range of index sizes.
+
+Run from services/image-inference:  python -m benchmarks.bench_near_duplicate
+"""
+
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from utils.near_duplicate import NearDuplicateIndex, perceptual_hash
+
+def synthetic_photo(rng: np.random.Generator, size: int = 512) -> Image.Image:
+    """Smooth random field with fine noise, a stand-in for a leaf photo"""
+    coarse = Image.fromarray(rng.integers(0, 256, (12, 12, 3), dtype=np.uint8)).resize((size, size), Image.BICUBIC)
+    pixels = np.asarray(coarse, dtype=np.int16) + rng.integers(-12, 12, (size, size, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+def reencode(image: Image.Image, quality: int = 60) -> Image.Image:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return Image.open(BytesIO(buffer.getvalue())).convert("RGB")
+
+PERTURBATIONS = {
+    "jpeg q60": reencode,
+    "crop 5%": lambda im: im.crop((im.width // 40, im.height // 40, im.width - im.width // 40, im.height - im.height // 40)),
+    "crop 10%": lambda im: im.crop((im.width // 20, im.height // 20, im.width - im.width // 20, im.height - im.height // 20)),
+    "resize 50%": lambda im: im.resize((im.width // 2, im.height // 2), Image.BILINEAR),
+    "brightness +20%": lambda im: ImageEnhance.Brightness(im).enhance(1.2)
+}
+
+def robustness(photos: int):
+    rng = np.random.default_rng(0)
+    images = [synthetic_photo(rng) for _ in range(photos)]
+    hashes = [perceptual_hash(image) for image in images]
+    print(f"{'perturbation':<16} {'mean bits':>9} {'max bits':>8}")
+    for label, perturb in PERTURBATIONS.items():
+        distances = [(perceptual_hash(perturb(image)) ^ h).bit_count() for image, h in zip(images, hashes)]
+        print(f"{label:<16} {np.mean(distances):>9.1f} {max(distances):>8}")
+    unrelated = [(hashes[i] ^ hashes[j]).bit_count() for i in range(photos) for j in range(i + 1, photos)]
+    print(f"{'unrelated':<16} {np.mean(unrelated):>9.1f} {'min ' + str(min(unrelated)):>8}")
+
+def lookup(sizes, queries: int, max_distance: int):
+    rng = np.random.default_rng(1)
+    print(f"\n{'entries':>9} {'MIH us/query':>13} {'scan us/query':>14} {'candidates':>11} {'speedup':>8}")
+    for size in sizes:
+        stored = rng.integers(0, 2**63, size, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, size, dtype=np.uint64)
+        index = NearDuplicateIndex(max_distance=max_distance, max_entries=size)
+        for value in stored.tolist():
+            index.add(value, None, value)
+
+        # Half the queries are near copies of stored hashes, half are unrelated
+        probes = []
+        for i in range(queries):
+            if i % 2:
+                probes.append(int(rng.integers(0, 2**63)) * 2)
+            else:
+                flips = rng.choice(64, max_distance, replace=False)
+                probes.append(int(stored[rng.integers(size)]) ^ sum(1 << int(bit) for bit in flips))
+
+        start = time.perf_counter()
+        mih = [index.find(probe, None) for probe in probes]
+        mih_us = (time.perf_counter() - start) / queries * 1e6
+
+        bytes_view = stored.view(np.uint8).reshape(size, 8)
+        start = time.perf_counter()
+        for probe, found in zip(probes, mih):
+            diff = np.unpackbits(bytes_view ^ np.frombuffer(np.uint64(probe).tobytes(), dtype=np.uint8), axis=1)
+            distances = diff.sum(axis=1)
+            nearest = int(distances.min())
+            assert (found is not None) == (nearest <= max_distance)
+        scan_us = (time.perf_counter() - start) / queries * 1e6
+
+        candidates = index.stats()["mean_candidates"]
+        print(f"{size:>9,} {mih_us:>13.1f} {scan_us:>14.1f} {candidates:>11.1f} {scan_us / mih_us:>7.0f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+    robustness(args.photos)
+    lookup(args.sizes, args.queries, args.max_distance)
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,6 @@ import time
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Dict, List, Optional, Any
-from io import BytesIO
 import uuid
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends
@@ -30,7 +29,13 @@ from core.cache import CacheManager
 from core.storage import StorageManager
 from models.pest_detector import PestDetector
 from models.crop_classifier import CropClassifier
-from utils.image_processing import preprocess_image, post_process_results
+from utils.batching import MicroBatcher
+from utils.decode_pool import DecodePool, ImageDecodeError, LoopLagMonitor
+from utils.inference_backend import (
+    DEFAULT_BACKEND, InferenceBackend, classify_batch, detect_batch, load_backend, load_torch_backend
+)
+from utils.image_processing import post_process_results
+from utils.near_duplicate import NearDuplicateIndex
 from utils.metrics import MetricsCollector
 
 # Configure logging
@@ -47,13 +52,116 @@ pest_detector = PestDetector()
 crop_classifier = CropClassifier()
 metrics_collector = MetricsCollector()
 
+# Batched forward passes run on INFERENCE_BACKEND: the PyTorch checkpoints (torch, the default)
+# or the exported models (onnxruntime/openvino, see scripts/export_models.py). Loaded at startup;
+# None when the model could not be loaded and the model class answers one image at a time.
+pest_backend: Optional[InferenceBackend] = None
+crop_backend: Optional[InferenceBackend] = None
+
+def load_inference_backend(model: str) -> Optional[InferenceBackend]:
+    try:
+        if DEFAULT_BACKEND == "torch":
+            return load_torch_backend(model)
+        return load_backend(model)
+    except Exception as e:
+        logger.error(f"❌ {model} has no batched backend ({e}); running one image per pass")
+        return None
+
+def run_pest_backend(requests: List[tuple]) -> List[List["DetectionResult"]]:
+    """One backend call on the stacked, letterboxed batch, then NMS per request"""
+    batch = detect_batch(pest_backend, [image for image, _ in requests], [t for _, t in requests])
+    return [
+        [
+            DetectionResult(
+                class_name=pest_backend.label(int(cls)),
+                confidence=float(score),
+                bbox=[float(v) for v in box],
+                area=float((box[2] - box[0]) * (box[3] - box[1]))
+            )
+            for box, score, cls in zip(*detections)
+        ]
+        for detections in batch
+    ]
+
+def run_crop_backend(requests: List[tuple]) -> List[List["DetectionResult"]]:
+    """One backend call on the stacked classifier inputs; whole-image results above the threshold"""
+    batch = classify_batch(crop_backend, [image for image, _ in requests])
+    results = []
+    for (image, threshold), predictions in zip(requests, batch):
+        width, height = image.size if isinstance(image, Image.Image) else (image.shape[1], image.shape[0])
+        results.append([
+            DetectionResult(
+                class_name=crop_backend.label(cls),
+                confidence=probability,
+                bbox=[0.0, 0.0, float(width), float(height)],
+                area=float(width * height)
+            )
+            for cls, probability in predictions if probability >= threshold
+        ])
+    return results
+
+async def detect_pests_batch(requests: List[tuple]) -> List[List["DetectionResult"]]:
+    """One forward pass of the pest detector for (image, confidence threshold) requests"""
+    return await pest_detector.detect_batch([image for image, _ in requests], [t for _, t in requests])
+
+async def classify_crops_batch(requests: List[tuple]) -> List[List["DetectionResult"]]:
+    """One forward pass of the crop classifier for (image, confidence threshold) requests"""
+    return await crop_classifier.classify_batch([image for image, _ in requests], [t for _, t in requests])
+
+# Concurrent requests share batched forward passes (INFERENCE_MAX_BATCH / INFERENCE_MAX_WAIT_MS).
+# Only a model with a real batched pass gets a batcher: gathering single-image calls would
+# just add the collection window to every request. Created at startup, once the backends load.
+pest_batcher: Optional[MicroBatcher] = None
+crop_batcher: Optional[MicroBatcher] = None
+
+def start_batchers():
+    global pest_backend, crop_backend, pest_batcher, crop_batcher
+    pest_backend = load_inference_backend("pest_detector")
+    crop_backend = load_inference_backend("crop_classifier")
+    if pest_backend is not None:
+        pest_batcher = MicroBatcher(run_pest_backend, name="pest_detector")
+    elif hasattr(pest_detector, "detect_batch"):
+        pest_batcher = MicroBatcher(detect_pests_batch, name="pest_detector")
+    if crop_backend is not None:
+        crop_batcher = MicroBatcher(run_crop_backend, name="crop_classifier")
+    elif hasattr(crop_classifier, "classify_batch"):
+        crop_batcher = MicroBatcher(classify_crops_batch, name="crop_classifier")
+
+def model_versions() -> Dict[str, Dict[str, str]]:
+    """Model versions, with the backend and precision that serve them"""
+    return {
+        "pest_detector": {"version": pest_detector.version, **(pest_backend.describe() if pest_backend else {})},
+        "crop_classifier": {"version": crop_classifier.version, **(crop_backend.describe() if crop_backend else {})}
+    }
+
+async def detect_pests(image, confidence_threshold: float) -> List["DetectionResult"]:
+    if pest_batcher is None:
+        return await pest_detector.detect(image, confidence_threshold)
+    return await pest_batcher.submit((image, confidence_threshold))
+
+async def classify_crops(image, confidence_threshold: float) -> List["DetectionResult"]:
+    if crop_batcher is None:
+        return await crop_classifier.classify(image, confidence_threshold)
+    return await crop_batcher.submit((image, confidence_threshold))
+
+# Decode + preprocess run in worker processes (DECODE_WORKERS, default one per core)
+decode_pool = DecodePool(compute_phash=True)
+loop_lag_monitor = LoopLagMonitor()
+
+# Re-uploads of a photo reuse its analysis (NEAR_DUPLICATE_MAX_DISTANCE / NEAR_DUPLICATE_CACHE_SIZE)
+near_duplicates = NearDuplicateIndex()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application startup and shutdown events"""
     # Startup
     logger.info("🚀 Starting Image Inference Service...")
+    loop_lag_monitor.start()
     
     try:
+        # Start the decode worker pool
+        decode_pool.start()
+        
         # Initialize cache
         await cache_manager.initialize()
         logger.info("✅ Cache manager initialized")
@@ -65,6 +173,7 @@ async def lifespan(app: FastAPI):
         # Load models
         await pest_detector.load_models()
         await crop_classifier.load_models()
+        await asyncio.to_thread(start_batchers)
         logger.info("✅ AI models loaded")
         
         # Initialize metrics collection
@@ -83,6 +192,11 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Shutting down Image Inference Service...")
+    for batcher in (pest_batcher, crop_batcher):
+        if batcher is not None:
+            await batcher.close()
+    await asyncio.to_thread(decode_pool.close)
+    await loop_lag_monitor.stop()
     await cache_manager.close()
     await storage_manager.close()
     metrics_collector.stop()
@@ -178,7 +292,8 @@ async def health_check():
         "models": model_status,
         "gpu_available": torch.cuda.is_available(),
         "cache_status": await cache_manager.get_status(),
-        "storage_status": await storage_manager.get_status()
+        "storage_status": await storage_manager.get_status(),
+        "event_loop_lag": loop_lag_monitor.stats()
     }
 
 # Root endpoint
@@ -243,28 +358,65 @@ async def analyze_image(
                 detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE_MB}MB"
             )
         
-        # Convert to PIL Image
-        image = Image.open(BytesIO(content))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Store image for processing
-        image_id = await storage_manager.store_image(content, file.filename, job_id)
-        
-        # Preprocess image
-        processed_image = preprocess_image(image)
+        # Decode, convert to RGB and preprocess in the decode pool
+        try:
+            decoded = await decode_pool.decode(content)
+        except ImageDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        timings = decoded.timings
+        
+        # A near-identical earlier upload analysed the same way answers without inference
+        versions = model_versions()
+        duplicate_context = (
+            analysis_type, confidence_threshold, language,
+            *(tuple(sorted(version.items())) for version in versions.values())
+        )
+        duplicate = near_duplicates.find(decoded.phash, duplicate_context) if decoded.phash is not None else None
+        if duplicate is not None:
+            decoded.release()
+            image_id = await storage_manager.store_image(content, file.filename, job_id)
+            prior = duplicate.value
+            processing_time = (time.time() - start_time) * 1000
+            # The earlier job belongs to another caller; only the hash distance is reported
+            response = prior.copy(update={
+                "job_id": job_id,
+                "image_id": image_id,
+                "processing_time_ms": processing_time,
+                "metadata": {
+                    **prior.metadata,
+                    "image_size": decoded.original_size,
+                    "file_size_bytes": file_size,
+                    "timings_ms": {stage: round(ms, 2) for stage, ms in timings.items()},
+                    "hash_distance": duplicate.distance,
+                    "processed_at": time.time()
+                }
+            })
+            await cache_manager.store_result(job_id, response.dict())
+            record_analysis(response, processing_time, background_tasks)
+            return response
         
         # Perform analysis based on type
         detections = []
         overall_confidence = 0.0
         
-        if analysis_type in ["pest_detection", "full_analysis"]:
-            pest_results = await pest_detector.detect(processed_image, confidence_threshold)
-            detections.extend(pest_results)
-        
-        if analysis_type in ["crop_classification", "full_analysis"]:
-            crop_results = await crop_classifier.classify(processed_image, confidence_threshold)
-            detections.extend(crop_results)
+        with decoded:
+            # Store image for processing
+            stage_start = time.perf_counter()
+            image_id = await storage_manager.store_image(content, file.filename, job_id)
+            timings["store_ms"] = (time.perf_counter() - stage_start) * 1000
+            
+            # decoded.image maps shared memory; it is not kept past this block
+            if analysis_type in ["pest_detection", "full_analysis"]:
+                stage_start = time.perf_counter()
+                pest_results = await detect_pests(decoded.image, confidence_threshold)
+                detections.extend(pest_results)
+                timings["pest_detection_ms"] = (time.perf_counter() - stage_start) * 1000
+            
+            if analysis_type in ["crop_classification", "full_analysis"]:
+                stage_start = time.perf_counter()
+                crop_results = await classify_crops(decoded.image, confidence_threshold)
+                detections.extend(crop_results)
+                timings["crop_classification_ms"] = (time.perf_counter() - stage_start) * 1000
         
         # Calculate overall confidence
         if detections:
@@ -274,7 +426,7 @@ async def analyze_image(
         recommendations = generate_recommendations(detections, language)
         
         # Post-process results
-        processed_results = post_process_results(detections, image.size)
+        processed_results = post_process_results(detections, decoded.original_size)
         
         processing_time = (time.time() - start_time) * 1000
         
@@ -288,37 +440,20 @@ async def analyze_image(
             processing_time_ms=processing_time,
             recommendations=recommendations,
             metadata={
-                "image_size": image.size,
+                "image_size": decoded.original_size,
                 "file_size_bytes": file_size,
-                "model_versions": {
-                    "pest_detector": pest_detector.version,
-                    "crop_classifier": crop_classifier.version
-                },
+                "timings_ms": {stage: round(ms, 2) for stage, ms in timings.items()},
+                "model_versions": versions,
                 "processed_at": time.time()
             }
         )
         
         # Cache result for future retrieval
         await cache_manager.store_result(job_id, response.dict())
+        if decoded.phash is not None:
+            near_duplicates.add(decoded.phash, duplicate_context, response)
         
-        # Record metrics
-        metrics_collector.record_inference(
-            analysis_type=analysis_type,
-            processing_time_ms=processing_time,
-            num_detections=len(detections),
-            confidence=overall_confidence
-        )
-        
-        # Queue low-confidence results for human review if enabled
-        if overall_confidence < settings.HUMAN_REVIEW_THRESHOLD:
-            background_tasks.add_task(
-                queue_for_human_review,
-                job_id,
-                image_id,
-                response.dict(),
-                overall_confidence
-            )
-        
+        record_analysis(response, processing_time, background_tasks)
         return response
         
     except HTTPException:
@@ -379,7 +514,19 @@ async def get_job_status(job_id: str):
 @app.get("/metrics", tags=["Monitoring"])
 async def get_metrics():
     """Get service metrics for monitoring"""
-    return metrics_collector.get_metrics()
+    metrics = metrics_collector.get_metrics()
+    metrics["batching"] = {
+        "pest_detector": pest_batcher.stats() if pest_batcher else None,
+        "crop_classifier": crop_batcher.stats() if crop_batcher else None
+    }
+    metrics["inference_backends"] = {
+        "pest_detector": pest_backend.describe() if pest_backend else None,
+        "crop_classifier": crop_backend.describe() if crop_backend else None
+    }
+    metrics["decode_pool"] = decode_pool.stats()
+    metrics["near_duplicates"] = near_duplicates.stats()
+    metrics["event_loop_lag"] = loop_lag_monitor.stats()
+    return metrics
 
 # Helper functions
 async def warm_up_models():
@@ -388,11 +535,30 @@ async def warm_up_models():
     dummy_pil = Image.fromarray(dummy_image)
     
     try:
-        await pest_detector.detect(dummy_pil, 0.5)
-        await crop_classifier.classify(dummy_pil, 0.5)
+        await detect_pests(dummy_pil, 0.5)
+        await classify_crops(dummy_pil, 0.5)
     except Exception as e:
         logger.warning(f"Model warm-up warning: {e}")
 
+def record_analysis(response: AnalysisResponse, processing_time_ms: float, background_tasks: BackgroundTasks):
+    """Metrics for an answered analysis, and a human review when its confidence is low"""
+    metrics_collector.record_inference(
+        analysis_type=response.analysis_type,
+        processing_time_ms=processing_time_ms,
+        num_detections=len(response.detections),
+        confidence=response.overall_confidence
+    )
+    
+    # Queue low-confidence results for human review if enabled
+    if response.overall_confidence < settings.HUMAN_REVIEW_THRESHOLD:
+        background_tasks.add_task(
+            queue_for_human_review,
+            response.job_id,
+            response.image_id,
+            response.dict(),
+            response.overall_confidence
+        )
+
 def generate_recommendations(detections: List[DetectionResult], language: str) -> List[str]:
     """Generate farming recommendations based on detections"""
     recommendations = []
@@ -448,27 +614,25 @@ async def process_image_background(
         
         # Process image (similar to analyze_image logic)
         content = await file.read()
-        image = Image.open(BytesIO(content))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Store and process
-        image_id = await storage_manager.store_image(content, file.filename, job_id)
-        processed_image = preprocess_image(image)
-        
-        await cache_manager.update_job_status(job_id, "processing", 0.5)
-        
-        # Perform analysis
-        detections = []
-        if analysis_type in ["pest_detection", "full_analysis"]:
-            pest_results = await pest_detector.detect(processed_image, confidence_threshold)
-            detections.extend(pest_results)
+        decoded = await decode_pool.decode(content)
         
-        await cache_manager.update_job_status(job_id, "processing", 0.8)
-        
-        if analysis_type in ["crop_classification", "full_analysis"]:
-            crop_results = await crop_classifier.classify(processed_image, confidence_threshold)
-            detections.extend(crop_results)
+        with decoded:
+            # Store and process
+            image_id = await storage_manager.store_image(content, file.filename, job_id)
+            
+            await cache_manager.update_job_status(job_id, "processing", 0.5)
+            
+            # Perform analysis
+            detections = []
+            if analysis_type in ["pest_detection", "full_analysis"]:
+                pest_results = await detect_pests(decoded.image, confidence_threshold)
+                detections.extend(pest_results)
+            
+            await cache_manager.update_job_status(job_id, "processing", 0.8)
+            
+            if analysis_type in ["crop_classification", "full_analysis"]:
+                crop_results = await classify_crops(decoded.image, confidence_threshold)
+                detections.extend(crop_results)
         
         # Complete processing
         overall_confidence = sum(d.confidence for d in detections) / len(detections) if detections else 0
@@ -0,0 +1,157 @@
+"""
+Export the detectors to ONNX and quantize them to INT8
+
+Writes <out>/pest_detector.fp32.onnx (YOLOv8, via ultralytics) and
+<out>/crop_classifier.fp32.onnx (EfficientNet-B0, via torch.onnx), both
+with a dynamic batch axis so micro-batches run as one call. With
+--calibration, each model is also statically quantized to
+<model>.int8.onnx: QDQ format, per-channel INT8 weights, activations
+calibrated on the images in that directory, pre-processed exactly as at
+inference time. ONNX Runtime and OpenVINO both run the INT8 files.
+Class names go to <model>.labels.txt, one per line by class id: the
+detector's come from the YOLO weights, the classifier's from
+--classifier-labels.
+
+Run from services/image-inference:
+    python -m scripts.export_models --yolo weights/pest_yolov8n.pt \
+        --classifier weights/crop_efficientnet_b0.pt --calibration data/calibration
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+from typing import Callable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from utils.inference_backend import (
+    CLASSIFIER_SIZE, DETECTOR_SIZE, ONNX_MODEL_DIR, classifier_input, labels_path, letterbox, load_torch_module,
+    model_path
+)
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def calibration_images(directory: str, count: int, seed: int = 0) -> List[str]:
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise SystemExit(f"No calibration images under {directory}")
+    random.Random(seed).shuffle(paths)
+    return paths[:count]
+
+def write_labels(model: str, names: List[str], out_dir: str):
+    with open(labels_path(model, out_dir), "w", encoding="utf-8") as f:
+        f.writelines(f"{name}\n" for name in names)
+
+def export_detector(weights: str, out_dir: str, opset: int) -> str:
+    from ultralytics import YOLO
+    yolo = YOLO(weights)
+    write_labels("pest_detector", [yolo.names[i] for i in sorted(yolo.names)], out_dir)
+    exported = yolo.export(format="onnx", imgsz=DETECTOR_SIZE, dynamic=True, simplify=True, opset=opset)
+    path = model_path("pest_detector", "fp32", out_dir)
+    shutil.move(exported, path)
+    return path
+
+def export_classifier(weights: str, out_dir: str, opset: int, num_classes: Optional[int]) -> str:
+    import torch
+    module = load_torch_module("classifier", weights, num_classes)
+    path = model_path("crop_classifier", "fp32", out_dir)
+    torch.onnx.export(
+        module,
+        torch.zeros(1, 3, CLASSIFIER_SIZE, CLASSIFIER_SIZE),
+        path,
+        input_names=["images"],
+        output_names=["logits"],
+        dynamic_axes={"images": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset
+    )
+    return path
+
+def quantize(fp32_path: str, int8_path: str, images: List[str], preprocess: Callable[[Image.Image], np.ndarray],
+             exclude: Optional[List[str]] = None) -> str:
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            with Image.open(path) as image:
+                return {input_name: preprocess(image.convert("RGB"))[None]}
+
+    prepared = fp32_path.replace(".fp32.onnx", ".prep.onnx")
+    quant_pre_process(fp32_path, prepared)
+    try:
+        quantize_static(
+            prepared,
+            int8_path,
+            ImageReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.Percentile,
+            nodes_to_exclude=exclude or []
+        )
+    finally:
+        os.remove(prepared)
+    return int8_path
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--yolo", help="ultralytics YOLOv8 pest detector weights (.pt)")
+    parser.add_argument("--classifier", help="EfficientNet-B0 crop classifier checkpoint (.pt)")
+    parser.add_argument("--num-classes", type=int, help="classifier classes when the checkpoint is a bare state dict")
+    parser.add_argument("--classifier-labels", help="text file of classifier class names, one per line by class id")
+    parser.add_argument("--out", default=ONNX_MODEL_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--calibration", help="directory of representative field photos for INT8 calibration")
+    parser.add_argument("--calibration-count", type=int, default=300)
+    parser.add_argument("--exclude-nodes", nargs="*", default=[],
+                        help="ONNX node names kept in fp32 (e.g. the YOLO head's final Concat)")
+    args = parser.parse_args()
+    if not (args.yolo or args.classifier):
+        parser.error("give --yolo and/or --classifier")
+
+    os.makedirs(args.out, exist_ok=True)
+    images = calibration_images(args.calibration, args.calibration_count) if args.calibration else None
+    exports = []
+    if args.yolo:
+        exports.append(("pest_detector", export_detector(args.yolo, args.out, args.opset), lambda im: letterbox(im)[0]))
+    if args.classifier:
+        if args.classifier_labels:
+            with open(args.classifier_labels, "r", encoding="utf-8") as f:
+                write_labels("crop_classifier", [line.strip() for line in f if line.strip()], args.out)
+        exports.append((
+            "crop_classifier",
+            export_classifier(args.classifier, args.out, args.opset, args.num_classes),
+            classifier_input
+        ))
+
+    for model, fp32_path, preprocess in exports:
+        logger.info(f"✅ {model}: {fp32_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+        if images:
+            int8_path = quantize(fp32_path, model_path(model, "int8", args.out), images, preprocess, args.exclude_nodes)
+            logger.info(f"✅ {model}: {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB, "
+                        f"{len(images)} calibration images)")
+
+if __name__ == "__main__":
+    main()
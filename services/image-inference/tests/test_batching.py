@@ -0,0 +1,146 @@
+"""
+Test Suite for Dynamic Micro-Batching
+
+Tests how the MicroBatcher cuts batches, reports failures, skips requests
+that gave up and shuts down.
+"""
+
+import pytest
+import asyncio
+import sys
+import os
+
+# Add the parent directory to sys.path to import service modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.batching import MicroBatcher
+
+class TestMicroBatcher:
+    """Test the micro-batching queue"""
+
+    def test_batches_are_cut_at_max_batch(self):
+        """Test concurrent requests fill batches of at most max_batch"""
+        batches = []
+
+        def process(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        async def scenario():
+            batcher = MicroBatcher(process, max_batch=4, max_wait_ms=50)
+            results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+            await batcher.close()
+            return results, batcher
+
+        results, batcher = asyncio.run(scenario())
+
+        assert results == [i * 2 for i in range(10)]
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        assert batcher.stats()["batch_sizes"] == {2: 1, 4: 2}
+
+    def test_batches_are_cut_at_max_wait(self):
+        """Test a request arriving after the window goes into the next batch"""
+        batches = []
+
+        async def process(items):
+            batches.append(list(items))
+            return items
+
+        async def scenario():
+            batcher = MicroBatcher(process, max_batch=16, max_wait_ms=20)
+            first = asyncio.ensure_future(batcher.submit("a"))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(batcher.submit("b"))
+            await asyncio.sleep(0.1)
+            third = await batcher.submit("c")
+            results = [await first, await second, third]
+            await batcher.close()
+            return results
+
+        assert asyncio.run(scenario()) == ["a", "b", "c"]
+        assert batches == [["a", "b"], ["c"]]
+
+    def test_exception_reaches_every_request_in_the_batch(self):
+        """Test a failed batch fails all of its requests and the batcher keeps serving"""
+        calls = []
+
+        async def process(items):
+            calls.append(list(items))
+            if len(calls) == 1:
+                raise ValueError("model crashed")
+            return items
+
+        async def scenario():
+            batcher = MicroBatcher(process, max_batch=3, max_wait_ms=50)
+            failed = await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+            recovered = await batcher.submit(7)
+            await batcher.close()
+            return failed, recovered, batcher.failures
+
+        failed, recovered, failures = asyncio.run(scenario())
+
+        assert all(isinstance(result, ValueError) for result in failed)
+        assert recovered == 7
+        assert failures == 1
+
+    def test_wrong_result_count_fails_the_batch(self):
+        """Test a process function returning too few results is reported as a failure"""
+        async def scenario():
+            batcher = MicroBatcher(lambda items: items[:1], max_batch=2, max_wait_ms=50)
+            results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+            await batcher.close()
+            return results
+
+        assert all(isinstance(result, RuntimeError) for result in asyncio.run(scenario()))
+
+    def test_cancelled_requests_are_dropped(self):
+        """Test requests cancelled while queued never reach the model"""
+        batches = []
+
+        async def process(items):
+            batches.append(list(items))
+            return items
+
+        async def scenario():
+            batcher = MicroBatcher(process, max_batch=8, max_wait_ms=50)
+            tasks = [asyncio.ensure_future(batcher.submit(i)) for i in range(4)]
+            await asyncio.sleep(0.01)
+            tasks[1].cancel()
+            tasks[2].cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            await batcher.close()
+            return results
+
+        results = asyncio.run(scenario())
+
+        assert results[0] == 0 and results[3] == 3
+        assert all(isinstance(result, asyncio.CancelledError) for result in results[1:3])
+        assert batches == [[0, 3]]
+
+    def test_close_cancels_queued_requests(self):
+        """Test close() stops the worker and cancels what is still waiting"""
+        started = []
+
+        async def process(items):
+            started.append(list(items))
+            await asyncio.sleep(10)
+            return items
+
+        async def scenario():
+            batcher = MicroBatcher(process, max_batch=1, max_wait_ms=0)
+            tasks = [asyncio.ensure_future(batcher.submit(i)) for i in range(3)]
+            await asyncio.sleep(0.01)
+            await batcher.close()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            return results, batcher
+
+        results, batcher = asyncio.run(scenario())
+
+        assert started == [[0]]
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        assert batcher._worker is None
+
+    def test_max_batch_must_be_positive(self):
+        """Test a batcher needs room for at least one item"""
+        with pytest.raises(ValueError):
+            MicroBatcher(lambda items: items, max_batch=0)
@@ -0,0 +1,108 @@
+"""
+Test Suite for the Decode Pool
+
+Tests the shared memory lifecycle of decoded uploads: segments are freed
+on release, when the waiting request is cancelled, and while views are
+still held; undecodable uploads raise ImageDecodeError.
+"""
+
+import pytest
+import asyncio
+import sys
+import os
+import time
+from io import BytesIO
+from multiprocessing import shared_memory
+
+# Add the parent directory to sys.path to import service modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PIL import Image
+
+from utils.decode_pool import DecodePool, ImageDecodeError
+
+SLOW_WIDTH = 33  # uploads this wide take a while to preprocess
+
+def preprocess(image: Image.Image) -> Image.Image:
+    """Module level so the spawned workers can import it"""
+    if image.width == SLOW_WIDTH:
+        time.sleep(1.0)
+    return image.resize((32, 32))
+
+def upload(width: int = 64, height: int = 48) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (10, 200, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def segment_exists(name: str) -> bool:
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    segment.close()
+    return True
+
+def shared_segments() -> set:
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+@pytest.fixture(scope="module")
+def pool():
+    decode_pool = DecodePool(workers=1, preprocess=preprocess)
+    decode_pool.start()
+    yield decode_pool
+    decode_pool.close()
+
+class TestDecodePool:
+    """Test decoding into shared memory"""
+
+    def test_segment_is_unlinked_after_with_block(self, pool):
+        """Test the segment exists while in use and is gone after the with block"""
+        decoded = asyncio.run(pool.decode(upload()))
+        name = decoded._segment.name
+
+        with decoded:
+            assert segment_exists(name)
+            assert decoded.original_size == (64, 48)
+            assert decoded.image.size == (32, 32)
+            assert decoded.image.getpixel((0, 0)) == (10, 200, 30)
+
+        assert not segment_exists(name)
+        assert decoded.array is None
+
+    def test_invalid_upload_raises_decode_error(self, pool):
+        """Test bytes that are not an image raise ImageDecodeError"""
+        with pytest.raises(ImageDecodeError):
+            asyncio.run(pool.decode(b"not an image"))
+
+    def test_release_with_live_view_does_not_raise(self, pool):
+        """Test releasing while a PIL view is still held defers the unmap"""
+        decoded = asyncio.run(pool.decode(upload()))
+        name = decoded._segment.name
+        pixels = decoded.image
+
+        decoded.release()
+        decoded.release()
+
+        assert not segment_exists(name)
+        assert pixels.getpixel((0, 0)) == (10, 200, 30)
+
+    @pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm to list segments")
+    def test_segment_is_unlinked_when_request_is_cancelled(self):
+        """Test a decode abandoned mid-flight frees the segment its worker creates"""
+        decode_pool = DecodePool(workers=1, preprocess=preprocess)
+        decode_pool.start()
+        with asyncio.run(decode_pool.decode(upload())):
+            pass  # the worker is up before the timed request
+        before = shared_segments()
+
+        async def abandon():
+            task = asyncio.ensure_future(decode_pool.decode(upload(width=SLOW_WIDTH)))
+            await asyncio.sleep(0.3)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(abandon())
+        decode_pool.close()
+
+        assert shared_segments() <= before
@@ -0,0 +1,169 @@
+"""
+Test Suite for the Inference Backends
+
+Tests the backend-independent pre- and post-processing (letterbox, NMS,
+YOLO decoding, top-k) and the batched passes against known outputs.
+"""
+
+import pytest
+import sys
+import os
+
+# Add the parent directory to sys.path to import service modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from PIL import Image
+
+from utils.inference_backend import (
+    InferenceBackend, Letterbox, _nms, classifier_input, classify_batch, detect_batch, letterbox, softmax,
+    top_k, yolo_detections
+)
+
+class RecordingBackend(InferenceBackend):
+    """Returns fixed outputs and keeps the batches it was given"""
+
+    name = "recording"
+
+    def __init__(self, output: np.ndarray):
+        super().__init__("test", "fp32")
+        self.output = output
+        self.batches = []
+
+    def run(self, batch: np.ndarray):
+        self.batches.append(batch)
+        return [self.output[:len(batch)]]
+
+def yolo_output(predictions) -> np.ndarray:
+    """(1, 4 + classes, anchors) head output from rows of (cx, cy, w, h, class scores...)"""
+    return np.array(predictions, dtype=np.float32).T[None]
+
+class TestLetterbox:
+    """Test the YOLOv8 input letterbox"""
+
+    def test_wide_image_is_padded_top_and_bottom(self):
+        """Test a 200x100 image fills the width and is centred vertically"""
+        chw, box = letterbox(Image.new("RGB", (200, 100), (255, 0, 0)), size=64)
+
+        assert chw.shape == (3, 64, 64)
+        assert chw.dtype == np.float32
+        assert box == Letterbox(scale=0.32, pad=(0, 16), size=(200, 100))
+        assert np.allclose(chw[:, :16], 114 / 255)
+        assert np.allclose(chw[:, 48:], 114 / 255)
+        assert np.allclose(chw[0, 16:48], 1.0)
+        assert np.allclose(chw[1:, 16:48], 0.0)
+
+    def test_tall_array_is_padded_left_and_right(self):
+        """Test an HWC array is accepted and padded at the sides"""
+        chw, box = letterbox(np.zeros((100, 50, 3), dtype=np.uint8), size=64)
+
+        assert box.pad == (16, 0)
+        assert box.size == (50, 100)
+        assert np.allclose(chw[:, :, :16], 114 / 255)
+        assert np.allclose(chw[:, :, 16:48], 0.0)
+
+    def test_classifier_input_is_normalized_crop(self):
+        """Test the classifier input is a 224 crop with ImageNet normalization"""
+        chw = classifier_input(Image.new("RGB", (400, 300), (124, 116, 104)))
+
+        assert chw.shape == (3, 224, 224)
+        assert np.allclose(chw, 0.0, atol=0.01)
+
+class TestDetections:
+    """Test NMS and YOLOv8 output decoding"""
+
+    def test_nms_suppresses_overlapping_boxes(self):
+        """Test the lower-scored of two overlapping boxes is dropped"""
+        boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+        scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+
+        assert _nms(boxes, scores, 0.45).tolist() == [1, 2]
+        assert _nms(boxes, scores, 0.9).tolist() == [1, 0, 2]
+
+    def test_boxes_map_back_to_original_pixels(self):
+        """Test NMS is per class and boxes are undone from the letterbox"""
+        output = yolo_output([
+            [32, 32, 20, 20, 0.9, 0.0],
+            [33, 32, 20, 20, 0.6, 0.0],  # same pest, suppressed
+            [32, 32, 20, 20, 0.0, 0.8],  # other class on the same spot, kept
+            [60, 60, 10, 10, 0.1, 0.1]   # below the confidence threshold
+        ])
+        box = Letterbox(scale=0.5, pad=(0, 16), size=(128, 96))
+
+        [(xyxy, scores, classes)] = yolo_detections(output, [box], confidence=0.25)
+
+        assert np.allclose(xyxy, [[44, 12, 84, 52], [44, 12, 84, 52]])
+        assert np.allclose(scores, [0.9, 0.8])
+        assert classes.tolist() == [0, 1]
+
+    def test_boxes_are_clipped_to_the_image(self):
+        """Test a box over the padding is clipped to the original image"""
+        output = yolo_output([[4, 20, 16, 16, 0.9]])
+        box = Letterbox(scale=1.0, pad=(0, 8), size=(64, 48))
+
+        [(xyxy, _, _)] = yolo_detections(output, [box])
+
+        assert np.allclose(xyxy, [[0, 4, 12, 20]])
+
+    def test_no_detections(self):
+        """Test an image without confident anchors gets empty arrays"""
+        [(xyxy, scores, classes)] = yolo_detections(yolo_output([[10, 10, 4, 4, 0.1]]), [Letterbox(1.0, (0, 0), (64, 64))])
+
+        assert xyxy.shape == (0, 4)
+        assert len(scores) == len(classes) == 0
+
+class TestTopK:
+    """Test classifier post-processing"""
+
+    def test_top_k_orders_by_probability(self):
+        """Test the most likely classes come first with softmax probabilities"""
+        logits = np.log(np.array([[1, 2, 3, 4], [4, 3, 2, 1]], dtype=np.float32))
+
+        result = top_k(logits, k=2)
+
+        assert [c for c, _ in result[0]] == [3, 2]
+        assert [c for c, _ in result[1]] == [0, 1]
+        assert [p for _, p in result[0]] == pytest.approx([0.4, 0.3])
+
+    def test_softmax_is_stable_for_large_logits(self):
+        """Test large logits do not overflow"""
+        assert np.allclose(softmax(np.array([[1000.0, 1000.0]])), [[0.5, 0.5]])
+
+class TestBatchedPasses:
+    """Test micro-batches go through the backend as one call"""
+
+    def test_backend_needs_run(self):
+        """Test the base backend cannot be used on its own"""
+        with pytest.raises(TypeError):
+            InferenceBackend("test", "fp32")
+
+    def test_detect_batch_is_one_call_with_per_image_thresholds(self):
+        """Test images are stacked into one NCHW batch and filtered per request"""
+        prediction = yolo_output([[320, 320, 64, 64, 0.6]])[0]
+        backend = RecordingBackend(np.stack([prediction, prediction]))
+        images = [Image.new("RGB", (640, 640)), Image.new("RGB", (320, 160))]
+
+        results = detect_batch(backend, images, [0.5, 0.7])
+
+        assert len(backend.batches) == 1
+        assert backend.batches[0].shape == (2, 3, 640, 640)
+        assert np.allclose(results[0][0], [[288, 288, 352, 352]])
+        assert len(results[1][1]) == 0
+
+    def test_classify_batch_is_one_call(self):
+        """Test classifier inputs are stacked and top-k comes back per image"""
+        logits = np.log(np.array([[1, 2, 7], [6, 3, 1]], dtype=np.float32))
+        backend = RecordingBackend(logits)
+
+        results = classify_batch(backend, [Image.new("RGB", (300, 300))] * 2, k=1)
+
+        assert backend.batches[0].shape == (2, 3, 224, 224)
+        assert results == [[(2, pytest.approx(0.7))], [(0, pytest.approx(0.6))]]
+
+    def test_labels_fall_back_to_class_ids(self):
+        """Test unknown class ids are still reported"""
+        backend = RecordingBackend(np.zeros((1, 2)))
+        backend.labels = ["aphid"]
+
+        assert backend.label(0) == "aphid"
+        assert backend.label(3) == "class_3"
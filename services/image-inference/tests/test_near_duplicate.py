@@ -0,0 +1,107 @@
+"""
+Test Suite for Near-Duplicate Lookup
+
+Tests the multi-index Hamming search of NearDuplicateIndex: the distance
+boundary, context matching, LRU eviction and the disabled index.
+"""
+
+import pytest
+import random
+import sys
+import os
+
+# Add the parent directory to sys.path to import service modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.near_duplicate import HASH_BITS, NearDuplicateIndex, _chunk_layout
+
+BASE_HASH = 0x0123456789ABCDEF
+CONTEXT = ("full_analysis", 0.5, "en")
+
+def flip_bits(phash: int, bits) -> int:
+    for bit in bits:
+        phash ^= 1 << bit
+    return phash
+
+class TestNearDuplicateIndex:
+    """Test the pHash index"""
+
+    @pytest.mark.parametrize("bits", [range(6), range(58, 64), range(0, 64, 11)])
+    def test_match_at_exactly_max_distance(self, bits):
+        """Test a hash max_distance bits away is found, wherever the bits fall"""
+        index = NearDuplicateIndex(max_distance=6, max_entries=1000)
+        index.add(BASE_HASH, CONTEXT, "prior")
+
+        duplicate = index.find(flip_bits(BASE_HASH, bits), CONTEXT)
+
+        assert duplicate is not None
+        assert duplicate.value == "prior"
+        assert duplicate.distance == 6
+
+    def test_no_match_past_max_distance(self):
+        """Test a hash max_distance + 1 bits away is not found"""
+        index = NearDuplicateIndex(max_distance=6, max_entries=1000)
+        index.add(BASE_HASH, CONTEXT, "prior")
+
+        assert index.find(flip_bits(BASE_HASH, range(0, 63, 9)), CONTEXT) is None
+        assert index.stats()["misses"] == 1
+
+    def test_matches_a_linear_scan(self):
+        """Test multi-index lookup finds the same closest distance as comparing every hash"""
+        rng = random.Random(7)
+        index = NearDuplicateIndex(max_distance=8, max_entries=5000)
+        hashes = [rng.getrandbits(HASH_BITS) for _ in range(500)]
+        for i, phash in enumerate(hashes):
+            index.add(phash, CONTEXT, i)
+
+        for _ in range(200):
+            source = rng.choice(hashes)
+            query = flip_bits(source, rng.sample(range(HASH_BITS), rng.randint(0, 10)))
+            closest = min((phash ^ query).bit_count() for phash in hashes)
+            duplicate = index.find(query, CONTEXT)
+            if closest > 8:
+                assert duplicate is None
+            else:
+                assert duplicate is not None and duplicate.distance == closest
+
+    def test_probe_radius_is_pigeonhole_bound(self):
+        """Test every chunk is probed at max_distance // chunks bits"""
+        layout = _chunk_layout(6, 1000)
+
+        assert sum(mask.bit_length() for _, mask, _ in layout) == HASH_BITS
+        assert all(max(flip.bit_count() for flip in flips) == 6 // len(layout) for _, _, flips in layout)
+
+    def test_other_context_never_hits(self):
+        """Test the same photo analysed with other models or parameters is not reused"""
+        index = NearDuplicateIndex(max_distance=6, max_entries=1000)
+        index.add(BASE_HASH, CONTEXT, "prior")
+
+        assert index.find(BASE_HASH, ("full_analysis", 0.7, "en")) is None
+        assert index.find(BASE_HASH, ("pest_detection", 0.5, "en")) is None
+        assert index.find(BASE_HASH, CONTEXT).distance == 0
+
+    def test_eviction_removes_entry_from_every_table(self):
+        """Test the least recently used entry leaves all chunk tables"""
+        index = NearDuplicateIndex(max_distance=6, max_entries=2)
+        index.add(BASE_HASH, CONTEXT, "first")
+        index.add(~BASE_HASH & (2 ** HASH_BITS - 1), CONTEXT, "second")
+        index.find(BASE_HASH, CONTEXT)  # "first" is now the most recently used
+        index.add(0x00FF00FF00FF00FF, CONTEXT, "third")
+
+        assert len(index) == 2
+        assert index.evictions == 1
+        assert index.find(~BASE_HASH & (2 ** HASH_BITS - 1), CONTEXT) is None
+        assert index.find(BASE_HASH, CONTEXT).value == "first"
+        remaining = {entry_id for table in index._tables for bucket in table.values() for entry_id in bucket}
+        assert remaining == set(index._entries)
+        assert all(len(table) <= 2 for table in index._tables)
+
+    def test_negative_max_distance_disables_index(self):
+        """Test a negative max_distance turns lookups and inserts off"""
+        index = NearDuplicateIndex(max_distance=-1, max_entries=1000)
+        index.add(BASE_HASH, CONTEXT, "prior")
+
+        assert not index.enabled
+        assert len(index) == 0
+        assert index.find(BASE_HASH, CONTEXT) is None
+        assert index.stats()["enabled"] is False
@@ -0,0 +1,297 @@
+"""
+Image decode and preprocessing off the event loop
+
+Decoding a large TIFF or JPEG and preprocessing it is CPU work that would
+block the uvicorn event loop (and every other request, /health included)
+if run inside an async handler. DecodePool runs it in a process pool sized
+to the machine's cores. Workers write the preprocessed pixels into a
+shared memory segment and return only its name, shape and dtype; the
+handler maps the segment as a NumPy array (or PIL image) without copying
+and releases it once inference is done.
+
+LoopLagMonitor measures how late the event loop wakes a sleeping task, the
+direct symptom of blocking work; StageTimings aggregates per-stage times.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.near_duplicate import perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "0")) or os.cpu_count() or 1
+LAG_SAMPLE_INTERVAL = 0.1  # seconds between event loop lag probes
+LAG_WINDOW = 600  # probes kept for percentiles (one minute)
+
+class ImageDecodeError(ValueError):
+    """The upload is not an image PIL can decode"""
+
+@dataclass(frozen=True)
+class SharedArray:
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    mode: Optional[str]  # PIL mode when the preprocessed image is a PIL image
+
+Preprocess = Callable[[Image.Image], Any]
+
+def _decode_worker(
+    content: bytes,
+    preprocess: Optional[Preprocess],
+    compute_phash: bool
+) -> Tuple[SharedArray, Tuple[int, int], Optional[int], Dict[str, float]]:
+    """Decode, convert and preprocess one upload into a new shared memory segment"""
+    if preprocess is None:
+        # Imported in the worker so the service's preprocessing runs there, not in the handler
+        from utils.image_processing import preprocess_image as preprocess
+    timings = {}
+    start = time.perf_counter()
+    try:
+        image = Image.open(BytesIO(content))
+        image.load()
+    except Exception as e:
+        raise ImageDecodeError(f"Cannot decode image: {e}") from None
+    original_size = image.size
+    timings["decode_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    timings["convert_ms"] = (time.perf_counter() - start) * 1000
+
+    phash = None
+    if compute_phash:
+        start = time.perf_counter()
+        phash = perceptual_hash(image)
+        timings["phash_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    processed = preprocess(image)
+    mode = processed.mode if isinstance(processed, Image.Image) else None
+    array = np.ascontiguousarray(np.asarray(processed))
+    timings["preprocess_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    try:
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        target[...] = array
+        del target
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+    timings["share_ms"] = (time.perf_counter() - start) * 1000
+    return SharedArray(segment.name, array.shape, array.dtype.str, mode), original_size, phash, timings
+
+class DecodedImage:
+    """Preprocessed image mapped from shared memory; call release() when inference is done"""
+
+    def __init__(
+        self,
+        shared: SharedArray,
+        original_size: Tuple[int, int],
+        phash: Optional[int],
+        timings: Dict[str, float]
+    ):
+        self._segment = shared_memory.SharedMemory(name=shared.name)
+        self.array: Optional[np.ndarray] = np.ndarray(shared.shape, dtype=np.dtype(shared.dtype), buffer=self._segment.buf)
+        self.array.flags.writeable = False
+        self.mode = shared.mode
+        self.original_size = original_size
+        self.phash = phash  # 64-bit perceptual hash of the decoded image, if computed
+        self.timings = timings
+        self._image: Optional[Image.Image] = None
+
+    @property
+    def image(self):
+        """What preprocess_image returned: a PIL image over the shared pixels, or the array"""
+        if self.mode is None:
+            return self.array
+        if self._image is None:
+            height, width = self.array.shape[:2]
+            self._image = Image.frombuffer(self.mode, (width, height), self.array, "raw", self.mode, 0, 1)
+        return self._image
+
+    def release(self):
+        """Unmap and free the segment; views handed out must no longer be used"""
+        if self._segment is None:
+            return
+        self._image = None
+        self.array = None
+        segment, self._segment = self._segment, None
+        segment.unlink()
+        try:
+            segment.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with the last one
+            _deferred.append(segment)
+        _close_deferred()
+
+    def __enter__(self) -> "DecodedImage":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def _unlink_segment(name: str):
+    """Free a segment by name, whoever created it"""
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
+
+def _discard_result(future):
+    """Done callback for a decode nobody is waiting for any more: free the segment it made"""
+    if not future.cancelled() and future.exception() is None:
+        _unlink_segment(future.result()[0].name)
+
+_deferred: List[shared_memory.SharedMemory] = []
+
+def _close_deferred():
+    for segment in list(_deferred):
+        try:
+            segment.close()
+            _deferred.remove(segment)
+        except BufferError:
+            pass
+
+class StageTimings:
+    """Count, mean and max per named stage"""
+
+    def __init__(self):
+        self._stages: Dict[str, List[float]] = {}  # stage -> [count, total ms, max ms]
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, float]):
+        with self._lock:
+            for stage, ms in timings.items():
+                entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += ms
+                entry[2] = max(entry[2], ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"count": count, "mean_ms": round(total / count, 3), "max_ms": round(peak, 3)}
+                for stage, (count, total, peak) in self._stages.items()
+            }
+
+class DecodePool:
+    """
+    Process pool for decode + preprocess, started with the service.
+
+    `preprocess` must be a module-level function (it is pickled to the
+    workers); the default is utils.image_processing.preprocess_image.
+    With `compute_phash` workers also hash the decoded image for
+    near-duplicate lookup.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_DECODE_WORKERS,
+        preprocess: Optional[Preprocess] = None,
+        compute_phash: bool = False
+    ):
+        self.workers = workers
+        self.preprocess = preprocess
+        self.compute_phash = compute_phash
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.timings = StageTimings()
+
+    def start(self):
+        if self._executor is None:
+            # spawn: forking a process that has loaded torch/OpenMP can deadlock the child
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"🧵 Image decode pool started with {self.workers} workers")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def decode(self, content: bytes) -> DecodedImage:
+        """Decoded, RGB-converted and preprocessed upload; raises ImageDecodeError"""
+        self.start()
+        submitted = time.perf_counter()
+        future = self._executor.submit(_decode_worker, content, self.preprocess, self.compute_phash)
+        try:
+            shared, original_size, phash, timings = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A worker already running still creates its segment; free it when it lands
+            future.add_done_callback(_discard_result)
+            raise
+        try:
+            decoded = DecodedImage(shared, original_size, phash, timings)
+        except BaseException:
+            _unlink_segment(shared.name)
+            raise
+        worker_ms = sum(timings.values())
+        timings["pool_wait_ms"] = max(0.0, (time.perf_counter() - submitted) * 1000 - worker_ms)
+        self.timings.record(timings)
+        return decoded
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "running": self._executor is not None, "stages": self.timings.stats()}
+
+class LoopLagMonitor:
+    """Samples how late the event loop runs a timer; blocking work shows up as lag"""
+
+    def __init__(self, interval: float = LAG_SAMPLE_INTERVAL, window: int = LAG_WINDOW):
+        self.interval = interval
+        self.samples: List[float] = []
+        self.window = window
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - expected) * 1000)
+            self.samples.append(lag_ms)
+            if len(self.samples) > self.window:
+                del self.samples[0]
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    def stats(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"samples": 0, "p50_ms": 0.0, "p99_ms": 0.0, "recent_max_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "samples": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2], 3),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+            "recent_max_ms": round(ordered[-1], 3),
+            "max_ms": round(self.max_lag_ms, 3)
+        }
@@ -0,0 +1,317 @@
+"""
+Selectable CPU inference backends for the detectors
+
+The YOLOv8 pest detector and EfficientNet crop classifier can run through
+PyTorch, ONNX Runtime or OpenVINO. scripts/export_models.py writes ONNX
+models (and INT8 QDQ ones quantized against a calibration set) named
+`<model>.<precision>.onnx`; both ONNX Runtime and OpenVINO load them, and
+OpenVINO executes the QDQ nodes as INT8 kernels. INFERENCE_BACKEND and
+INFERENCE_PRECISION pick the combination per deployment;
+benchmarks/bench_inference_backends.py compares them. The default stays
+torch: switch a deployment only once that benchmark has been run on its
+hardware and the INT8 agreement is acceptable.
+
+Every backend takes an NCHW float32 batch and returns the raw model
+outputs, so pre- and post-processing (letterbox, NMS, softmax) live here
+once, in NumPy, and do not depend on the backend. detect_batch and
+classify_batch stack a micro-batch into one NCHW array so the whole batch
+is a single backend call.
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnxruntime", "openvino")
+PRECISIONS = ("fp32", "int8")
+DEFAULT_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+DEFAULT_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+DEFAULT_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # 0: runtime default (all cores)
+MODEL_DIR = os.getenv("MODEL_PATH", "/app/models")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(MODEL_DIR, "onnx"))
+# PyTorch checkpoints behind the torch backend: (load_torch_module kind, path)
+TORCH_WEIGHTS = {
+    "pest_detector": ("detector", os.getenv("PEST_DETECTOR_WEIGHTS", os.path.join(MODEL_DIR, "pest_yolov8n.pt"))),
+    "crop_classifier": (
+        "classifier", os.getenv("CROP_CLASSIFIER_WEIGHTS", os.path.join(MODEL_DIR, "crop_efficientnet_b0.pt"))
+    )
+}
+
+DETECTOR_SIZE = 640
+CLASSIFIER_SIZE = 224
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+ImageInput = Union[Image.Image, np.ndarray]
+
+def model_path(model: str, precision: str = DEFAULT_PRECISION, directory: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(directory, f"{model}.{precision}.onnx")
+
+def labels_path(model: str, directory: str = ONNX_MODEL_DIR) -> str:
+    return os.path.join(directory, f"{model}.labels.txt")
+
+def load_labels(model: str, directory: str = ONNX_MODEL_DIR) -> List[str]:
+    """Class names written next to the exported model, one per line by class id"""
+    path = labels_path(model, directory)
+    if not os.path.exists(path):
+        logger.warning(f"⚠️ {path} not found; {model} classes are reported by id")
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+class InferenceBackend(ABC):
+    """Runs one model on an NCHW float32 batch and returns its raw outputs"""
+
+    name = "base"
+
+    def __init__(self, model: str, precision: str):
+        self.model = model
+        self.precision = precision
+        self.labels: List[str] = []
+
+    @abstractmethod
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        """Raw model outputs for the batch, in the model's output order"""
+
+    def label(self, class_id: int) -> str:
+        return self.labels[class_id] if class_id < len(self.labels) else f"class_{class_id}"
+
+    def describe(self) -> Dict[str, str]:
+        return {"model": self.model, "backend": self.name, "precision": self.precision}
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+
+    def __init__(self, model: str, module: Any, threads: int = DEFAULT_THREADS):
+        super().__init__(model, "fp32")
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.module = module.float().eval()
+
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        with self._torch.inference_mode():
+            outputs = self.module(self._torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32)))
+        if isinstance(outputs, (tuple, list)):
+            # ultralytics returns (predictions, feature maps); the head output comes first
+            outputs = outputs[0]
+        return [outputs.numpy()]
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = "onnxruntime"
+
+    def __init__(self, model: str, path: str, precision: str, threads: int = DEFAULT_THREADS):
+        super().__init__(model, precision)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("INFERENCE_BACKEND=onnxruntime needs the onnxruntime package") from None
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})
+
+class OpenVINOBackend(InferenceBackend):
+    name = "openvino"
+
+    def __init__(self, model: str, path: str, precision: str, threads: int = DEFAULT_THREADS):
+        super().__init__(model, precision)
+        try:
+            from openvino.runtime import Core
+        except ImportError:
+            raise RuntimeError("INFERENCE_BACKEND=openvino needs the openvino package") from None
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = str(threads)
+        core = Core()
+        self.compiled = core.compile_model(core.read_model(path), "CPU", config)
+        self.outputs = list(self.compiled.outputs)
+
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        results = self.compiled(np.ascontiguousarray(batch, dtype=np.float32))
+        return [results[output] for output in self.outputs]
+
+def load_backend(
+    model: str,
+    backend: str = DEFAULT_BACKEND,
+    precision: str = DEFAULT_PRECISION,
+    torch_module: Any = None,
+    directory: str = ONNX_MODEL_DIR,
+    threads: int = DEFAULT_THREADS
+) -> InferenceBackend:
+    """Backend for `model` ("pest_detector", "crop_classifier"); torch needs the loaded module"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}; expected one of {', '.join(PRECISIONS)}")
+    if backend == "torch":
+        if torch_module is None:
+            raise ValueError("The torch backend needs the loaded torch module")
+        if precision != "fp32":
+            logger.warning(f"⚠️ INT8 is served by the ONNX backends; running {model} on torch in fp32")
+        instance = TorchBackend(model, torch_module, threads)
+        names = getattr(torch_module, "names", None)  # ultralytics keeps {class id: name} on the model
+        instance.labels = [names[i] for i in sorted(names)] if names else load_labels(model, directory)
+        return instance
+
+    path = model_path(model, precision, directory)
+    if not os.path.exists(path):
+        raise RuntimeError(f"{path} not found; run scripts/export_models.py first")
+    runner = OnnxRuntimeBackend if backend == "onnxruntime" else OpenVINOBackend
+    instance = runner(model, path, precision, threads)
+    instance.labels = load_labels(model, directory)
+    logger.info(f"✅ {model} running on {backend} ({precision}) from {path}")
+    return instance
+
+def load_torch_backend(model: str, threads: int = DEFAULT_THREADS) -> InferenceBackend:
+    """Torch backend over the checkpoint in PEST_DETECTOR_WEIGHTS / CROP_CLASSIFIER_WEIGHTS"""
+    kind, path = TORCH_WEIGHTS[model]
+    if not os.path.exists(path):
+        raise RuntimeError(f"{path} not found")
+    instance = load_backend(model, "torch", "fp32", load_torch_module(kind, path), threads=threads)
+    logger.info(f"✅ {model} running on torch (fp32) from {path}")
+    return instance
+
+def load_torch_module(kind: str, path: str, num_classes: Optional[int] = None) -> Any:
+    """PyTorch module for a checkpoint: ultralytics YOLO weights, or an EfficientNet-B0"""
+    import torch
+    if kind == "detector":
+        from ultralytics import YOLO
+        return YOLO(path).model.float().eval()
+    checkpoint = torch.load(path, map_location="cpu")
+    if isinstance(checkpoint, torch.nn.Module):
+        return checkpoint.float().eval()
+    from torchvision.models import efficientnet_b0
+    state = checkpoint.get("state_dict", checkpoint)
+    classes = num_classes or state["classifier.1.weight"].shape[0]
+    module = efficientnet_b0(num_classes=classes)
+    module.load_state_dict(state)
+    return module.eval()
+
+# Pre-processing
+
+def _rgb_array(image: ImageInput) -> np.ndarray:
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+    return image
+
+@dataclass(frozen=True)
+class Letterbox:
+    scale: float
+    pad: Tuple[float, float]  # left, top
+    size: Tuple[int, int]  # original width, height
+
+def letterbox(image: ImageInput, size: int = DETECTOR_SIZE) -> Tuple[np.ndarray, Letterbox]:
+    """CHW float32 in [0, 1], resized to fit `size` with aspect kept and padded with grey (YOLOv8 input)"""
+    pixels = _rgb_array(image)
+    height, width = pixels.shape[:2]
+    scale = min(size / width, size / height)
+    new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+    resized = np.asarray(Image.fromarray(pixels).resize((new_width, new_height), Image.BILINEAR))
+    left, top = (size - new_width) // 2, (size - new_height) // 2
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_height, left:left + new_width] = resized
+    chw = canvas.transpose(2, 0, 1).astype(np.float32) / 255.0
+    return chw, Letterbox(scale, (left, top), (width, height))
+
+def classifier_input(image: ImageInput, size: int = CLASSIFIER_SIZE) -> np.ndarray:
+    """CHW float32: resize the short side to size * 8/7, center crop, ImageNet normalization"""
+    pixels = Image.fromarray(_rgb_array(image))
+    short = round(size * 8 / 7)
+    scale = short / min(pixels.size)
+    pixels = pixels.resize((max(size, round(pixels.width * scale)), max(size, round(pixels.height * scale))), Image.BILINEAR)
+    left, top = (pixels.width - size) // 2, (pixels.height - size) // 2
+    crop = np.asarray(pixels.crop((left, top, left + size, top + size)), dtype=np.float32) / 255.0
+    return ((crop - IMAGENET_MEAN) / IMAGENET_STD).transpose(2, 0, 1)
+
+# Post-processing
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indices kept by greedy non-maximum suppression, highest score first"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        height = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        overlap = width * height
+        iou = overlap / (areas[best] + areas[rest] - overlap + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def yolo_detections(
+    output: np.ndarray,
+    boxes: Sequence[Letterbox],
+    confidence: float = 0.25,
+    iou_threshold: float = 0.45,
+    max_detections: int = 300
+) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    (xyxy boxes in original pixels, scores, class ids) per image from a
+    YOLOv8 head output of shape (batch, 4 + classes, anchors).
+    """
+    results = []
+    for predictions, box in zip(output, boxes):
+        predictions = predictions.T  # anchors x (cx, cy, w, h, class scores...)
+        class_scores = predictions[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        mask = scores >= confidence
+        predictions, scores, classes = predictions[mask], scores[mask], classes[mask]
+        cx, cy, w, h = predictions[:, :4].T
+        xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        # Offset boxes per class so one NMS pass never suppresses across classes
+        offset = classes[:, None].astype(np.float32) * 4096.0
+        keep = _nms(xyxy + offset, scores, iou_threshold)[:max_detections]
+        xyxy = (xyxy[keep] - np.array([*box.pad, *box.pad], dtype=np.float32)) / box.scale
+        width, height = box.size
+        xyxy = np.clip(xyxy, 0, [width, height, width, height])
+        results.append((xyxy, scores[keep], classes[keep]))
+    return results
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+def top_k(logits: np.ndarray, k: int = 5) -> List[List[Tuple[int, float]]]:
+    """(class id, probability) pairs, most likely first, per image"""
+    probabilities = softmax(logits)
+    order = np.argsort(-probabilities, axis=1)[:, :k]
+    return [[(int(c), float(p[c])) for c in row] for row, p in zip(order, probabilities)]
+
+# Batched passes
+
+def detect_batch(
+    backend: InferenceBackend,
+    images: Sequence[ImageInput],
+    confidences: Sequence[float],
+    iou_threshold: float = 0.45
+) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Detections per image from one backend call on the letterboxed batch"""
+    letterboxed = [letterbox(image) for image in images]
+    output = backend.run(np.stack([chw for chw, _ in letterboxed]))[0]
+    return [
+        yolo_detections(output[i:i + 1], [box], confidence, iou_threshold)[0]
+        for i, ((_, box), confidence) in enumerate(zip(letterboxed, confidences))
+    ]
+
+def classify_batch(backend: InferenceBackend, images: Sequence[ImageInput], k: int = 5) -> List[List[Tuple[int, float]]]:
+    """Top-k (class id, probability) per image from one backend call"""
+    return top_k(backend.run(np.stack([classifier_input(image) for image in images]))[0], k)
@@ -0,0 +1,152 @@
+"""
+Near-duplicate lookup for analysis results
+
+Farmers often upload the same leaf photo several times, or a slightly
+re-cropped or re-compressed copy. Each analysed upload's 64-bit
+perceptual hash (pHash) is indexed with its AnalysisResponse; an upload
+whose hash is within `max_distance` bits of an indexed one, analysed with
+the same models and parameters, reuses that response instead of running
+inference.
+
+Hamming search uses multi-index hashing (Norouzi et al.): the hash is
+split into m disjoint chunks, each indexed in its own table. By pigeonhole
+any hash within r = max_distance bits differs from the query in at most
+r // m bits of some chunk, so probing every table at that radius yields
+all matches; only these candidates are compared bit by bit. m is chosen so
+chunks are about log2(max_entries) bits wide, which keeps buckets near one
+entry each. Entries are evicted least recently used past `max_entries`.
+"""
+
+import logging
+import math
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6"))  # negative disables
+DEFAULT_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_CACHE_SIZE", "10000"))
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit pHash of an image as an int"""
+    import imagehash
+    return int.from_bytes(np.packbits(imagehash.phash(image).hash.flatten()).tobytes(), "big")
+
+def _chunk_layout(max_distance: int, max_entries: int) -> List[Tuple[int, int, List[int]]]:
+    """(shift, mask, probe flips) per chunk; flips are every pattern of up to r // m bits"""
+    chunks = round(HASH_BITS / math.log2(max(max_entries, 2)))
+    chunks = max(1, min(chunks, max_distance + 1, HASH_BITS))
+    radius = max_distance // chunks
+    layout, shift = [], 0
+    for i in range(chunks):
+        width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+        flips = [
+            sum(1 << bit for bit in bits)
+            for k in range(radius + 1) for bits in combinations(range(width), k)
+        ]
+        layout.append((shift, (1 << width) - 1, flips))
+        shift += width
+    return layout
+
+@dataclass(frozen=True)
+class NearDuplicate:
+    value: Any
+    distance: int
+
+class NearDuplicateIndex:
+    """
+    Bounded pHash -> value index with Hamming-radius lookup.
+
+    `context` (models, versions, parameters) must match exactly for a hit.
+    Not thread-safe; the service uses it from the event loop only.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.enabled = max_distance >= 0 and max_entries > 0
+        self._layout = _chunk_layout(max(0, max_distance), max_entries)
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in self._layout]
+        self._entries: "OrderedDict[int, Tuple[int, Hashable, Any]]" = OrderedDict()  # id -> (hash, context, value)
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.candidates_checked = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def find(self, phash: int, context: Hashable) -> Optional[NearDuplicate]:
+        """Closest indexed value within max_distance for the same context"""
+        if not self.enabled:
+            return None
+        best_id, best_distance = None, self.max_distance + 1
+        seen: Set[int] = set()
+        for (shift, mask, flips), table in zip(self._layout, self._tables):
+            chunk = (phash >> shift) & mask
+            for flip in flips:
+                for entry_id in table.get(chunk ^ flip, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry_hash, entry_context, _ = self._entries[entry_id]
+                    if entry_context != context:
+                        continue
+                    distance = (entry_hash ^ phash).bit_count()
+                    if distance < best_distance:
+                        best_id, best_distance = entry_id, distance
+        self.candidates_checked += len(seen)
+        if best_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_id)
+        return NearDuplicate(self._entries[best_id][2], best_distance)
+
+    def add(self, phash: int, context: Hashable, value: Any):
+        if not self.enabled:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (phash, context, value)
+        for (shift, mask, _), table in zip(self._layout, self._tables):
+            table.setdefault((phash >> shift) & mask, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        phash, _, _ = self._entries.pop(entry_id)
+        for (shift, mask, _), table in zip(self._layout, self._tables):
+            key = (phash >> shift) & mask
+            bucket = table[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del table[key]
+
+    def clear(self):
+        self._entries.clear()
+        for table in self._tables:
+            table.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_distance": self.max_distance,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "mean_candidates": round(self.candidates_checked / lookups, 2) if lookups else 0.0
+        }